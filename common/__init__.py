@@ -0,0 +1,4 @@
+"""
+共用模組
+Web Server 與 Controller 共用的基礎設施
+"""
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+警報判斷流程模組
+將閾值規則、串流異常偵測與警報生命週期串成單一流程，
+由 MQTT 控制器、離線重播工具與 Web Server（批次上傳）共用，確保三者產生相同的警報
+"""
+
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from common.alert_rules import check_alerts
+from common.alert_state import AlertTracker
+from common.anomaly import AnomalyDetector
+
+# payload 中一般的字串 device_id（不含跳脫字元）
+DEVICE_ID_PATTERN = re.compile(rb'"device_id"\s*:\s*"([^"\\]*)"')
+
+
+class AlertPipeline:
+    """依 Config 設定建立的警報判斷流程"""
+
+    def __init__(self):
+        """初始化異常偵測器與警報狀態機"""
+        # 串流異常偵測器
+        self.anomaly_detector = None
+        if Config.ANOMALY_DETECTION_ENABLED:
+            self.anomaly_detector = AnomalyDetector(
+                alpha=Config.ANOMALY_EWMA_ALPHA,
+                z_threshold=Config.ANOMALY_Z_THRESHOLD,
+                warmup=Config.ANOMALY_WARMUP,
+                max_temp_step=Config.ANOMALY_MAX_TEMP_STEP,
+                max_humidity_step=Config.ANOMALY_MAX_HUMIDITY_STEP
+            )
+
+        # 警報狀態機（同一事件只在開啟、定期提醒與解除時通知）
+        self.alert_tracker = None
+        if Config.ALERT_LIFECYCLE_ENABLED:
+            self.alert_tracker = AlertTracker(
+                clear_conditions={
+                    'high_temperature': lambda temp, humidity: temp <= Config.TEMP_THRESHOLD - Config.TEMP_HYSTERESIS,
+                    'low_humidity': lambda temp, humidity: humidity >= Config.HUMIDITY_THRESHOLD + Config.HUMIDITY_HYSTERESIS
+                },
+                min_duration=Config.ALERT_MIN_DURATION,
+                cooldown=Config.ALERT_COOLDOWN,
+                reminder_interval=Config.ALERT_REMINDER_INTERVAL
+            )
+
+    def evaluate(self, device: str, temp: float, humidity: float, now: float) -> List[Dict[str, Any]]:
+        """
+        判斷單筆讀數需要處理的警報
+
+        參數:
+        - device: 裝置識別碼
+        - now: 讀數的時間（秒），供警報生命週期計算持續時間與冷卻
+        """
+        alerts = check_alerts(temp, humidity, Config.TEMP_THRESHOLD, Config.HUMIDITY_THRESHOLD)
+        if self.anomaly_detector:
+            alerts.extend(self.anomaly_detector.check(device, temp, humidity))
+
+        # 依警報生命週期合併同一事件的重複警報
+        if self.alert_tracker:
+            alerts = self.alert_tracker.update(device, alerts, temp, humidity, now)
+        return alerts
+
+
+def parse_reading_time(timestamp: str) -> Optional[float]:
+    """將讀數的 ISO 8601 時間轉為 epoch 秒數，無法解析時回傳 None"""
+    try:
+        return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_created_at(reading_time: float) -> str:
+    """將讀數時間轉為資料庫 created_at 的格式（UTC）"""
+    return datetime.fromtimestamp(reading_time, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_device_id(topic: str, data: Dict[str, Any]) -> str:
+    """取得裝置識別碼：優先使用數據中的 device_id，否則取自 topic (env/<device>/reading)"""
+    device = data.get('device_id')
+    if device:
+        return str(device)
+    parts = topic.split('/')
+    return parts[1] if len(parts) >= 3 else topic
+
+
+def routing_key(topic: str, payload: bytes) -> str:
+    """
+    取得訊息的分派鍵（接收佇列與多行程分區），與判斷警報時的 get_device_id(topic, data) 相同
+
+    分派端不解析 JSON：payload 沒有 device_id 時直接使用 topic；只有一個一般的字串值時以正規表示式取出；
+    其他情況（跳脫字元、數字、重複的鍵）才完整解析
+    """
+    if b'"device_id"' not in payload:
+        return get_device_id(topic, {})
+    match = DEVICE_ID_PATTERN.search(payload)
+    if match and payload.count(b'"device_id"') == 1:
+        return get_device_id(topic, {'device_id': match.group(1).decode('utf-8', 'replace')})
+    try:
+        data = json.loads(payload)
+        return get_device_id(topic, data if isinstance(data, dict) else {})
+    except ValueError:
+        # 無法解析的訊息由 worker 計為錯誤
+        return get_device_id(topic, {})
+
+
+def build_alert_data(
+    alert: Dict[str, Any],
+    sensor_data: Dict[str, Any],
+    timestamp: str,
+    device: Optional[str] = None
+) -> Dict[str, Any]:
+    """組成寫入資料庫與通知 Web Server 的警報資料"""
+    alert_data = {
+        'alert_type': alert['type'],
+        'severity': alert['severity'],
+        'message': alert['message'],
+        'timestamp': timestamp,
+        'sensor_data': sensor_data
+    }
+    if 'state' in alert:
+        alert_data['state'] = alert['state']
+    if device:
+        alert_data['device_id'] = device
+    return alert_data
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+警報規則模組
+溫度與濕度的閾值規則，由 Controller（MQTT）與 Web Server（批次上傳）共用
+"""
+
+from typing import Any, Dict, List
+
+
+def check_alerts(temp: float, humidity: float, temp_threshold: float, humidity_threshold: float) -> List[Dict[str, Any]]:
+    """檢查單筆讀數的警報條件"""
+    alerts = []
+
+    # 檢查溫度警報
+    if temp > temp_threshold:
+        alerts.append({
+            'type': 'high_temperature',
+            'message': f'高溫警報！當前溫度 {temp}°C 超過閾值 {temp_threshold}°C',
+            'severity': 'warning'
+        })
+
+    # 檢查濕度警報
+    if humidity < humidity_threshold:
+        alerts.append({
+            'type': 'low_humidity',
+            'message': f'低濕度警報！當前濕度 {humidity}% 低於閾值 {humidity_threshold}%',
+            'severity': 'warning'
+        })
+
+    return alerts
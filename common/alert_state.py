@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+警報生命週期管理模組
+依 (裝置, 警報類型) 追蹤事件狀態，將連續觸發的警報合併為一次事件，
+避免持續異常時每筆讀數都寫入資料庫並推播
+
+狀態轉換:
+- pending: 條件成立但尚未持續 min_duration 秒
+- open: 已發出開啟通知；之後每 reminder_interval 秒發出一次彙總提醒 (ongoing)
+- resolved: 條件解除（達到遲滯閾值）並發出解除通知；
+  cooldown 秒內再次觸發視為同一事件延續，不重新發出開啟通知；
+  但若已發出解除通知，會立即發出一次 ongoing 提醒，避免使用者以為異常已經解除
+"""
+
+from typing import Dict, List, Any, Callable, Optional
+
+# 條件解除判斷函數：(temp, humidity) -> 是否已解除
+ClearCondition = Callable[[float, float], bool]
+
+
+class AlertIncident:
+    """單一 (裝置, 警報類型) 的事件狀態"""
+
+    __slots__ = (
+        'state', 'started', 'last_emit', 'resolved_at', 'resolution_sent',
+        'total_count', 'count_since_emit', 'last_alert'
+    )
+
+    def __init__(self, now: float):
+        self.state = 'pending'
+        self.started = now
+        self.last_emit = now
+        self.resolved_at = 0.0
+        self.resolution_sent = False
+        self.total_count = 0
+        self.count_since_emit = 0
+        self.last_alert: Optional[Dict[str, Any]] = None
+
+
+class AlertTracker:
+    """
+    警報狀態機
+
+    update() 接收單筆讀數觸發的原始警報（check_alerts 的格式），
+    回傳需要寫入資料庫與推播的事件，每個事件多一個 state 欄位:
+    open / ongoing / resolved。
+    """
+
+    def __init__(
+        self,
+        clear_conditions: Optional[Dict[str, ClearCondition]] = None,
+        min_duration: float = 0.0,
+        cooldown: float = 300.0,
+        reminder_interval: float = 600.0
+    ):
+        """
+        初始化警報狀態機
+
+        參數:
+        - clear_conditions: 各警報類型的解除條件（遲滯閾值）；
+          未設定的類型視為單次事件，沒有觸發即解除且不發出解除通知
+        - min_duration: 條件需持續多少秒才發出開啟通知
+        - cooldown: 解除後多少秒內再次觸發視為同一事件
+        - reminder_interval: 事件持續期間的彙總提醒間隔（秒）
+        """
+        self.clear_conditions = clear_conditions or {}
+        self.min_duration = min_duration
+        self.cooldown = cooldown
+        self.reminder_interval = reminder_interval
+        self.incidents: Dict[str, Dict[str, AlertIncident]] = {}
+
+    def update(
+        self,
+        device: str,
+        alerts: List[Dict[str, Any]],
+        temp: float,
+        humidity: float,
+        now: float
+    ) -> List[Dict[str, Any]]:
+        """以一筆讀數更新裝置的警報狀態，回傳需要處理的事件"""
+        device_incidents = self.incidents.get(device)
+        if device_incidents is None:
+            if not alerts:
+                return []
+            device_incidents = self.incidents[device] = {}
+
+        events = []
+        triggered = set()
+
+        for alert in alerts:
+            alert_type = alert['type']
+            triggered.add(alert_type)
+            incident = device_incidents.get(alert_type)
+
+            reopened = False
+            if incident is None or (incident.state == 'resolved' and now - incident.resolved_at >= self.cooldown):
+                incident = device_incidents[alert_type] = AlertIncident(now)
+            elif incident.state == 'resolved':
+                # 冷卻期間內再次觸發，延續原本的事件；已通知解除時需要重新告知
+                incident.state = 'open'
+                reopened = incident.resolution_sent
+
+            incident.total_count += 1
+            incident.count_since_emit += 1
+            incident.last_alert = alert
+
+            if incident.state == 'pending':
+                if now - incident.started >= self.min_duration:
+                    incident.state = 'open'
+                    incident.last_emit = now
+                    incident.count_since_emit = 0
+                    events.append(dict(alert, state='open'))
+            elif reopened or now - incident.last_emit >= self.reminder_interval:
+                events.append(self._ongoing_event(incident, now))
+                incident.last_emit = now
+                incident.count_since_emit = 0
+                incident.resolution_sent = False
+
+        for alert_type in [t for t in device_incidents if t not in triggered]:
+            incident = device_incidents[alert_type]
+            clear_condition = self.clear_conditions.get(alert_type)
+
+            if incident.state == 'pending':
+                # 未持續到 min_duration 就消失，視為雜訊
+                del device_incidents[alert_type]
+            elif incident.state == 'open':
+                if clear_condition is None:
+                    incident.state = 'resolved'
+                    incident.resolved_at = now
+                elif clear_condition(temp, humidity):
+                    incident.state = 'resolved'
+                    incident.resolved_at = now
+                    # 冷卻期間反覆觸發/解除時，同一次通知之後只發出一次解除
+                    if not incident.resolution_sent:
+                        incident.resolution_sent = True
+                        events.append(self._resolved_event(alert_type, incident, now))
+            elif now - incident.resolved_at >= self.cooldown:
+                del device_incidents[alert_type]
+
+        if not device_incidents:
+            del self.incidents[device]
+
+        return events
+
+    @staticmethod
+    def _ongoing_event(incident: AlertIncident, now: float) -> Dict[str, Any]:
+        """建立持續中的彙總提醒"""
+        alert = incident.last_alert
+        return dict(
+            alert,
+            state='ongoing',
+            message=(
+                f"{alert['message']}（持續 {now - incident.started:.0f} 秒，"
+                f"期間 {incident.count_since_emit} 筆讀數觸發）"
+            )
+        )
+
+    @staticmethod
+    def _resolved_event(alert_type: str, incident: AlertIncident, now: float) -> Dict[str, Any]:
+        """建立解除通知"""
+        return {
+            'type': alert_type,
+            'state': 'resolved',
+            'severity': 'info',
+            'message': (
+                f"警報解除 ({alert_type})：持續 {now - incident.started:.0f} 秒，"
+                f"共 {incident.total_count} 筆讀數觸發"
+            )
+        }
+
+    def active_count(self) -> int:
+        """目前開啟中的事件數"""
+        return sum(
+            1
+            for device_incidents in self.incidents.values()
+            for incident in device_incidents.values()
+            if incident.state == 'open'
+        )
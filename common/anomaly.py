@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+串流異常偵測模組
+以 EWMA 平均/變異數計算 z-score，並偵測相鄰讀數的變化量，
+每筆讀數只需常數時間與常數空間的狀態更新
+"""
+
+import math
+import time
+from typing import Dict, List, Any
+
+
+class DeviceState:
+    """單一裝置的偵測狀態"""
+
+    __slots__ = (
+        'count',
+        'temp_mean', 'temp_var', 'last_temp',
+        'humidity_mean', 'humidity_var', 'last_humidity'
+    )
+
+    def __init__(self, temp: float, humidity: float):
+        self.count = 1
+        self.temp_mean = temp
+        self.temp_var = 0.0
+        self.last_temp = temp
+        self.humidity_mean = humidity
+        self.humidity_var = 0.0
+        self.last_humidity = humidity
+
+
+class AnomalyDetector:
+    """
+    EWMA z-score 與變化量異常偵測器
+
+    - z-score: 以更新前的 EWMA 平均與標準差計算，超過 z_threshold 視為異常
+    - 變化量: 與上一筆讀數的差值超過 max_temp_step / max_humidity_step 視為異常
+    前 warmup 筆讀數只用來建立基準，不會觸發 z-score 異常。
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        z_threshold: float = 4.0,
+        warmup: int = 30,
+        max_temp_step: float = 5.0,
+        max_humidity_step: float = 15.0,
+        min_std: float = 0.1
+    ):
+        """初始化偵測器"""
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.max_temp_step = max_temp_step
+        self.max_humidity_step = max_humidity_step
+        self.min_var = min_std * min_std
+        self.devices: Dict[str, DeviceState] = {}
+
+    def check(self, device: str, temp: float, humidity: float) -> List[Dict[str, Any]]:
+        """更新裝置狀態並回傳偵測到的異常警報（格式與 check_alerts 相同）"""
+        state = self.devices.get(device)
+        if state is None:
+            self.devices[device] = DeviceState(temp, humidity)
+            return []
+
+        alerts = []
+        alpha = self.alpha
+        warmed_up = state.count >= self.warmup
+        state.count += 1
+
+        # 溫度
+        diff = temp - state.temp_mean
+        if warmed_up:
+            z = diff / math.sqrt(max(state.temp_var, self.min_var))
+            if abs(z) > self.z_threshold:
+                alerts.append(self._alert(
+                    f'溫度異常！當前溫度 {temp}°C 偏離近期平均 {state.temp_mean:.1f}°C (z={z:.1f})'
+                ))
+        step = temp - state.last_temp
+        if abs(step) > self.max_temp_step:
+            alerts.append(self._alert(
+                f'溫度驟變！溫度由 {state.last_temp}°C 變為 {temp}°C (變化 {step:+.1f}°C)'
+            ))
+        incr = alpha * diff
+        state.temp_mean += incr
+        state.temp_var = (1 - alpha) * (state.temp_var + diff * incr)
+        state.last_temp = temp
+
+        # 濕度
+        diff = humidity - state.humidity_mean
+        if warmed_up:
+            z = diff / math.sqrt(max(state.humidity_var, self.min_var))
+            if abs(z) > self.z_threshold:
+                alerts.append(self._alert(
+                    f'濕度異常！當前濕度 {humidity}% 偏離近期平均 {state.humidity_mean:.1f}% (z={z:.1f})'
+                ))
+        step = humidity - state.last_humidity
+        if abs(step) > self.max_humidity_step:
+            alerts.append(self._alert(
+                f'濕度驟變！濕度由 {state.last_humidity}% 變為 {humidity}% (變化 {step:+.1f}%)'
+            ))
+        incr = alpha * diff
+        state.humidity_mean += incr
+        state.humidity_var = (1 - alpha) * (state.humidity_var + diff * incr)
+        state.last_humidity = humidity
+
+        return alerts
+
+    @staticmethod
+    def _alert(message: str) -> Dict[str, Any]:
+        return {
+            'type': 'anomaly',
+            'message': message,
+            'severity': 'warning'
+        }
+
+
+if __name__ == "__main__":
+    # 吞吐量測試：確認每秒可處理超過 10k 筆讀數
+    import random
+
+    detector = AnomalyDetector()
+    devices = [f"room{i:02d}" for i in range(50)]
+    readings = [
+        (random.choice(devices), random.gauss(25, 1), random.gauss(50, 3))
+        for _ in range(200000)
+    ]
+
+    start = time.perf_counter()
+    anomalies = 0
+    for device, temp, humidity in readings:
+        anomalies += len(detector.check(device, temp, humidity))
+    elapsed = time.perf_counter() - start
+
+    print(f"📊 處理 {len(readings)} 筆讀數，耗時 {elapsed:.3f} 秒")
+    print(f"   吞吐量: {len(readings) / elapsed:,.0f} 筆/秒")
+    print(f"   偵測到異常: {anomalies} 次")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Controller → Web Server 通知延遲基準測試
+在子行程啟動 Web Server（暫存資料庫，開啟常駐通道），比較兩種通知方式：
+
+- http: 以 keep-alive 的 httpx.Client 逐則 POST /api/alerts/notify（目前 controller 的做法）
+- channel: 經由 Unix domain socket 常駐通道送出，等待確認
+
+每則通知的延遲為送出到收到回應（確認）的時間，結果為中位數與 p99；
+另外量測連續送出時的吞吐量（http 逐則等待回應，channel 不等待確認連續送出）。
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from common.startup_benchmark import _free_port
+from common.stream_channel import ChannelClient
+from common.websocket_soak import _percentile
+
+
+def _alert(i: int) -> Dict[str, Any]:
+    return {
+        "alert_type": "high_temperature",
+        "severity": "warning",
+        "message": f"benchmark {i}",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "sensor_data": {"temp": 31.0, "humidity": 50.0},
+        "device_id": "bench"
+    }
+
+
+def _summary(latencies: List[float], seconds: float, count: int) -> Dict[str, float]:
+    return {
+        'p50_us': round(statistics.median(latencies) * 1e6, 1),
+        'p99_us': round(_percentile(latencies, 0.99) * 1e6, 1),
+        'throughput_per_s': round(count / seconds, 1)
+    }
+
+
+def bench_http(base_url: str, count: int) -> Dict[str, float]:
+    import httpx
+
+    with httpx.Client(timeout=5.0) as client:
+        for i in range(min(100, count)):
+            client.post(base_url + "/api/alerts/notify", json=_alert(i))
+        latencies = []
+        started = time.perf_counter()
+        for i in range(count):
+            sent = time.perf_counter()
+            response = client.post(base_url + "/api/alerts/notify", json=_alert(i))
+            latencies.append(time.perf_counter() - sent)
+            response.raise_for_status()
+        return _summary(latencies, time.perf_counter() - started, count)
+
+
+def bench_channel(socket_path: str, count: int) -> Dict[str, float]:
+    client = ChannelClient(socket_path)
+    client.start()
+    try:
+        for i in range(min(100, count)):
+            client.wait(client.send('alerts', [_alert(i)]), 5.0)
+        latencies = []
+        for i in range(count):
+            sent = time.perf_counter()
+            if not client.wait(client.send('alerts', [_alert(i)]), 5.0):
+                raise RuntimeError("通道確認逾時")
+            latencies.append(time.perf_counter() - sent)
+
+        # 連續送出（不等待確認）的吞吐量
+        started = time.perf_counter()
+        for i in range(count):
+            client.send('alerts', [_alert(i)])
+        if not client.flush(60.0):
+            raise RuntimeError("通道確認逾時")
+        result = _summary(latencies, time.perf_counter() - started, count)
+    finally:
+        client.close()
+    return result
+
+
+def run_benchmark(count: int = 2000) -> Dict[str, Any]:
+    """啟動 Web Server 並比較 HTTP 與常駐通道的通知延遲"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "server.sock")
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "bench.db"),
+            RING_BUFFER_PATH=os.path.join(tmp, "recent_readings.ring"),
+            CHANNEL_SOCKET_PATH=socket_path,
+            CONFIG_VERBOSE='false'
+        )
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            deadline = time.perf_counter() + 60
+            while True:
+                try:
+                    with urllib.request.urlopen(base_url + "/api/health", timeout=5) as response:
+                        response.read()
+                    if os.path.exists(socket_path):
+                        break
+                except OSError:
+                    pass
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("Web Server 未能啟動")
+                time.sleep(0.05)
+            result = {
+                'count': count,
+                'http': bench_http(base_url, count),
+                'channel': bench_channel(socket_path, count)
+            }
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    result['time'] = datetime.utcnow().isoformat() + "Z"
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="比較 /api/alerts/notify 與常駐通道的通知延遲")
+    parser.add_argument('--count', type=int, default=2000, help="每種方式送出的通知數")
+    parser.add_argument('--output', help="將結果附加到 JSON Lines 檔案")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.count)
+    for name, label in (('http', 'HTTP /api/alerts/notify'), ('channel', '常駐通道')):
+        stats = result[name]
+        print(f"⏱️ {label}: 中位數 {stats['p50_us']:.0f} µs，p99 {stats['p99_us']:.0f} µs，"
+              f"吞吐量 {stats['throughput_per_s']:.0f} 則/秒")
+    speedup = result['http']['p50_us'] / result['channel']['p50_us']
+    print(f"📉 常駐通道的中位數延遲為 HTTP 的 1/{speedup:.1f}")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"💾 已附加到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+可合併的分位數草圖（DDSketch）
+以每小時、每個欄位一份草圖的方式記錄讀數分布，序列化後存入 reading_sketches 資料表
+
+誤差界限：
+- 數值依 |x| 的對數分桶，相鄰桶的比例為 gamma = (1 + alpha) / (1 - alpha)，
+  每個桶以 2 * gamma^k / (gamma + 1) 代表，桶內任一數值的相對誤差不超過 alpha
+- 分位數以相鄰排名線性內插（與 numpy 預設相同），兩個排名的估計值各自在 alpha 以內，
+  因此估計值與精確百分位數的相對誤差不超過 alpha（兩個排名的數值異號時為
+  alpha * max(|x_lo|, |x_hi|) 的絕對誤差）；最小值與最大值為精確值
+- 草圖合併是各桶計數相加，合併任意多個小時不會增加誤差；
+  相對精度不同的草圖合併時，誤差上限為兩者相加
+- |x| < MIN_INDEXABLE 的數值記為 0
+"""
+
+import math
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from operator import add
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 預設相對精度：25°C 約 ±0.12°C、60% 約 ±0.3%
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+# 記錄草圖的欄位
+SKETCH_METRICS = ('temp', 'humidity')
+
+# 小於此絕對值的數值記為 0
+MIN_INDEXABLE = 1e-9
+
+# 序列化格式版本
+FORMAT_VERSION = 1
+
+# 小時桶的格式（與 created_at 相同，UTC）
+HOUR_FORMAT = '%Y-%m-%d %H:00:00'
+
+_HEADER = struct.Struct('<Bdddd')
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class _Store:
+    """連續索引的桶計數（offset 起的計數列表），合併時以切片逐段相加"""
+
+    __slots__ = ('offset', 'counts')
+
+    def __init__(self):
+        self.offset = 0
+        self.counts: List[int] = []
+
+    def add(self, key: int, count: int):
+        if not self.counts:
+            self.offset = key
+            self.counts = [count]
+            return
+        index = key - self.offset
+        if index < 0:
+            self.counts[:0] = [0] * -index
+            self.offset = key
+            index = 0
+        elif index >= len(self.counts):
+            self.counts.extend([0] * (index - len(self.counts) + 1))
+        self.counts[index] += count
+
+    def merge_counts(self, offset: int, counts: Sequence[int]):
+        if not counts:
+            return
+        if not self.counts:
+            self.offset = offset
+            self.counts = list(counts)
+            return
+        if offset < self.offset:
+            self.counts[:0] = [0] * (self.offset - offset)
+            self.offset = offset
+        begin = offset - self.offset
+        end = begin + len(counts)
+        if end > len(self.counts):
+            self.counts.extend([0] * (end - len(self.counts)))
+        self.counts[begin:end] = map(add, self.counts[begin:end], counts)
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        """由小到大的 (索引, 計數)，略過空桶"""
+        return ((self.offset + i, count) for i, count in enumerate(self.counts) if count)
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+
+class DDSketch:
+    """相對誤差保證的分位數草圖，可合併、可序列化"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("相對精度必須介於 0 到 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = _Store()
+        self.negative = _Store()
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1):
+        if value > MIN_INDEXABLE:
+            self.positive.add(self._key(value), count)
+        elif value < -MIN_INDEXABLE:
+            self.negative.add(self._key(-value), count)
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'DDSketch'):
+        """合併另一份草圖；相對精度不同時以代表值重新分桶"""
+        if not other.count:
+            return
+        if other.gamma == self.gamma:
+            self.positive.merge_counts(other.positive.offset, other.positive.counts)
+            self.negative.merge_counts(other.negative.offset, other.negative.counts)
+        else:
+            for key, count in other.positive.items():
+                self.positive.add(self._key(other._value(key)), count)
+            for key, count in other.negative.items():
+                self.negative.add(self._key(other._value(key)), count)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _ordered_buckets(self) -> List[Tuple[float, int]]:
+        """由小到大的 (代表值, 計數)"""
+        buckets = [(-self._value(key), count) for key, count in reversed(list(self.negative.items()))]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend((self._value(key), count) for key, count in self.positive.items())
+        return buckets
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """q 介於 0 到 1，以相鄰排名線性內插；空草圖回傳 None"""
+        if not self.count:
+            return [None for _ in qs]
+        buckets = self._ordered_buckets()
+        ranks = []
+        for q in qs:
+            position = q * (self.count - 1)
+            lower = int(position)
+            ranks.append((position, lower, min(lower + 1, self.count - 1)))
+
+        # 依排名由小到大走訪一次桶
+        needed = sorted({rank for _, lower, upper in ranks for rank in (lower, upper)})
+        values = {}
+        index = 0
+        cumulative = 0
+        for rank in needed:
+            while cumulative + buckets[index][1] <= rank:
+                cumulative += buckets[index][1]
+                index += 1
+            values[rank] = min(max(buckets[index][0], self.min), self.max)
+        if 0 in values:
+            values[0] = self.min
+        if self.count - 1 in values:
+            values[self.count - 1] = self.max
+
+        return [
+            values[lower] + (values[upper] - values[lower]) * (position - lower)
+            for position, lower, upper in ranks
+        ]
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+
+    def to_bytes(self) -> bytes:
+        """
+        序列化：固定長度的標頭（版本、相對精度、總和、最小、最大），
+        之後以 zlib 壓縮 0 的計數、兩個 store 的 offset / 長度（varint）與 uint32 計數
+        """
+        body = bytearray()
+        _write_varint(body, self.zero_count)
+        counts = array('I')
+        for store in (self.positive, self.negative):
+            _write_varint(body, (store.offset << 1) ^ (store.offset >> 63))
+            _write_varint(body, len(store.counts))
+            counts.extend(store.counts)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        body += counts.tobytes()
+        header = _HEADER.pack(FORMAT_VERSION, self.relative_accuracy, self.sum, self.min, self.max)
+        return header + zlib.compress(bytes(body))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'DDSketch':
+        version, relative_accuracy, value_sum, low, high = _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支援的草圖格式版本: {version}")
+        sketch = cls(relative_accuracy)
+        body = zlib.decompress(data[_HEADER.size:])
+        sketch.zero_count, pos = _read_varint(body, 0)
+        layout = []
+        for _ in range(2):
+            zigzag, pos = _read_varint(body, pos)
+            length, pos = _read_varint(body, pos)
+            layout.append(((zigzag >> 1) ^ -(zigzag & 1), length))
+        counts = array('I')
+        counts.frombytes(body[pos:])
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        (positive_offset, positive_length), (negative_offset, _) = layout
+        sketch.positive.offset = positive_offset
+        sketch.positive.counts = counts[:positive_length].tolist()
+        sketch.negative.offset = negative_offset
+        sketch.negative.counts = counts[positive_length:].tolist()
+        sketch.count = sketch.zero_count + sum(counts)
+        sketch.sum = value_sum
+        sketch.min = low
+        sketch.max = high
+        return sketch
+
+
+def hour_bucket(moment: datetime) -> str:
+    """取得時間所屬的小時桶"""
+    return moment.strftime(HOUR_FORMAT)
+
+
+def align_range(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """將 [start, end) 向外對齊到整點"""
+    aligned_start = start.replace(minute=0, second=0, microsecond=0)
+    aligned_end = end.replace(minute=0, second=0, microsecond=0)
+    if aligned_end < end:
+        aligned_end += timedelta(hours=1)
+    return aligned_start, aligned_end
+
+
+def merge_into_db(conn: sqlite3.Connection, sketches: Iterable[Tuple[str, str, DDSketch]]):
+    """
+    將 (小時, 欄位, 草圖) 合併進 reading_sketches
+
+    讀取、合併、寫回在呼叫端的交易中進行，多個寫入端需以 BEGIN IMMEDIATE 取得寫入鎖
+    """
+    for hour, metric, sketch in sketches:
+        if not sketch.count:
+            continue
+        row = conn.execute(
+            "SELECT sketch FROM reading_sketches WHERE hour = ? AND metric = ?",
+            (hour, metric)
+        ).fetchone()
+        if row:
+            stored = DDSketch.from_bytes(row[0])
+            stored.merge(sketch)
+            sketch = stored
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO reading_sketches (hour, metric, sketch, count, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (hour, metric, sketch.to_bytes(), sketch.count)
+        )
+
+
+def load_sketches(
+    conn: sqlite3.Connection,
+    start: datetime,
+    end: datetime,
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY
+) -> Tuple[Dict[str, DDSketch], int]:
+    """合併 [start, end) 內整點小時的草圖，回傳 (各欄位的草圖, 小時數)"""
+    merged = {metric: DDSketch(relative_accuracy) for metric in SKETCH_METRICS}
+    hours = set()
+    rows = conn.execute(
+        "SELECT hour, metric, sketch FROM reading_sketches WHERE hour >= ? AND hour < ?",
+        (hour_bucket(start), hour_bucket(end))
+    )
+    for hour, metric, data in rows:
+        if metric in merged:
+            merged[metric].merge(DDSketch.from_bytes(data))
+            hours.add(hour)
+    return merged, len(hours)
+
+
+def rebuild_sketches(
+    conn: sqlite3.Connection,
+    start: datetime,
+    end: datetime,
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY
+) -> int:
+    """由原始讀數重建 [start, end) 內各小時的草圖（覆寫既有草圖），回傳重建的小時數"""
+    start, end = align_range(start, end)
+    sketches: Dict[Tuple[str, str], DDSketch] = {}
+    rows = conn.execute(
+        """
+        SELECT strftime('%Y-%m-%d %H:00:00', created_at), temp, humidity
+        FROM sensor_readings
+        WHERE created_at >= ? AND created_at < ?
+        """,
+        (start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+    )
+    for hour, temp, humidity in rows:
+        for metric, value in (('temp', temp), ('humidity', humidity)):
+            if value is None:
+                continue
+            sketch = sketches.get((hour, metric))
+            if sketch is None:
+                sketch = sketches[(hour, metric)] = DDSketch(relative_accuracy)
+            sketch.add(value)
+    conn.execute(
+        "DELETE FROM reading_sketches WHERE hour >= ? AND hour < ?",
+        (hour_bucket(start), hour_bucket(end))
+    )
+    merge_into_db(conn, ((hour, metric, sketch) for (hour, metric), sketch in sketches.items()))
+    return len({hour for hour, _ in sketches})
+
+
+class HourlySketches:
+    """寫入端累積每小時、每個欄位的草圖，定期合併進資料庫（執行緒安全）"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self._sketches: Dict[Tuple[str, str], DDSketch] = {}
+        self._lock = threading.Lock()
+
+    def add(self, temp: Optional[float], humidity: Optional[float], moment: Optional[datetime] = None):
+        hour = hour_bucket(moment or datetime.utcnow())
+        with self._lock:
+            self._add_locked(hour, temp, humidity)
+
+    def add_many(self, rows: Iterable[Tuple], moment: Optional[datetime] = None):
+        """
+        加入 (temp, humidity, ...) 資料列
+
+        資料列的第四欄為 created_at（UTC 'YYYY-MM-DD HH:MM:SS'，例如回補的歷史讀數）時歸入該時間的小時，
+        否則歸入 moment（預設為現在）的小時
+        """
+        default_hour = hour_bucket(moment or datetime.utcnow())
+        with self._lock:
+            for row in rows:
+                created_at = row[3] if len(row) > 3 else None
+                hour = created_at[:13] + ':00:00' if created_at else default_hour
+                self._add_locked(hour, row[0], row[1])
+
+    def _add_locked(self, hour: str, temp: Optional[float], humidity: Optional[float]):
+        for metric, value in (('temp', temp), ('humidity', humidity)):
+            if value is None:
+                continue
+            sketch = self._sketches.get((hour, metric))
+            if sketch is None:
+                sketch = self._sketches[(hour, metric)] = DDSketch(self.relative_accuracy)
+            sketch.add(value)
+
+    def drain(self) -> List[Tuple[str, str, DDSketch]]:
+        """取出目前累積的草圖並清空"""
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+        return [(hour, metric, sketch) for (hour, metric), sketch in sketches.items()]
+
+    def restore(self, sketches: Iterable[Tuple[str, str, DDSketch]]):
+        """寫入失敗時放回草圖，下次再合併"""
+        with self._lock:
+            for hour, metric, sketch in sketches:
+                current = self._sketches.get((hour, metric))
+                if current is None:
+                    self._sketches[(hour, metric)] = sketch
+                else:
+                    current.merge(sketch)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sketches)
+
+
+def _benchmark(days: int):
+    """基準測試：每 10 秒一筆讀數的百分位數，草圖合併 vs 精確計算"""
+    import os
+    import random
+    import tempfile
+    import time
+
+    from data.init_db import migrate
+    from server.core.statistics import RangeScanner
+
+    end = datetime(2025, 4, 1)
+    start = end - timedelta(days=days)
+    qs = [50, 95, 99]
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        migrate(db_path)
+        rows = []
+        created = start
+        while created < end:
+            hour_of_day = created.hour + created.minute / 60
+            temp = 24 + 4 * math.sin(hour_of_day / 24 * 2 * math.pi) + rng.gauss(0, 1.5)
+            rows.append((round(temp, 1), round(min(max(rng.gauss(55, 10), 0), 100), 1),
+                         created.isoformat() + "Z", created.strftime('%Y-%m-%d %H:%M:%S')))
+            created += timedelta(seconds=10)
+        with sqlite3.connect(db_path) as conn:
+            conn.executemany(
+                "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            began = time.perf_counter()
+            hours = rebuild_sketches(conn, start, end)
+            build_elapsed = time.perf_counter() - began
+            stored_bytes = conn.execute("SELECT SUM(LENGTH(sketch)) FROM reading_sketches").fetchone()[0]
+
+        print(f"📊 {len(rows):,} 筆讀數，{hours} 個小時桶")
+        print(f"   建立草圖: {build_elapsed:.3f} 秒，共 {stored_bytes:,} bytes（平均每份 {stored_bytes / hours / 2:.0f} bytes）")
+
+        began = time.perf_counter()
+        exact, _ = RangeScanner(db_path, workers=1).scan(start, end)
+        exact_elapsed = time.perf_counter() - began
+
+        began = time.perf_counter()
+        with sqlite3.connect(db_path) as conn:
+            sketches, _ = load_sketches(conn, start, end)
+        estimates = {metric: sketch.quantiles([q / 100 for q in qs]) for metric, sketch in sketches.items()}
+        sketch_elapsed = time.perf_counter() - began
+
+        print(f"   精確計算: {exact_elapsed:.3f} 秒，草圖合併: {sketch_elapsed:.3f} 秒"
+              f"（{exact_elapsed / sketch_elapsed:.0f} 倍；草圖的耗時只與小時數有關，與讀數筆數無關）")
+        for metric in SKETCH_METRICS:
+            exact_values = exact[metric].percentiles(qs)
+            for q, estimate in zip(qs, estimates[metric]):
+                value = exact_values[f"p{q}"]
+                error = abs(estimate - value) / abs(value)
+                print(f"   {metric} p{q}: 精確 {value:.3f}，草圖 {estimate:.3f}，"
+                      f"相對誤差 {error:.4%}（上限 {DEFAULT_RELATIVE_ACCURACY:.2%}）")
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令列：預設執行基準測試；--rebuild 由原始讀數重建資料庫中的草圖"""
+    import argparse
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="分位數草圖基準測試與重建")
+    parser.add_argument('--days', type=int, default=90, help="基準測試或重建的天數")
+    parser.add_argument('--rebuild', action='store_true', help="重建 DB_PATH 中最近 --days 天的草圖")
+    args = parser.parse_args(argv)
+
+    if not args.rebuild:
+        _benchmark(args.days)
+        return
+
+    # 目前小時的讀數可能仍在 controller 記憶體中的草圖內，只重建到上一個整點
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    with sqlite3.connect(Config.get_db_path(), timeout=30.0) as conn:
+        hours = rebuild_sketches(conn, end - timedelta(days=args.days), end, Config.SKETCH_RELATIVE_ACCURACY)
+    print(f"✅ 已重建 {hours} 個小時的草圖")
+
+
+if __name__ == "__main__":
+    main()
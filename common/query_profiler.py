@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+SQL 查詢分析模組
+以自訂的 sqlite3 Connection / Cursor 記錄每個 SQL 敘述的執行時間與回傳筆數，
+超過門檻的敘述會擷取 EXPLAIN QUERY PLAN 並寫入慢查詢紀錄檔
+
+使用方式:
+    sqlite3.connect(db_path, factory=ProfilingConnection)
+
+命令列工具（合併 Web Server 與 Controller 的統計，依總耗時列出前 N 名）:
+    uv run common/query_profiler.py --top 20
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# 可以擷取執行計畫的敘述類型
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+
+def normalize_sql(sql: str) -> str:
+    """合併空白，讓同一個敘述只對應一筆統計"""
+    return ' '.join(sql.split())
+
+
+class QueryProfiler:
+    """SQL 敘述統計"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        slow_threshold: float = 0.05,
+        slow_log_path: Optional[str] = None
+    ):
+        """
+        初始化分析器
+
+        參數:
+        - enabled: 是否啟用
+        - slow_threshold: 慢查詢門檻（秒）
+        - slow_log_path: 慢查詢紀錄檔路徑（JSON Lines），None 代表不寫檔
+        """
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+        # 每個敘述: [呼叫次數, 總耗時, 最長耗時, 總筆數, 慢查詢次數]
+        self.stats: Dict[str, list] = {}
+        self.plans: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, slow_threshold: float, slow_log_path: Optional[str]):
+        """更新設定"""
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.slow_log_path = slow_log_path
+
+    def record(self, connection, sql: str, parameters, elapsed: float, rows: int):
+        """記錄一次敘述執行"""
+        key = normalize_sql(sql)
+        is_slow = elapsed >= self.slow_threshold
+        with self._lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = [0, 0.0, 0.0, 0, 0]
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+            entry[3] += rows
+            if is_slow:
+                entry[4] += 1
+
+        if is_slow:
+            plan = self.plans.get(key)
+            if plan is None and connection is not None:
+                plan = self.plans[key] = self._explain(connection, sql, parameters)
+            self._write_slow_log(key, parameters, elapsed, rows, plan)
+
+    @staticmethod
+    def _explain(connection, sql: str, parameters) -> List[str]:
+        """擷取執行計畫"""
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        try:
+            # 使用基本的 sqlite3.Cursor，避免 EXPLAIN 本身也被記錄
+            cursor = sqlite3.Cursor(connection)
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f"無法取得執行計畫: {e}"]
+
+    def _write_slow_log(self, sql: str, parameters, elapsed: float, rows: int, plan: Optional[List[str]]):
+        """寫入慢查詢紀錄"""
+        if not self.slow_log_path:
+            return
+        entry = {
+            'time': datetime.utcnow().isoformat() + "Z",
+            'pid': os.getpid(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'rows': rows,
+            'sql': sql,
+            'parameters': [str(p) for p in parameters] if isinstance(parameters, (list, tuple)) else str(parameters),
+            'plan': plan or []
+        }
+        try:
+            with self._lock, open(self.slow_log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"❌ 寫入慢查詢紀錄失敗: {e}")
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """依總耗時排序，取得前 limit 個敘述"""
+        with self._lock:
+            items = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {
+                'sql': sql,
+                'calls': calls,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / calls, 3) if calls else 0.0,
+                'max_ms': round(max_time * 1000, 3),
+                'rows': rows,
+                'slow_calls': slow_calls,
+                'plan': self.plans.get(sql, [])
+            }
+            for sql, (calls, total, max_time, rows, slow_calls) in items
+        ]
+
+    def reset(self):
+        """清除統計"""
+        with self._lock:
+            self.stats.clear()
+            self.plans.clear()
+
+
+# 建立全域的分析器實例（各行程依 Config 設定啟用）
+profiler = QueryProfiler()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """
+    記錄執行時間與筆數的 Cursor
+
+    SELECT 的耗時包含之後的 fetch；敘述在下一次 execute、取完所有資料、
+    cursor 或連線關閉時才結算。
+    """
+
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, parameters, elapsed, rows = pending
+        if rows == 0 and self.rowcount > 0:
+            rows = self.rowcount
+        profiler.record(self.connection, sql, parameters, elapsed, rows)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        if not profiler.enabled:
+            return super().execute(sql, parameters)
+
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, parameters, time.perf_counter() - start, 0]
+            self.connection._last_cursor = self
+            # 沒有結果集的敘述（INSERT / UPDATE / DELETE）已執行完畢
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not profiler.enabled:
+            return super().executemany(sql, seq_of_parameters)
+
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            profiler.record(None, sql, (), time.perf_counter() - start, max(self.rowcount, 0))
+
+    def _fetch(self, method, *args):
+        pending = self._pending
+        if pending is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        pending[2] += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(super().fetchmany, size if size is not None else self.arraysize)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """預設使用 ProfilingCursor 的 Connection"""
+
+    _last_cursor = None
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _finish_last_cursor(self):
+        cursor = self._last_cursor
+        if cursor is not None:
+            self._last_cursor = None
+            cursor._finish()
+
+    def commit(self):
+        self._finish_last_cursor()
+        super().commit()
+
+    def close(self):
+        self._finish_last_cursor()
+        super().close()
+
+
+def _fetch_json(url: str) -> List[Dict[str, Any]]:
+    """從 Web Server 或 Controller 取得統計"""
+    import urllib.request
+
+    with urllib.request.urlopen(url, timeout=5) as response:
+        payload = json.loads(response.read().decode('utf-8'))
+    return payload.get('data', [])
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令列工具：合併多個行程的統計並依總耗時列出前 N 名"""
+    import argparse
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="列出耗時最多的 SQL 敘述")
+    parser.add_argument('urls', nargs='*', help="統計來源 URL（預設為 Web Server 與 Controller）")
+    parser.add_argument('--top', type=int, default=20, help="列出的敘述數量")
+    args = parser.parse_args(argv)
+
+    urls = args.urls or [
+        f"{Config.WEB_SERVER_URL}/api/debug/queries?limit=1000",
+        f"http://{Config.CONTROLLER_METRICS_HOST}:{Config.CONTROLLER_METRICS_PORT}/queries?limit=1000"
+    ]
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    for url in urls:
+        try:
+            entries = _fetch_json(url)
+        except Exception as e:
+            print(f"⚠️ 無法取得 {url}: {e}")
+            continue
+        for entry in entries:
+            total = merged.get(entry['sql'])
+            if total is None:
+                merged[entry['sql']] = dict(entry)
+            else:
+                total['calls'] += entry['calls']
+                total['total_ms'] += entry['total_ms']
+                total['rows'] += entry['rows']
+                total['slow_calls'] += entry['slow_calls']
+                total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+                total['plan'] = total['plan'] or entry['plan']
+
+    ranked = sorted(merged.values(), key=lambda e: e['total_ms'], reverse=True)[:args.top]
+    print(f"{'總耗時(ms)':>12} {'次數':>8} {'平均(ms)':>10} {'最長(ms)':>10} {'筆數':>10} {'慢查詢':>6}  SQL")
+    for entry in ranked:
+        avg = entry['total_ms'] / entry['calls'] if entry['calls'] else 0.0
+        print(
+            f"{entry['total_ms']:>12.1f} {entry['calls']:>8} {avg:>10.3f} {entry['max_ms']:>10.3f} "
+            f"{entry['rows']:>10} {entry['slow_calls']:>6}  {entry['sql'][:120]}"
+        )
+        for line in entry['plan']:
+            print(f"{'':>62}└ {line}")
+
+
+if __name__ == "__main__":
+    main()
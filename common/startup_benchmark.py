@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+啟動時間基準測試
+量測 Web Server 與 controller 的 import 時間、controller 初始化時間，
+以及 Web Server 從啟動行程到回應第一個（需要查詢資料庫的）請求的時間與關閉時間。
+
+每次量測都在新的子行程中進行，使用暫存資料庫；結果取中位數。
+--output 會將結果附加到 JSON Lines 檔案，方便追蹤每次變更後的啟動時間。
+"""
+
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子行程中量測 import 時間（controller 以腳本方式執行，需把 controller/ 加入路徑）
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {path!r})
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+CONTROLLER_INIT_SCRIPT = """
+import sys, time
+sys.path.insert(0, {path!r})
+started = time.perf_counter()
+from controller import EnvironmentController
+EnvironmentController()
+print(time.perf_counter() - started)
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _bench_env(tmp: str) -> Dict[str, str]:
+    """使用暫存資料庫與環形緩衝區，關閉 controller 的 /metrics 伺服器避免佔用連接埠"""
+    return dict(
+        os.environ,
+        DB_PATH=os.path.join(tmp, "startup.db"),
+        RING_BUFFER_PATH=os.path.join(tmp, "recent_readings.ring"),
+        CONTROLLER_METRICS_ENABLED='false',
+        CONFIG_VERBOSE='false'
+    )
+
+
+def _run_timed_script(script: str, env: Dict[str, str]) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _time_to_first_request(env: Dict[str, str], path: str) -> Dict[str, float]:
+    """啟動 uvicorn，輪詢直到第一個請求成功；再送出 SIGTERM 量測關閉時間"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + 60
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    response.read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("Web Server 未能啟動")
+                time.sleep(0.005)
+        ready = time.perf_counter() - started
+
+        # 第一個請求之後，再量測一次已預熱的請求
+        request_started = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=5) as response:
+            response.read()
+        warm_request = time.perf_counter() - request_started
+
+        stop_started = time.perf_counter()
+        process.terminate()
+        process.wait(timeout=30)
+        shutdown = time.perf_counter() - stop_started
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    return {'first_request': ready, 'warm_request': warm_request, 'shutdown': shutdown}
+
+
+def run_benchmark(runs: int = 5, path: str = "/api/sensor/readings?limit=10") -> Dict[str, Any]:
+    """執行所有量測，回傳各項的中位數（秒）"""
+    samples: Dict[str, List[float]] = {}
+
+    def record(name: str, value: float):
+        samples.setdefault(name, []).append(value)
+
+    controller_dir = os.path.join(PROJECT_ROOT, 'controller')
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = _bench_env(tmp)
+            record('server_import', _run_timed_script(IMPORT_SCRIPT.format(path=PROJECT_ROOT, module='server.main'), env))
+            record('controller_import', _run_timed_script(IMPORT_SCRIPT.format(path=controller_dir, module='controller'), env))
+            record('controller_init', _run_timed_script(CONTROLLER_INIT_SCRIPT.format(path=controller_dir), env))
+            for name, value in _time_to_first_request(env, path).items():
+                record(f"server_{name}", value)
+
+    return {
+        'time': datetime.utcnow().isoformat() + "Z",
+        'runs': runs,
+        'results_ms': {name: round(statistics.median(values) * 1000, 1) for name, values in samples.items()}
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="量測 Web Server 與 controller 的啟動時間")
+    parser.add_argument('--runs', type=int, default=5, help="重複次數（取中位數）")
+    parser.add_argument('--path', default="/api/sensor/readings?limit=10", help="第一個請求的路徑")
+    parser.add_argument('--output', help="將結果附加到 JSON Lines 檔案")
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.runs, args.path)
+    labels = {
+        'server_import': "Web Server import",
+        'server_first_request': "Web Server 啟動到第一個請求",
+        'server_warm_request': "Web Server 預熱後的請求",
+        'server_shutdown': "Web Server 關閉",
+        'controller_import': "controller import",
+        'controller_init': "controller import + 初始化"
+    }
+    print(f"⏱️ 啟動時間（{result['runs']} 次中位數）")
+    for name, label in labels.items():
+        print(f"   {label}: {result['results_ms'][name]:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"💾 已附加到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Controller → Web Server 常駐通道
+同一台主機上的 controller 與 Web Server 以 Unix domain socket 維持一條長連線，
+省去每則通知的 HTTP 請求解析、連線處理與 pydantic 驗證。
+
+訊框格式：4 位元組大端序長度 + UTF-8 JSON
+- controller → Web Server: {"id": N, "type": "alerts" | "readings", "data": [...]}
+- Web Server → controller: {"type": "ack", "id": N, ...} 或 {"type": "error", "id": N, "error": "..."}
+
+Web Server 依序處理同一連線的訊框；controller 不等待確認即可連續送出（pipelining），
+尚未確認的訊框在重新連線後依序重送（至少一次，斷線當下已處理但未確認的訊框會重複）。
+"""
+
+import json
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+# 長度前綴與單一訊框上限
+HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    """將訊息編碼為長度前綴的訊框"""
+    body = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(body) > MAX_FRAME_SIZE:
+        raise ValueError(f"訊框過大: {len(body)} bytes")
+    return HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader) -> Dict[str, Any]:
+    """從 asyncio.StreamReader 讀取一個訊框（連線結束時拋出 asyncio.IncompleteReadError）"""
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"訊框過大: {size} bytes")
+    return json.loads(await reader.readexactly(size))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("通道已關閉")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    """從阻塞式 socket 讀取一個訊框"""
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"訊框過大: {size} bytes")
+    return json.loads(_recv_exactly(sock, size))
+
+
+class ChannelClient:
+    """
+    執行緒版本的通道客戶端（controller 的三種引擎共用）
+
+    send() 指定訊框編號、記錄為未確認並放入待寫佇列後立即返回，不碰 socket，
+    可以直接在 asyncio 事件迴圈上呼叫；只有背景執行緒會阻塞在 socket 上：
+    寫入執行緒依序寫出待寫的訊框，連線執行緒負責連線、讀取確認，
+    斷線後以指數退避重新連線，並把所有未確認的訊框依序重新排入待寫佇列。
+    未確認的訊框超過 max_pending 時丟棄最舊的（警報與讀數已寫入資料庫，Web Server 可由資料庫補送）。
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000,
+                 reconnect_delay: float = 0.2, max_reconnect_delay: float = 5.0):
+        self.path = path
+        self.max_pending = max(1, max_pending)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._next_id = 0
+        self._unacked: 'OrderedDict[int, bytes]' = OrderedDict()
+        # 等待寫入目前連線的訊框編號（被確認或丟棄的訊框寫入時略過）
+        self._outbox: Deque[int] = deque()
+        # 狀態鎖：未確認訊框、待寫佇列與連線
+        self._cond = threading.Condition()
+        self._sock: Optional[socket.socket] = None
+        self._closed = False
+        self._threads: List[threading.Thread] = []
+
+        # 統計數據
+        self.stats = {
+            'sent': 0,
+            'acked': 0,
+            'errors': 0,
+            'rejected': 0,
+            'resent': 0,
+            'dropped': 0,
+            'connects': 0
+        }
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._unacked)
+
+    def start(self):
+        """啟動連線（讀取確認）與寫入的背景執行緒"""
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._run, name="server-channel", daemon=True),
+                threading.Thread(target=self._write_loop, name="server-channel-writer", daemon=True)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def send(self, message_type: str, data: Any) -> int:
+        """排入一個訊框（不阻塞；未連線時等待重新連線後送出），回傳訊框編號"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("通道已關閉")
+            self._next_id += 1
+            frame_id = self._next_id
+            frame = encode_frame({"id": frame_id, "type": message_type, "data": data})
+            if len(self._unacked) >= self.max_pending:
+                self._unacked.popitem(last=False)
+                self.stats['dropped'] += 1
+            self._unacked[frame_id] = frame
+            self._outbox.append(frame_id)
+            self.stats['sent'] += 1
+            self._cond.notify_all()
+        return frame_id
+
+    def wait(self, frame_id: int, timeout: Optional[float] = None) -> bool:
+        """等待訊框被確認（或被丟棄），逾時回傳 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: frame_id not in self._unacked, timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已送出的訊框被確認"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._unacked, timeout)
+
+    def close(self, timeout: float = 5.0):
+        """等待未確認的訊框（最多 timeout 秒）後關閉連線"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            sock = self._sock
+            self._cond.notify_all()
+        if sock is not None:
+            self._drop(sock)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _drop(self, sock: socket.socket):
+        with self._cond:
+            if self._sock is sock:
+                self._sock = None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _write_loop(self):
+        """寫入執行緒：依序把待寫的訊框寫入目前的連線"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or (self._sock is not None and self._outbox))
+                if self._closed:
+                    return
+                sock = self._sock
+                frames = [self._unacked[i] for i in self._outbox if i in self._unacked]
+                self._outbox.clear()
+            if not frames:
+                continue
+            try:
+                sock.sendall(b"".join(frames))
+            except OSError:
+                # 連線執行緒會發現斷線並重新連線，屆時重送所有未確認的訊框
+                self._drop(sock)
+
+    def _connect(self) -> socket.socket:
+        """連線，並把未確認的訊框依序重新排入待寫佇列"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except BaseException:
+            sock.close()
+            raise
+        with self._cond:
+            if self._closed:
+                sock.close()
+                raise ConnectionError("通道已關閉")
+            self._sock = sock
+            # 未確認的訊框已包含所有尚未寫入的訊框
+            self._outbox = deque(self._unacked)
+            self.stats['resent'] += len(self._outbox)
+            self.stats['connects'] += 1
+            self._cond.notify_all()
+        return sock
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self._closed:
+            try:
+                sock = self._connect()
+            except OSError:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+            print(f"🔗 已連接到 Web Server 通道: {self.path}")
+            try:
+                while True:
+                    self._handle_reply(recv_frame(sock))
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._drop(sock)
+                sock.close()
+            if not self._closed:
+                print(f"⚠️ Web Server 通道中斷，{len(self._unacked)} 個訊框等待重送")
+
+    def _handle_reply(self, reply: Dict[str, Any]):
+        with self._cond:
+            if self._unacked.pop(reply.get('id'), None) is None:
+                return
+            if reply.get('type') == 'ack':
+                self.stats['acked'] += 1
+                self.stats['rejected'] += reply.get('rejected', 0)
+            else:
+                self.stats['errors'] += 1
+                print(f"   通知: ❌ Web Server 通道回報錯誤: {reply.get('error')}")
+            self._cond.notify_all()
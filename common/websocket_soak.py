@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+WebSocket / SSE 連線壓力測試
+在子行程啟動 Web Server（暫存資料庫），建立大量 /ws/alerts（或 --transport sse 時 /sse/alerts）連線，量測：
+- 每個連線佔用的 Web Server 記憶體（RSS 差值 / 連線數）
+- 建立所有連線的時間
+- 推播延遲：送出 /api/alerts/notify 到每個客戶端收到警報的時間（各客戶端的中位數、p99、最大值）
+
+客戶端在同一個行程中以 asyncio 執行，WebSocket 客戶端會回覆伺服器的心跳 ping；
+SSE 客戶端以原始 HTTP/1.1 連線解析 chunked 串流，避免 HTTP 函式庫本身的負擔影響比較。
+單一 CPU 時客戶端與伺服器互相競爭，延遲為上限值。
+"""
+
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from common.startup_benchmark import _free_port
+
+
+def _rss_kb(pid: int) -> int:
+    """讀取行程的常駐記憶體（KB，僅支援 Linux）"""
+    with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("無法讀取 VmRSS")
+
+
+def _raise_fd_limit(needed: int):
+    """客戶端與伺服器各需要約一個檔案描述符 / 連線"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SoakClient:
+    """一個 WebSocket 客戶端：記錄每則警報的收到時間，並回覆心跳"""
+
+    def __init__(self, arrivals: Dict[str, int]):
+        self.received: Dict[str, float] = {}
+        # 所有客戶端共用：每則警報已送達的客戶端數
+        self.arrivals = arrivals
+
+    def _receive(self, key: str, now: float):
+        self.received[key] = now
+        self.arrivals[key] = self.arrivals.get(key, 0) + 1
+
+    async def run(self, url: str, protocol: str, connected: asyncio.Event, compression: bool):
+        import websockets
+        from server.core.websocket import decode_message, expand_batch
+
+        subprotocols = None if protocol == 'v1' else [protocol]
+        async with websockets.connect(
+            url, subprotocols=subprotocols, compression='deflate' if compression else None,
+            open_timeout=120, ping_interval=None, max_queue=None
+        ) as ws:
+            connected.set()
+            async for data in ws:
+                now = time.perf_counter()
+                message = decode_message(data)
+                if message["type"] == "ping":
+                    await ws.send('{"type": "pong"}')
+                elif message["type"] == "alert":
+                    self._receive(message["data"]["message"], now)
+                elif message["type"] == "alerts":
+                    for alert in expand_batch(message):
+                        self._receive(alert["message"], now)
+
+
+class SSESoakClient(SoakClient):
+    """一個 SSE 客戶端：解析 chunked 編碼的事件串流，記錄每則警報的收到時間"""
+
+    async def run(self, url: str, protocol: str, connected: asyncio.Event, compression: bool):
+        host, _, rest = url.removeprefix("http://").partition("/")
+        hostname, _, port = host.partition(":")
+        reader, writer = await asyncio.open_connection(hostname, int(port), limit=2 ** 20)
+        try:
+            writer.write(
+                f"GET /{rest} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode("ascii")
+            )
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head.startswith(b"HTTP/1.1 200"):
+                raise RuntimeError(f"SSE 連線失敗: {head.splitlines()[0].decode()}")
+            connected.set()
+            buffer = b""
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                if size == 0:
+                    return
+                buffer += await reader.readexactly(size)
+                await reader.readexactly(2)
+                now = time.perf_counter()
+                *events, buffer = buffer.split(b"\n\n")
+                for event in events:
+                    fields = dict(line.split(b": ", 1) for line in event.split(b"\n") if b": " in line)
+                    if fields.get(b"event") == b"alert":
+                        self._receive(json.loads(fields[b"data"])["data"]["message"], now)
+        finally:
+            writer.close()
+
+
+async def _soak(base_url: str, connections: int, broadcasts: int, protocol: str,
+                pid: int, concurrency: int, compression: bool, transport: str) -> Dict[str, Any]:
+    if transport == 'sse':
+        url = base_url + "/sse/alerts"
+        client_class = SSESoakClient
+    else:
+        url = base_url.replace("http://", "ws://") + "/ws/alerts"
+        client_class = SoakClient
+    rss_before = _rss_kb(pid)
+
+    arrivals: Dict[str, int] = {}
+    clients = [client_class(arrivals) for _ in range(connections)]
+    tasks = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_client(client: SoakClient):
+        async with semaphore:
+            connected = asyncio.Event()
+            task = asyncio.create_task(client.run(url, protocol, connected, compression))
+            tasks.append(task)
+            waiter = asyncio.create_task(connected.wait())
+            done, _ = await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                waiter.cancel()
+                task.result()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(open_client(client) for client in clients))
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(1.0)
+    rss_after = _rss_kb(pid)
+
+    latencies: List[Dict[str, float]] = []
+    for i in range(broadcasts):
+        body = json.dumps({
+            "alert_type": "high_temperature",
+            "severity": "warning",
+            "message": f"soak {i}",
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "sensor_data": {"temp": 31.0, "humidity": 50.0}
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            base_url + "/api/alerts/notify", data=body, headers={"Content-Type": "application/json"}
+        )
+        sent = time.perf_counter()
+        await asyncio.to_thread(lambda: urllib.request.urlopen(request, timeout=300).read())
+        key = f"soak {i}"
+        deadline = time.perf_counter() + 300
+        while arrivals.get(key, 0) < connections:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"推播 {i} 未在時限內送達所有客戶端")
+            await asyncio.sleep(0.01)
+        per_client = [client.received[key] - sent for client in clients]
+        latencies.append({
+            'p50': statistics.median(per_client),
+            'p99': _percentile(per_client, 0.99),
+            'max': max(per_client)
+        })
+        await asyncio.sleep(0.2)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        'connections': connections,
+        'transport': transport,
+        'protocol': protocol if transport == 'ws' else 'sse',
+        'compression': compression and transport == 'ws',
+        'connect_seconds': round(connect_seconds, 2),
+        'server_rss_mb': {'before': round(rss_before / 1024, 1), 'after': round(rss_after / 1024, 1)},
+        'server_kb_per_connection': round((rss_after - rss_before) / connections, 1),
+        'broadcast_latency_ms': {
+            name: round(statistics.median(run[name] for run in latencies) * 1000, 1)
+            for name in ('p50', 'p99', 'max')
+        }
+    }
+
+
+def run_soak(
+    connections: int = 10000,
+    broadcasts: int = 5,
+    protocol: str = 'v1',
+    concurrency: int = 200,
+    compression: bool = False,
+    transport: str = 'ws'
+) -> Dict[str, Any]:
+    """啟動 Web Server 並執行壓力測試，回傳量測結果"""
+    _raise_fd_limit(connections + 1024)
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "soak.db"),
+            RING_BUFFER_PATH=os.path.join(tmp, "recent_readings.ring"),
+            CONFIG_VERBOSE='false',
+            WS_MAX_CONNECTIONS=str(connections + 100)
+        )
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--backlog", "4096"],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            preexec_fn=lambda: _raise_fd_limit(connections + 1024)
+        )
+        try:
+            deadline = time.perf_counter() + 60
+            while True:
+                try:
+                    with urllib.request.urlopen(base_url + "/api/health", timeout=5) as response:
+                        response.read()
+                    break
+                except OSError:
+                    if process.poll() is not None or time.perf_counter() > deadline:
+                        raise RuntimeError("Web Server 未能啟動")
+                    time.sleep(0.05)
+            result = asyncio.run(_soak(base_url, connections, broadcasts, protocol, process.pid, concurrency, compression, transport))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    result['time'] = datetime.utcnow().isoformat() + "Z"
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="WebSocket / SSE 大量連線的記憶體與推播延遲壓力測試")
+    parser.add_argument('--connections', type=int, default=10000, help="同時連線數")
+    parser.add_argument('--broadcasts', type=int, default=5, help="推播次數（延遲取中位數）")
+    parser.add_argument('--transport', default='ws', choices=['ws', 'sse'], help="連線方式（sse 時忽略 --protocol 與 --compression）")
+    parser.add_argument('--protocol', default='v1', choices=['v1', 'alerts.v2', 'alerts.v2.zlib'], help="客戶端協定")
+    parser.add_argument('--concurrency', type=int, default=200, help="同時進行的連線握手數")
+    parser.add_argument('--compression', action='store_true', help="客戶端要求 permessage-deflate")
+    parser.add_argument('--output', help="將結果附加到 JSON Lines 檔案")
+    args = parser.parse_args(argv)
+
+    result = run_soak(
+        args.connections, args.broadcasts, args.protocol, args.concurrency, args.compression, args.transport
+    )
+    latency = result['broadcast_latency_ms']
+    print(f"🔌 {result['connections']} 個連線（{result['protocol']}"
+          f"{'，permessage-deflate' if result['compression'] else ''}），建立耗時 {result['connect_seconds']:.2f} s")
+    print(f"💾 Web Server 記憶體: {result['server_rss_mb']['before']} → {result['server_rss_mb']['after']} MB"
+          f"（每個連線 {result['server_kb_per_connection']:.1f} KB）")
+    print(f"📢 推播延遲: 中位數 {latency['p50']:.1f} ms，p99 {latency['p99']:.1f} ms，最大 {latency['max']:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"💾 已附加到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,36 @@
 """
 
 import os
+import socket
 from typing import Optional
 from dotenv import load_dotenv
 
 # 載入 .env 檔案
-def load_env_file():
-    """載入 .env 檔案"""
+def load_env_file(verbose: Optional[bool] = None):
+    """
+    載入 .env 檔案
+
+    import 時只印出一行摘要；設定 CONFIG_VERBOSE=true（或 verbose=True）時才逐行印出載入的設定，
+    避免每個行程啟動時都把 .env 內容（可能包含密碼）寫進日誌。
+    """
     env_file = os.path.join(os.path.dirname(__file__), '.env')
-    if os.path.exists(env_file):
-        print(f"📋 載入 .env 檔案: {env_file}")
-        load_dotenv(env_file)
-        # 印出載入的環境變數（可選）
-        with open(env_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    print(f"   {key}={value}")
-    else:
+    if not os.path.exists(env_file):
         print(f"⚠️ .env 檔案不存在: {env_file}")
+        return
+    load_dotenv(env_file)
+    if verbose is None:
+        verbose = os.getenv('CONFIG_VERBOSE', 'false').lower() == 'true'
+
+    entries = []
+    with open(env_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                entries.append(line.split('=', 1))
+    print(f"📋 載入 .env 檔案: {env_file}（{len(entries)} 項設定）")
+    if verbose:
+        for key, value in entries:
+            print(f"   {key}={value}")
 
 # 載入 .env 檔案
 load_env_file()
@@ -33,21 +44,150 @@ class Config:
     
     # 資料庫配置
     DB_PATH = os.getenv('DB_PATH', 'data/environment.db')
+    # 寫入端等待資料庫鎖的秒數（schema 遷移建立索引期間寫入會等待）
+    DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 30.0))
     
     # MQTT 配置
     MQTT_BROKER = os.getenv('MQTT_BROKER', 'localhost')
     MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
     MQTT_TOPIC = os.getenv('MQTT_TOPIC', 'env/room01/reading')
     
+    # MQTT 水平擴展配置（共享訂閱、持久化 session、流量控制）
+    MQTT_SHARED_GROUP = os.getenv('MQTT_SHARED_GROUP', '')
+    MQTT_CLIENT_ID = os.getenv('MQTT_CLIENT_ID', '')
+    CONTROLLER_INSTANCE = os.getenv('CONTROLLER_INSTANCE', '0')
+    MQTT_PERSISTENT_SESSION = os.getenv('MQTT_PERSISTENT_SESSION', 'false').lower() == 'true'
+    MQTT_SUBSCRIBE_QOS = int(os.getenv('MQTT_SUBSCRIBE_QOS', 1))
+    MQTT_MAX_INFLIGHT = int(os.getenv('MQTT_MAX_INFLIGHT', 100))
+    MQTT_MAX_QUEUED = int(os.getenv('MQTT_MAX_QUEUED', 0))
+    
     # Web Server 配置
     WEB_SERVER_HOST = os.getenv('WEB_SERVER_HOST', 'localhost')
     WEB_SERVER_PORT = int(os.getenv('WEB_SERVER_PORT', 8000))
     WEB_SERVER_URL = os.getenv('WEB_SERVER_URL', 'http://localhost:8000')
     
+    # 批次讀數上傳 (POST /api/sensor/readings/batch)
+    BATCH_INGEST_MAX_READINGS = int(os.getenv('BATCH_INGEST_MAX_READINGS', 100000))
+    BATCH_INGEST_CHUNK_SIZE = int(os.getenv('BATCH_INGEST_CHUNK_SIZE', 5000))
+    
+    # 批次警報通知 (POST /api/alerts/notify/batch)
+    ALERT_NOTIFY_BATCH_MAX = int(os.getenv('ALERT_NOTIFY_BATCH_MAX', 1000))
+    
+    # 監控指標 (/metrics)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    
     # 警報閾值
     TEMP_THRESHOLD = float(os.getenv('TEMP_THRESHOLD', 30.0))
     HUMIDITY_THRESHOLD = float(os.getenv('HUMIDITY_THRESHOLD', 40.0))
     
+    # Controller 監控指標（內嵌 HTTP /metrics 端點）
+    CONTROLLER_METRICS_ENABLED = os.getenv('CONTROLLER_METRICS_ENABLED', 'true').lower() == 'true'
+    CONTROLLER_METRICS_HOST = os.getenv('CONTROLLER_METRICS_HOST', '127.0.0.1')
+    CONTROLLER_METRICS_PORT = int(os.getenv('CONTROLLER_METRICS_PORT', 9100))
+    
+    # SQL 查詢分析與慢查詢紀錄（預設關閉）
+    QUERY_PROFILING_ENABLED = os.getenv('QUERY_PROFILING_ENABLED', 'false').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 50))
+    SLOW_QUERY_LOG_PATH = os.getenv('SLOW_QUERY_LOG_PATH', 'data/slow_queries.log')
+    
+    # Controller 接收佇列配置（過載策略: drop_oldest / block / sample）
+    # block 會阻塞 paho 的網路執行緒：佇列滿的期間無法回覆 PINGREQ 與 QoS 1 確認，可能被 broker 斷線
+    INGEST_QUEUE_ENABLED = os.getenv('INGEST_QUEUE_ENABLED', 'true').lower() == 'true'
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 1))
+    INGEST_OVERLOAD_POLICY = os.getenv('INGEST_OVERLOAD_POLICY', 'drop_oldest')
+    INGEST_COALESCE = os.getenv('INGEST_COALESCE', 'true').lower() == 'true'
+    INGEST_PRESSURE_RATIO = float(os.getenv('INGEST_PRESSURE_RATIO', 0.8))
+    INGEST_SAMPLE_EVERY = int(os.getenv('INGEST_SAMPLE_EVERY', 10))
+    
+    # Controller 引擎（thread: 預設的 paho 背景執行緒引擎, asyncio: 單一事件迴圈引擎）
+    CONTROLLER_ENGINE = os.getenv('CONTROLLER_ENGINE', 'thread')
+    # asyncio 引擎同時進行的 Web Server 通知數上限
+    NOTIFY_CONCURRENCY = int(os.getenv('NOTIFY_CONCURRENCY', 100))
+    # Controller 批次通知：在 NOTIFY_BATCH_WINDOW 秒內或累積到 NOTIFY_BATCH_MAX 則時
+    # 以一次 /api/alerts/notify/batch 請求送出（0 表示每則警報一個請求）
+    NOTIFY_BATCH_WINDOW = float(os.getenv('NOTIFY_BATCH_WINDOW', 0))
+    NOTIFY_BATCH_MAX = int(os.getenv('NOTIFY_BATCH_MAX', 100))
+    
+    # Controller 多行程模式（CONTROLLER_PROCESSES > 1 時由 supervisor 啟動 worker 行程）
+    CONTROLLER_PROCESSES = int(os.getenv('CONTROLLER_PROCESSES', 1))
+    CONTROLLER_DISPATCH_BATCH = int(os.getenv('CONTROLLER_DISPATCH_BATCH', 200))
+    CONTROLLER_MAX_RESTARTS = int(os.getenv('CONTROLLER_MAX_RESTARTS', 3))
+    
+    # 警報生命週期配置（遲滯、最短持續時間、冷卻、彙總提醒）
+    ALERT_LIFECYCLE_ENABLED = os.getenv('ALERT_LIFECYCLE_ENABLED', 'true').lower() == 'true'
+    TEMP_HYSTERESIS = float(os.getenv('TEMP_HYSTERESIS', 0.5))
+    HUMIDITY_HYSTERESIS = float(os.getenv('HUMIDITY_HYSTERESIS', 2.0))
+    ALERT_MIN_DURATION = float(os.getenv('ALERT_MIN_DURATION', 0))
+    ALERT_COOLDOWN = float(os.getenv('ALERT_COOLDOWN', 300))
+    ALERT_REMINDER_INTERVAL = float(os.getenv('ALERT_REMINDER_INTERVAL', 600))
+    
+    # 串流異常偵測配置
+    ANOMALY_DETECTION_ENABLED = os.getenv('ANOMALY_DETECTION_ENABLED', 'true').lower() == 'true'
+    ANOMALY_EWMA_ALPHA = float(os.getenv('ANOMALY_EWMA_ALPHA', 0.1))
+    ANOMALY_Z_THRESHOLD = float(os.getenv('ANOMALY_Z_THRESHOLD', 4.0))
+    ANOMALY_WARMUP = int(os.getenv('ANOMALY_WARMUP', 30))
+    ANOMALY_MAX_TEMP_STEP = float(os.getenv('ANOMALY_MAX_TEMP_STEP', 5.0))
+    ANOMALY_MAX_HUMIDITY_STEP = float(os.getenv('ANOMALY_MAX_HUMIDITY_STEP', 15.0))
+    
+    # 最近讀數環形緩衝區配置（controller 寫入，server 讀取）
+    # 以 <RING_BUFFER_PATH>.lock 限制只有一個 controller 寫入，共享訂閱的其他實例只標記外部寫入
+    RING_BUFFER_ENABLED = os.getenv('RING_BUFFER_ENABLED', 'true').lower() == 'true'
+    RING_BUFFER_PATH = os.getenv('RING_BUFFER_PATH', 'data/recent_readings.ring')
+    RING_BUFFER_CAPACITY = int(os.getenv('RING_BUFFER_CAPACITY', 4096))
+    
+    # Web Server 最近讀數快取配置
+    READING_CACHE_ENABLED = os.getenv('READING_CACHE_ENABLED', 'true').lower() == 'true'
+    READING_CACHE_HOURS = float(os.getenv('READING_CACHE_HOURS', 6.0))
+    READING_CACHE_MAX_ENTRIES = int(os.getenv('READING_CACHE_MAX_ENTRIES', 200000))
+    READING_CACHE_REFRESH_INTERVAL = float(os.getenv('READING_CACHE_REFRESH_INTERVAL', 1.0))
+    # 啟動時預先載入快取（否則第一個請求才載入）
+    READING_CACHE_PRELOAD = os.getenv('READING_CACHE_PRELOAD', 'true').lower() == 'true'
+    
+    # Web Server 啟動時預熱資料庫（開啟連線、載入 schema 與索引頁、映射環形緩衝區）
+    SERVER_WARMUP_ENABLED = os.getenv('SERVER_WARMUP_ENABLED', 'true').lower() == 'true'
+    
+    # 範圍統計（百分位數、直方圖）：時間範圍切成區段，由執行緒池平行掃描
+    STATS_SCAN_WORKERS = int(os.getenv('STATS_SCAN_WORKERS', 4))
+    STATS_CHUNK_HOURS = float(os.getenv('STATS_CHUNK_HOURS', 24))
+    
+    # 唯讀副本（Web Server 的分析查詢改讀副本，不與 controller 的寫入競爭）
+    READ_REPLICA_ENABLED = os.getenv('READ_REPLICA_ENABLED', 'false').lower() == 'true'
+    READ_REPLICA_PATH = os.getenv('READ_REPLICA_PATH', 'data/environment.replica.db')
+    READ_REPLICA_MODE = os.getenv('READ_REPLICA_MODE', 'incremental')
+    READ_REPLICA_REFRESH_INTERVAL = float(os.getenv('READ_REPLICA_REFRESH_INTERVAL', 1.0))
+    READ_REPLICA_MAX_STALENESS = float(os.getenv('READ_REPLICA_MAX_STALENESS', 5.0))
+    READ_REPLICA_CHUNK_ROWS = int(os.getenv('READ_REPLICA_CHUNK_ROWS', 5000))
+    
+    # 分位數草圖（每小時、每個欄位一份，controller 累積後定期合併進資料庫）
+    SKETCH_ENABLED = os.getenv('SKETCH_ENABLED', 'true').lower() == 'true'
+    SKETCH_RELATIVE_ACCURACY = float(os.getenv('SKETCH_RELATIVE_ACCURACY', 0.005))
+    SKETCH_FLUSH_INTERVAL = float(os.getenv('SKETCH_FLUSH_INTERVAL', 60.0))
+    
+    # WebSocket v2 協定（alerts.v2 / alerts.v2.zlib）：合併警報的時間窗（秒）與每個訊框最多的警報數
+    WS_BATCH_WINDOW = float(os.getenv('WS_BATCH_WINDOW', 0.05))
+    WS_BATCH_MAX_ALERTS = int(os.getenv('WS_BATCH_MAX_ALERTS', 100))
+    # 重新連線補送：記憶體中保留的推播數，缺口超出時由 alert_history 補送的最大筆數
+    WS_REPLAY_BUFFER_SIZE = int(os.getenv('WS_REPLAY_BUFFER_SIZE', 1000))
+    WS_REPLAY_DB_LIMIT = int(os.getenv('WS_REPLAY_DB_LIMIT', 500))
+    # 由資料庫補送時往前多查的秒數：警報先寫入資料庫、之後才推播，需涵蓋最大的通知延遲
+    # （NOTIFY_BATCH_WINDOW、通知逾時與常駐通道重新連線）
+    WS_REPLAY_DB_LAG = float(os.getenv('WS_REPLAY_DB_LAG', 30.0))
+    # WebSocket 連線管理：心跳間隔、閒置超時（秒，0 停用心跳）與同時連線數上限
+    WS_HEARTBEAT_INTERVAL = float(os.getenv('WS_HEARTBEAT_INTERVAL', 30.0))
+    WS_IDLE_TIMEOUT = float(os.getenv('WS_IDLE_TIMEOUT', 90.0))
+    WS_MAX_CONNECTIONS = int(os.getenv('WS_MAX_CONNECTIONS', 10000))
+    # Server-Sent Events（/sse/alerts、/sse/readings）：每個客戶端的待送佇列上限、
+    # 客戶端重新連線的等待時間（毫秒），以及讀數推播查詢新讀數的間隔（秒）
+    SSE_MAX_QUEUE = int(os.getenv('SSE_MAX_QUEUE', 2000))
+    SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 5000))
+    SSE_READINGS_INTERVAL = float(os.getenv('SSE_READINGS_INTERVAL', 1.0))
+    # Controller → Web Server 的常駐通道（Unix domain socket，空字串停用並改用 HTTP 通知）：
+    # Web Server 在此路徑監聽，controller 連線後以長度前綴的訊框送出警報與新讀數；
+    # CHANNEL_MAX_PENDING 為 controller 端尚未確認的訊框上限（超過時丟棄最舊的）
+    CHANNEL_SOCKET_PATH = os.getenv('CHANNEL_SOCKET_PATH', '')
+    CHANNEL_MAX_PENDING = int(os.getenv('CHANNEL_MAX_PENDING', 10000))
+    
     @classmethod
     def get_project_root(cls) -> str:
         """取得專案根目錄"""
@@ -66,6 +206,59 @@ class Config:
             
         return db_path
     
+    @classmethod
+    def get_ring_buffer_path(cls) -> str:
+        """取得環形緩衝區檔案絕對路徑"""
+        ring_path = cls.RING_BUFFER_PATH
+        if not os.path.isabs(ring_path):
+            ring_path = os.path.join(cls.get_project_root(), ring_path)
+        return ring_path
+    
+    @classmethod
+    def get_read_replica_path(cls) -> str:
+        """取得唯讀副本絕對路徑"""
+        replica_path = cls.READ_REPLICA_PATH
+        if not os.path.isabs(replica_path):
+            replica_path = os.path.join(cls.get_project_root(), replica_path)
+        return replica_path
+    
+    @classmethod
+    def get_channel_socket_path(cls) -> str:
+        """取得常駐通道的 socket 絕對路徑（未設定時為空字串）"""
+        socket_path = cls.CHANNEL_SOCKET_PATH
+        if socket_path and not os.path.isabs(socket_path):
+            socket_path = os.path.join(cls.get_project_root(), socket_path)
+        return socket_path
+    
+    @classmethod
+    def get_mqtt_subscription(cls) -> str:
+        """取得 controller 訂閱的 topic，設定共享群組時使用 $share/<group>/<topic>"""
+        if cls.MQTT_SHARED_GROUP:
+            return f"$share/{cls.MQTT_SHARED_GROUP}/{cls.MQTT_TOPIC}"
+        return cls.MQTT_TOPIC
+    
+    @classmethod
+    def get_mqtt_client_id(cls) -> str:
+        """
+        取得 controller 的 MQTT client id
+
+        持久化 session 需要固定的 client id：未指定 MQTT_CLIENT_ID 時以主機名稱與 CONTROLLER_INSTANCE 組成；
+        非持久化 session 且未指定時回傳空字串，由 client 隨機產生。
+        """
+        if cls.MQTT_CLIENT_ID:
+            return cls.MQTT_CLIENT_ID
+        if cls.MQTT_PERSISTENT_SESSION:
+            return f"env-controller-{socket.gethostname()}-{cls.CONTROLLER_INSTANCE}"
+        return ''
+    
+    @classmethod
+    def get_slow_query_log_path(cls) -> str:
+        """取得慢查詢紀錄檔絕對路徑"""
+        log_path = cls.SLOW_QUERY_LOG_PATH
+        if log_path and not os.path.isabs(log_path):
+            log_path = os.path.join(cls.get_project_root(), log_path)
+        return log_path
+    
     @classmethod
     def print_config(cls):
         """印出當前配置"""
@@ -78,6 +271,7 @@ class Config:
         print(f"   Web Server: {cls.WEB_SERVER_URL}")
         print(f"   溫度閾值: {cls.TEMP_THRESHOLD}°C")
         print(f"   濕度閾值: {cls.HUMIDITY_THRESHOLD}%")
+        print(f"   環形緩衝區: {cls.get_ring_buffer_path() if cls.RING_BUFFER_ENABLED else '停用'}")
 
 if __name__ == "__main__":
     Config.print_config() 
\ No newline at end of file
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+asyncio 控制器引擎
+MQTT 客戶端、資料庫寫入與 Web Server 通知都在同一個事件迴圈上進行：
+
+- MQTT: paho 的 socket 交由事件迴圈監聽（add_reader / add_writer），不啟動 paho 的背景執行緒
+- 解析與警報判斷: 在事件迴圈中依到達順序批次處理
+- 資料庫: 每批讀數與警報以一次交易寫入，透過單一執行緒的 executor 執行（SQLite 只允許一個寫入者）
+- 通知: 共用連線池的 httpx.AsyncClient，同時進行的通知數以 NOTIFY_CONCURRENCY 限制
+  （NOTIFY_BATCH_WINDOW > 0 時，時間窗內的警報合併成一次 /api/alerts/notify/batch 請求）
+  （設定 CHANNEL_SOCKET_PATH 時改由常駐通道送出，並推送新讀數）
+
+待處理的訊息超過 INGEST_QUEUE_SIZE 時暫停讀取 socket，由 TCP 背壓讓 Broker 保留訊息。
+
+使用方式:
+    CONTROLLER_ENGINE=asyncio uv run controller/controller.py
+"""
+
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+import paho.mqtt.client as mqtt
+
+# 加入專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from common.alert_pipeline import build_alert_data, get_device_id
+from controller import EnvironmentController
+import metrics
+
+
+class AsyncEnvironmentController(EnvironmentController):
+    """以 asyncio 事件迴圈運行的控制器，連線設定、統計與警報流程沿用 EnvironmentController"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        參數:
+        - transport: httpx.AsyncClient 使用的 transport（測試時可替換）
+        """
+        super().__init__()
+        # 接收佇列與阻塞式 HTTP 客戶端由事件迴圈取代
+        self.ingest_queues = []
+        self._transport = transport
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.async_http: Optional[httpx.AsyncClient] = None
+        self._db_executor: Optional[ThreadPoolExecutor] = None
+        self._socket = None
+        self._reading_paused = False
+        self._running = False
+
+        # 待處理的 MQTT 訊息（由 on_message 放入，處理工作取出）
+        self._pending: List[Tuple[str, bytes]] = []
+        self._pending_event: Optional[asyncio.Event] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._notify_limit: Optional[asyncio.Semaphore] = None
+        self._notify_tasks: Set[asyncio.Task] = set()
+        # 批次通知：等待送出的警報與時間窗結束時的送出排程
+        self._notify_buffer: List[Dict[str, Any]] = []
+        self._notify_flush: Optional[asyncio.TimerHandle] = None
+        self._tasks: List[asyncio.Task] = []
+
+        # 同時進行中的通知數（目前值與最高值）
+        self.notify_in_flight = 0
+        self.notify_in_flight_max = 0
+
+    # ---- MQTT socket 與事件迴圈整合 ----
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._socket = sock
+        self._reading_paused = False
+        self.loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        if not self._reading_paused:
+            self.loop.remove_reader(sock)
+        self._socket = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    def _pause_reading(self):
+        """待處理訊息過多時停止讀取 socket"""
+        if self._socket is not None and not self._reading_paused:
+            self.loop.remove_reader(self._socket)
+            self._reading_paused = True
+
+    def _resume_reading(self):
+        if self._socket is not None and self._reading_paused:
+            self.loop.add_reader(self._socket, self.client.loop_read)
+            self._reading_paused = False
+
+    async def _mqtt_maintenance(self):
+        """定期執行 paho 的 keepalive 與重送，斷線時重新連線"""
+        delay = 1.0
+        while self._running:
+            if self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+                try:
+                    self.client.reconnect()
+                    delay = 1.0
+                except OSError as e:
+                    print(f"⚠️ 重新連線失敗: {e}，{delay:.0f} 秒後重試")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+                    continue
+            await asyncio.sleep(1.0)
+
+    # ---- 訊息處理 ----
+
+    def on_message(self, client, userdata, msg):
+        """接收 MQTT 訊息回調（在事件迴圈中執行）"""
+        metrics.MESSAGES_RECEIVED.inc()
+        metrics.ingest_rate.mark()
+        self._pending.append((msg.topic, msg.payload))
+        self._pending_event.set()
+        if len(self._pending) >= Config.INGEST_QUEUE_SIZE:
+            self._pause_reading()
+
+    async def _processor(self):
+        """依到達順序解析一批訊息並判斷警報，交給寫入工作"""
+        while True:
+            if not self._pending:
+                if not self._running:
+                    break
+                await self._pending_event.wait()
+                self._pending_event.clear()
+                continue
+            batch, self._pending = self._pending, []
+            self._resume_reading()
+
+            rows = []
+            alerts = []
+            for topic, payload in batch:
+                start = time.perf_counter()
+                try:
+                    data = json.loads(payload)
+                    temp = data.get('temp', 0)
+                    humidity = data.get('humidity', 0)
+                    device = get_device_id(topic, data)
+                    evaluated = self.alert_pipeline.evaluate(device, temp, humidity, time.monotonic())
+                except (ValueError, TypeError, AttributeError) as e:
+                    metrics.MESSAGES_PROCESSED.inc('decode_error' if isinstance(e, ValueError) else 'error')
+                    continue
+                finally:
+                    metrics.PROCESS_DURATION.observe(time.perf_counter() - start)
+                rows.append((temp, humidity, data.get('timestamp', '')))
+                for alert in evaluated:
+                    alerts.append(build_alert_data(alert, data, datetime.utcnow().isoformat() + "Z", device))
+            # 寫入佇列有上限，寫入落後時暫停處理（訊息累積到上限後停止讀取 socket）
+            await self._write_queue.put((rows, alerts))
+
+    async def _writer(self):
+        """以單一執行緒的 executor 寫入資料庫，完成後更新環形緩衝區並發送通知"""
+        while True:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+            rows, alerts = item
+            start = time.perf_counter()
+            first_id = await self.loop.run_in_executor(self._db_executor, self.db.save_batch, rows, alerts)
+            metrics.DB_WRITE_DURATION.observe(time.perf_counter() - start, 'batch')
+            if first_id is None:
+                metrics.MESSAGES_PROCESSED.inc('error', amount=len(rows))
+                continue
+
+            self.message_count += len(rows)
+            metrics.MESSAGES_PROCESSED.inc('ok', amount=len(rows))
+            if self.ring_buffer:
+                for offset, (temp, humidity, timestamp) in enumerate(rows):
+                    self.ring_buffer.append(first_id + offset, temp, humidity, timestamp)
+            self.publish_readings(first_id, rows)
+
+            for alert_data in alerts:
+                self.alert_count += 1
+                metrics.ALERTS_EMITTED.inc(alert_data['alert_type'])
+                print(f"🚨 警報 #{self.alert_count}: {alert_data['message']}")
+                if Config.NOTIFY_BATCH_WINDOW > 0:
+                    self._queue_notification(alert_data)
+                elif self.server_channel:
+                    # 只排入通道的待寫佇列，由通道的寫入執行緒寫入 socket
+                    self.server_channel.send('alerts', [alert_data])
+                else:
+                    self._spawn_notify(self._notify("/api/alerts/notify", alert_data))
+
+    def _spawn_notify(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    def _queue_notification(self, alert_data: Dict[str, Any]):
+        """加入批次通知：累積到 NOTIFY_BATCH_MAX 則時立即送出，否則在時間窗結束時送出"""
+        self._notify_buffer.append(alert_data)
+        if len(self._notify_buffer) >= Config.NOTIFY_BATCH_MAX:
+            self._flush_notifications()
+        elif self._notify_flush is None:
+            self._notify_flush = self.loop.call_later(Config.NOTIFY_BATCH_WINDOW, self._flush_notifications)
+
+    def _flush_notifications(self):
+        """送出累積的批次通知"""
+        if self._notify_flush is not None:
+            self._notify_flush.cancel()
+            self._notify_flush = None
+        alerts, self._notify_buffer = self._notify_buffer, []
+        if alerts and self.server_channel:
+            metrics.NOTIFY_BATCH_SIZE.observe(len(alerts))
+            self.server_channel.send('alerts', alerts)
+        elif alerts:
+            metrics.NOTIFY_BATCH_SIZE.observe(len(alerts))
+            self._spawn_notify(self._notify("/api/alerts/notify/batch", {"alerts": alerts}))
+
+    async def _notify(self, path: str, payload: Dict[str, Any]):
+        """發送警報通知（單則或批次）到 Web Server"""
+        async with self._notify_limit:
+            self.notify_in_flight += 1
+            self.notify_in_flight_max = max(self.notify_in_flight_max, self.notify_in_flight)
+            start = time.perf_counter()
+            try:
+                response = await self.async_http.post(f"{Config.WEB_SERVER_URL}{path}", json=payload)
+                if response.status_code != 200:
+                    metrics.NOTIFY_FAILURES.inc('http_status')
+                    print(f"   通知: ⚠️ Web Server 回應異常 (狀態碼: {response.status_code})")
+                elif 'alerts' in payload:
+                    rejected = response.json().get('rejected', 0)
+                    if rejected:
+                        metrics.NOTIFY_FAILURES.inc('rejected', amount=rejected)
+                        print(f"   通知: ⚠️ Web Server 略過 {rejected} 則不合格的警報")
+            except httpx.ConnectError:
+                metrics.NOTIFY_FAILURES.inc('connect')
+                print(f"   通知: ❌ 無法連接到 Web Server ({Config.WEB_SERVER_URL})")
+            except httpx.TimeoutException:
+                metrics.NOTIFY_FAILURES.inc('timeout')
+                print("   通知: ❌ 請求超時")
+            except httpx.HTTPError as e:
+                metrics.NOTIFY_FAILURES.inc('other')
+                print(f"   通知: ❌ 發送失敗: {e}")
+            finally:
+                self.notify_in_flight -= 1
+                metrics.NOTIFY_DURATION.observe(time.perf_counter() - start)
+
+    # ---- 生命週期 ----
+
+    async def start(self):
+        """在目前的事件迴圈上連接 MQTT Broker 並啟動處理工作"""
+        self.loop = asyncio.get_running_loop()
+        self._running = True
+        self._pending_event = asyncio.Event()
+        self._write_queue = asyncio.Queue(maxsize=2)
+        self._notify_limit = asyncio.Semaphore(Config.NOTIFY_CONCURRENCY)
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.async_http = httpx.AsyncClient(
+            timeout=5.0,
+            transport=self._transport,
+            limits=httpx.Limits(
+                max_connections=Config.NOTIFY_CONCURRENCY,
+                max_keepalive_connections=Config.NOTIFY_CONCURRENCY
+            )
+        )
+
+        if self.server_channel:
+            self.server_channel.start()
+
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        print(f"🔗 正在連接到 MQTT Broker: {Config.MQTT_BROKER}:{Config.MQTT_PORT}")
+        self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
+        self._tasks = [
+            asyncio.create_task(self._mqtt_maintenance()),
+            asyncio.create_task(self._processor()),
+            asyncio.create_task(self._writer())
+        ]
+
+    async def stop(self):
+        """停止接收，處理完剩餘訊息與通知後關閉連線"""
+        self.client.disconnect()
+        self._running = False
+        maintenance, processor, writer = self._tasks
+        maintenance.cancel()
+        self._pending_event.set()
+        await processor
+        await self._write_queue.put(None)
+        await writer
+        self._flush_notifications()
+        if self._notify_tasks:
+            await asyncio.gather(*self._notify_tasks, return_exceptions=True)
+        await self.async_http.aclose()
+        if self.server_channel:
+            # 等待未確認的訊框時不阻塞事件迴圈
+            await self.loop.run_in_executor(None, self.server_channel.close)
+        self._db_executor.shutdown(wait=True)
+        self.db.flush_sketches()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        if self.ring_buffer:
+            self.ring_buffer.close()
+
+    def connect(self):
+        """asyncio 引擎請使用 start()"""
+        raise RuntimeError("AsyncEnvironmentController 需在事件迴圈中以 await start() 連線")
+
+    async def run_async(self):
+        """主運行循環：每 30 秒顯示統計，收到 SIGINT / SIGTERM 後停止"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        try:
+            await self.start()
+        except OSError as e:
+            print(f"❌ 連接 MQTT Broker 失敗: {e}")
+            return
+
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=30)
+            except asyncio.TimeoutError:
+                print(
+                    f"📈 統計: 收到 {self.message_count} 筆數據, 觸發 {self.alert_count} 次警報, "
+                    f"進行中通知 {self.notify_in_flight} (最高 {self.notify_in_flight_max})"
+                )
+
+        print("\n🛑 控制器已停止")
+        await self.stop()
+        print(f"📊 最終統計: 收到 {self.message_count} 筆數據, 觸發 {self.alert_count} 次警報")
+
+    def run(self):
+        """啟動 asyncio 引擎"""
+        print("🚀 啟動環境監控控制器（asyncio 引擎）...")
+        print(f"📋 訂閱 Topic: {Config.get_mqtt_subscription()}")
+        print(f"🌐 Web Server URL: {Config.WEB_SERVER_URL}（同時通知上限 {Config.NOTIFY_CONCURRENCY}）")
+        print(f"💾 資料庫路徑: {self.db.db_path}")
+        print("-" * 50)
+
+        if Config.CONTROLLER_METRICS_ENABLED:
+            try:
+                self.metrics_server = metrics.start_metrics_server(
+                    Config.CONTROLLER_METRICS_HOST, Config.CONTROLLER_METRICS_PORT
+                )
+                print(f"📈 監控指標: http://{Config.CONTROLLER_METRICS_HOST}:{Config.CONTROLLER_METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"⚠️ 無法啟動監控指標伺服器: {e}")
+
+        asyncio.run(self.run_async())
+
+
+if __name__ == "__main__":
+    AsyncEnvironmentController().run()
@@ -7,20 +7,27 @@
 import json
 import os
 import sys
+import threading
 import time
+import zlib
 from datetime import datetime
 import paho.mqtt.client as mqtt
-import httpx
 
 # 添加專案根目錄到 Python 路徑，以便導入 config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
 from database import DatabaseManager
+from common.alert_pipeline import AlertPipeline, build_alert_data, get_device_id, routing_key
+from ingest_queue import IngestQueue
+from notify_batcher import NotifyBatcher
+from common.stream_channel import ChannelClient
+import metrics
+from data.ring_buffer import RingBufferLocked, RingBufferWriter
 
 class EnvironmentController:
     def __init__(self):
         """初始化環境控制器"""
-        self.client = mqtt.Client()
+        self.client = self.create_mqtt_client()
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
@@ -28,25 +35,133 @@ class EnvironmentController:
         # 初始化資料庫管理器
         self.db = DatabaseManager()
         
-        # 初始化 HTTP 客戶端（用於通知 Web Server）
-        self.http_client = httpx.Client(timeout=5.0)
+        # 初始化最近讀數環形緩衝區（供 Web Server 直接讀取最新讀數）
+        # 緩衝區只有一個寫入端：已由其他控制器（共享訂閱的其他實例）寫入時，
+        # 本控制器的讀數只寫入資料庫並提高 external_id，Web Server 會改查資料庫
+        self.ring_buffer = None
+        if Config.RING_BUFFER_ENABLED:
+            try:
+                self.ring_buffer = RingBufferWriter(
+                    Config.get_ring_buffer_path(),
+                    capacity=Config.RING_BUFFER_CAPACITY
+                )
+            except RingBufferLocked:
+                print("⚠️ 環形緩衝區已由其他控制器寫入，本控制器的讀數只寫入資料庫")
+                self.db.external_ring = Config.get_ring_buffer_path()
         
-        # 統計數據
+        # 初始化警報判斷流程（閾值規則、串流異常偵測、警報生命週期）
+        self.alert_pipeline = AlertPipeline()
+        self.anomaly_detector = self.alert_pipeline.anomaly_detector
+        self.alert_tracker = self.alert_pipeline.alert_tracker
+        
+        # HTTP 客戶端（用於通知 Web Server）在第一次發送通知時才建立：
+        # 載入 httpx / httpcore 與建立 SSL 設定約佔初始化時間的九成，多數時候用不到
+        self._http_client = None
+        self._http_client_lock = threading.Lock()
+        
+        # Controller → Web Server 常駐通道（設定 CHANNEL_SOCKET_PATH 時取代 HTTP 通知，並推送新讀數）
+        self.server_channel = None
+        if Config.CHANNEL_SOCKET_PATH:
+            self.server_channel = ChannelClient(Config.get_channel_socket_path(), Config.CHANNEL_MAX_PENDING)
+        
+        # 批次通知：時間窗內的警報以一次 /api/alerts/notify/batch 請求送出
+        self.notify_batcher = None
+        if Config.NOTIFY_BATCH_WINDOW > 0:
+            self.notify_batcher = NotifyBatcher(
+                self.send_alerts_to_server, Config.NOTIFY_BATCH_WINDOW, Config.NOTIFY_BATCH_MAX
+            )
+        
+        # 初始化接收佇列：MQTT 回調只負責放入佇列，由處理執行緒解析與寫入
+        # 依裝置（優先使用 payload 的 device_id）分區，同一裝置的讀數固定由同一個執行緒依序處理
+        self.ingest_queues = []
+        self.ingest_workers = []
+        if Config.INGEST_QUEUE_ENABLED:
+            self.ingest_queues = [
+                IngestQueue(
+                    maxsize=Config.INGEST_QUEUE_SIZE,
+                    policy=Config.INGEST_OVERLOAD_POLICY,
+                    coalesce=Config.INGEST_COALESCE,
+                    pressure_ratio=Config.INGEST_PRESSURE_RATIO,
+                    sample_every=Config.INGEST_SAMPLE_EVERY
+                )
+                for _ in range(max(1, Config.INGEST_WORKERS))
+            ]
+        self._ring_lock = threading.Lock()
+        
+        # 內嵌的 /metrics HTTP 伺服器
+        self.metrics_server = None
+        self._has_connected = False
+        metrics.registry.gauge(
+            'controller_mqtt_connected', 'MQTT 是否連線中',
+            callback=lambda: int(self.client.is_connected())
+        )
+        if self.server_channel:
+            metrics.registry.gauge(
+                'controller_channel_connected', 'Web Server 通道是否連線中',
+                callback=lambda: int(self.server_channel.connected)
+            )
+            metrics.registry.gauge(
+                'controller_channel_pending', 'Web Server 通道尚未確認的訊框數',
+                callback=lambda: self.server_channel.pending
+            )
+        metrics.registry.gauge(
+            'controller_ingest_queue_depth', '接收佇列目前深度',
+            callback=lambda: sum(len(queue) for queue in self.ingest_queues)
+        )
+        metrics.registry.counter(
+            'controller_ingest_queue_dropped_total', '接收佇列累計丟棄數（含取樣丟棄）',
+            callback=lambda: sum(queue.dropped + queue.sampled_out for queue in self.ingest_queues)
+        )
+        metrics.registry.counter(
+            'controller_ingest_queue_coalesced_total', '接收佇列累計合併數',
+            callback=lambda: sum(queue.coalesced for queue in self.ingest_queues)
+        )
+        metrics.registry.gauge(
+            'controller_ingest_queue_dwell_max_seconds', '接收佇列最長等待時間',
+            callback=lambda: max((queue.dwell_max for queue in self.ingest_queues), default=0.0)
+        )
+        
+        # 統計數據（多個處理執行緒同時更新）
         self.message_count = 0
         self.alert_count = 0
+        self._stats_lock = threading.Lock()
+        
+    def create_mqtt_client(self):
+        """
+        建立 MQTT 客戶端
+
+        - 持久化 session: 使用固定 client id 且 clean_session=False，
+          斷線期間 Broker 會保留訂閱並暫存 QoS 1 訊息，重新連線後補送
+        - 流量控制: 未確認訊息數上限（max_inflight）與送出佇列上限（max_queued）
+        """
+        client = mqtt.Client(
+            client_id=Config.get_mqtt_client_id(),
+            clean_session=not Config.MQTT_PERSISTENT_SESSION
+        )
+        client.max_inflight_messages_set(Config.MQTT_MAX_INFLIGHT)
+        client.max_queued_messages_set(Config.MQTT_MAX_QUEUED)
+        return client
         
     def on_connect(self, client, userdata, flags, rc):
         """MQTT 連接成功回調"""
         if rc == 0:
+            metrics.MQTT_CONNECTS.inc()
+            if self._has_connected:
+                metrics.MQTT_RECONNECTS.inc()
+            self._has_connected = True
             print(f"✅ 控制器已連接到 MQTT Broker: {Config.MQTT_BROKER}:{Config.MQTT_PORT}")
-            # 訂閱感測器數據 topic
-            client.subscribe(Config.MQTT_TOPIC, qos=1)
-            print(f"📡 已訂閱 Topic: {Config.MQTT_TOPIC}")
+            if flags.get('session present'):
+                print("♻️ 沿用 Broker 上的持久化 session")
+            # 訂閱感測器數據 topic（共享訂閱時，群組內的控制器輪流分配訊息）
+            subscription = Config.get_mqtt_subscription()
+            client.subscribe(subscription, qos=Config.MQTT_SUBSCRIBE_QOS)
+            print(f"📡 已訂閱 Topic: {subscription}")
         else:
             print(f"❌ 連接失敗，錯誤碼: {rc}")
             
     def on_disconnect(self, client, userdata, rc):
         """MQTT 斷線回調"""
+        metrics.MQTT_DISCONNECTS.inc('false' if rc != 0 else 'true')
         if rc != 0:
             print(f"⚠️ 意外斷線，錯誤碼: {rc}")
         else:
@@ -54,128 +169,255 @@ class EnvironmentController:
             
     def on_message(self, client, userdata, msg):
         """接收 MQTT 訊息回調"""
+        metrics.MESSAGES_RECEIVED.inc()
+        metrics.ingest_rate.mark()
+        if self.ingest_queues:
+            # 以裝置為分區與合併的鍵：同一個 topic 可能承載多個裝置（閘道器），不同 topic 也可能是同一裝置
+            device = routing_key(msg.topic, msg.payload)
+            queue = self.ingest_queues[zlib.crc32(device.encode('utf-8')) % len(self.ingest_queues)]
+            queue.put(device, (msg.topic, msg.payload))
+        else:
+            self.process_message(msg.topic, msg.payload)
+            
+    def _ingest_worker(self, queue):
+        """處理執行緒：從接收佇列取出訊息並處理"""
+        while True:
+            entry = queue.get(timeout=1.0)
+            if entry is None:
+                if queue.closed:
+                    break
+                continue
+            _, (topic, payload) = entry
+            self.process_message(topic, payload)
+            
+    def process_message(self, topic, payload):
+        """解析、儲存感測器數據並處理警報"""
+        start = time.perf_counter()
         try:
             # 解析 JSON 數據
-            data = json.loads(msg.payload.decode('utf-8'))
-            self.message_count += 1
+            data = json.loads(payload.decode('utf-8'))
+            decoded = time.perf_counter()
+            metrics.JSON_DECODE_DURATION.observe(decoded - start)
+            with self._stats_lock:
+                self.message_count += 1
+                message_number = self.message_count
             
             # 提取數據
             temp = data.get('temp', 0)
             humidity = data.get('humidity', 0)
             timestamp = data.get('timestamp', '')
             
-            print(f"📊 收到數據 #{self.message_count}")
+            print(f"📊 收到數據 #{message_number}")
             print(f"   溫度: {temp}°C, 濕度: {humidity}%")
             print(f"   時間: {timestamp}")
             
             # 儲存感測器數據到資料庫
-            if self.db.save_sensor_reading(data):
+            with metrics.DB_WRITE_DURATION.time('reading'):
+                reading_id = self.db.save_sensor_reading(data)
+            if reading_id:
                 print("   儲存: ✅ 已寫入資料庫")
+                self._append_ring(reading_id, temp, humidity, timestamp)
+                self.publish_readings(reading_id, [(temp, humidity, timestamp)])
             else:
                 print("   儲存: ❌ 寫入資料庫失敗")
             
             # 檢查警報條件
-            alerts = self.check_alerts(temp, humidity)
+            evaluation_start = time.perf_counter()
+            device = self.get_device_id(topic, data)
+            alerts = self.alert_pipeline.evaluate(device, temp, humidity, time.monotonic())
+            metrics.ALERT_EVALUATION_DURATION.observe(time.perf_counter() - evaluation_start)
             
             # 處理警報
             if alerts:
-                self.handle_alerts(alerts, data)
+                self.handle_alerts(alerts, data, device)
             else:
                 print("   狀態: ✅ 正常")
                 
             print("-" * 50)
+            metrics.MESSAGES_PROCESSED.inc('ok')
             
         except json.JSONDecodeError as e:
+            metrics.MESSAGES_PROCESSED.inc('decode_error')
             print(f"❌ JSON 解析錯誤: {e}")
         except Exception as e:
+            metrics.MESSAGES_PROCESSED.inc('error')
             print(f"❌ 處理訊息時發生錯誤: {e}")
+        finally:
+            metrics.PROCESS_DURATION.observe(time.perf_counter() - start)
             
-    def check_alerts(self, temp, humidity):
-        """檢查警報條件"""
-        alerts = []
-        
-        # 檢查溫度警報
-        if temp > Config.TEMP_THRESHOLD:
-            alerts.append({
-                'type': 'high_temperature',
-                'message': f'高溫警報！當前溫度 {temp}°C 超過閾值 {Config.TEMP_THRESHOLD}°C',
-                'severity': 'warning'
-            })
-            
-        # 檢查濕度警報
-        if humidity < Config.HUMIDITY_THRESHOLD:
-            alerts.append({
-                'type': 'low_humidity',
-                'message': f'低濕度警報！當前濕度 {humidity}% 低於閾值 {Config.HUMIDITY_THRESHOLD}%',
-                'severity': 'warning'
-            })
-            
-        return alerts
-        
-    def handle_alerts(self, alerts, data):
+    def _append_ring(self, reading_id, temp, humidity, timestamp):
+        """寫入環形緩衝區；失敗時只記錄，不影響之後的警報判斷（Web Server 會改查資料庫）"""
+        if not self.ring_buffer:
+            return
+        try:
+            with self._ring_lock:
+                self.ring_buffer.append(reading_id, temp, humidity, timestamp)
+        except Exception as e:
+            print(f"   緩衝區: ❌ 寫入環形緩衝區失敗: {e}")
+            
+    def get_device_id(self, topic, data):
+        """取得裝置識別碼：優先使用數據中的 device_id，否則取自 topic (env/<device>/reading)"""
+        return get_device_id(topic, data)
+            
+    def handle_alerts(self, alerts, data, device=None):
         """處理警報"""
-        self.alert_count += len(alerts)
+        with self._stats_lock:
+            self.alert_count += len(alerts)
+            alert_number = self.alert_count - len(alerts)
         
         for alert in alerts:
-            print(f"🚨 警報 #{self.alert_count}: {alert['message']}")
+            alert_number += 1
+            print(f"🚨 警報 #{alert_number}: {alert['message']}")
+            metrics.ALERTS_EMITTED.inc(alert['type'])
             
             # 準備警報資料
-            alert_data = {
-                'alert_type': alert['type'],
-                'severity': alert['severity'],
-                'message': alert['message'],
-                'timestamp': datetime.utcnow().isoformat() + "Z",
-                'sensor_data': data
-            }
+            alert_data = build_alert_data(alert, data, datetime.utcnow().isoformat() + "Z", device)
             
             # 儲存警報到資料庫
-            if self.db.save_alert(alert_data):
+            with metrics.DB_WRITE_DURATION.time('alert'):
+                saved = self.db.save_alert(alert_data)
+            if saved:
                 print(f"   儲存: ✅ 警報已寫入資料庫")
             else:
                 print(f"   儲存: ❌ 警報寫入資料庫失敗")
             
             # 發送 HTTP 通知到 Web Server
+            self.notify_server(alert_data)
+    
+    @property
+    def http_client(self):
+        """通知 Web Server 用的 httpx.Client（第一次使用時建立）"""
+        if self._http_client is None:
+            with self._http_client_lock:
+                if self._http_client is None:
+                    import httpx
+                    self._http_client = httpx.Client(timeout=5.0)
+        return self._http_client
+    
+    def notify_server(self, alert_data):
+        """通知 Web Server：啟用批次通知時加入批次，否則立即發送（經由常駐通道或 HTTP）"""
+        if self.notify_batcher:
+            self.notify_batcher.add(alert_data)
+        elif self.server_channel:
+            self.server_channel.send('alerts', [alert_data])
+        else:
             self.send_alert_to_server(alert_data)
     
-    def send_alert_to_server(self, alert_data):
-        """發送警報通知到 Web Server"""
+    def publish_readings(self, first_id, rows):
+        """透過常駐通道推送新寫入的讀數（Web Server 不必等到下一次查詢即可推播給 /sse/readings）"""
+        if self.server_channel and rows:
+            self.server_channel.send('readings', [
+                {'id': first_id + offset, 'temp': temp, 'humidity': humidity, 'timestamp': timestamp}
+                for offset, (temp, humidity, timestamp) in enumerate(rows)
+            ])
+    
+    def _post_to_server(self, path, payload):
+        """POST 到 Web Server，失敗時記錄原因；回傳回應（連線失敗時為 None）"""
+        import httpx
+        start = time.perf_counter()
         try:
-            # 構建 API URL
-            api_url = f"{Config.WEB_SERVER_URL}/api/alerts/notify"
-            
-            # 發送 POST 請求
-            response = self.http_client.post(api_url, json=alert_data)
-            
-            if response.status_code == 200:
-                print(f"   通知: ✅ 已發送到 Web Server")
-                print(f"   回應: {response.json().get('message', 'OK')}")
-            else:
+            response = self.http_client.post(f"{Config.WEB_SERVER_URL}{path}", json=payload)
+            if response.status_code != 200:
+                metrics.NOTIFY_FAILURES.inc('http_status')
                 print(f"   通知: ⚠️ Web Server 回應異常 (狀態碼: {response.status_code})")
                 print(f"   錯誤: {response.text}")
-                
+            return response
         except httpx.ConnectError:
+            metrics.NOTIFY_FAILURES.inc('connect')
             print(f"   通知: ❌ 無法連接到 Web Server ({Config.WEB_SERVER_URL})")
         except httpx.TimeoutException:
+            metrics.NOTIFY_FAILURES.inc('timeout')
             print(f"   通知: ⏱️ 連接 Web Server 超時")
         except Exception as e:
+            metrics.NOTIFY_FAILURES.inc('other')
             print(f"   通知: ❌ 發送失敗: {e}")
+        finally:
+            metrics.NOTIFY_DURATION.observe(time.perf_counter() - start)
+        return None
+    
+    def send_alert_to_server(self, alert_data):
+        """發送警報通知到 Web Server"""
+        response = self._post_to_server("/api/alerts/notify", alert_data)
+        if response is not None and response.status_code == 200:
+            print(f"   通知: ✅ 已發送到 Web Server")
+            print(f"   回應: {response.json().get('message', 'OK')}")
+    
+    def send_alerts_to_server(self, alerts):
+        """以一次請求發送多則警報通知到 Web Server"""
+        metrics.NOTIFY_BATCH_SIZE.observe(len(alerts))
+        if self.server_channel:
+            self.server_channel.send('alerts', alerts)
+            return
+        response = self._post_to_server("/api/alerts/notify/batch", {"alerts": alerts})
+        if response is not None and response.status_code == 200:
+            result = response.json()
+            print(f"   通知: ✅ {result.get('broadcast', len(alerts))} 則警報已批次發送到 Web Server")
+            if result.get('rejected'):
+                metrics.NOTIFY_FAILURES.inc('rejected', amount=result['rejected'])
+                print(f"   錯誤: {result.get('errors')}")
         
     def connect(self):
         """連接到 MQTT Broker"""
         try:
             print(f"🔗 正在連接到 MQTT Broker: {Config.MQTT_BROKER}:{Config.MQTT_PORT}")
             self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
+            self.start_workers()
             self.client.loop_start()
             return True
         except Exception as e:
             print(f"❌ 連接 MQTT Broker 失敗: {e}")
             return False
             
+    def start_workers(self):
+        """啟動接收佇列的處理執行緒"""
+        if self.notify_batcher:
+            self.notify_batcher.start()
+        if self.server_channel:
+            self.server_channel.start()
+        for i, queue in enumerate(self.ingest_queues):
+            worker = threading.Thread(
+                target=self._ingest_worker,
+                args=(queue,),
+                name=f"ingest-worker-{i}",
+                daemon=True
+            )
+            worker.start()
+            self.ingest_workers.append(worker)
+            
+    def get_queue_stats(self):
+        """彙總所有接收佇列的統計資訊"""
+        stats = [queue.get_stats() for queue in self.ingest_queues]
+        dequeued = sum(s['dequeued'] for s in stats)
+        return {
+            'depth': sum(s['depth'] for s in stats),
+            'max_depth': max((s['max_depth'] for s in stats), default=0),
+            'dropped': sum(s['dropped'] for s in stats),
+            'coalesced': sum(s['coalesced'] for s in stats),
+            'sampled_out': sum(s['sampled_out'] for s in stats),
+            'blocked': sum(s['blocked'] for s in stats),
+            'dwell_avg': sum(s['dwell_avg'] * s['dequeued'] for s in stats) / dequeued if dequeued else 0.0,
+            'dwell_max': max((s['dwell_max'] for s in stats), default=0.0)
+        }
+        
     def disconnect(self):
         """斷開 MQTT 連接並關閉 HTTP 客戶端"""
         self.client.loop_stop()
         self.client.disconnect()
-        self.http_client.close()
+        for queue in self.ingest_queues:
+            queue.close()
+        for worker in self.ingest_workers:
+            worker.join(timeout=5.0)
+        self.db.flush_sketches()
+        if self.notify_batcher:
+            self.notify_batcher.close()
+        if self.server_channel:
+            self.server_channel.close()
+        if self._http_client is not None:
+            self._http_client.close()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+        if self.ring_buffer:
+            self.ring_buffer.close()
         
     def get_stats(self):
         """取得統計資訊"""
@@ -187,20 +429,35 @@ class EnvironmentController:
             'db_total_readings': db_stats['total_readings'],
             'db_total_alerts': db_stats['total_alerts'],
             'db_today_readings': db_stats['today_readings'],
-            'db_today_alerts': db_stats['today_alerts']
+            'db_today_alerts': db_stats['today_alerts'],
+            'queue': self.get_queue_stats()
         }
         
     def run(self):
         """主運行循環"""
         print("🚀 啟動環境監控控制器...")
         print(f"📡 目標 MQTT Broker: {Config.MQTT_BROKER}:{Config.MQTT_PORT}")
-        print(f"📋 訂閱 Topic: {Config.MQTT_TOPIC}")
+        print(f"📋 訂閱 Topic: {Config.get_mqtt_subscription()}")
+        if Config.MQTT_PERSISTENT_SESSION:
+            print(f"🪪 持久化 session, client id: {Config.get_mqtt_client_id()}")
         print(f"🌐 Web Server URL: {Config.WEB_SERVER_URL}")
         print(f"🚨 溫度閾值: {Config.TEMP_THRESHOLD}°C")
         print(f"🚨 濕度閾值: {Config.HUMIDITY_THRESHOLD}%")
+        print(f"🔍 異常偵測: {'啟用' if self.anomaly_detector else '停用'}")
+        if self.ingest_queues:
+            print(f"📥 接收佇列: {len(self.ingest_queues)} x {Config.INGEST_QUEUE_SIZE} 筆, 過載策略 {Config.INGEST_OVERLOAD_POLICY}")
         print(f"💾 資料庫路徑: {self.db.db_path}")
         print("-" * 50)
         
+        if Config.CONTROLLER_METRICS_ENABLED:
+            try:
+                self.metrics_server = metrics.start_metrics_server(
+                    Config.CONTROLLER_METRICS_HOST, Config.CONTROLLER_METRICS_PORT
+                )
+                print(f"📈 監控指標: http://{Config.CONTROLLER_METRICS_HOST}:{Config.CONTROLLER_METRICS_PORT}/metrics")
+            except OSError as e:
+                print(f"⚠️ 無法啟動監控指標伺服器: {e}")
+        
         if not self.connect():
             return
             
@@ -211,6 +468,13 @@ class EnvironmentController:
                 stats = self.get_stats()
                 print(f"📈 統計: 收到 {stats['message_count']} 筆數據, 觸發 {stats['alert_count']} 次警報")
                 print(f"💾 資料庫: 總計 {stats['db_total_readings']} 筆讀數, {stats['db_total_alerts']} 筆警報")
+                if self.ingest_queues:
+                    queue = stats['queue']
+                    print(
+                        f"📥 佇列: 深度 {queue['depth']} (最高 {queue['max_depth']}), "
+                        f"丟棄 {queue['dropped'] + queue['sampled_out']}, 合併 {queue['coalesced']}, "
+                        f"平均等待 {queue['dwell_avg'] * 1000:.1f} ms"
+                    )
                 
         except KeyboardInterrupt:
             print("\n🛑 控制器已停止")
@@ -220,5 +484,14 @@ class EnvironmentController:
             self.disconnect()
 
 if __name__ == "__main__":
-    controller = EnvironmentController()
+    if Config.CONTROLLER_PROCESSES > 1:
+        # 多行程模式：由 supervisor 依裝置分派給 worker 行程
+        from supervisor import SupervisedController
+        controller = SupervisedController(Config.CONTROLLER_PROCESSES)
+    elif Config.CONTROLLER_ENGINE == 'asyncio':
+        # asyncio 引擎：MQTT、資料庫寫入與通知在同一個事件迴圈上進行
+        from async_engine import AsyncEnvironmentController
+        controller = AsyncEnvironmentController()
+    else:
+        controller = EnvironmentController()
     controller.run() 
\ No newline at end of file
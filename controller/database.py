@@ -8,13 +8,36 @@ import sqlite3
 import json
 import os
 import sys
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 # 加入專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
+from common.query_profiler import ProfilingConnection, profiler
+from common.quantile_sketch import HourlySketches, merge_into_db
+from data.init_db import migrate
+from data.ring_buffer import mark_external_write
+
+# 警報記錄的寫入敘述（單筆與批次共用）
+ALERT_INSERT_SQL = '''
+    INSERT INTO alert_history 
+    (alert_type, severity, message, sensor_data, timestamp, temp, humidity, device_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 回補歷史資料的寫入敘述：created_at 使用原始時間（None 時為寫入時間）
+READING_BACKFILL_SQL = '''
+    INSERT INTO sensor_readings (temp, humidity, timestamp, created_at)
+    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+'''
+ALERT_BACKFILL_SQL = '''
+    INSERT INTO alert_history 
+    (alert_type, severity, message, sensor_data, timestamp, temp, humidity, device_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+'''
 
 class DatabaseManager:
     def __init__(self, db_path: Optional[str] = None):
@@ -24,42 +47,44 @@ class DatabaseManager:
         else:
             # 使用 config.py 的 get_db_path 方法
             self.db_path = Config.get_db_path(__file__)
+        
+        # 查詢分析（選用）：記錄每個 SQL 敘述的耗時並寫入慢查詢紀錄
+        self.connection_factory = sqlite3.Connection
+        if Config.QUERY_PROFILING_ENABLED:
+            profiler.configure(True, Config.SLOW_QUERY_THRESHOLD_MS / 1000, Config.get_slow_query_log_path())
+            self.connection_factory = ProfilingConnection
+            
+        # 每小時的分位數草圖：寫入讀數時累積，每 SKETCH_FLUSH_INTERVAL 秒合併進資料庫
+        self.sketches = HourlySketches(Config.SKETCH_RELATIVE_ACCURACY) if Config.SKETCH_ENABLED else None
+        self._sketches_flushed_at = time.monotonic()
+        
+        # 不經過環形緩衝區的寫入端（離線重播）設定緩衝區路徑，寫入讀數時提高緩衝區標頭的 external_id，
+        # Web Server 就不會以緩衝區中較舊的讀數回答最新讀數
+        self.external_ring: Optional[str] = None
             
-        # 檢查資料庫是否存在，如果不存在則初始化
+        # 檢查資料庫是否存在，如果不存在則初始化；已存在則套用尚未執行的 schema 遷移
         if not os.path.exists(self.db_path):
             self._init_database()
+        else:
+            migrate(self.db_path)
             
     def _init_database(self):
         """初始化資料庫（內部方法）"""
         print(f"🔄 資料庫不存在，正在初始化: {self.db_path}")
         
-        # 確保 data 目錄存在
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        
-        # 讀取 schema 檔案
-        schema_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'schema.sql')
-        
         try:
-            with open(schema_file, 'r', encoding='utf-8') as f:
-                schema_sql = f.read()
-        except FileNotFoundError:
-            print(f"❌ Schema 檔案不存在: {schema_file}")
+            migrate(self.db_path)
+        except FileNotFoundError as e:
+            print(f"❌ Schema 檔案不存在: {e.filename}")
             print("💡 請先執行: uv run data/init_db.py")
-            raise FileNotFoundError(f"Schema 檔案不存在: {schema_file}")
-        
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 執行 schema SQL
-            cursor.executescript(schema_sql)
-            conn.commit()
+            raise
             
         print(f"✅ 資料庫初始化完成: {self.db_path}")
             
-    def save_sensor_reading(self, data: Dict[str, Any]) -> bool:
-        """儲存感測器讀數"""
+    def save_sensor_reading(self, data: Dict[str, Any]) -> Optional[int]:
+        """儲存感測器讀數，成功時回傳新增資料列的 id"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO sensor_readings (temp, humidity, timestamp)
@@ -69,38 +94,165 @@ class DatabaseManager:
                     data.get('humidity', 0),
                     data.get('timestamp', '')
                 ))
+                self._mark_external(cursor.lastrowid)
                 conn.commit()
-                return True
+                reading_id = cursor.lastrowid
+            self._record_sketches([(data.get('temp', 0), data.get('humidity', 0))])
+            return reading_id
         except Exception as e:
             print(f"❌ 儲存感測器讀數失敗: {e}")
-            return False
+            return None
+            
+    def _mark_external(self, last_id: int):
+        """提交前記錄不經過環形緩衝區寫入的最後一筆讀數 id"""
+        if self.external_ring:
+            mark_external_write(self.external_ring, last_id)
             
+    def _record_sketches(self, rows: List[Tuple]):
+        """將已寫入的 (temp, humidity, ...) 讀數加入草圖，到期時合併進資料庫"""
+        if self.sketches is None or not rows:
+            return
+        self.sketches.add_many(rows)
+        if time.monotonic() - self._sketches_flushed_at >= Config.SKETCH_FLUSH_INTERVAL:
+            self.flush_sketches()
+            
+    def flush_sketches(self) -> int:
+        """
+        將累積的草圖合併進 reading_sketches，回傳合併的草圖數
+
+        多個 controller 可能同時合併同一個小時，讀取與寫回在同一個 IMMEDIATE 交易中進行；
+        失敗時草圖放回記憶體，下次再合併。
+        """
+        if self.sketches is None:
+            return 0
+        self._sketches_flushed_at = time.monotonic()
+        sketches = self.sketches.drain()
+        if not sketches:
+            return 0
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, isolation_level=None, factory=self.connection_factory)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    merge_into_db(conn, sketches)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+            return len(sketches)
+        except Exception as e:
+            print(f"❌ 合併分位數草圖失敗: {e}")
+            self.sketches.restore(sketches)
+            return 0
+            
+    @staticmethod
+    def _alert_row(alert_data: Dict[str, Any]) -> tuple:
+        """將警報資料轉為 alert_history 的資料列"""
+        sensor_data = alert_data.get('sensor_data', {})
+        return (
+            alert_data.get('alert_type', ''),
+            alert_data.get('severity', ''),
+            alert_data.get('message', ''),
+            json.dumps(sensor_data),
+            alert_data.get('timestamp', ''),
+            sensor_data.get('temp'),
+            sensor_data.get('humidity'),
+            alert_data.get('device_id', sensor_data.get('device_id'))
+        )
+        
     def save_alert(self, alert_data: Dict[str, Any]) -> bool:
         """儲存警報記錄"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO alert_history 
-                    (alert_type, severity, message, sensor_data, timestamp)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    alert_data.get('alert_type', ''),
-                    alert_data.get('severity', ''),
-                    alert_data.get('message', ''),
-                    json.dumps(alert_data.get('sensor_data', {})),
-                    alert_data.get('timestamp', '')
-                ))
+                cursor.execute(ALERT_INSERT_SQL, self._alert_row(alert_data))
                 conn.commit()
                 return True
         except Exception as e:
             print(f"❌ 儲存警報記錄失敗: {e}")
             return False
             
+    def save_sensor_readings(self, rows: List[Tuple]) -> int:
+        """
+        在單一交易中批次儲存讀數，回傳寫入筆數
+
+        資料列為 (temp, humidity, timestamp)；回補歷史讀數時為 (temp, humidity, timestamp, created_at)，
+        created_at 為 UTC 'YYYY-MM-DD HH:MM:SS'，分位數草圖也歸入該時間的小時
+        """
+        if not rows:
+            return 0
+        sql = READING_BACKFILL_SQL if len(rows[0]) > 3 else (
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)"
+        )
+        try:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
+                conn.executemany(sql, rows)
+                self._mark_external(conn.execute("SELECT last_insert_rowid()").fetchone()[0])
+                conn.commit()
+            self._record_sketches(rows)
+            return len(rows)
+        except Exception as e:
+            print(f"❌ 批次儲存感測器讀數失敗: {e}")
+            return 0
+            
+    def save_alerts(self, alerts: List[Dict[str, Any]], created_at: Optional[List[Optional[str]]] = None) -> int:
+        """
+        在單一交易中批次儲存警報記錄，回傳寫入筆數
+
+        created_at: 回補歷史警報時每筆警報的建立時間（UTC 'YYYY-MM-DD HH:MM:SS'），預設為寫入時間
+        """
+        if not alerts:
+            return 0
+        if created_at is None:
+            sql, params = ALERT_INSERT_SQL, [self._alert_row(alert) for alert in alerts]
+        else:
+            sql = ALERT_BACKFILL_SQL
+            params = [self._alert_row(alert) + (moment,) for alert, moment in zip(alerts, created_at)]
+        try:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
+                conn.executemany(sql, params)
+                conn.commit()
+                return len(alerts)
+        except Exception as e:
+            print(f"❌ 批次儲存警報記錄失敗: {e}")
+            return 0
+            
+    def save_batch(
+        self,
+        rows: List[Tuple[float, float, str]],
+        alerts: List[Dict[str, Any]]
+    ) -> Optional[int]:
+        """
+        在單一交易中寫入一批讀數與警報
+
+        成功時回傳第一筆讀數的 id（同一交易內的 id 連續），沒有讀數時回傳 0；失敗時回傳 None
+        """
+        try:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
+                first_id = 0
+                if rows:
+                    conn.executemany(
+                        "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+                        rows
+                    )
+                    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    self._mark_external(last_id)
+                    first_id = last_id - len(rows) + 1
+                if alerts:
+                    conn.executemany(ALERT_INSERT_SQL, [self._alert_row(alert) for alert in alerts])
+                conn.commit()
+            self._record_sketches(rows)
+            return first_id
+        except Exception as e:
+            print(f"❌ 批次寫入失敗: {e}")
+            return None
+            
     def get_recent_readings(self, limit: int = 100) -> list:
         """取得最近的感測器讀數"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT temp, humidity, timestamp, created_at
@@ -116,7 +268,7 @@ class DatabaseManager:
     def get_recent_alerts(self, limit: int = 50) -> list:
         """取得最近的警報記錄"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT alert_type, severity, message, timestamp, created_at
@@ -132,7 +284,7 @@ class DatabaseManager:
     def get_statistics(self) -> Dict[str, Any]:
         """取得統計資訊"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
                 
                 # 感測器讀數統計
@@ -175,7 +327,7 @@ class DatabaseManager:
     def cleanup_old_data(self, days: int = 30):
         """清理舊數據（保留指定天數）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory) as conn:
                 cursor = conn.cursor()
                 
                 # 清理舊的感測器讀數
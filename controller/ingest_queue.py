@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+有界接收佇列模組
+在 MQTT 回調執行緒與處理執行緒之間交接訊息，提供背壓與過載策略
+
+過載策略:
+- drop_oldest（預設）: 佇列滿時丟棄最舊的訊息
+- block: 佇列滿時阻塞 MQTT 回調執行緒，由 TCP 背壓讓 broker 暫停推送；
+  paho 的回調在網路執行緒中執行，阻塞期間無法送出 keepalive 與 QoS 1 確認，
+  佇列持續滿超過 keepalive 時間會被 broker 斷線
+- sample: 壓力下（深度超過 pressure_ratio）只接收每 sample_every 筆中的一筆，佇列滿時丟棄新訊息
+
+壓力下若同一個 key（裝置識別碼）已有訊息在佇列中等待，可以直接以新訊息取代（coalesce），
+同一裝置只保留最新讀數。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+OVERLOAD_POLICIES = ('block', 'drop_oldest', 'sample')
+
+
+class IngestQueue:
+    """有界接收佇列"""
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        policy: str = 'drop_oldest',
+        coalesce: bool = True,
+        pressure_ratio: float = 0.8,
+        sample_every: int = 10
+    ):
+        """初始化接收佇列"""
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"無效的過載策略: {policy}，有效策略: {', '.join(OVERLOAD_POLICIES)}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce = coalesce
+        self.pressure_threshold = max(1, int(maxsize * pressure_ratio))
+        self.sample_every = max(1, sample_every)
+
+        # 每個項目: [key, item, enqueue_time]
+        self._entries = deque()
+        self._pending: Dict[Any, list] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # 統計數據
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.sampled_out = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.dwell_total = 0.0
+        self.dwell_max = 0.0
+        self._sample_counter = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: Any, item: Any) -> bool:
+        """放入一筆訊息，回傳是否被接收（被合併也算接收）"""
+        with self._cond:
+            depth = len(self._entries)
+
+            if depth >= self.pressure_threshold:
+                # 壓力下先嘗試合併同一裝置尚未處理的訊息
+                if self.coalesce:
+                    entry = self._pending.get(key)
+                    if entry is not None:
+                        entry[1] = item
+                        self.coalesced += 1
+                        return True
+
+                if self.policy == 'sample':
+                    self._sample_counter += 1
+                    if self._sample_counter % self.sample_every:
+                        self.sampled_out += 1
+                        return False
+
+            if depth >= self.maxsize:
+                if self.policy == 'block':
+                    self.blocked += 1
+                    while len(self._entries) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return False
+                elif self.policy == 'drop_oldest':
+                    self._remove_entry(self._entries.popleft())
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return False
+
+            entry = [key, item, time.monotonic()]
+            self._entries.append(entry)
+            self._pending[key] = entry
+            self.enqueued += 1
+            if len(self._entries) > self.max_depth:
+                self.max_depth = len(self._entries)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[Any, Any]]:
+        """取出最舊的訊息 (key, item)；逾時或佇列已關閉時回傳 None"""
+        with self._cond:
+            if not self._entries:
+                self._cond.wait_for(lambda: self._entries or self._closed, timeout)
+                if not self._entries:
+                    return None
+
+            entry = self._entries.popleft()
+            self._remove_entry(entry)
+            dwell = time.monotonic() - entry[2]
+            self.dequeued += 1
+            self.dwell_total += dwell
+            if dwell > self.dwell_max:
+                self.dwell_max = dwell
+            self._cond.notify_all()
+            return entry[0], entry[1]
+
+    @property
+    def closed(self) -> bool:
+        """佇列是否已關閉"""
+        return self._closed
+
+    def _remove_entry(self, entry: list):
+        """從合併索引中移除項目"""
+        if self._pending.get(entry[0]) is entry:
+            del self._pending[entry[0]]
+
+    def close(self):
+        """關閉佇列，喚醒所有等待中的執行緒"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """取得佇列統計資訊"""
+        with self._cond:
+            return {
+                'depth': len(self._entries),
+                'max_depth': self.max_depth,
+                'capacity': self.maxsize,
+                'policy': self.policy,
+                'enqueued': self.enqueued,
+                'dequeued': self.dequeued,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'sampled_out': self.sampled_out,
+                'blocked': self.blocked,
+                'dwell_avg': self.dwell_total / self.dequeued if self.dequeued else 0.0,
+                'dwell_max': self.dwell_max
+            }
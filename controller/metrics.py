@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Controller 監控指標模組
+定義 controller 各處理階段的指標，並以內嵌 HTTP 伺服器提供 /metrics 與 /queries 端點
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# 加入專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import MetricsRegistry
+from common.query_profiler import profiler
+
+# 建立 controller 的指標註冊表
+registry = MetricsRegistry()
+
+MESSAGES_RECEIVED = registry.counter('controller_messages_received_total', '收到的 MQTT 訊息數')
+MESSAGES_PROCESSED = registry.counter('controller_messages_processed_total', '處理完成的訊息數（依結果）', ['result'])
+JSON_DECODE_DURATION = registry.histogram(
+    'controller_json_decode_duration_seconds',
+    'JSON 解析時間',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+DB_WRITE_DURATION = registry.histogram('controller_db_write_duration_seconds', '資料庫寫入時間', ['operation'])
+ALERT_EVALUATION_DURATION = registry.histogram(
+    'controller_alert_evaluation_duration_seconds',
+    '警報規則、異常偵測與生命週期判斷的時間',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+PROCESS_DURATION = registry.histogram('controller_process_duration_seconds', '單筆訊息的總處理時間')
+NOTIFY_DURATION = registry.histogram('controller_notify_duration_seconds', '通知 Web Server 的時間')
+NOTIFY_BATCH_SIZE = registry.histogram(
+    'controller_notify_batch_alerts',
+    '每次批次通知的警報數',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+NOTIFY_FAILURES = registry.counter('controller_notify_failures_total', '通知 Web Server 失敗次數（依原因）', ['reason'])
+ALERTS_EMITTED = registry.counter('controller_alerts_emitted_total', '發出的警報數（依類型）', ['alert_type'])
+MQTT_CONNECTS = registry.counter('controller_mqtt_connects_total', '成功連線到 MQTT Broker 的次數')
+MQTT_RECONNECTS = registry.counter('controller_mqtt_reconnects_total', '斷線後重新連線的次數')
+MQTT_DISCONNECTS = registry.counter('controller_mqtt_disconnects_total', '斷線次數', ['expected'])
+
+
+class RateMeter:
+    """以每秒分桶計算最近 window 秒的平均速率"""
+
+    __slots__ = ('window', '_buckets', '_seconds')
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self._buckets = [0] * (window + 1)
+        self._seconds = [0] * (window + 1)
+
+    def mark(self, count: int = 1):
+        """記錄事件"""
+        second = int(time.monotonic())
+        index = second % len(self._buckets)
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._buckets[index] = 0
+        self._buckets[index] += count
+
+    def rate(self) -> float:
+        """最近 window 個完整秒的每秒平均值"""
+        now = int(time.monotonic())
+        total = 0
+        for second, count in zip(self._seconds, self._buckets):
+            if now - self.window <= second < now:
+                total += count
+        return total / self.window
+
+
+ingest_rate = RateMeter()
+registry.gauge('controller_ingest_rate', '最近 10 秒的平均接收速率（筆/秒）', callback=ingest_rate.rate)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """處理 GET /metrics 與 GET /queries（SQL 查詢分析）的 HTTP handler"""
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        if path == '/metrics':
+            self._send(registry.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif path == '/queries':
+            params = parse_qs(query)
+            try:
+                limit = int(params.get('limit', ['20'])[0])
+            except ValueError:
+                self.send_error(400)
+                return
+            statements = profiler.top(limit)
+            payload = {
+                'status': 'success',
+                'enabled': profiler.enabled,
+                'slow_threshold_ms': profiler.slow_threshold * 1000,
+                'data': statements,
+                'count': len(statements)
+            }
+            self._send(json.dumps(payload, ensure_ascii=False), 'application/json; charset=utf-8')
+        else:
+            self.send_error(404)
+
+    def _send(self, text: str, content_type: str):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不在每次抓取時輸出存取紀錄
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    """在背景執行緒啟動 /metrics、/queries HTTP 伺服器"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+批次通知
+在短時間窗內累積警報，以一次 /api/alerts/notify/batch 請求送出
+
+一筆讀數同時觸發多條規則、或一批超標讀數同時觸發大量警報時，
+原本每則警報各需一次 HTTP 往返；批次後每個時間窗（或每 max_size 則）只需一次。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+
+class NotifyBatcher:
+    """
+    執行緒版本的通知批次器（thread 引擎與多行程模式使用）
+
+    第一則警報加入後等待 window 秒，或累積到 max_size 則時立即由背景執行緒呼叫 send_batch；
+    關閉時送出剩餘的警報。
+    """
+
+    def __init__(self, send_batch: Callable[[List[Dict[str, Any]]], None], window: float, max_size: int):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._items: List[Dict[str, Any]] = []
+        self._first_added = 0.0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+        # 統計數據
+        self.batches = 0
+        self.sent = 0
+
+    def start(self):
+        """啟動送出執行緒"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="notify-batcher", daemon=True)
+            self._thread.start()
+
+    def add(self, alert_data: Dict[str, Any]):
+        """加入一則待送出的警報"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("批次通知已關閉")
+            if not self._items:
+                self._first_added = time.monotonic()
+            self._items.append(alert_data)
+            if len(self._items) == 1 or len(self._items) >= self.max_size:
+                self._cond.notify()
+
+    def _take(self) -> List[Dict[str, Any]]:
+        """等待時間窗結束或累積到上限，取出一批（關閉且沒有待送警報時回傳空列表）"""
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            deadline = self._first_added + self.window
+            while len(self._items) < self.max_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._items = self._items[:self.max_size], self._items[self.max_size:]
+            # 超過上限而留下的警報已等待過，下一輪立即送出
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if not batch:
+                break
+            try:
+                self.send_batch(batch)
+            except Exception as e:
+                print(f"   通知: ❌ 批次通知失敗: {e}")
+            self.batches += 1
+            self.sent += len(batch)
+
+    def close(self, timeout: float = 10.0):
+        """送出剩餘的警報後停止執行緒"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+離線重播／回補工具
+將 CSV 或 JSONL 檔案中的歷史讀數，以與 MQTT 控制器相同的解析、儲存與警報判斷流程寫入資料庫，
+不經過 MQTT
+
+- 解析: 多個行程平行解析檔案區塊（每個區塊 batch_size 行）
+- 寫入: 單一寫入執行緒，每個區塊的讀數與警報各以一次 executemany 交易寫入，
+  與主執行緒的警報判斷重疊進行（SQLite 執行期間會釋放 GIL）
+- 警報: 主執行緒依檔案順序逐筆判斷，警報生命週期以讀數的 timestamp 計時；
+  可選擇寫入並通知 Web Server (notify)、只寫入資料庫 (store) 或不判斷警報 (skip)
+- 時間: 讀數與警報的 created_at 與分位數草圖的小時都使用讀數的 timestamp（UTC），
+  無法解析時沿用前一筆讀數的時間
+
+重播的讀數不會寫入環形緩衝區（緩衝區只由執行中的控制器寫入），只提高緩衝區標頭的 external_id，
+Web Server 發現緩衝區不是最新時改查資料庫。
+
+使用方式:
+    uv run controller/replay.py readings.jsonl
+    uv run controller/replay.py backup.csv --alerts notify --workers 4
+
+CSV 需有標題列，欄位為 temp, humidity, timestamp，可選 device_id。
+JSONL 每行為一筆與 MQTT 訊息相同格式的 JSON。
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from multiprocessing import Pool
+from queue import Queue
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+# 加入專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import DatabaseManager
+from common.alert_pipeline import (
+    AlertPipeline, build_alert_data, format_created_at, get_device_id, parse_reading_time
+)
+
+ALERT_MODES = ('store', 'notify', 'skip')
+
+# 解析後的讀數: (temp, humidity, timestamp, device_id, 讀數時間 epoch)
+Record = Tuple[float, float, str, Optional[str], Optional[float]]
+
+
+def _to_record(data: Dict[str, Any]) -> Record:
+    """依控制器的欄位預設值取出讀數"""
+    timestamp = data.get('timestamp', '') or ''
+    device = data.get('device_id') or None
+    return (
+        float(data.get('temp', 0)),
+        float(data.get('humidity', 0)),
+        timestamp,
+        str(device) if device else None,
+        parse_reading_time(timestamp)
+    )
+
+
+def decode_jsonl(lines: List[str]) -> Tuple[List[Record], int]:
+    """解析 JSONL 區塊，回傳 (讀數, 錯誤數)"""
+    records = []
+    errors = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            records.append(_to_record(data))
+        except (ValueError, TypeError, AttributeError):
+            errors += 1
+    return records, errors
+
+
+def decode_csv(args: Tuple[List[str], List[str]]) -> Tuple[List[Record], int]:
+    """解析 CSV 區塊（不含標題列），回傳 (讀數, 錯誤數)"""
+    fieldnames, lines = args
+    records = []
+    errors = 0
+    for row in csv.DictReader(lines, fieldnames=fieldnames):
+        try:
+            records.append(_to_record(row))
+        except (ValueError, TypeError):
+            errors += 1
+    return records, errors
+
+
+def read_chunks(path: str, batch_size: int, file_format: str) -> Iterator[Any]:
+    """以 batch_size 行為單位讀取檔案，產生解析函數的參數"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        fieldnames = None
+        if file_format == 'csv':
+            fieldnames = next(csv.reader([f.readline()]), [])
+            fieldnames = [name.strip() for name in fieldnames]
+
+        chunk = []
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= batch_size:
+                yield (fieldnames, chunk) if fieldnames is not None else chunk
+                chunk = []
+        if chunk:
+            yield (fieldnames, chunk) if fieldnames is not None else chunk
+
+
+class ReplayRunner:
+    """重播歷史讀數"""
+
+    def __init__(
+        self,
+        db: Optional[DatabaseManager] = None,
+        alert_mode: str = 'store',
+        topic: Optional[str] = None,
+        batch_size: int = 20000,
+        progress_interval: float = 2.0,
+        ring_buffer_path: Optional[str] = None
+    ):
+        """
+        初始化重播工具
+
+        參數:
+        - db: 資料庫管理器，預設使用 Config 的資料庫
+        - alert_mode: store / notify / skip
+        - topic: 讀數沒有 device_id 時，用來推得裝置的 MQTT topic
+        - batch_size: 每個解析區塊與寫入交易的行數
+        - progress_interval: 進度輸出間隔（秒）
+        - ring_buffer_path: 要標記外部寫入的環形緩衝區，預設使用 Config 的設定，空字串停用
+        """
+        if alert_mode not in ALERT_MODES:
+            raise ValueError(f"無效的警報模式: {alert_mode}，有效模式: {', '.join(ALERT_MODES)}")
+
+        self.db = db or DatabaseManager()
+        if ring_buffer_path is None and Config.RING_BUFFER_ENABLED:
+            ring_buffer_path = Config.get_ring_buffer_path()
+        self.db.external_ring = ring_buffer_path or None
+        self.alert_mode = alert_mode
+        self.topic = topic or Config.MQTT_TOPIC
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.alert_pipeline = AlertPipeline() if alert_mode != 'skip' else None
+        self.http_client = httpx.Client(timeout=5.0) if alert_mode == 'notify' else None
+        # 目前重播到的讀數時間（供警報生命週期計時）
+        self._now = 0.0
+
+        # 統計數據
+        self.stats = {
+            'rows': 0,
+            'inserted': 0,
+            'rejected': 0,
+            'alerts': 0,
+            'notified': 0,
+            'notify_failed': 0,
+            'elapsed': 0.0
+        }
+
+    def run(self, path: str, workers: int = 1, file_format: Optional[str] = None) -> Dict[str, Any]:
+        """重播檔案中的所有讀數，回傳統計資訊"""
+        if file_format is None:
+            file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        decoder = decode_csv if file_format == 'csv' else decode_jsonl
+        chunks = read_chunks(path, self.batch_size, file_format)
+
+        start = time.perf_counter()
+        last_report = start
+        write_queue: Queue = Queue(maxsize=4)
+        writer = threading.Thread(target=self._writer, args=(write_queue,), name="replay-writer")
+        writer.start()
+        pool = Pool(workers) if workers > 1 else None
+        try:
+            # imap 依序回傳結果，解析在背景行程進行時主執行緒同時判斷前一個區塊的警報
+            decoded = pool.imap(decoder, chunks) if pool else map(decoder, chunks)
+            for records, errors in decoded:
+                self.stats['rejected'] += errors
+                self.stats['rows'] += len(records) + errors
+                if records:
+                    write_queue.put(self._prepare(records))
+
+                now = time.perf_counter()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    rate = self.stats['rows'] / (now - start)
+                    print(f"⏩ 已處理 {self.stats['rows']} 筆 ({rate:,.0f} 筆/秒)")
+        finally:
+            write_queue.put(None)
+            writer.join()
+            self.db.flush_sketches()
+            if pool:
+                pool.close()
+                pool.join()
+            if self.http_client:
+                self.http_client.close()
+
+        self.stats['elapsed'] = time.perf_counter() - start
+        return self.stats
+
+    def _prepare(self, records: List[Record]) -> Tuple[List[Tuple], List[Dict[str, Any]], List[Optional[str]]]:
+        """
+        依檔案順序產生一個區塊要寫入的資料並判斷警報
+
+        回傳 (讀數資料列, 警報, 每筆警報的 created_at)；讀數資料列為 (temp, humidity, timestamp, created_at)
+        """
+        rows = []
+        alert_batch = []
+        alert_times = []
+        for temp, humidity, timestamp, device, reading_time in records:
+            # 沒有可解析時間的讀數沿用前一筆的時間（檔案開頭就無法解析時為寫入時間）
+            if reading_time is not None:
+                self._now = reading_time
+            created_at = format_created_at(self._now) if self._now else None
+            rows.append((temp, humidity, timestamp, created_at))
+            if not self.alert_pipeline:
+                continue
+
+            sensor_data = {'temp': temp, 'humidity': humidity, 'timestamp': timestamp}
+            if device:
+                sensor_data['device_id'] = device
+            device = get_device_id(self.topic, sensor_data)
+
+            for alert in self.alert_pipeline.evaluate(device, temp, humidity, self._now):
+                alert_batch.append(build_alert_data(alert, sensor_data, timestamp, device))
+                alert_times.append(created_at)
+        return rows, alert_batch, alert_times
+
+    def _writer(self, write_queue: Queue):
+        """單一寫入端：依序寫入每個區塊的讀數與警報"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            rows, alerts, alert_times = item
+            self.stats['inserted'] += self.db.save_sensor_readings(rows)
+            self.stats['alerts'] += self.db.save_alerts(alerts, alert_times)
+            if self.http_client:
+                for alert_data in alerts:
+                    self._notify(alert_data)
+
+    def _notify(self, alert_data: Dict[str, Any]):
+        """通知 Web Server"""
+        try:
+            response = self.http_client.post(f"{Config.WEB_SERVER_URL}/api/alerts/notify", json=alert_data)
+            if response.status_code == 200:
+                self.stats['notified'] += 1
+            else:
+                self.stats['notify_failed'] += 1
+        except httpx.HTTPError:
+            self.stats['notify_failed'] += 1
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令列進入點"""
+    parser = argparse.ArgumentParser(description="將 CSV / JSONL 歷史讀數重播寫入資料庫")
+    parser.add_argument('path', help="讀數檔案（.csv 或 .jsonl）")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="檔案格式，預設依副檔名判斷")
+    parser.add_argument('--alerts', choices=ALERT_MODES, default='store',
+                        help="store: 只寫入資料庫（預設）, notify: 寫入並通知 Web Server, skip: 不判斷警報")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="解析行程數")
+    parser.add_argument('--batch-size', type=int, default=20000, help="每個區塊的行數")
+    parser.add_argument('--topic', default=Config.MQTT_TOPIC, help="讀數沒有 device_id 時使用的 topic")
+    parser.add_argument('--db', help="資料庫路徑，預設使用 DB_PATH")
+    args = parser.parse_args(argv)
+
+    print(f"🔁 重播 {args.path}（警報: {args.alerts}，解析行程: {args.workers}）")
+    runner = ReplayRunner(
+        db=DatabaseManager(db_path=args.db) if args.db else None,
+        alert_mode=args.alerts,
+        topic=args.topic,
+        batch_size=args.batch_size
+    )
+    stats = runner.run(args.path, workers=args.workers, file_format=args.format)
+
+    rate = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    print("-" * 50)
+    print(f"✅ 完成: {stats['rows']} 筆, 耗時 {stats['elapsed']:.2f} 秒 ({rate:,.0f} 筆/秒)")
+    print(f"💾 寫入 {stats['inserted']} 筆讀數, 略過 {stats['rejected']} 筆無法解析的資料")
+    print(f"🚨 警報 {stats['alerts']} 筆", end='')
+    if args.alerts == 'notify':
+        print(f"，通知成功 {stats['notified']} 筆，失敗 {stats['notify_failed']} 筆")
+    else:
+        print()
+
+
+if __name__ == "__main__":
+    main()
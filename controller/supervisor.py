@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+多行程控制器（supervisor 模式）
+單一 MQTT 連線接收訊息，依裝置 ID 的一致性雜湊分派給多個 worker 行程，
+由 worker 解析 JSON 與判斷警報，結果再交給主行程的單一寫入執行緒批次寫入資料庫
+
+- 分區: 同一裝置固定由同一個 worker 處理，讀數順序與警報狀態（異常偵測、生命週期）保留在該 worker
+- 重啟: worker 異常結束時以相同分區重新啟動，尚未回傳結果的批次依序重送（不遺失、不重複寫入）；
+  重新啟動的 worker 警報狀態從頭開始
+- 再平衡: 60 秒內重啟超過 CONTROLLER_MAX_RESTARTS 次的 worker 會移出雜湊環，
+  其裝置改由其他 worker 處理；resize() 先等所有批次處理完成再調整分區
+
+使用方式:
+    uv run controller/supervisor.py --processes 4
+    CONTROLLER_PROCESSES=4 uv run controller/controller.py
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from multiprocessing import connection, get_context
+from queue import Empty, Queue
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 加入專案根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import DatabaseManager
+from common.alert_pipeline import AlertPipeline, build_alert_data, get_device_id, routing_key
+from controller import EnvironmentController
+import metrics
+
+# 寫入端每次交易最多合併的讀數筆數
+WRITE_BATCH = 5000
+
+class HashRing:
+    """一致性雜湊環：節點增減時只有約 1/N 的裝置改變分區"""
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 64):
+        """
+        參數:
+        - nodes: 初始節點（worker 編號）
+        - replicas: 每個節點在環上的虛擬節點數，越多分布越平均
+        """
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._nodes: Dict[int, int] = {}
+        self._cache: Dict[str, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        """跨行程穩定的雜湊值（內建 hash() 每個行程不同）"""
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    @property
+    def nodes(self) -> List[int]:
+        return sorted(set(self._nodes.values()))
+
+    def add(self, node: int):
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            if point not in self._nodes:
+                bisect.insort(self._keys, point)
+            self._nodes[point] = node
+        self._cache.clear()
+
+    def remove(self, node: int):
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                self._keys.remove(point)
+        self._cache.clear()
+
+    def get(self, key: str) -> int:
+        """取得 key 所屬的節點"""
+        node = self._cache.get(key)
+        if node is None:
+            if not self._keys:
+                raise LookupError("雜湊環沒有任何節點")
+            index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+            node = self._nodes[self._keys[index]]
+            self._cache[key] = node
+        return node
+
+
+def _worker_main(slot_id: int, conn, settings: Dict[str, Any]):
+    """worker 行程：解析訊息並判斷警報，回傳 (批次序號, 讀數, 警報, 成功數, 錯誤數)"""
+    # 由 supervisor 處理 Ctrl+C，worker 等待停止訊號再結束
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 套用主行程的設定，確保與主行程一致（包含命令列或測試調整的值）
+    for key, value in settings.items():
+        setattr(Config, key, value)
+
+    pipeline = AlertPipeline()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        seq, batch = message
+        rows = []
+        alerts = []
+        errors = 0
+        for topic, payload in batch:
+            try:
+                data = json.loads(payload)
+                temp = data.get('temp', 0)
+                humidity = data.get('humidity', 0)
+                timestamp = data.get('timestamp', '')
+                device = get_device_id(topic, data)
+                evaluated = pipeline.evaluate(device, float(temp), float(humidity), time.monotonic())
+            except (ValueError, TypeError, AttributeError):
+                errors += 1
+                continue
+            rows.append((temp, humidity, timestamp))
+            for alert in evaluated:
+                alerts.append(build_alert_data(alert, data, datetime.utcnow().isoformat() + "Z", device))
+        conn.send((seq, rows, alerts, len(rows), errors))
+    conn.close()
+
+
+class _Slot:
+    """一個 worker 分區的狀態"""
+
+    def __init__(self, slot_id: int):
+        self.id = slot_id
+        self.process = None
+        self.conn = None
+        # 尚未送出的訊息
+        self.pending: List[Tuple[str, bytes]] = []
+        # 已送出但尚未收到結果的批次（序號 -> 訊息），worker 異常結束時依序重送
+        self.unacked: "OrderedDict[int, List[Tuple[str, bytes]]]" = OrderedDict()
+        self.next_seq = 0
+        self.restarts: deque = deque()
+
+
+class WorkerPool:
+    """worker 行程池：分派、收集結果、單一寫入端與故障處理"""
+
+    def __init__(
+        self,
+        processes: int,
+        db: Optional[DatabaseManager] = None,
+        ring_buffer=None,
+        on_batch: Optional[Callable[[int, List[Dict[str, Any]]], None]] = None,
+        on_rows: Optional[Callable[[int, List[Tuple[float, float, str]]], None]] = None,
+        dispatch_batch: int = 200,
+        flush_interval: float = 0.05,
+        max_restarts: int = 3,
+        restart_window: float = 60.0
+    ):
+        """
+        參數:
+        - processes: worker 行程數
+        - db: 資料庫管理器，預設使用 Config 的資料庫
+        - ring_buffer: 最近讀數環形緩衝區寫入端（選用）
+        - on_batch: 每次寫入後呼叫 on_batch(寫入筆數, 警報列表)
+        - on_rows: 每次寫入後呼叫 on_rows(第一筆讀數 id, 讀數列表)（選用）
+        - dispatch_batch: 每次送給 worker 的訊息數；未滿時每 flush_interval 秒送出
+        - max_restarts / restart_window: 超過重啟次數的 worker 移出雜湊環
+        """
+        self.processes = max(1, processes)
+        self.db = db or DatabaseManager()
+        self.ring_buffer = ring_buffer
+        self.on_batch = on_batch
+        self.on_rows = on_rows
+        self.dispatch_batch = dispatch_batch
+        self.flush_interval = flush_interval
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+
+        self._ctx = get_context('spawn')
+        self.ring = HashRing()
+        self._slots: Dict[int, _Slot] = {}
+        self._next_slot_id = 0
+        # 分派鎖：路由、待送訊息與送出；故障處理與再平衡期間持有此鎖以暫停分派
+        self._lock = threading.Lock()
+        # 結果鎖：批次序號與未確認批次
+        self._ack_lock = threading.Lock()
+        self._write_queue: Queue = Queue(maxsize=64)
+        # 被替換的連線由收集執行緒關閉，避免在它讀取時關閉
+        self._retired_conns: List[Any] = []
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+        self.stats = {
+            'dispatched': 0,
+            'processed': 0,
+            'errors': 0,
+            'written': 0,
+            'alerts': 0,
+            'write_failures': 0,
+            'restarts': 0,
+            'retired': 0
+        }
+
+    # ---- 生命週期 ----
+
+    def start(self):
+        """啟動 worker 行程與收集、寫入、監控執行緒"""
+        self._running = True
+        with self._lock:
+            for _ in range(self.processes):
+                self._add_slot()
+        for target, name in (
+            (self._collector, "pool-collector"),
+            (self._writer, "pool-writer"),
+            (self._monitor, "pool-monitor"),
+            (self._flusher, "pool-flusher")
+        ):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30.0):
+        """送出剩餘訊息、等待處理與寫入完成後停止所有行程"""
+        with self._lock:
+            self._flush_locked()
+            self._wait_idle(timeout)
+            self._running = False
+            for slot in list(self._slots.values()):
+                self._stop_slot(slot)
+            self._slots.clear()
+        self._write_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+        self._close_retired()
+
+    def resize(self, processes: int, timeout: float = 30.0) -> bool:
+        """
+        調整 worker 數量
+
+        先暫停分派並等待所有已送出的批次完成，再增減雜湊環上的節點，
+        被移動的裝置之後的讀數由新的 worker 處理，不會與舊 worker 交錯。
+        """
+        processes = max(1, processes)
+        with self._lock:
+            self._flush_locked()
+            idle = self._wait_idle(timeout)
+            while len(self._slots) < processes:
+                self._add_slot()
+            while len(self._slots) > processes:
+                slot = self._slots.pop(max(self._slots))
+                self.ring.remove(slot.id)
+                self._stop_slot(slot)
+            self.processes = processes
+        print(f"🔀 worker 數量調整為 {processes}")
+        return idle
+
+    def _add_slot(self):
+        slot = _Slot(self._next_slot_id)
+        self._next_slot_id += 1
+        self._spawn(slot)
+        self._slots[slot.id] = slot
+        self.ring.add(slot.id)
+
+    def _spawn(self, slot: _Slot):
+        """啟動 slot 的 worker 行程（每次都建立新的管道，避免沿用斷掉的連線）"""
+        settings = {key: value for key, value in vars(Config).items() if key.isupper()}
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(slot.id, child_conn, settings),
+            name=f"controller-worker-{slot.id}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        with self._ack_lock:
+            slot.process = process
+            slot.conn = parent_conn
+
+    def _stop_slot(self, slot: _Slot):
+        """通知 worker 結束並等待行程退出"""
+        with self._ack_lock:
+            conn = slot.conn
+            slot.conn = None
+        try:
+            conn.send(None)
+        except (OSError, AttributeError):
+            pass
+        slot.process.join(timeout=5.0)
+        if slot.process.is_alive():
+            slot.process.terminate()
+            slot.process.join()
+        if conn:
+            with self._ack_lock:
+                self._retired_conns.append(conn)
+
+    def _close_retired(self):
+        with self._ack_lock:
+            retired = self._retired_conns
+            self._retired_conns = []
+        for conn in retired:
+            conn.close()
+
+    def _wait_idle(self, timeout: float) -> bool:
+        """等待所有已送出的批次都收到結果"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._ack_lock:
+                if not any(slot.unacked for slot in self._slots.values()):
+                    return True
+            time.sleep(0.01)
+        print("⚠️ 等待 worker 完成批次逾時")
+        return False
+
+    # ---- 分派 ----
+
+    def dispatch(self, topic: str, payload: bytes):
+        """依裝置分派一則訊息（由 MQTT 回調呼叫）"""
+        with self._lock:
+            self._route_locked(topic, payload)
+            self.stats['dispatched'] += 1
+
+    def _route_locked(self, topic: str, payload: bytes):
+        slot = self._slots[self.ring.get(routing_key(topic, payload))]
+        slot.pending.append((topic, payload))
+        if len(slot.pending) >= self.dispatch_batch:
+            self._send_locked(slot, slot.pending)
+            slot.pending = []
+
+    def _send_locked(self, slot: _Slot, batch: List[Tuple[str, bytes]]):
+        with self._ack_lock:
+            seq = slot.next_seq
+            slot.next_seq += 1
+            slot.unacked[seq] = batch
+            conn = slot.conn
+        try:
+            conn.send((seq, batch))
+        except (OSError, AttributeError):
+            # worker 已結束，批次保留在 unacked，由監控執行緒重送
+            pass
+
+    def _flush_locked(self):
+        for slot in self._slots.values():
+            if slot.pending:
+                self._send_locked(slot, slot.pending)
+                slot.pending = []
+
+    def _flusher(self):
+        """定期送出未滿一批的訊息，避免低流量時延遲"""
+        while self._running:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                if self._running:
+                    self._flush_locked()
+
+    # ---- 結果與寫入 ----
+
+    def _collector(self):
+        """收集 worker 的結果並交給寫入端"""
+        while self._running:
+            self._close_retired()
+            with self._ack_lock:
+                conns = {slot.conn: slot for slot in self._slots.values() if slot.conn is not None}
+            try:
+                ready = connection.wait(list(conns), timeout=0.2)
+            except (OSError, ValueError):
+                continue
+            for conn in ready:
+                try:
+                    seq, rows, alerts, processed, errors = conn.recv()
+                except (EOFError, OSError):
+                    continue
+                slot = conns[conn]
+                with self._ack_lock:
+                    # 連線已被替換時，這個批次會由新的 worker 重新處理
+                    if slot.conn is not conn or slot.unacked.pop(seq, None) is None:
+                        continue
+                self.stats['processed'] += processed
+                self.stats['errors'] += errors
+                self._write_queue.put((rows, alerts))
+
+    def _writer(self):
+        """單一寫入端：合併多個批次後以一次交易寫入讀數與警報"""
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            rows, alerts = list(item[0]), list(item[1])
+            while len(rows) < WRITE_BATCH:
+                try:
+                    item = self._write_queue.get_nowait()
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                rows.extend(item[0])
+                alerts.extend(item[1])
+
+            with metrics.DB_WRITE_DURATION.time('batch'):
+                first_id = self.db.save_batch(rows, alerts)
+            if first_id is None:
+                self.stats['write_failures'] += len(rows)
+                continue
+            self.stats['written'] += len(rows)
+            self.stats['alerts'] += len(alerts)
+            if self.ring_buffer and rows:
+                for offset, (temp, humidity, timestamp) in enumerate(rows):
+                    self.ring_buffer.append(first_id + offset, temp, humidity, timestamp)
+            if self.on_rows and rows:
+                self.on_rows(first_id, rows)
+            if self.on_batch:
+                self.on_batch(len(rows), alerts)
+
+    # ---- 故障處理 ----
+
+    def _monitor(self):
+        """監控 worker 行程，異常結束時重新啟動或移出雜湊環"""
+        while self._running:
+            time.sleep(0.2)
+            for slot in list(self._slots.values()):
+                if self._running and slot.process is not None and not slot.process.is_alive():
+                    self._handle_failure(slot)
+
+    def _handle_failure(self, slot: _Slot):
+        with self._lock:
+            if not self._running or self._slots.get(slot.id) is not slot or slot.process.is_alive():
+                return
+            now = time.monotonic()
+            slot.restarts.append(now)
+            while slot.restarts and now - slot.restarts[0] > self.restart_window:
+                slot.restarts.popleft()
+
+            with self._ack_lock:
+                if slot.conn:
+                    self._retired_conns.append(slot.conn)
+                slot.conn = None
+                replay = list(slot.unacked.values())
+                slot.unacked.clear()
+
+            if len(slot.restarts) > self.max_restarts and len(self._slots) > 1:
+                # 反覆失敗：移出雜湊環，未處理的訊息依原順序改派給新的分區
+                del self._slots[slot.id]
+                self.ring.remove(slot.id)
+                self.stats['retired'] += 1
+                print(f"⚠️ worker {slot.id} 反覆異常結束，已移出分區（剩餘 {len(self._slots)} 個）")
+                pending = slot.pending
+                slot.pending = []
+                for batch in replay + [pending]:
+                    for topic, payload in batch:
+                        self._route_locked(topic, payload)
+                self._flush_locked()
+                return
+
+            print(f"⚠️ worker {slot.id} 異常結束（exit code {slot.process.exitcode}），重新啟動並重送 {len(replay)} 個批次")
+            self.stats['restarts'] += 1
+            self._spawn(slot)
+            for batch in replay:
+                self._send_locked(slot, batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._ack_lock:
+            pending = sum(len(slot.pending) for slot in self._slots.values())
+            unacked = sum(len(batch) for slot in self._slots.values() for batch in slot.unacked.values())
+        return {**self.stats, 'workers': len(self._slots), 'pending': pending, 'in_flight': unacked}
+
+
+class SupervisedController(EnvironmentController):
+    """以 worker 行程池處理訊息的控制器，MQTT 連線、統計與通知沿用 EnvironmentController"""
+
+    def __init__(self, processes: int):
+        super().__init__()
+        # 接收佇列由 worker 行程池取代
+        self.ingest_queues = []
+        self.pool = WorkerPool(
+            processes,
+            db=self.db,
+            ring_buffer=self.ring_buffer,
+            on_batch=self._on_batch,
+            on_rows=self.publish_readings if self.server_channel else None,
+            dispatch_batch=Config.CONTROLLER_DISPATCH_BATCH,
+            max_restarts=Config.CONTROLLER_MAX_RESTARTS
+        )
+        # 通知 Web Server 在獨立執行緒進行，不阻塞寫入端
+        self._notify_queue: Queue = Queue()
+        self._notifier = None
+        metrics.registry.gauge(
+            'controller_workers', '執行中的 worker 行程數',
+            callback=lambda: len(self.pool._slots)
+        )
+        metrics.registry.gauge(
+            'controller_worker_restarts', 'worker 行程累計重啟次數',
+            callback=lambda: self.pool.stats['restarts']
+        )
+
+    def on_message(self, client, userdata, msg):
+        """接收 MQTT 訊息回調：只分派，不解析"""
+        metrics.MESSAGES_RECEIVED.inc()
+        metrics.ingest_rate.mark()
+        self.pool.dispatch(msg.topic, msg.payload)
+
+    def start_workers(self):
+        """啟動 worker 行程池與通知執行緒"""
+        self.pool.start()
+        if self.notify_batcher:
+            self.notify_batcher.start()
+        if self.server_channel:
+            self.server_channel.start()
+        self._notifier = threading.Thread(target=self._notify_worker, name="notifier", daemon=True)
+        self._notifier.start()
+        print(f"🧩 已啟動 {self.pool.processes} 個 worker 行程")
+
+    def _on_batch(self, count: int, alerts: List[Dict[str, Any]]):
+        """寫入端完成一批後更新統計並排入通知"""
+        self.message_count += count
+        metrics.MESSAGES_PROCESSED.inc('ok', amount=count)
+        for alert_data in alerts:
+            self.alert_count += 1
+            metrics.ALERTS_EMITTED.inc(alert_data['alert_type'])
+            print(f"🚨 警報 #{self.alert_count}: {alert_data['message']}")
+            self._notify_queue.put(alert_data)
+
+    def _notify_worker(self):
+        while True:
+            alert_data = self._notify_queue.get()
+            if alert_data is None:
+                break
+            self.notify_server(alert_data)
+
+    def disconnect(self):
+        """停止接收後等待 worker 處理完剩餘訊息，再關閉連線"""
+        self.client.loop_stop()
+        self.pool.stop()
+        if self._notifier:
+            self._notify_queue.put(None)
+            self._notifier.join(timeout=10.0)
+        super().disconnect()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['workers'] = self.pool.get_stats()
+        return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    """命令列進入點"""
+    parser = argparse.ArgumentParser(description="以多個 worker 行程運行環境監控控制器")
+    # 有設定 CONTROLLER_PROCESSES（大於 1）時以它為準，否則每個 CPU 核心一個 worker
+    default_processes = Config.CONTROLLER_PROCESSES if Config.CONTROLLER_PROCESSES > 1 else (os.cpu_count() or 1)
+    parser.add_argument('--processes', type=int, default=default_processes,
+                        help="worker 行程數（預設為 CONTROLLER_PROCESSES，未設定時為 CPU 核心數）")
+    args = parser.parse_args(argv)
+    SupervisedController(args.processes).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+"""
+Pytest 配置檔案
+將專案根目錄與 controller 目錄加入 Python 路徑，與 controller.py 的匯入方式一致
+"""
+
+import sys
+import os
+
+controller_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+project_root = os.path.dirname(controller_dir)
+sys.path.insert(0, project_root)
+sys.path.insert(0, controller_dir)
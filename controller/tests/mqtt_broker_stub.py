@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+測試用的最小 MQTT 3.1.1 Broker
+只實作控制器測試需要的部分: CONNECT / SUBSCRIBE / PUBLISH (QoS 0、1) / PINGREQ / DISCONNECT，
+支援共享訂閱（$share/<group>/<filter>，群組內輪流分配）與持久化 session（clean_session=0 時暫存離線訊息）
+"""
+
+import socket
+import struct
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """判斷 topic 是否符合訂閱條件（支援 + 與 #）"""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _Session:
+    """client 的 session：訂閱、離線訊息與目前的連線"""
+
+    def __init__(self, client_id: str, persistent: bool):
+        self.client_id = client_id
+        self.persistent = persistent
+        self.subscriptions: Dict[str, int] = {}
+        self.pending: deque = deque()
+        self.conn: Optional[socket.socket] = None
+        self.send_lock = threading.Lock()
+        self.next_packet_id = 1
+
+    def deliver(self, topic: str, payload: bytes, qos: int):
+        """送出訊息；離線時暫存（只有持久化 session 會保留）"""
+        with self.send_lock:
+            if self.conn is None:
+                if self.persistent and qos > 0:
+                    self.pending.append((topic, payload, qos))
+                return
+            body = _encode_string(topic)
+            if qos:
+                body += struct.pack('!H', self.next_packet_id)
+                self.next_packet_id = self.next_packet_id % 65535 + 1
+            try:
+                self.conn.sendall(_packet(PUBLISH, qos << 1, body + payload))
+            except OSError:
+                if self.persistent and qos > 0:
+                    self.pending.append((topic, payload, qos))
+
+
+class StubBroker:
+    """在背景執行緒運行的 MQTT Broker，port=0 時自動選擇可用埠"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = socket.create_server((host, port))
+        self.host = host
+        self.port = self._server.getsockname()[1]
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _Session] = {}
+        self._group_cursor: Dict[Tuple[str, str], int] = {}
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self.published = 0
+
+    def start(self) -> 'StubBroker':
+        self._running = True
+        thread = threading.Thread(target=self._accept_loop, name="stub-broker", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._running = False
+        self._server.close()
+        with self._lock:
+            for session in self._sessions.values():
+                if session.conn:
+                    try:
+                        session.conn.close()
+                    except OSError:
+                        pass
+
+    def connected_clients(self) -> List[str]:
+        with self._lock:
+            return [s.client_id for s in self._sessions.values() if s.conn is not None]
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _read_packet(self, stream) -> Optional[Tuple[int, int, bytes]]:
+        header = stream.read(1)
+        if not header:
+            return None
+        multiplier, length = 1, 0
+        while True:
+            byte = stream.read(1)
+            if not byte:
+                return None
+            length += (byte[0] & 0x7F) * multiplier
+            if not byte[0] & 0x80:
+                break
+            multiplier *= 128
+        body = stream.read(length) if length else b''
+        if len(body) < length:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _serve(self, conn: socket.socket):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = conn.makefile('rb')
+        session = None
+        try:
+            while self._running:
+                packet = self._read_packet(stream)
+                if packet is None:
+                    break
+                packet_type, flags, body = packet
+                if packet_type == CONNECT:
+                    session = self._handle_connect(conn, body)
+                elif session is None:
+                    break
+                elif packet_type == SUBSCRIBE:
+                    self._handle_subscribe(session, body)
+                elif packet_type == UNSUBSCRIBE:
+                    self._handle_unsubscribe(session, body)
+                elif packet_type == PUBLISH:
+                    self._handle_publish(session, flags, body)
+                elif packet_type == PINGREQ:
+                    with session.send_lock:
+                        conn.sendall(_packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    break
+                # PUBACK 等其他封包不需處理
+        except OSError:
+            pass
+        finally:
+            if session is not None:
+                with self._lock:
+                    with session.send_lock:
+                        if session.conn is conn:
+                            session.conn = None
+                    if not session.persistent and self._sessions.get(session.client_id) is session:
+                        del self._sessions[session.client_id]
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _handle_connect(self, conn: socket.socket, body: bytes) -> _Session:
+        offset = 2 + struct.unpack('!H', body[:2])[0]
+        connect_flags = body[offset + 1]
+        offset += 4
+        id_length = struct.unpack('!H', body[offset:offset + 2])[0]
+        client_id = body[offset + 2:offset + 2 + id_length].decode('utf-8')
+        clean_session = bool(connect_flags & 0x02)
+
+        with self._lock:
+            if not client_id:
+                client_id = f"auto-{id(conn)}"
+            existing = self._sessions.get(client_id)
+            if existing and existing.conn is not None:
+                # 相同 client id 重複連線時中斷舊連線
+                try:
+                    existing.conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                existing.conn = None
+            session_present = bool(existing) and not clean_session and existing.persistent
+            if not session_present:
+                existing = _Session(client_id, persistent=not clean_session)
+                self._sessions[client_id] = existing
+            session = existing
+
+        with session.send_lock:
+            conn.sendall(_packet(CONNACK, 0, bytes([int(session_present), 0])))
+            session.conn = conn
+        while session.pending:
+            session.deliver(*session.pending.popleft())
+        return session
+
+    def _handle_subscribe(self, session: _Session, body: bytes):
+        packet_id = body[:2]
+        offset = 2
+        granted = bytearray()
+        while offset < len(body):
+            length = struct.unpack('!H', body[offset:offset + 2])[0]
+            topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+            qos = min(body[offset + 2 + length], 1)
+            offset += 3 + length
+            with self._lock:
+                session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+        with session.send_lock:
+            session.conn.sendall(_packet(SUBACK, 0, packet_id + bytes(granted)))
+
+    def _handle_unsubscribe(self, session: _Session, body: bytes):
+        offset = 2
+        while offset < len(body):
+            length = struct.unpack('!H', body[offset:offset + 2])[0]
+            with self._lock:
+                session.subscriptions.pop(body[offset + 2:offset + 2 + length].decode('utf-8'), None)
+            offset += 2 + length
+        with session.send_lock:
+            session.conn.sendall(_packet(UNSUBACK, 0, body[:2]))
+
+    def _handle_publish(self, session: _Session, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        length = struct.unpack('!H', body[:2])[0]
+        topic = body[2:2 + length].decode('utf-8')
+        offset = 2 + length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+        payload = body[offset:]
+
+        targets = []
+        with self._lock:
+            self.published += 1
+            groups: Dict[Tuple[str, str], List[Tuple[_Session, int]]] = {}
+            for candidate in self._sessions.values():
+                for topic_filter, sub_qos in candidate.subscriptions.items():
+                    if topic_filter.startswith('$share/'):
+                        _, group, real_filter = topic_filter.split('/', 2)
+                        if topic_matches(real_filter, topic):
+                            groups.setdefault((group, real_filter), []).append((candidate, sub_qos))
+                    elif topic_matches(topic_filter, topic):
+                        targets.append((candidate, min(qos, sub_qos)))
+            for key, members in groups.items():
+                # 群組內依 client id 排序後輪流分配，優先選擇連線中的成員
+                members.sort(key=lambda member: member[0].client_id)
+                online = [member for member in members if member[0].conn is not None] or members
+                cursor = self._group_cursor.get(key, 0)
+                chosen, sub_qos = online[cursor % len(online)]
+                self._group_cursor[key] = cursor + 1
+                targets.append((chosen, min(qos, sub_qos)))
+
+        if qos:
+            with session.send_lock:
+                session.conn.sendall(_packet(PUBACK, 0, packet_id))
+        for target, target_qos in targets:
+            target.deliver(topic, payload, target_qos)
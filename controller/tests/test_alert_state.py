@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+警報生命週期測試
+"""
+
+from common.alert_state import AlertTracker
+
+HIGH_TEMP = {'type': 'high_temperature', 'message': '高溫警報！', 'severity': 'warning'}
+ANOMALY = {'type': 'anomaly', 'message': '溫度異常！', 'severity': 'warning'}
+
+def _tracker(**kwargs):
+    return AlertTracker(
+        clear_conditions={'high_temperature': lambda temp, humidity: temp <= 29.5},
+        **kwargs
+    )
+
+def _run(tracker, temps, start=0.0, step=5.0):
+    """依序送入讀數（每 step 秒一筆），回傳所有事件"""
+    events = []
+    for i, temp in enumerate(temps):
+        alerts = [HIGH_TEMP] if temp > 30 else []
+        events.extend(tracker.update("room01", alerts, temp, 50.0, start + i * step))
+    return events
+
+def test_long_incident_produces_bounded_events():
+    """測試長時間高溫只產生開啟、定期提醒與解除事件"""
+    tracker = _tracker(reminder_interval=600)
+    # 高溫持續 1 小時（720 筆讀數），之後恢復
+    events = _run(tracker, [32.0] * 720 + [28.0])
+
+    states = [e['state'] for e in events]
+    assert states[0] == 'open'
+    assert states[-1] == 'resolved'
+    assert states.count('ongoing') == 5
+    assert len(events) == 7
+    assert events[-1]['severity'] == 'info'
+    assert "期間" in events[1]['message']
+
+def test_hysteresis_keeps_incident_open():
+    """測試在遲滯區間內不會解除"""
+    tracker = _tracker()
+    events = _run(tracker, [31.0, 29.8, 29.9, 31.0, 29.0])
+    assert [e['state'] for e in events] == ['open', 'resolved']
+
+def test_min_duration_debounce():
+    """測試短暫超標不會發出警報"""
+    tracker = _tracker(min_duration=10)
+    assert _run(tracker, [31.0, 31.0, 28.0]) == []
+    assert tracker.incidents == {}
+
+    events = _run(tracker, [31.0, 31.0, 31.0], start=100)
+    assert [e['state'] for e in events] == ['open']
+
+def test_cooldown_suppresses_flapping():
+    """測試冷卻期間再次觸發延續同一事件，不重新發出開啟通知"""
+    tracker = _tracker(cooldown=300)
+    events = _run(tracker, [31.0, 28.0, 31.0, 28.0, 31.0])
+    assert [e['state'] for e in events] == ['open', 'resolved', 'ongoing', 'resolved', 'ongoing']
+    assert "持續 20 秒" in events[-1]['message']
+
+    # 重新告知的事件解除後，冷卻結束再觸發視為新事件
+    events = _run(tracker, [28.0, 31.0], start=1000, step=400)
+    assert [e['state'] for e in events] == ['resolved', 'open']
+
+def test_retrigger_after_resolution_is_notified():
+    """測試已通知解除後，冷卻期間內再次觸發會發出 ongoing 提醒並允許再次解除"""
+    tracker = _tracker(cooldown=300, reminder_interval=600)
+    events = _run(tracker, [31.0, 28.0, 28.0, 31.0, 31.0, 31.0])
+    assert [e['state'] for e in events] == ['open', 'resolved', 'ongoing']
+    assert events[-1]['type'] == 'high_temperature'
+    assert tracker.active_count() == 1
+
+    events = _run(tracker, [28.0], start=30)
+    assert [e['state'] for e in events] == ['resolved']
+    assert "共 4 筆讀數觸發" in events[0]['message']
+
+def test_point_alerts_without_clear_condition():
+    """測試沒有解除條件的單次警報只受冷卻限制"""
+    tracker = _tracker(cooldown=60, reminder_interval=30)
+    events = []
+    for i, alerts in enumerate([[ANOMALY], [], [ANOMALY], [], [ANOMALY]]):
+        events.extend(tracker.update("room01", alerts, 25.0, 50.0, i * 5.0))
+    assert [e['state'] for e in events] == ['open']
+
+    events = tracker.update("room01", [ANOMALY], 25.0, 50.0, 40.0)
+    assert [e['state'] for e in events] == ['ongoing']
+    assert tracker.active_count() == 1
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+串流異常偵測測試
+"""
+
+import random
+
+from common.anomaly import AnomalyDetector, DeviceState
+
+def test_no_alerts_during_normal_readings():
+    """測試穩定讀數不會觸發異常"""
+    random.seed(1)
+    detector = AnomalyDetector(warmup=10)
+    for _ in range(500):
+        alerts = detector.check("room01", random.uniform(24.5, 25.5), random.uniform(49, 51))
+        assert alerts == []
+
+def test_z_score_anomaly():
+    """測試偏離 EWMA 平均的讀數會觸發 anomaly 警報"""
+    random.seed(2)
+    detector = AnomalyDetector(warmup=10, max_temp_step=100, max_humidity_step=100)
+    for _ in range(100):
+        detector.check("room01", random.gauss(25, 0.5), random.gauss(50, 1))
+
+    alerts = detector.check("room01", 35.0, 50.0)
+    assert len(alerts) == 1
+    assert alerts[0]["type"] == "anomaly"
+    assert alerts[0]["severity"] == "warning"
+    assert "溫度異常" in alerts[0]["message"]
+
+def test_warmup_suppresses_z_score():
+    """測試暖機期間只偵測變化量"""
+    detector = AnomalyDetector(warmup=30, max_temp_step=3.0)
+    detector.check("room01", 25.0, 50.0)
+    alerts = detector.check("room01", 29.0, 50.0)
+    assert len(alerts) == 1
+    assert "溫度驟變" in alerts[0]["message"]
+
+def test_devices_are_independent():
+    """測試每個裝置有獨立的狀態"""
+    detector = AnomalyDetector(warmup=5)
+    for _ in range(20):
+        detector.check("room01", 25.0, 50.0)
+        detector.check("room02", 18.0, 70.0)
+
+    assert set(detector.devices) == {"room01", "room02"}
+    assert isinstance(detector.devices["room01"], DeviceState)
+    assert detector.devices["room01"].temp_mean == 25.0
+    assert detector.devices["room02"].humidity_mean == 70.0
+    assert not hasattr(detector.devices["room01"], "__dict__")
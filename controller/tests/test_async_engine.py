@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+asyncio 控制器引擎測試
+使用 tests/mqtt_broker_stub.py 的本機 Broker 與 httpx.MockTransport
+"""
+
+import asyncio
+import json
+import sqlite3
+
+import httpx
+import paho.mqtt.client as mqtt
+import pytest
+
+from config import Config
+from async_engine import AsyncEnvironmentController
+from mqtt_broker_stub import StubBroker
+
+
+@pytest.fixture
+def broker(monkeypatch, tmp_path):
+    stub = StubBroker().start()
+    monkeypatch.setattr(Config, 'MQTT_BROKER', stub.host)
+    monkeypatch.setattr(Config, 'MQTT_PORT', stub.port)
+    monkeypatch.setattr(Config, 'MQTT_TOPIC', 'env/+/reading')
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', False)
+    monkeypatch.setattr(Config, 'ANOMALY_DETECTION_ENABLED', False)
+    yield stub
+    stub.stop()
+
+
+def _publish(broker, messages):
+    publisher = mqtt.Client(client_id="test-publisher")
+    publisher.connect(broker.host, broker.port, 60)
+    publisher.loop_start()
+    for topic, payload in messages:
+        publisher.publish(topic, json.dumps(payload), qos=1).wait_for_publish(5)
+    publisher.loop_stop()
+    publisher.disconnect()
+
+
+async def _wait_until(condition, timeout=10.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+
+def test_async_engine_stores_readings_and_notifies_concurrently(broker):
+    """測試 asyncio 引擎寫入所有讀數，並同時進行多個通知"""
+    notified = []
+
+    async def handler(request):
+        # 模擬較慢的 Web Server，依序處理時 50 筆需要 5 秒
+        await asyncio.sleep(0.1)
+        notified.append(json.loads(request.content))
+        return httpx.Response(200, json={'message': 'OK'})
+
+    messages = []
+    for seq in range(10):
+        for device in range(50):
+            messages.append((
+                f"env/room{device:02d}/reading",
+                {'temp': 35.0, 'humidity': 50.0, 'timestamp': f"room{device:02d}-{seq:03d}"}
+            ))
+
+    async def scenario():
+        controller = AsyncEnvironmentController(transport=httpx.MockTransport(handler))
+        await controller.start()
+        try:
+            assert await _wait_until(lambda: len(broker.connected_clients()) == 1)
+            await asyncio.sleep(0.3)
+            started = asyncio.get_running_loop().time()
+            await asyncio.get_running_loop().run_in_executor(None, _publish, broker, messages)
+            assert await _wait_until(lambda: controller.message_count == 500 and len(notified) == 50)
+            elapsed = asyncio.get_running_loop().time() - started
+        finally:
+            await controller.stop()
+        return controller, elapsed
+
+    controller, elapsed = asyncio.run(scenario())
+
+    with sqlite3.connect(Config.DB_PATH) as conn:
+        timestamps = [row[0] for row in conn.execute("SELECT timestamp FROM sensor_readings ORDER BY id")]
+        alert_devices = {row[0] for row in conn.execute("SELECT device_id FROM alert_history")}
+    assert len(timestamps) == 500
+    own = [t for t in timestamps if t.startswith('room07')]
+    assert own == sorted(own) and len(own) == 10
+    # 警報生命週期：每個裝置只開啟一次高溫事件
+    assert alert_devices == {f"room{device:02d}" for device in range(50)}
+    assert controller.alert_count == 50
+    assert controller.notify_in_flight_max > 10
+    assert elapsed < 5.0
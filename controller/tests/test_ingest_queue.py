@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+有界接收佇列測試
+"""
+
+import threading
+import time
+import pytest
+
+from ingest_queue import IngestQueue
+
+def test_fifo_and_dwell_stats():
+    """測試先進先出與等待時間統計"""
+    queue = IngestQueue(maxsize=10)
+    for i in range(3):
+        assert queue.put(f"room{i}", i)
+    assert len(queue) == 3
+    assert [queue.get()[1] for _ in range(3)] == [0, 1, 2]
+    assert queue.get(timeout=0.01) is None
+
+    stats = queue.get_stats()
+    assert stats['enqueued'] == 3
+    assert stats['dequeued'] == 3
+    assert stats['max_depth'] == 3
+    assert stats['dwell_max'] >= stats['dwell_avg'] >= 0
+
+def test_drop_oldest_policy():
+    """測試佇列滿時丟棄最舊的訊息"""
+    queue = IngestQueue(maxsize=3, policy='drop_oldest', coalesce=False)
+    for i in range(5):
+        queue.put(f"room{i}", i)
+    assert [queue.get()[1] for _ in range(3)] == [2, 3, 4]
+    assert queue.get_stats()['dropped'] == 2
+
+def test_coalesce_under_pressure():
+    """測試壓力下同一裝置只保留最新讀數"""
+    queue = IngestQueue(maxsize=4, policy='drop_oldest', pressure_ratio=0.5)
+    queue.put("room01", 1)
+    queue.put("room02", 1)
+    # 深度已達壓力門檻，同一裝置的新讀數取代舊讀數
+    queue.put("room01", 2)
+    queue.put("room02", 2)
+    assert len(queue) == 2
+    assert queue.get() == ("room01", 2)
+    assert queue.get() == ("room02", 2)
+    assert queue.get_stats()['coalesced'] == 2
+
+def test_sample_policy():
+    """測試壓力下只接收部分訊息"""
+    queue = IngestQueue(maxsize=100, policy='sample', coalesce=False, pressure_ratio=0.1, sample_every=5)
+    for i in range(60):
+        queue.put(f"room{i}", i)
+    stats = queue.get_stats()
+    assert stats['enqueued'] == 10 + 10
+    assert stats['sampled_out'] == 40
+
+def test_block_policy_waits_for_consumer():
+    """測試 block 策略會等待處理執行緒取出訊息"""
+    queue = IngestQueue(maxsize=2, policy='block', coalesce=False)
+    queue.put("room01", 1)
+    queue.put("room02", 2)
+
+    def consume():
+        time.sleep(0.05)
+        queue.get()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.monotonic()
+    assert queue.put("room03", 3)
+    assert time.monotonic() - start >= 0.04
+    consumer.join()
+    assert queue.get_stats()['blocked'] == 1
+
+    # 關閉後等待中的寫入會放棄
+    queue.close()
+    assert not queue.put("room04", 4)
+
+def test_invalid_policy():
+    """測試無效的過載策略"""
+    with pytest.raises(ValueError):
+        IngestQueue(policy='unknown')
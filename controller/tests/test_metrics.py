@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Controller 監控指標測試
+"""
+
+import urllib.request
+import urllib.error
+import pytest
+
+import metrics
+
+def test_metrics_server_serves_registry():
+    """測試內嵌 HTTP 伺服器輸出指標"""
+    metrics.MESSAGES_RECEIVED.inc()
+    metrics.DB_WRITE_DURATION.observe(0.002, 'reading')
+
+    server = metrics.start_metrics_server('127.0.0.1', 0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.status == 200
+            body = response.read().decode('utf-8')
+        assert 'controller_messages_received_total' in body
+        assert 'controller_db_write_duration_seconds_bucket{operation="reading",le="0.0025"}' in body
+        assert 'controller_ingest_rate' in body
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.shutdown()
+
+def test_rate_meter():
+    """測試速率計算只統計完整的秒數"""
+    meter = metrics.RateMeter(window=5)
+    meter.mark(100)
+    # 目前這一秒尚未結束，不列入計算
+    assert meter.rate() == 0
+
+def test_metrics_server_serves_query_profile(tmp_path):
+    """測試 /queries 端點輸出 controller 資料庫的 SQL 統計"""
+    import json
+    from database import DatabaseManager
+    from common.query_profiler import ProfilingConnection, profiler
+
+    saved = (profiler.enabled, profiler.slow_threshold, profiler.slow_log_path)
+    profiler.reset()
+    profiler.configure(True, 10.0, None)
+    server = metrics.start_metrics_server('127.0.0.1', 0)
+    try:
+        db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+        db.connection_factory = ProfilingConnection
+        db.save_sensor_reading({'temp': 25.0, 'humidity': 50.0, 'timestamp': '2025-01-01T00:00:00Z'})
+
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/queries?limit=5") as response:
+            payload = json.loads(response.read().decode('utf-8'))
+        assert payload['enabled'] is True
+        assert any(entry['sql'].startswith('INSERT INTO sensor_readings') for entry in payload['data'])
+    finally:
+        server.shutdown()
+        profiler.configure(*saved)
+        profiler.reset()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+MQTT 共享訂閱與持久化 session 測試
+使用 tests/mqtt_broker_stub.py 的本機 Broker，不需要 mosquitto
+"""
+
+import json
+import sqlite3
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from config import Config
+from controller import EnvironmentController
+from mqtt_broker_stub import StubBroker
+
+
+@pytest.fixture
+def broker(monkeypatch, tmp_path):
+    """啟動本機 Broker，並將控制器指向暫存資料庫"""
+    stub = StubBroker().start()
+    monkeypatch.setattr(Config, 'MQTT_BROKER', stub.host)
+    monkeypatch.setattr(Config, 'MQTT_PORT', stub.port)
+    monkeypatch.setattr(Config, 'MQTT_TOPIC', 'env/+/reading')
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', False)
+    yield stub
+    stub.stop()
+
+
+def _wait_until(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _publish(broker, count, start=0):
+    """以 QoS 1 發布讀數，分散到多個裝置 topic"""
+    publisher = mqtt.Client(client_id="test-publisher")
+    publisher.connect(broker.host, broker.port, 60)
+    publisher.loop_start()
+    for i in range(start, start + count):
+        payload = json.dumps({'temp': 25.0, 'humidity': 50.0, 'timestamp': f"seq-{i}"})
+        publisher.publish(f"env/room{i % 4:02d}/reading", payload, qos=1).wait_for_publish(5)
+    publisher.loop_stop()
+    publisher.disconnect()
+
+
+def _stored_timestamps(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT timestamp FROM sensor_readings")]
+
+
+def test_subscription_and_client_id(monkeypatch):
+    """測試共享訂閱 topic 與固定 client id 的組成"""
+    monkeypatch.setattr(Config, 'MQTT_TOPIC', 'env/+/reading')
+    monkeypatch.setattr(Config, 'MQTT_SHARED_GROUP', '')
+    monkeypatch.setattr(Config, 'MQTT_CLIENT_ID', '')
+    monkeypatch.setattr(Config, 'MQTT_PERSISTENT_SESSION', False)
+    assert Config.get_mqtt_subscription() == 'env/+/reading'
+    assert Config.get_mqtt_client_id() == ''
+
+    monkeypatch.setattr(Config, 'MQTT_SHARED_GROUP', 'controllers')
+    monkeypatch.setattr(Config, 'MQTT_PERSISTENT_SESSION', True)
+    monkeypatch.setattr(Config, 'CONTROLLER_INSTANCE', '3')
+    assert Config.get_mqtt_subscription() == '$share/controllers/env/+/reading'
+    assert Config.get_mqtt_client_id().endswith('-3')
+    assert Config.get_mqtt_client_id() == Config.get_mqtt_client_id()
+
+
+def test_shared_subscription_splits_without_duplicates(broker, monkeypatch):
+    """測試共享訂閱時多個控制器分攤訊息，每筆只被處理一次"""
+    monkeypatch.setattr(Config, 'MQTT_SHARED_GROUP', 'controllers')
+    controllers = []
+    for i in range(3):
+        monkeypatch.setattr(Config, 'CONTROLLER_INSTANCE', str(i))
+        controllers.append(EnvironmentController())
+    try:
+        for controller in controllers:
+            assert controller.connect()
+        assert _wait_until(lambda: len(broker.connected_clients()) == 3)
+        # 等待訂閱完成
+        time.sleep(0.3)
+
+        _publish(broker, 300)
+        assert _wait_until(lambda: sum(c.message_count for c in controllers) >= 300)
+        time.sleep(0.2)
+
+        counts = [controller.message_count for controller in controllers]
+        assert sum(counts) == 300
+        assert all(count == 100 for count in counts)
+        timestamps = _stored_timestamps(Config.DB_PATH)
+        assert sorted(timestamps) == sorted(f"seq-{i}" for i in range(300))
+    finally:
+        for controller in controllers:
+            controller.disconnect()
+
+
+def test_persistent_session_receives_messages_sent_while_offline(broker, monkeypatch):
+    """測試持久化 session：控制器離線期間的 QoS 1 訊息在重新連線後補送"""
+    monkeypatch.setattr(Config, 'MQTT_PERSISTENT_SESSION', True)
+    monkeypatch.setattr(Config, 'CONTROLLER_INSTANCE', '0')
+
+    controller = EnvironmentController()
+    assert controller.connect()
+    assert _wait_until(lambda: len(broker.connected_clients()) == 1)
+    time.sleep(0.3)
+    _publish(broker, 5)
+    assert _wait_until(lambda: controller.message_count == 5)
+    controller.disconnect()
+    assert _wait_until(lambda: not broker.connected_clients())
+
+    # 離線期間發布
+    _publish(broker, 5, start=5)
+
+    restarted = EnvironmentController()
+    try:
+        assert restarted.connect()
+        assert _wait_until(lambda: restarted.message_count == 5)
+        assert sorted(_stored_timestamps(Config.DB_PATH)) == sorted(f"seq-{i}" for i in range(10))
+    finally:
+        restarted.disconnect()
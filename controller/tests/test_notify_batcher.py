@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+批次通知測試
+測試時間窗、數量上限、關閉時送出剩餘警報，以及 asyncio 引擎的批次通知
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from config import Config
+from async_engine import AsyncEnvironmentController
+from notify_batcher import NotifyBatcher
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.event = threading.Event()
+
+    def __call__(self, batch):
+        self.batches.append((time.monotonic(), [alert['i'] for alert in batch]))
+        self.event.set()
+
+
+def test_batcher_sends_after_window():
+    """測試時間窗內的警報合併成一批，在第一則加入後約 window 秒送出"""
+    recorder = Recorder()
+    batcher = NotifyBatcher(recorder, window=0.2, max_size=100)
+    batcher.start()
+    try:
+        started = time.monotonic()
+        for i in range(5):
+            batcher.add({'i': i})
+        assert recorder.event.wait(2.0)
+        sent_at, items = recorder.batches[0]
+        assert items == [0, 1, 2, 3, 4]
+        assert 0.15 <= sent_at - started < 1.0
+    finally:
+        batcher.close()
+    assert batcher.batches == 1 and batcher.sent == 5
+
+
+def test_batcher_flushes_at_max_size_and_on_close():
+    """測試累積到上限時立即送出，關閉時送出剩餘的警報"""
+    recorder = Recorder()
+    batcher = NotifyBatcher(recorder, window=10.0, max_size=3)
+    batcher.start()
+    for i in range(7):
+        batcher.add({'i': i})
+    assert recorder.event.wait(2.0)
+    batcher.close()
+    assert [items for _, items in recorder.batches] == [[0, 1, 2], [3, 4, 5], [6]]
+    with pytest.raises(RuntimeError):
+        batcher.add({'i': 7})
+
+
+def test_async_engine_batches_notifications(monkeypatch, tmp_path):
+    """測試 asyncio 引擎在時間窗內以一次批次請求送出多則警報"""
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', False)
+    monkeypatch.setattr(Config, 'NOTIFY_BATCH_WINDOW', 0.05)
+    monkeypatch.setattr(Config, 'NOTIFY_BATCH_MAX', 4)
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={'status': 'success', 'rejected': 0})
+
+    async def scenario():
+        controller = AsyncEnvironmentController(transport=httpx.MockTransport(handler))
+        controller.loop = asyncio.get_running_loop()
+        controller._notify_limit = asyncio.Semaphore(Config.NOTIFY_CONCURRENCY)
+        controller.async_http = httpx.AsyncClient(transport=controller._transport)
+        try:
+            for i in range(6):
+                controller._queue_notification({'message': f"警報 {i}"})
+            # 累積到上限的 4 則立即送出，剩餘 2 則在時間窗結束後送出
+            await asyncio.sleep(0.01)
+            assert len(requests) == 1
+            await asyncio.sleep(0.1)
+            await asyncio.gather(*controller._notify_tasks)
+        finally:
+            await controller.async_http.aclose()
+
+    asyncio.run(scenario())
+    assert [path for path, _ in requests] == ["/api/alerts/notify/batch"] * 2
+    assert [[a['message'] for a in body['alerts']] for _, body in requests] == [
+        [f"警報 {i}" for i in range(4)], ["警報 4", "警報 5"]
+    ]
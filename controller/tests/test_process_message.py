@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+控制器訊息處理測試
+"""
+
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import metrics
+from config import Config
+from controller import EnvironmentController
+from data.ring_buffer import RingBufferReader
+
+
+def test_numeric_timestamp_still_evaluates_alerts(tmp_path, monkeypatch):
+    """測試數字格式的 timestamp 寫入環形緩衝區時轉為字串，且不影響警報判斷"""
+    ring_path = str(tmp_path / "recent.ring")
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', True)
+    monkeypatch.setattr(Config, 'RING_BUFFER_PATH', ring_path)
+    monkeypatch.setattr(Config, 'INGEST_QUEUE_ENABLED', False)
+    monkeypatch.setattr(Config, 'NOTIFY_BATCH_WINDOW', 0)
+    monkeypatch.setattr(Config, 'CHANNEL_SOCKET_PATH', '')
+
+    controller = EnvironmentController()
+    notified = []
+    monkeypatch.setattr(controller, 'send_alert_to_server', notified.append)
+    controller.process_message(
+        "env/room01/reading",
+        json.dumps({"temp": 40, "humidity": 50, "timestamp": 1700000000}).encode('utf-8')
+    )
+
+    latest = RingBufferReader(ring_path).latest()
+    assert (latest["temp"], latest["timestamp"]) == (40.0, "1700000000")
+    with sqlite3.connect(controller.db.db_path) as conn:
+        alerts = conn.execute("SELECT alert_type FROM alert_history").fetchall()
+    assert ('high_temperature',) in alerts
+    assert [alert['alert_type'] for alert in notified] == [alert[0] for alert in alerts]
+    controller.ring_buffer.close()
+
+def test_ingest_queue_keys_by_payload_device(tmp_path, monkeypatch):
+    """測試接收佇列以 payload 的 device_id 分區與合併，同一 topic 的不同裝置不互相取代"""
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', False)
+    monkeypatch.setattr(Config, 'INGEST_QUEUE_ENABLED', True)
+    monkeypatch.setattr(Config, 'INGEST_WORKERS', 4)
+    monkeypatch.setattr(Config, 'INGEST_PRESSURE_RATIO', 0.0)
+    monkeypatch.setattr(Config, 'CHANNEL_SOCKET_PATH', '')
+
+    controller = EnvironmentController()
+    for device, temp in [("room01", 20.0), ("room02", 21.0), ("room01", 22.0)]:
+        payload = json.dumps({"temp": temp, "humidity": 50, "device_id": device}).encode('utf-8')
+        controller.on_message(None, None, SimpleNamespace(topic="env/gateway/reading", payload=payload))
+
+    queued = {}
+    for queue in controller.ingest_queues:
+        while (entry := queue.get(timeout=0)) is not None:
+            device, (topic, payload) = entry
+            assert topic == "env/gateway/reading"
+            queued[device] = json.loads(payload)["temp"]
+    # 壓力下 room01 的新讀數取代舊讀數，room02 不受影響
+    assert queued == {"room01": 22.0, "room02": 21.0}
+    assert sum(queue.coalesced for queue in controller.ingest_queues) == 1
+
+    rendered = metrics.registry.render()
+    assert "# TYPE controller_ingest_queue_coalesced_total counter" in rendered
+    assert "# TYPE controller_ingest_queue_dropped_total counter" in rendered
+
+def test_second_controller_marks_ring_instead_of_writing(tmp_path, monkeypatch):
+    """測試環形緩衝區已有寫入端時，其他控制器只寫入資料庫並提高 external_id"""
+    ring_path = str(tmp_path / "recent.ring")
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "test.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', True)
+    monkeypatch.setattr(Config, 'RING_BUFFER_PATH', ring_path)
+    monkeypatch.setattr(Config, 'INGEST_QUEUE_ENABLED', False)
+    monkeypatch.setattr(Config, 'CHANNEL_SOCKET_PATH', '')
+
+    owner = EnvironmentController()
+    other = EnvironmentController()
+    try:
+        assert owner.ring_buffer is not None
+        assert other.ring_buffer is None
+        reader = RingBufferReader(ring_path)
+
+        owner.process_message("env/room01/reading", b'{"temp": 20, "humidity": 50, "timestamp": "t1"}')
+        other.process_message("env/room02/reading", b'{"temp": 21, "humidity": 50, "timestamp": "t2"}')
+        assert reader.external_id() == 2
+        assert reader.latest()["id"] == 1
+
+        owner.process_message("env/room01/reading", b'{"temp": 22, "humidity": 50, "timestamp": "t3"}')
+        assert reader.latest()["id"] == 3
+    finally:
+        owner.ring_buffer.close()
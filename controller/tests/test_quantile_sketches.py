@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+控制器分位數草圖測試
+"""
+
+import sqlite3
+
+from config import Config
+from database import DatabaseManager
+from common.quantile_sketch import DDSketch
+
+
+def test_controllers_merge_hourly_sketches(tmp_path, monkeypatch):
+    """測試兩個控制器各自累積的草圖合併進同一個小時，數量與範圍正確"""
+    monkeypatch.setattr(Config, 'SKETCH_ENABLED', True)
+    monkeypatch.setattr(Config, 'SKETCH_FLUSH_INTERVAL', 3600)
+    db_path = str(tmp_path / "test.db")
+    first = DatabaseManager(db_path=db_path)
+    second = DatabaseManager(db_path=db_path)
+
+    first.save_batch([(20.0 + i * 0.1, 40.0, f"a-{i}") for i in range(100)], [])
+    second.save_sensor_readings([(30.0 + i * 0.1, 60.0, f"b-{i}") for i in range(100)])
+    second.save_sensor_reading({'temp': -5.0, 'humidity': 0.0, 'timestamp': 'b-x'})
+
+    # 未到合併間隔時只在記憶體中累積
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM reading_sketches").fetchone()[0] == 0
+
+    assert first.flush_sketches() == 2
+    assert second.flush_sketches() >= 2
+    assert first.flush_sketches() == 0
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT metric, sketch, count FROM reading_sketches").fetchall()
+    sketches = {}
+    for metric, data, count in rows:
+        sketch = sketches.setdefault(metric, DDSketch(Config.SKETCH_RELATIVE_ACCURACY))
+        sketch.merge(DDSketch.from_bytes(data))
+        assert count == DDSketch.from_bytes(data).count
+    temp = sketches['temp']
+    assert temp.count == 201
+    assert (temp.min, temp.max) == (-5.0, 39.9)
+    assert abs(temp.quantile(0.5) - 29.95) <= Config.SKETCH_RELATIVE_ACCURACY * 29.95 + 0.1
+    assert sketches['humidity'].quantile(0.0) == 0.0
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+離線重播工具測試
+"""
+
+import json
+import sqlite3
+import pytest
+
+from config import Config
+from database import DatabaseManager
+from data.ring_buffer import RingBufferReader, RingBufferWriter
+from replay import ReplayRunner, decode_csv, decode_jsonl
+
+def _write_jsonl(path, temps):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, temp in enumerate(temps):
+            f.write(json.dumps({
+                'temp': temp,
+                'humidity': 50.0,
+                'timestamp': f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z",
+                'device_id': 'room01'
+            }) + '\n')
+
+def _count(db, table):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_decoders_count_bad_rows():
+    """測試 JSONL 與 CSV 解析，無法解析的資料列只計數不中斷"""
+    records, errors = decode_jsonl([
+        '{"temp": 25.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:00Z"}\n',
+        'not json\n',
+        '[1, 2]\n',
+        '\n'
+    ])
+    assert errors == 2
+    assert records[0][:4] == (25.0, 50.0, "2025-01-01T00:00:00Z", None)
+    assert records[0][4] == 1735689600.0
+
+    records, errors = decode_csv((
+        ['temp', 'humidity', 'timestamp', 'device_id'],
+        ['31.5,45,2025-01-01T00:00:00Z,room02\n', 'abc,45,2025-01-01T00:00:01Z,room02\n']
+    ))
+    assert errors == 1
+    assert records[0][:4] == (31.5, 45.0, "2025-01-01T00:00:00Z", "room02")
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_replay_stores_readings_and_lifecycle_alerts(tmp_path, workers):
+    """測試重播寫入所有讀數，警報生命週期以讀數時間計時"""
+    path = str(tmp_path / "readings.jsonl")
+    # 每秒一筆，高溫持續 6 分鐘後恢復（跨多個區塊）
+    _write_jsonl(path, [32.0] * 360 + [25.0] * 10)
+
+    db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+    runner = ReplayRunner(db=db, alert_mode='store', batch_size=50)
+    stats = runner.run(path, workers=workers)
+
+    assert stats['rows'] == 370
+    assert stats['inserted'] == 370
+    assert _count(db, 'sensor_readings') == 370
+
+    # 持續時間短於定期提醒間隔：只有開啟與解除，警報時間為讀數時間
+    with sqlite3.connect(db.db_path) as conn:
+        rows = conn.execute(
+            "SELECT severity, timestamp, device_id FROM alert_history "
+            "WHERE alert_type = 'high_temperature' ORDER BY id"
+        ).fetchall()
+    assert rows == [
+        ('warning', "2025-01-01T00:00:00Z", "room01"),
+        ('info', "2025-01-01T00:06:00Z", "room01")
+    ]
+    assert stats['alerts'] == _count(db, 'alert_history')
+
+def test_replay_keeps_original_times(tmp_path, monkeypatch):
+    """測試回補的讀數與警報以讀數時間作為 created_at，分位數草圖歸入讀數時間的小時"""
+    monkeypatch.setattr(Config, 'SKETCH_ENABLED', True)
+    path = str(tmp_path / "readings.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        for timestamp, temp in (("2024-03-01T10:15:00Z", 32.0), ("2024-03-01T11:45:30Z", 25.0),
+                                ("not a time", 25.0)):
+            f.write(json.dumps({'temp': temp, 'humidity': 50.0, 'timestamp': timestamp}) + '\n')
+
+    db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+    ReplayRunner(db=db, alert_mode='store', batch_size=2).run(path)
+
+    with sqlite3.connect(db.db_path) as conn:
+        readings = conn.execute("SELECT created_at FROM sensor_readings ORDER BY id").fetchall()
+        alerts = conn.execute(
+            "SELECT severity, timestamp, created_at FROM alert_history "
+            "WHERE alert_type = 'high_temperature' ORDER BY id"
+        ).fetchall()
+        hours = conn.execute(
+            "SELECT hour, count FROM reading_sketches WHERE metric = 'temp' ORDER BY hour"
+        ).fetchall()
+    # 無法解析時間的讀數沿用前一筆的時間
+    assert readings == [("2024-03-01 10:15:00",), ("2024-03-01 11:45:30",), ("2024-03-01 11:45:30",)]
+    assert alerts == [
+        ('warning', "2024-03-01T10:15:00Z", "2024-03-01 10:15:00"),
+        ('info', "2024-03-01T11:45:30Z", "2024-03-01 11:45:30")
+    ]
+    assert hours == [("2024-03-01 10:00:00", 1), ("2024-03-01 11:00:00", 2)]
+
+def test_replay_marks_ring_buffer(tmp_path):
+    """測試重播的讀數提高環形緩衝區的 external_id，Web Server 不再以緩衝區回答最新讀數"""
+    path = str(tmp_path / "readings.jsonl")
+    _write_jsonl(path, [25.0] * 5)
+    ring_path = str(tmp_path / "recent.ring")
+    writer = RingBufferWriter(ring_path, capacity=8)
+    writer.append(1, 25.0, 50.0, "live")
+
+    db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+    ReplayRunner(db=db, alert_mode='skip', batch_size=2, ring_buffer_path=ring_path).run(path)
+
+    assert RingBufferReader(ring_path).external_id() == 5
+    writer.close()
+
+def test_replay_csv_skip_alerts(tmp_path):
+    """測試 CSV 重播並略過警報判斷"""
+    path = str(tmp_path / "readings.csv")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("temp,humidity,timestamp\n")
+        for i in range(100):
+            f.write(f"35.0,20.0,2025-01-01T00:00:{i % 60:02d}Z\n")
+
+    db = DatabaseManager(db_path=str(tmp_path / "test.db"))
+    stats = ReplayRunner(db=db, alert_mode='skip', batch_size=30).run(path)
+
+    assert stats['inserted'] == 100
+    assert stats['alerts'] == 0
+    assert _count(db, 'alert_history') == 0
+
+def test_invalid_alert_mode(tmp_path):
+    """測試無效的警報模式"""
+    with pytest.raises(ValueError):
+        ReplayRunner(db=DatabaseManager(db_path=str(tmp_path / "test.db")), alert_mode='email')
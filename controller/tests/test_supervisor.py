@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+多行程控制器（supervisor）測試
+"""
+
+import json
+import sqlite3
+import time
+
+import pytest
+
+import supervisor
+from config import Config
+from database import DatabaseManager
+from supervisor import HashRing, WorkerPool, routing_key
+
+
+def _message(device, seq, temp=25.0):
+    payload = json.dumps({'temp': temp, 'humidity': 50.0, 'timestamp': f"{device}-{seq:05d}"})
+    return f"env/{device}/reading", payload.encode('utf-8')
+
+
+def _timestamps(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT timestamp FROM sensor_readings ORDER BY id")]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return DatabaseManager(db_path=str(tmp_path / "test.db"))
+
+
+def test_hash_ring_moves_few_keys_when_node_added():
+    """測試一致性雜湊：分布平均，新增節點時只有約 1/N 的裝置改變分區"""
+    ring = HashRing(range(4))
+    devices = [f"room{i:04d}" for i in range(4000)]
+    before = {device: ring.get(device) for device in devices}
+
+    counts = [list(before.values()).count(node) for node in range(4)]
+    assert min(counts) > 600
+
+    ring.add(4)
+    moved = [device for device in devices if ring.get(device) != before[device]]
+    assert 400 < len(moved) < 1300
+    # 被移動的裝置都移到新節點
+    assert all(ring.get(device) == 4 for device in moved)
+
+    ring.remove(4)
+    assert all(ring.get(device) == before[device] for device in devices)
+
+
+def test_pool_writes_every_reading_once_in_device_order(db):
+    """測試多個 worker 處理後每筆讀數只寫入一次，且同一裝置依序寫入"""
+    pool = WorkerPool(3, db=db, dispatch_batch=50)
+    pool.start()
+    try:
+        for seq in range(300):
+            for device in ('room01', 'room02', 'room03', 'room04', 'room05'):
+                pool.dispatch(*_message(device, seq))
+    finally:
+        pool.stop()
+
+    timestamps = _timestamps(db)
+    assert len(timestamps) == 1500
+    assert pool.stats['written'] == 1500
+    for device in ('room01', 'room02', 'room03', 'room04', 'room05'):
+        own = [t for t in timestamps if t.startswith(device)]
+        assert own == sorted(own) and len(own) == 300
+
+
+def test_alert_state_stays_with_one_worker(db):
+    """測試同一裝置的警報狀態保留在同一個 worker：持續高溫只開啟一次事件"""
+    pool = WorkerPool(3, db=db, dispatch_batch=10)
+    pool.start()
+    try:
+        for seq in range(100):
+            pool.dispatch(*_message('room01', seq, temp=35.0))
+    finally:
+        pool.stop()
+
+    with sqlite3.connect(db.db_path) as conn:
+        alerts = conn.execute(
+            "SELECT device_id FROM alert_history WHERE alert_type = 'high_temperature'"
+        ).fetchall()
+    assert alerts == [('room01',)]
+
+
+def test_routing_key_matches_pipeline_device():
+    """測試分派鍵與警報判斷使用相同的裝置：優先使用 payload 的 device_id，否則取自 topic"""
+    assert routing_key("env/room01/reading", b'{"temp": 25.0}') == "room01"
+    assert routing_key("env/gw/reading", b'{"temp": 25.0, "device_id": "room07"}') == "room07"
+    assert routing_key("env/gw/reading", b'{"device_id" : "room\\u0030"}') == "room0"
+    assert routing_key("env/gw/reading", b'{"device_id": 42}') == "42"
+    assert routing_key("env/gw/reading", b'{"device_id": ""}') == "gw"
+    assert routing_key("env/gw/reading", b'{"device_id": "a", "device_id": "b"}') == "b"
+    assert routing_key("env/gw/reading", b'not json "device_id"') == "gw"
+
+
+def test_device_on_several_topics_stays_with_one_worker(db):
+    """測試同一個 device_id 經由多個 topic 送出時仍由同一個 worker 處理：持續高溫只開啟一次事件"""
+    pool = WorkerPool(3, db=db, dispatch_batch=10)
+    pool.start()
+    try:
+        for seq in range(100):
+            payload = json.dumps({
+                'temp': 35.0, 'humidity': 50.0, 'timestamp': f"room01-{seq:05d}", 'device_id': 'room01'
+            })
+            pool.dispatch(f"env/gw{seq % 4}/reading", payload.encode('utf-8'))
+    finally:
+        pool.stop()
+
+    assert _timestamps(db) == [f"room01-{seq:05d}" for seq in range(100)]
+    with sqlite3.connect(db.db_path) as conn:
+        alerts = conn.execute(
+            "SELECT device_id FROM alert_history WHERE alert_type = 'high_temperature'"
+        ).fetchall()
+    assert alerts == [('room01',)]
+
+
+def test_worker_restart_replays_unfinished_batches(db):
+    """測試 worker 異常結束後重新啟動，未完成的批次重送且不重複寫入"""
+    pool = WorkerPool(2, db=db, dispatch_batch=20)
+    pool.start()
+    try:
+        for seq in range(200):
+            pool.dispatch(*_message('room01', seq))
+        victim = pool._slots[pool.ring.get('room01')]
+        victim.process.kill()
+        for seq in range(200, 400):
+            pool.dispatch(*_message('room01', seq))
+
+        deadline = time.time() + 30
+        while pool.stats['restarts'] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert pool.stats['restarts'] >= 1
+    timestamps = _timestamps(db)
+    assert timestamps == [f"room01-{seq:05d}" for seq in range(400)]
+
+
+def test_resize_rebalances_devices(db):
+    """測試調整 worker 數量後分區改變，讀數仍完整寫入"""
+    pool = WorkerPool(1, db=db, dispatch_batch=25)
+    pool.start()
+    try:
+        devices = [f"room{i:02d}" for i in range(20)]
+        for seq in range(50):
+            for device in devices:
+                pool.dispatch(*_message(device, seq))
+        assert pool.resize(3)
+        assert len(pool.ring.nodes) == 3
+        assert len({pool.ring.get(device) for device in devices}) > 1
+        for seq in range(50, 100):
+            for device in devices:
+                pool.dispatch(*_message(device, seq))
+    finally:
+        pool.stop()
+
+    timestamps = _timestamps(db)
+    assert len(timestamps) == 2000
+    for device in devices:
+        own = [t for t in timestamps if t.startswith(device)]
+        assert own == sorted(own)
+
+
+@pytest.mark.parametrize("configured, expected", [(1, 6), (3, 3)])
+def test_processes_default_follows_config(monkeypatch, configured, expected):
+    """測試 --processes 預設值：設定 CONTROLLER_PROCESSES 時以它為準，否則為 CPU 核心數"""
+    started = []
+    monkeypatch.setattr(Config, "CONTROLLER_PROCESSES", configured)
+    monkeypatch.setattr(supervisor.os, "cpu_count", lambda: 6)
+    monkeypatch.setattr(supervisor, "SupervisedController",
+                        lambda processes: type("Stub", (), {"run": lambda self: started.append(processes)})())
+    supervisor.main([])
+    assert started == [expected]
@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 """
 資料庫初始化腳本
-建立資料庫檔案和 schema
+建立資料庫檔案，並依 PRAGMA user_version 套用版本化的 schema 遷移
 """
 
 import sqlite3
 import os
 import sys
+from typing import Optional
 
 # 加入專案根目錄到 Python 路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -17,6 +18,117 @@ def get_project_root():
     """取得專案根目錄"""
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# 版本化的 schema 遷移：(版本, 說明, SQL 敘述列表)
+# 版本 1 為 schema.sql 的基礎結構；之後的變更一律新增遷移，不修改既有版本。
+# 每個遷移都必須可以在已有資料、且 controller 仍在寫入的資料庫上執行。
+MIGRATIONS = [
+    (1, "基礎 schema (schema.sql)", None),
+    (2, "警報歷史的複合索引（依類型/嚴重程度過濾並依時間排序）", [
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_type_created
+           ON alert_history(alert_type, created_at)""",
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_severity_created
+           ON alert_history(severity, created_at)""",
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_type_severity_created
+           ON alert_history(alert_type, severity, created_at)""",
+    ]),
+    (3, "警報歷史的數值欄位（溫度、濕度、裝置），由 sensor_data 回填", [
+        "ALTER TABLE alert_history ADD COLUMN temp REAL",
+        "ALTER TABLE alert_history ADD COLUMN humidity REAL",
+        "ALTER TABLE alert_history ADD COLUMN device_id TEXT",
+        """UPDATE alert_history
+           SET temp = json_extract(sensor_data, '$.temp'),
+               humidity = json_extract(sensor_data, '$.humidity'),
+               device_id = json_extract(sensor_data, '$.device_id')
+           WHERE json_valid(sensor_data)""",
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_temp
+           ON alert_history(temp)""",
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_humidity
+           ON alert_history(humidity)""",
+        """CREATE INDEX IF NOT EXISTS idx_alert_history_device_created
+           ON alert_history(device_id, created_at)""",
+    ]),
+    (4, "每小時、每個欄位的分位數草圖（common/quantile_sketch.py）", [
+        """CREATE TABLE IF NOT EXISTS reading_sketches (
+               hour TEXT NOT NULL,
+               metric TEXT NOT NULL,
+               sketch BLOB NOT NULL,
+               count INTEGER NOT NULL,
+               updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+               PRIMARY KEY (hour, metric)
+           ) WITHOUT ROWID""",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def _load_schema_statements() -> list:
+    """讀取 schema.sql 並拆成單一敘述"""
+    schema_file = os.path.join(os.path.dirname(__file__), 'schema.sql')
+    with open(schema_file, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+
+    statements = []
+    buffer = ""
+    for line in schema_sql.splitlines():
+        if line.strip().startswith('--'):
+            continue
+        buffer += line + "\n"
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    return statements
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """取得資料庫目前的 schema 版本"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(db_path: str, busy_timeout: Optional[float] = None) -> int:
+    """
+    將資料庫升級到最新版本，回傳套用的遷移數量
+
+    每個遷移在獨立的 IMMEDIATE 交易中執行並一併更新 user_version，
+    中途失敗時該版本整個回滾；建立索引期間讀取不受影響，
+    controller 與 Web Server 的寫入連線最多等待 DB_BUSY_TIMEOUT 秒，
+    遷移時間超過這個值時寫入會失敗，請先停止 controller 再遷移。
+    busy_timeout 為遷移本身等待寫入鎖的秒數（預設為 DB_BUSY_TIMEOUT）。
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+    if busy_timeout is None:
+        busy_timeout = Config.DB_BUSY_TIMEOUT
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None)
+    try:
+        applied = 0
+        for version, description, statements in MIGRATIONS:
+            if get_schema_version(conn) >= version:
+                continue
+            if statements is None:
+                statements = _load_schema_statements()
+
+            print(f"🔄 套用 schema 遷移 v{version}: {description}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 取得寫入鎖後再確認一次，避免多個行程同時遷移
+                if get_schema_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied += 1
+
+        if applied:
+            # 更新統計資訊，讓查詢規劃器使用新的索引
+            conn.execute("PRAGMA optimize")
+            print(f"✅ schema 已升級到 v{get_schema_version(conn)}")
+        return applied
+    finally:
+        conn.close()
+
 def init_database():
     """初始化資料庫"""
     # 使用 Config 類別取得資料庫路徑
@@ -24,28 +136,20 @@ def init_database():
     
     print(f"🔧 初始化資料庫: {db_path}")
     
-    # 確保目錄存在
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    
-    # 讀取 schema 檔案
-    schema_file = os.path.join(os.path.dirname(__file__), 'schema.sql')
-    
+    # 套用所有 schema 遷移
     try:
-        with open(schema_file, 'r', encoding='utf-8') as f:
-            schema_sql = f.read()
-    except FileNotFoundError:
-        print(f"❌ Schema 檔案不存在: {schema_file}")
+        migrate(db_path)
+    except FileNotFoundError as e:
+        print(f"❌ Schema 檔案不存在: {e.filename}")
+        return False
+    except Exception as e:
+        print(f"❌ 資料庫初始化失敗: {e}")
         return False
     
-    # 建立資料庫連接
     try:
         with sqlite3.connect(db_path) as conn:
             cursor = conn.cursor()
             
-            # 執行 schema SQL
-            cursor.executescript(schema_sql)
-            conn.commit()
-            
             print("✅ 資料庫初始化成功")
             
             # 顯示建立的資料表
@@ -85,9 +189,14 @@ def check_database():
             if missing_tables:
                 print(f"⚠️ 缺少資料表: {missing_tables}")
                 return False
-            else:
-                print("✅ 所有必要資料表都存在")
-                return True
+            
+            version = get_schema_version(conn)
+            if version < SCHEMA_VERSION:
+                print(f"⚠️ schema 版本 v{version} 落後最新版本 v{SCHEMA_VERSION}")
+                return False
+            
+            print(f"✅ 所有必要資料表都存在，schema 版本 v{version}")
+            return True
                 
     except Exception as e:
         print(f"❌ 檢查資料庫失敗: {e}")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+最近讀數環形緩衝區
+以記憶體映射檔案在 controller 與 server 之間共享最近的感測器讀數
+
+檔案格式:
+- 標頭 (64 bytes): magic、格式版本、容量、下一筆寫入序號 (head)、
+  不經過緩衝區寫入資料庫的最大讀數 id (external_id)
+- 紀錄區: capacity 筆固定長度紀錄，第 seq 筆寫入 slot = seq % capacity
+
+每筆紀錄以 seqlock 方式保護: 寫入前把版本設為 2*seq+1 (奇數代表寫入中)，
+寫完後設為 2*seq+2。讀取端前後各讀一次版本，兩次相同且等於預期值才算有效，
+否則代表紀錄正在被寫入或已被新的讀數覆蓋。
+
+批次上傳、離線重播等不經過緩衝區的寫入端以 mark_external_write() 提高 external_id；
+讀取端只在緩衝區最新一筆的 id 大於 external_id 時使用緩衝區，不必查詢資料庫就能判斷緩衝區是否仍是最新。
+
+緩衝區只允許一個寫入端：RingBufferWriter 以 <path>.lock 的 flock 排他鎖保護，
+鎖已被其他行程持有時拋出 RingBufferLocked（例如共享訂閱下的多個控制器），
+取不到鎖的控制器改以 mark_external_write() 標記自己寫入的讀數。
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import time
+from typing import Optional, List, Dict, Any
+
+MAGIC = b'IOTRING1'
+FORMAT_VERSION = 1
+
+# 標頭: magic, 格式版本, 容量, head (下一筆寫入的序號)
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+HEAD_OFFSET = 16
+EXTERNAL_OFFSET = 24
+EXTERNAL_ID = struct.Struct('<Q')
+
+# 紀錄: 版本, 資料庫 id, 溫度, 濕度, 寫入時間 (epoch 秒), 感測器時間字串
+RECORD = struct.Struct('<Qqddd32s')
+VERSION = struct.Struct('<Q')
+TIMESTAMP_SIZE = 32
+
+
+class RingBufferLocked(Exception):
+    """環形緩衝區已有其他寫入端"""
+
+
+def _file_size(capacity: int) -> int:
+    """計算指定容量所需的檔案大小"""
+    return HEADER_SIZE + capacity * RECORD.size
+
+
+def mark_external_write(path: str, reading_id: int) -> bool:
+    """
+    記錄不經過緩衝區寫入資料庫的讀數 id（只會提高 external_id）
+
+    多個寫入端以 external_id 欄位的檔案鎖保護讀取與寫回；緩衝區檔案不存在時不需要記錄，回傳 False。
+    """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        if os.fstat(fd).st_size < HEADER_SIZE:
+            return False
+        fcntl.lockf(fd, fcntl.LOCK_EX, EXTERNAL_ID.size, EXTERNAL_OFFSET)
+        try:
+            with mmap.mmap(fd, HEADER_SIZE) as mm:
+                if HEADER.unpack_from(mm, 0)[0] != MAGIC:
+                    return False
+                if EXTERNAL_ID.unpack_from(mm, EXTERNAL_OFFSET)[0] < reading_id:
+                    EXTERNAL_ID.pack_into(mm, EXTERNAL_OFFSET, reading_id)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, EXTERNAL_ID.size, EXTERNAL_OFFSET)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _format_created_at(created: float) -> str:
+    """將 epoch 秒轉為與 SQLite CURRENT_TIMESTAMP 相同的格式"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(created))
+
+
+class RingBufferWriter:
+    """環形緩衝區寫入端（單一寫入者，由 controller 使用）"""
+
+    def __init__(self, path: str, capacity: int = 4096):
+        """
+        取得寫入鎖後開啟或建立環形緩衝區檔案
+
+        其他行程已持有寫入鎖時拋出 RingBufferLocked
+        """
+        self.path = path
+        self.capacity = capacity
+        self._mm = None
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        # 寫入鎖在 close() 或行程結束時釋放；開啟檔案前取得，避免重新建立檔案時取代其他寫入端的檔案
+        self._lock_fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise RingBufferLocked(f"環形緩衝區已有其他寫入端: {self.path}")
+        self._open()
+
+    def _open(self):
+        """開啟檔案並驗證標頭，格式不符時重新建立"""
+        external_id = 0
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER_SIZE:
+            with open(self.path, 'r+b') as f:
+                self._mm = mmap.mmap(f.fileno(), 0)
+            magic, version, capacity, _ = HEADER.unpack_from(self._mm, 0)
+            if magic == MAGIC:
+                # 重新建立時保留 external_id，舊檔案之前的外部寫入仍然有效
+                external_id = EXTERNAL_ID.unpack_from(self._mm, EXTERNAL_OFFSET)[0]
+                if (version == FORMAT_VERSION and capacity == self.capacity
+                        and len(self._mm) == _file_size(self.capacity)):
+                    return
+            self._mm.close()
+
+        # 以暫存檔建立後再原子替換，避免讀取端映射到被截斷的檔案
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.truncate(_file_size(self.capacity))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.capacity, 0))
+            f.write(EXTERNAL_ID.pack(external_id))
+        os.replace(tmp_path, self.path)
+
+        with open(self.path, 'r+b') as f:
+            self._mm = mmap.mmap(f.fileno(), 0)
+
+    @property
+    def head(self) -> int:
+        """已寫入的總筆數"""
+        return struct.unpack_from('<Q', self._mm, HEAD_OFFSET)[0]
+
+    def append(self, reading_id: int, temp: float, humidity: float,
+               timestamp: str, created: Optional[float] = None):
+        """寫入一筆讀數（timestamp 不是字串時轉為字串，超過 32 bytes 時截斷）"""
+        mm = self._mm
+        seq = struct.unpack_from('<Q', mm, HEAD_OFFSET)[0]
+        offset = HEADER_SIZE + (seq % self.capacity) * RECORD.size
+
+        # 版本設為奇數，標記寫入中
+        VERSION.pack_into(mm, offset, 2 * seq + 1)
+        RECORD.pack_into(
+            mm, offset,
+            2 * seq + 1,
+            reading_id,
+            float(temp),
+            float(humidity),
+            created if created is not None else time.time(),
+            str(timestamp).encode('utf-8')[:TIMESTAMP_SIZE]
+        )
+        # 寫入完成，版本設為偶數後再推進 head
+        VERSION.pack_into(mm, offset, 2 * seq + 2)
+        struct.pack_into('<Q', mm, HEAD_OFFSET, seq + 1)
+
+    def close(self):
+        """關閉映射並釋放寫入鎖"""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class RingBufferReader:
+    """環形緩衝區讀取端（可多個讀取者，由 server 使用）"""
+
+    def __init__(self, path: str, max_retries: int = 3):
+        """建立讀取端，檔案會在第一次讀取時才開啟"""
+        self.path = path
+        self.max_retries = max_retries
+        self._mm = None
+        self._inode = None
+        self.capacity = 0
+
+    def _ensure_open(self) -> bool:
+        """確認映射有效；檔案被 controller 重建時重新開啟"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.close()
+            return False
+
+        if self._mm is not None and st.st_ino == self._inode:
+            return True
+
+        self.close()
+        if st.st_size < HEADER_SIZE:
+            return False
+
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, capacity, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or st.st_size != _file_size(capacity):
+            mm.close()
+            return False
+
+        self._mm = mm
+        self._inode = st.st_ino
+        self.capacity = capacity
+        return True
+
+    def _read_record(self, seq: int) -> Optional[Dict[str, Any]]:
+        """讀取第 seq 筆紀錄；紀錄已被覆蓋或持續寫入中時回傳 None"""
+        mm = self._mm
+        offset = HEADER_SIZE + (seq % self.capacity) * RECORD.size
+        expected = 2 * seq + 2
+
+        for _ in range(self.max_retries):
+            version, reading_id, temp, humidity, created, raw_ts = RECORD.unpack_from(mm, offset)
+            if version != expected:
+                if version & 1:
+                    continue
+                return None
+            if VERSION.unpack_from(mm, offset)[0] != version:
+                continue
+            return {
+                'id': reading_id,
+                'temp': temp,
+                'humidity': humidity,
+                'timestamp': raw_ts.rstrip(b'\0').decode('utf-8'),
+                'created_at': _format_created_at(created)
+            }
+        return None
+
+    def external_id(self) -> int:
+        """不經過緩衝區寫入資料庫的最大讀數 id（緩衝區無法使用時為 0）"""
+        if not self._ensure_open():
+            return 0
+        return EXTERNAL_ID.unpack_from(self._mm, EXTERNAL_OFFSET)[0]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """取得最新一筆讀數，無法由緩衝區提供時回傳 None"""
+        readings = self.recent(1)
+        return readings[0] if readings else None
+
+    def recent(self, limit: int, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        取得最近的讀數（新到舊）
+
+        緩衝區無法完整涵蓋 [offset, offset + limit) 這個範圍時回傳 None，
+        由呼叫端改查資料庫。
+        """
+        if not self._ensure_open():
+            return None
+
+        head = struct.unpack_from('<Q', self._mm, HEAD_OFFSET)[0]
+        end = offset + limit
+        if end > head or end > self.capacity:
+            return None
+
+        readings = []
+        for seq in range(head - 1 - offset, head - 1 - end, -1):
+            record = self._read_record(seq)
+            if record is None:
+                return None
+            readings.append(record)
+        return readings
+
+    def close(self):
+        """關閉映射"""
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = None
+        self._inode = None
@@ -1,5 +1,6 @@
 -- 環境監控系統資料庫 Schema
 -- 建立時間: 2025-01-27
+-- 此檔案為 schema 版本 1；之後的結構變更請新增到 data/init_db.py 的 MIGRATIONS
 
 -- 感測器讀數表
 CREATE TABLE IF NOT EXISTS sensor_readings (
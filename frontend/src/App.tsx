@@ -40,7 +40,7 @@ interface Alert {
 }
 
 // WebSocket 訊息格式
-interface WebSocketMessage {
+interface WebSocketAlertMessage {
   type: 'alert'
   data: {
     alert_type: string
@@ -52,9 +52,31 @@ interface WebSocketMessage {
       humidity: number
     }
   }
-  broadcast_time: string
+  broadcast_time: string | null
+  // 推播序號（由資料庫補送的警報為 null）
+  seq: number | null
+  replay?: boolean
 }
 
+// 重新連線補送結束的訊息，seq 為之後重新連線時應帶上的序號
+interface WebSocketReplayMessage {
+  type: 'replay'
+  source: 'buffer' | 'database'
+  count: number
+  seq: number
+  // 資料庫補送超過上限時為 true，from 之前的警報沒有補送
+  truncated?: boolean
+  from?: string
+}
+
+// 伺服器的心跳，需回覆任何訊息，否則閒置超時後連線會被關閉
+interface WebSocketPingMessage {
+  type: 'ping'
+  seq: number
+}
+
+type WebSocketMessage = WebSocketAlertMessage | WebSocketReplayMessage | WebSocketPingMessage
+
 // 後端 API 回傳的資料格式
 interface ApiSensorData {
   id: number
@@ -155,11 +177,14 @@ function App() {
     let ws: WebSocket | null = null
     let reconnectTimer: number | null = null
     let isUnmounting = false
+    // 收到的最大推播序號，重新連線時伺服器只補送之後的警報
+    let lastSeq: number | null = null
 
     const connectWebSocket = () => {
       try {
-        console.log('🔌 正在連接 WebSocket...', WS_ENDPOINTS.alerts)
-        ws = new WebSocket(WS_ENDPOINTS.alerts)
+        const url = lastSeq ? `${WS_ENDPOINTS.alerts}?last_seq=${lastSeq}` : WS_ENDPOINTS.alerts
+        console.log('🔌 正在連接 WebSocket...', url)
+        ws = new WebSocket(url)
 
         ws.onopen = () => {
           console.log('✅ WebSocket 連線已建立')
@@ -172,6 +197,15 @@ function App() {
             const message: WebSocketMessage = JSON.parse(event.data)
             console.log('📨 收到 WebSocket 訊息:', message)
 
+            if (message.seq && (lastSeq === null || message.seq > lastSeq)) {
+              lastSeq = message.seq
+            }
+
+            if (message.type === 'ping') {
+              ws?.send(JSON.stringify({ type: 'pong' }))
+              return
+            }
+
             if (message.type === 'alert') {
               const { severity, message: alertMessage, timestamp } = message.data
               
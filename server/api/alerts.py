@@ -9,11 +9,17 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, date
 from pydantic import BaseModel, Field
 
+from config import Config
 from server.core import get_db_manager, manager
+from server.core.ingest import MAX_REPORTED_ERRORS
 from fastapi.responses import JSONResponse
 
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
 
+# 有效的警報類型與嚴重程度
+VALID_ALERT_TYPES = ["high_temperature", "low_humidity", "anomaly"]
+VALID_SEVERITIES = ["info", "warning", "error"]
+
 # 定義請求和回應模型
 class AlertNotificationRequest(BaseModel):
     """警報通知請求模型"""
@@ -22,6 +28,18 @@ class AlertNotificationRequest(BaseModel):
     message: str
     timestamp: str
     sensor_data: Dict[str, Any]
+    state: Optional[str] = None
+    device_id: Optional[str] = None
+
+class AlertNotificationBatchRequest(BaseModel):
+    """批次警報通知請求模型"""
+    alerts: List[AlertNotificationRequest] = Field(..., min_length=1)
+
+class AlertSensorData(BaseModel):
+    """警報觸發時的感測器數值"""
+    temp: Optional[float] = None
+    humidity: Optional[float] = None
+    device_id: Optional[str] = None
 
 class AlertResponse(BaseModel):
     """警報資料回應模型"""
@@ -29,7 +47,7 @@ class AlertResponse(BaseModel):
     alert_type: str
     severity: str
     message: str
-    sensor_data: str
+    sensor_data: AlertSensorData
     timestamp: str
     sent_to_frontend: bool
     created_at: str
@@ -47,6 +65,68 @@ class AlertStatisticsResponse(BaseModel):
     status: str = "success"
     data: Dict[str, Any]
 
+# 常駐通道的警報不經過 pydantic，直接檢查欄位型別
+ALERT_FIELD_TYPES = {
+    "alert_type": str,
+    "severity": str,
+    "message": str,
+    "timestamp": str,
+    "sensor_data": dict
+}
+OPTIONAL_ALERT_FIELDS = ("state", "device_id")
+
+def _validation_error(alert_type: str, severity: str) -> Optional[str]:
+    """檢查警報類型與嚴重程度，回傳錯誤訊息（合格時為 None）"""
+    if alert_type not in VALID_ALERT_TYPES:
+        return f"無效的警報類型。有效類型: {', '.join(VALID_ALERT_TYPES)}"
+    if severity not in VALID_SEVERITIES:
+        return f"無效的嚴重程度。有效程度: {', '.join(VALID_SEVERITIES)}"
+    return None
+
+def _alert_payload(alert: Dict[str, Any]) -> Dict[str, Any]:
+    """推播給前端的警報內容"""
+    alert_payload = {
+        "alert_type": alert["alert_type"],
+        "severity": alert["severity"],
+        "message": alert["message"],
+        "timestamp": alert["timestamp"],
+        "sensor_data": alert["sensor_data"]
+    }
+    # 警報生命週期狀態 (open / ongoing / resolved)
+    for field in OPTIONAL_ALERT_FIELDS:
+        if alert.get(field):
+            alert_payload[field] = alert[field]
+    return alert_payload
+
+def _check_alert_fields(alert: Any) -> Optional[str]:
+    """檢查通道送來的警報（未經 pydantic 驗證的 dict）"""
+    if not isinstance(alert, dict):
+        return "警報必須是物件"
+    for field, field_type in ALERT_FIELD_TYPES.items():
+        if not isinstance(alert.get(field), field_type):
+            return f"缺少或無效的欄位: {field}"
+    for field in OPTIONAL_ALERT_FIELDS:
+        if not isinstance(alert.get(field), (str, type(None))):
+            return f"無效的欄位: {field}"
+    return _validation_error(alert["alert_type"], alert["severity"])
+
+async def receive_alerts(alerts: List[Any]) -> Dict[str, Any]:
+    """
+    常駐通道（見 server/core/channel.py）的警報處理
+
+    與 /notify/batch 相同的逐則驗證與批次推播，但不經過 HTTP 與 pydantic；回傳附加在確認中的結果。
+    """
+    payloads = []
+    errors = []
+    for index, alert in enumerate(alerts):
+        error = _check_alert_fields(alert)
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            payloads.append(_alert_payload(alert))
+    await manager.broadcast_many(payloads)
+    return {"broadcast": len(payloads), "rejected": len(errors), "errors": errors[:MAX_REPORTED_ERRORS]}
+
 # API 路由
 @router.post("/notify")
 async def notify_alert(alert: AlertNotificationRequest):
@@ -56,28 +136,15 @@ async def notify_alert(alert: AlertNotificationRequest):
     參數:
     - alert: 警報通知資料
     """
-    # 驗證警報類型
-    valid_alert_types = ["high_temperature", "low_humidity"]
-    if alert.alert_type not in valid_alert_types:
+    # 驗證警報類型與嚴重程度
+    error = _validation_error(alert.alert_type, alert.severity)
+    if error:
         return JSONResponse(
             status_code=400,
             content={
                 "status": "error",
                 "detail": {
-                    "message": f"無效的警報類型。有效類型: {', '.join(valid_alert_types)}"
-                }
-            }
-        )
-    
-    # 驗證嚴重程度
-    valid_severities = ["info", "warning", "error"]
-    if alert.severity not in valid_severities:
-        return JSONResponse(
-            status_code=400,
-            content={
-                "status": "error",
-                "detail": {
-                    "message": f"無效的嚴重程度。有效程度: {', '.join(valid_severities)}"
+                    "message": error
                 }
             }
         )
@@ -85,13 +152,7 @@ async def notify_alert(alert: AlertNotificationRequest):
     # 實作 WebSocket 推播功能
     # 將警報推播給所有連線的前端客戶端
     try:
-        await manager.broadcast_alert({
-            "alert_type": alert.alert_type,
-            "severity": alert.severity,
-            "message": alert.message,
-            "timestamp": alert.timestamp,
-            "sensor_data": alert.sensor_data
-        })
+        await manager.broadcast_alert(_alert_payload(alert.model_dump()))
         print(f"✅ 警報已推播: {alert.alert_type} - {alert.message}")
     except Exception as e:
         print(f"❌ WebSocket 推播失敗: {e}")
@@ -105,10 +166,53 @@ async def notify_alert(alert: AlertNotificationRequest):
         }
     )
 
+@router.post("/notify/batch")
+async def notify_alerts_batch(batch: AlertNotificationBatchRequest):
+    """
+    一次接收多則來自 Controller 的警報通知
+
+    所有警報在同一次請求中驗證，不合格的警報會被略過並列在 errors 中，
+    其餘警報依序指定推播序號後一起推播（v2 連線收到一個合併訊框）。
+    """
+    if len(batch.alerts) > Config.ALERT_NOTIFY_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"單次最多通知 {Config.ALERT_NOTIFY_BATCH_MAX} 則警報"
+        )
+
+    payloads = []
+    errors = []
+    for index, alert in enumerate(batch.alerts):
+        error = _validation_error(alert.alert_type, alert.severity)
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            payloads.append(_alert_payload(alert.model_dump()))
+
+    try:
+        await manager.broadcast_many(payloads)
+        if payloads:
+            print(f"✅ {len(payloads)} 則警報已推播")
+    except Exception as e:
+        print(f"❌ WebSocket 推播失敗: {e}")
+
+    return {
+        "status": "success",
+        "received": len(batch.alerts),
+        "broadcast": len(payloads),
+        "rejected": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS]
+    }
+
 @router.get("/history", response_model=AlertListResponse)
 async def get_alert_history(
     alert_type: Optional[str] = None,
     severity: Optional[str] = None,
+    device_id: Optional[str] = None,
+    min_temp: Optional[float] = None,
+    max_temp: Optional[float] = None,
+    min_humidity: Optional[float] = None,
+    max_humidity: Optional[float] = None,
     limit: int = Query(default=50, ge=1, le=1000),
     offset: int = Query(default=0, ge=0)
 ) -> AlertListResponse:
@@ -118,28 +222,29 @@ async def get_alert_history(
     參數:
     - alert_type: 警報類型過濾
     - severity: 嚴重程度過濾
+    - device_id: 裝置過濾
+    - min_temp / max_temp: 觸發時溫度範圍過濾
+    - min_humidity / max_humidity: 觸發時濕度範圍過濾
     - limit: 回傳筆數限制
     - offset: 分頁偏移量
     """
     # 驗證警報類型
-    valid_alert_types = ["high_temperature", "low_humidity"]
-    if alert_type and alert_type not in valid_alert_types:
+    if alert_type and alert_type not in VALID_ALERT_TYPES:
         raise HTTPException(
             status_code=400,
             detail={
                 "status": "error",
-                "message": f"無效的警報類型。有效類型: {', '.join(valid_alert_types)}"
+                "message": f"無效的警報類型。有效類型: {', '.join(VALID_ALERT_TYPES)}"
             }
         )
     
     # 驗證嚴重程度
-    valid_severities = ["info", "warning", "error"]
-    if severity and severity not in valid_severities:
+    if severity and severity not in VALID_SEVERITIES:
         raise HTTPException(
             status_code=400,
             detail={
                 "status": "error",
-                "message": f"無效的嚴重程度。有效程度: {', '.join(valid_severities)}"
+                "message": f"無效的嚴重程度。有效程度: {', '.join(VALID_SEVERITIES)}"
             }
         )
     
@@ -148,7 +253,12 @@ async def get_alert_history(
         limit=limit,
         offset=offset,
         alert_type=alert_type,
-        severity=severity
+        severity=severity,
+        device_id=device_id,
+        min_temp=min_temp,
+        max_temp=max_temp,
+        min_humidity=min_humidity,
+        max_humidity=max_humidity
     )
     
     return AlertListResponse(
@@ -163,7 +273,12 @@ async def get_alert_history_by_date_range(
     start_date: str,
     end_date: str,
     alert_type: Optional[str] = None,
-    severity: Optional[str] = None
+    severity: Optional[str] = None,
+    device_id: Optional[str] = None,
+    min_temp: Optional[float] = None,
+    max_temp: Optional[float] = None,
+    min_humidity: Optional[float] = None,
+    max_humidity: Optional[float] = None
 ) -> AlertListResponse:
     """
     根據日期範圍取得警報歷史
@@ -173,6 +288,9 @@ async def get_alert_history_by_date_range(
     - end_date: 結束日期 (YYYY-MM-DD)
     - alert_type: 警報類型過濾
     - severity: 嚴重程度過濾
+    - device_id: 裝置過濾
+    - min_temp / max_temp: 觸發時溫度範圍過濾
+    - min_humidity / max_humidity: 觸發時濕度範圍過濾
     """
     try:
         # 驗證日期格式
@@ -193,7 +311,12 @@ async def get_alert_history_by_date_range(
             start_date=start_date,
             end_date=end_date,
             alert_type=alert_type,
-            severity=severity
+            severity=severity,
+            device_id=device_id,
+            min_temp=min_temp,
+            max_temp=max_temp,
+            min_humidity=min_humidity,
+            max_humidity=max_humidity
         )
         
         return AlertListResponse(
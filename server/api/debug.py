@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+除錯相關的 API 端點
+提供 SQL 查詢分析結果（需設定 QUERY_PROFILING_ENABLED=true）與唯讀副本狀態
+"""
+
+from fastapi import APIRouter, Query
+
+from common.query_profiler import profiler
+from server.core import get_db_manager
+
+# 建立路由器
+router = APIRouter(
+    prefix="/api/debug",
+    tags=["debug"],
+)
+
+@router.get("/queries")
+async def get_query_profile(
+    limit: int = Query(default=20, ge=1, le=1000, description="依總耗時列出的敘述數量")
+):
+    """取得總耗時最多的 SQL 敘述"""
+    statements = profiler.top(limit)
+    return {
+        "status": "success",
+        "enabled": profiler.enabled,
+        "slow_threshold_ms": profiler.slow_threshold * 1000,
+        "data": statements,
+        "count": len(statements)
+    }
+
+@router.delete("/queries")
+async def reset_query_profile():
+    """清除 SQL 查詢分析統計"""
+    profiler.reset()
+    return {"status": "success", "message": "查詢統計已清除"}
+
+@router.get("/replica")
+async def get_replica_status():
+    """取得唯讀副本的狀態（是否啟用、落後秒數、更新統計）"""
+    replica = get_db_manager().replica
+    return {
+        "status": "success",
+        "enabled": replica is not None,
+        "data": replica.get_stats() if replica else None
+    }
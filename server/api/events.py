@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events API 路由
+提供只需接收資料的客戶端使用的警報與讀數串流
+"""
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from config import Config
+from server.core import ConnectionManager, SSEConnection, manager, readings_manager
+
+router = APIRouter(prefix="/sse", tags=["sse"])
+
+async def _subscribe(request: Request, channel: ConnectionManager) -> StreamingResponse:
+    """將請求加入推播頻道並回傳事件串流（帶 Last-Event-ID 時先補送錯過的事件）"""
+    connection = SSEConnection(request, Config.SSE_MAX_QUEUE)
+    if not await channel.connect(connection, protocol='sse'):
+        raise HTTPException(
+            status_code=503,
+            detail="連線數已達上限",
+            headers={"Retry-After": str(max(1, Config.SSE_RETRY_MS // 1000))}
+        )
+    return StreamingResponse(
+        connection.events(channel, Config.SSE_RETRY_MS),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 避免 nginx 等反向代理緩衝事件
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.get("/alerts")
+async def stream_alerts(request: Request):
+    """
+    警報事件串流
+    與 /ws/alerts 的 v1 格式相同：每則警報一個 alert 事件，id 為推播序號
+    """
+    return await _subscribe(request, manager)
+
+@router.get("/readings")
+async def stream_readings(request: Request):
+    """
+    感測器讀數事件串流
+    每筆新寫入的讀數一個 reading 事件，id 為推播序號
+    """
+    return await _subscribe(request, readings_manager)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+監控指標 API 端點
+以 Prometheus 文字格式輸出 Web Server 的監控指標
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from server.core import registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """取得 Prometheus 格式的監控指標"""
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
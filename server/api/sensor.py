@@ -4,10 +4,14 @@
 處理所有與感測器數據相關的請求
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from typing import Dict, List, Any
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Any, Optional
 
-from server.core import get_db_manager
+from config import Config
+from server.core import db_manager, manager
+from server.core.ingest import MAX_REPORTED_ERRORS, evaluate_alerts, parse_readings, validate_readings
+from server.core.statistics import RANGE_PRESETS, resolve_range
 
 # 建立路由器
 router = APIRouter(
@@ -16,9 +20,9 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# 取得資料庫管理器
-# 在 sensor.py 中的 get_db_manager() 呼叫不會建立新的實例，而是取得在 database.py 被導入時就已經建立的實例。
-db_manager = get_db_manager()
+# 資料庫管理器
+# db_manager 是全域實例的代理：import 時不建立連線，第一次使用（或 Web Server 啟動）時才建立。
+# 測試以 monkeypatch 替換這個名稱即可改用暫存資料庫。
 
 @router.get("/latest")
 async def get_latest_sensor_reading():
@@ -53,6 +57,57 @@ async def get_sensor_readings(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"取得讀數列表失敗: {str(e)}")
 
+@router.post("/readings/batch")
+async def ingest_sensor_readings_batch(request: Request):
+    """
+    批次上傳感測器讀數（供閘道器使用）
+
+    內容為 JSON 陣列，或 Content-Type 為 application/x-ndjson 的逐行 JSON。
+    每筆讀數需包含 temp、humidity、timestamp，可選 device_id（字串）；
+    不合格的讀數會被略過並列在 errors 中，其餘讀數照常寫入。
+    讀數與警報的 created_at 為讀數的 timestamp，警報依裝置以讀數時間判斷。
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    try:
+        records = await run_in_threadpool(parse_readings, body, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無法解析上傳內容: {str(e)}")
+
+    if len(records) > Config.BATCH_INGEST_MAX_READINGS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"單次最多上傳 {Config.BATCH_INGEST_MAX_READINGS} 筆讀數"
+        )
+
+    def ingest():
+        # 解析後的驗證、寫入與警報判斷都在執行緒中進行，不阻塞事件迴圈
+        rows, devices, errors = validate_readings(records)
+        rows, alerts, alert_times = evaluate_alerts(rows, devices)
+        inserted = db_manager.insert_sensor_readings(rows, Config.BATCH_INGEST_CHUNK_SIZE)
+        db_manager.save_alerts(alerts, alert_times)
+        return inserted, errors, alerts
+
+    try:
+        inserted, errors, alerts = await run_in_threadpool(ingest)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批次寫入讀數失敗: {str(e)}")
+
+    try:
+        await manager.broadcast_many(alerts)
+    except Exception as e:
+        print(f"❌ WebSocket 推播失敗: {e}")
+
+    return {
+        "status": "success",
+        "received": len(records),
+        "inserted": inserted,
+        "rejected": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "alerts": len(alerts)
+    }
+
 @router.get("/readings/range")
 async def get_sensor_readings_by_date_range(
     start_date: str = Query(..., description="開始日期 (YYYY-MM-DD)"),
@@ -82,10 +137,12 @@ async def get_sensor_readings_by_date_range(
         raise HTTPException(status_code=500, detail=f"取得日期範圍讀數失敗: {str(e)}")
 
 @router.get("/statistics")
-async def get_sensor_statistics():
+async def get_sensor_statistics(
+    hours: Optional[float] = Query(default=None, gt=0, description="只統計最近幾小時的讀數")
+):
     """取得感測器統計資訊"""
     try:
-        stats = db_manager.get_sensor_statistics()
+        stats = db_manager.get_sensor_statistics(hours=hours)
         if stats:
             return {
                 "status": "success",
@@ -94,4 +151,66 @@ async def get_sensor_statistics():
         else:
             raise HTTPException(status_code=404, detail="沒有找到統計資料")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"取得統計資訊失敗: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"取得統計資訊失敗: {str(e)}")
+
+@router.get("/statistics/distribution")
+async def get_sensor_distribution(
+    range_name: Optional[str] = Query(default=None, alias="range", description=f"預設範圍: {', '.join(RANGE_PRESETS)}（未指定 start 時使用，預設 day）"),
+    start: Optional[str] = Query(default=None, description="開始時間 (ISO 8601，UTC)"),
+    end: Optional[str] = Query(default=None, description="結束時間 (ISO 8601，UTC)，預設為現在"),
+    percentiles: str = Query(default="50,95,99", description="以逗號分隔的百分位數"),
+    bins: int = Query(default=20, ge=1, le=200, description="直方圖的區間數")
+):
+    """
+    取得時間範圍內溫度與濕度的百分位數與分布直方圖
+
+    範圍依 created_at 切成多個區段平行掃描後合併，結果為精確值（以 0.01 為單位分組）。
+    """
+    try:
+        start_time, end_time = resolve_range(range_name, start, end)
+        qs = [float(q) for q in percentiles.split(',') if q.strip()]
+        if not qs or any(not 0 <= q <= 100 for q in qs):
+            raise ValueError("百分位數必須介於 0 到 100")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無效的參數: {str(e)}")
+
+    try:
+        data = await run_in_threadpool(db_manager.get_reading_distribution, start_time, end_time, qs, bins)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"取得分布統計失敗: {str(e)}")
+    return {
+        "status": "success",
+        "data": data
+    }
+
+@router.get("/statistics/quantiles")
+async def get_sensor_quantiles(
+    range_name: Optional[str] = Query(default=None, alias="range", description=f"預設範圍: {', '.join(RANGE_PRESETS)}（未指定 start 時使用，預設 day）"),
+    start: Optional[str] = Query(default=None, description="開始時間 (ISO 8601，UTC)，向前對齊到整點"),
+    end: Optional[str] = Query(default=None, description="結束時間 (ISO 8601，UTC)，預設為現在，向後對齊到整點"),
+    percentiles: str = Query(default="50,95,99", description="以逗號分隔的百分位數")
+):
+    """
+    由每小時的分位數草圖估計溫度與濕度的百分位數
+
+    不讀取原始讀數，任意長度的範圍都只需合併每小時一份的草圖；
+    估計值的相對誤差不超過回傳的 relative_accuracy。
+    controller 每 SKETCH_FLUSH_INTERVAL 秒合併一次草圖，最近的讀數可能尚未納入。
+    需要精確值時請使用 /statistics/distribution。
+    """
+    try:
+        start_time, end_time = resolve_range(range_name, start, end)
+        qs = [float(q) for q in percentiles.split(',') if q.strip()]
+        if not qs or any(not 0 <= q <= 100 for q in qs):
+            raise ValueError("百分位數必須介於 0 到 100")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無效的參數: {str(e)}")
+
+    try:
+        data = await run_in_threadpool(db_manager.get_reading_quantiles, start_time, end_time, qs)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"取得分位數估計失敗: {str(e)}")
+    return {
+        "status": "success",
+        "data": data
+    }
@@ -3,12 +3,28 @@
 包含系統基礎設施層級的功能
 """
 
-from .database import DatabaseManager, get_db_manager
-from .websocket import ConnectionManager, manager
+from .cache import ReadingCache
+from .database import DatabaseManager, close_db_manager, db_manager, get_db_manager
+from .websocket import ConnectionManager, manager, readings_manager
+from .sse import SSEConnection, ReadingsFeed, poll_readings
+from .channel import ChannelServer
+from .metrics import MetricsRegistry, MetricsMiddleware, registry, monitor_event_loop_lag
 
 __all__ = [
+    'ReadingCache',
     'DatabaseManager',
     'get_db_manager',
+    'close_db_manager',
+    'db_manager',
     'ConnectionManager',
-    'manager'
+    'manager',
+    'readings_manager',
+    'SSEConnection',
+    'ReadingsFeed',
+    'poll_readings',
+    'ChannelServer',
+    'MetricsRegistry',
+    'MetricsMiddleware',
+    'registry',
+    'monitor_event_loop_lag'
 ]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+最近讀數快取模組
+在 Web Server 記憶體中保留最近 N 小時的感測器讀數，減少重複查詢 SQLite
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, List, Dict, Any, Callable
+
+
+class ReadingCache:
+    """
+    最近讀數的時間窗快取
+
+    數值欄位以 array 儲存（依 created_at 遞增排列，與資料庫查詢的排序相同），
+    每次刷新只查詢 id > last_seen_id 的新資料，超出時間窗或筆數上限的舊資料會從前端淘汰。
+    回補的歷史讀數 id 較新但 created_at 較舊：時間窗外的直接略過，時間窗內的插入對應位置，
+    讓依 created_at 二分搜尋的淘汰與統計保持正確。
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable,
+        window_hours: float = 6.0,
+        max_entries: int = 200000,
+        refresh_interval: float = 1.0
+    ):
+        """初始化快取"""
+        self.connection_factory = connection_factory
+        self.window_hours = window_hours
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+
+        self.ids = array('q')
+        self.temps = array('d')
+        self.humidities = array('d')
+        self.timestamps: List[str] = []
+        self.created_at: List[str] = []
+
+        self.last_seen_id = 0
+        # 快取是否包含資料表中的所有讀數（尚未淘汰過任何資料）
+        self.complete = False
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _cutoff(self, hours: float) -> str:
+        """取得時間窗起點（與 created_at 相同的字串格式，可直接比較大小）"""
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - hours * 3600))
+
+    def refresh(self, force: bool = False):
+        """增量刷新快取"""
+        now = time.monotonic()
+        if not force and self._loaded and now - self._last_refresh < self.refresh_interval:
+            return
+
+        with self._lock:
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                if not self._loaded:
+                    # 第一次載入只取時間窗內的讀數
+                    cutoff = self._cutoff(self.window_hours)
+                    cursor.execute("""
+                        SELECT id, temp, humidity, timestamp, created_at
+                        FROM sensor_readings
+                        WHERE created_at >= ?
+                        ORDER BY created_at, id
+                    """, (cutoff,))
+                    rows = cursor.fetchall()
+                    cursor.execute(
+                        "SELECT EXISTS(SELECT 1 FROM sensor_readings WHERE created_at < ?)",
+                        (cutoff,)
+                    )
+                    self.complete = not cursor.fetchone()[0]
+                else:
+                    cursor.execute("""
+                        SELECT id, temp, humidity, timestamp, created_at
+                        FROM sensor_readings
+                        WHERE id > ?
+                        ORDER BY id
+                    """, (self.last_seen_id,))
+                    rows = cursor.fetchall()
+
+            cutoff = self._cutoff(self.window_hours)
+            for row in rows:
+                self._add(row, cutoff)
+            if rows:
+                self.last_seen_id = max(self.last_seen_id, max(row[0] for row in rows))
+
+            self._evict()
+            self._loaded = True
+            self._last_refresh = now
+
+    def _add(self, row: tuple, cutoff: str):
+        """加入一筆讀數，維持 created_at 遞增排列"""
+        created_at = row[4]
+        if created_at < cutoff:
+            # 回補的歷史讀數：不在時間窗內，快取不再包含整張資料表
+            self.complete = False
+            return
+        if not self.created_at or created_at >= self.created_at[-1]:
+            self.ids.append(row[0])
+            self.temps.append(row[1])
+            self.humidities.append(row[2])
+            self.timestamps.append(row[3])
+            self.created_at.append(created_at)
+            return
+        index = bisect_right(self.created_at, created_at)
+        self.ids.insert(index, row[0])
+        self.temps.insert(index, row[1])
+        self.humidities.insert(index, row[2])
+        self.timestamps.insert(index, row[3])
+        self.created_at.insert(index, created_at)
+
+    def _evict(self):
+        """淘汰時間窗外或超過筆數上限的舊讀數"""
+        count = bisect_left(self.created_at, self._cutoff(self.window_hours))
+        count = max(count, len(self.ids) - self.max_entries)
+        if count <= 0:
+            return
+
+        del self.ids[:count]
+        del self.temps[:count]
+        del self.humidities[:count]
+        del self.timestamps[:count]
+        del self.created_at[:count]
+        self.complete = False
+
+    def _row(self, i: int) -> Dict[str, Any]:
+        """將第 i 筆讀數轉為與資料庫查詢相同格式的字典"""
+        return {
+            'id': self.ids[i],
+            'temp': self.temps[i],
+            'humidity': self.humidities[i],
+            'timestamp': self.timestamps[i],
+            'created_at': self.created_at[i]
+        }
+
+    def get_readings(self, limit: int, offset: int = 0) -> Optional[List[Dict[str, Any]]]:
+        """
+        取得最近的讀數（新到舊）
+
+        快取無法完整涵蓋要求的範圍時回傳 None，由呼叫端改查資料庫。
+        """
+        self.refresh()
+        # 其他請求的執行緒可能同時刷新（附加並從前端淘汰），讀取期間持有鎖
+        with self._lock:
+            size = len(self.ids)
+            if offset + limit > size and not self.complete:
+                return None
+
+            end = size - offset
+            start = max(end - limit, 0)
+            return [self._row(i) for i in range(end - 1, start - 1, -1)]
+
+    def get_statistics(self, hours: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        計算統計資訊
+
+        - hours 為 None 時統計全部讀數，只有在快取包含整張資料表時才能回答
+        - hours 在時間窗內時只統計最近 hours 小時的讀數
+        超出快取範圍時回傳 None。
+        """
+        self.refresh()
+        # 在鎖內複製需要的區段，計算時不阻擋刷新
+        with self._lock:
+            if hours is None:
+                if not self.complete:
+                    return None
+                start = 0
+            else:
+                if hours > self.window_hours and not self.complete:
+                    return None
+                start = bisect_left(self.created_at, self._cutoff(hours))
+
+            temps = self.temps[start:]
+            humidities = self.humidities[start:]
+            latest_reading_time = self.created_at[-1] if self.created_at else None
+        total = len(temps)
+        if total == 0:
+            return {
+                'total_readings': 0,
+                'avg_temp': None,
+                'avg_humidity': None,
+                'min_temp': None,
+                'max_temp': None,
+                'min_humidity': None,
+                'max_humidity': None
+            }
+
+        return {
+            'total_readings': total,
+            'avg_temp': sum(temps) / total,
+            'avg_humidity': sum(humidities) / total,
+            'min_temp': min(temps),
+            'max_temp': max(temps),
+            'min_humidity': min(humidities),
+            'max_humidity': max(humidities),
+            'latest_reading_time': latest_reading_time
+        }
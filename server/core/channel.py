@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Controller 常駐通道（Web Server 端）
+在 CHANNEL_SOCKET_PATH 監聽 Unix domain socket，接收 controller 以長度前綴訊框送來的警報與新讀數，
+處理後依序回覆確認。訊框格式見 common/stream_channel.py。
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from common.stream_channel import encode_frame, read_frame
+from .metrics import registry
+
+# 訊息處理函式：接收訊框的 data，回傳要附加在確認中的欄位（可為 None）
+Handler = Callable[[List[Dict[str, Any]]], Awaitable[Optional[Dict[str, Any]]]]
+
+CHANNEL_FRAMES = registry.counter('channel_frames_received_total', '通道收到的訊框數（依類型）', ['type'])
+CHANNEL_HANDLE_DURATION = registry.histogram(
+    'channel_handle_duration_seconds',
+    '通道訊框的處理時間（收到到回覆確認）',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1)
+)
+
+
+class ChannelServer:
+    """Unix domain socket 通道伺服器，每個 controller 連線依序處理訊框"""
+
+    def __init__(self, handlers: Dict[str, Handler]):
+        self.handlers = handlers
+        self.path: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    @property
+    def connections(self) -> int:
+        return len(self._writers)
+
+    def has_clients(self) -> bool:
+        """是否有 controller 連線中（連線中的 controller 會直接推送新讀數）"""
+        return bool(self._writers)
+
+    async def start(self, path: str):
+        """開始監聽（移除前一次執行留下的 socket 檔案）"""
+        if os.path.exists(path):
+            os.unlink(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, path=path)
+        self.path = path
+        print(f"🔌 Controller 通道監聽中: {path}")
+
+    async def stop(self):
+        """停止監聽並關閉所有連線（controller 會自動重新連線並重送未確認的訊框）"""
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        self._server = None
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        print(f"🔗 Controller 通道連線 - 目前連線數: {len(self._writers)}")
+        try:
+            while True:
+                message = await read_frame(reader)
+                start = time.perf_counter()
+                reply = await self.dispatch(message)
+                writer.write(encode_frame(reply))
+                await writer.drain()
+                CHANNEL_HANDLE_DURATION.observe(time.perf_counter() - start)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            print(f"❌ Controller 通道訊框無效: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            print(f"🔌 Controller 通道關閉 - 目前連線數: {len(self._writers)}")
+
+    async def dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """處理一個訊框，回傳確認或錯誤"""
+        if not isinstance(message, dict):
+            return {"type": "error", "id": None, "error": "訊框必須是物件"}
+        message_type = message.get('type')
+        frame_id = message.get('id')
+        handler = self.handlers.get(message_type)
+        if handler is None:
+            CHANNEL_FRAMES.inc('unknown')
+            return {"type": "error", "id": frame_id, "error": f"未知的訊息類型: {message_type}"}
+        CHANNEL_FRAMES.inc(message_type)
+        data = message.get('data')
+        if not isinstance(data, list):
+            return {"type": "error", "id": frame_id, "error": "data 必須是列表"}
+        try:
+            result = await handler(data)
+        except Exception as e:
+            print(f"❌ 處理通道訊息失敗: {e}")
+            return {"type": "error", "id": frame_id, "error": str(e)}
+        return {"type": "ack", "id": frame_id, **(result or {})}
@@ -4,25 +4,129 @@
 處理 SQLite 資料庫連接和基本操作
 """
 
+import json
 import sqlite3
 import os
 import sys
-from typing import Optional, List, Dict, Any, Tuple
+import threading
+import time
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 from contextlib import contextmanager
+from datetime import datetime
 
 # 將專案根目錄加入 Python 路徑
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from config import Config
+from common.query_profiler import ProfilingConnection, profiler
+from common.quantile_sketch import HourlySketches, align_range, load_sketches, merge_into_db
+from data.init_db import migrate
+from data.ring_buffer import RingBufferReader, mark_external_write
+from .cache import ReadingCache
+from .replica import ReadReplica
+from .statistics import TIME_FORMAT, RangeScanner
+from .metrics import registry, timed
+
+# 各查詢方法的執行時間
+DB_QUERY_DURATION = registry.histogram(
+    'db_query_duration_seconds',
+    'DatabaseManager 各方法的執行時間',
+    ['method']
+)
 
 class DatabaseManager:
     """資料庫管理類別"""
     
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, ring_buffer_path: Optional[str] = None):
         """初始化資料庫管理器"""
         self.db_path = db_path or Config.get_db_path()
         self._ensure_db_directory()
+        
+        # 套用尚未執行的 schema 遷移（與 controller 共用同一個資料庫）
+        migrate(self.db_path)
+        
+        # 查詢分析（選用）：記錄每個 SQL 敘述的耗時並寫入慢查詢紀錄
+        self.connection_factory = sqlite3.Connection
+        if Config.QUERY_PROFILING_ENABLED:
+            profiler.configure(True, Config.SLOW_QUERY_THRESHOLD_MS / 1000, Config.get_slow_query_log_path())
+            self.connection_factory = ProfilingConnection
+        
+        # 最近讀數優先從 controller 的環形緩衝區讀取，涵蓋不到時才查詢資料庫
+        if ring_buffer_path is None and Config.RING_BUFFER_ENABLED:
+            ring_buffer_path = Config.get_ring_buffer_path()
+        self.ring_reader = RingBufferReader(ring_buffer_path) if ring_buffer_path else None
+        
+        # 最近 N 小時的讀數快取，在時間窗內的查詢直接由記憶體回答
+        self.reading_cache = None
+        if Config.READING_CACHE_ENABLED:
+            self.reading_cache = ReadingCache(
+                self.get_connection,
+                window_hours=Config.READING_CACHE_HOURS,
+                max_entries=Config.READING_CACHE_MAX_ENTRIES,
+                refresh_interval=Config.READING_CACHE_REFRESH_INTERVAL
+            )
+        
+        # 範圍統計：依時間區段平行掃描
+        self.range_scanner = RangeScanner(
+            self.db_path,
+            connection_factory=self.connection_factory,
+            workers=Config.STATS_SCAN_WORKERS,
+            chunk_hours=Config.STATS_CHUNK_HOURS
+        )
+        
+        # 唯讀副本（選用）：分析查詢改讀副本，由 start_replica() 完成第一次同步並開始背景更新
+        self.replica = None
+        if Config.READ_REPLICA_ENABLED:
+            self.replica = ReadReplica(
+                self.db_path,
+                Config.get_read_replica_path(),
+                mode=Config.READ_REPLICA_MODE,
+                refresh_interval=Config.READ_REPLICA_REFRESH_INTERVAL,
+                max_staleness=Config.READ_REPLICA_MAX_STALENESS,
+                chunk_rows=Config.READ_REPLICA_CHUNK_ROWS
+            )
+    
+    def warm_up(self, preload_cache: bool = False) -> Dict[str, float]:
+        """
+        預熱（Web Server 啟動時呼叫），回傳各步驟耗時（毫秒）
+
+        - 開啟一次連線並讀取 schema 與各資料表的最新資料列，讓 schema 解析與索引根頁面進入快取
+        - 映射 controller 的環形緩衝區
+        - preload_cache 時預先載入最近讀數快取，第一個請求不必等待載入
+        """
+        timings = {}
+        started = time.perf_counter()
+        with self.get_connection() as conn:
+            conn.execute("SELECT name FROM sqlite_master").fetchall()
+            conn.execute("SELECT MAX(id) FROM sensor_readings").fetchone()
+            conn.execute("SELECT MAX(created_at) FROM sensor_readings").fetchone()
+            conn.execute("SELECT MAX(id) FROM alert_history").fetchone()
+        timings['database_ms'] = (time.perf_counter() - started) * 1000
+
+        if self.ring_reader:
+            started = time.perf_counter()
+            self.ring_reader.latest()
+            timings['ring_buffer_ms'] = (time.perf_counter() - started) * 1000
+
+        if preload_cache and self.reading_cache is not None:
+            started = time.perf_counter()
+            self.reading_cache.refresh(force=True)
+            timings['reading_cache_ms'] = (time.perf_counter() - started) * 1000
+        return timings
+    
+    def start_replica(self):
+        """同步唯讀副本並開始背景更新（Web Server 啟動時呼叫）"""
+        if self.replica:
+            self.replica.start()
+    
+    def close(self):
+        """釋放背景執行緒與檔案映射（Web Server 關閉時呼叫）"""
+        self.range_scanner.shutdown()
+        if self.replica:
+            self.replica.stop()
+        if self.ring_reader:
+            self.ring_reader.close()
     
     def _ensure_db_directory(self):
         """確保資料庫目錄存在"""
@@ -30,12 +134,16 @@ class DatabaseManager:
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir)
     
+    def read_path(self) -> str:
+        """分析查詢使用的資料庫路徑：唯讀副本在允許的落後範圍內時為副本，否則為主資料庫"""
+        return self.replica.read_path() if self.replica else self.db_path
+    
     @contextmanager
-    def get_connection(self):
+    def get_connection(self, db_path: Optional[str] = None):
         """取得資料庫連接的上下文管理器"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(db_path or self.db_path, timeout=Config.DB_BUSY_TIMEOUT, factory=self.connection_factory)
             conn.row_factory = sqlite3.Row
             yield conn
         except sqlite3.Error as e:
@@ -45,8 +153,31 @@ class DatabaseManager:
             if conn:
                 conn.close()
     
+    def _ring_recent(self, limit: int, offset: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        由環形緩衝區取得最近讀數
+
+        批次上傳與離線重播的讀數不經過環形緩衝區，寫入時提高緩衝區標頭的 external_id；
+        緩衝區最新一筆必須大於 external_id，且到查詢範圍為止的 id 連續（中間沒有夾著其他寫入端的讀數），
+        否則回傳 None，改查資料庫。
+        """
+        readings = self.ring_reader.recent(offset + limit)
+        if not readings:
+            return readings
+        if readings[0]['id'] - readings[-1]['id'] != len(readings) - 1:
+            return None
+        if readings[0]['id'] <= self.ring_reader.external_id():
+            return None
+        return readings[offset:]
+    
+    @timed(DB_QUERY_DURATION, 'get_latest_sensor_reading')
     def get_latest_sensor_reading(self) -> Optional[Dict[str, Any]]:
         """取得最新的感測器讀數"""
+        if self.ring_reader:
+            readings = self._ring_recent(1, 0)
+            if readings:
+                return readings[0]
+        
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
@@ -62,8 +193,22 @@ class DatabaseManager:
             print(f"❌ 取得最新讀數失敗: {e}")
             return None
     
+    @timed(DB_QUERY_DURATION, 'get_sensor_readings')
     def get_sensor_readings(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
         """取得感測器讀數列表"""
+        if self.ring_reader:
+            readings = self._ring_recent(limit, offset)
+            if readings is not None:
+                return readings
+        
+        if self.reading_cache:
+            try:
+                readings = self.reading_cache.get_readings(limit, offset)
+                if readings is not None:
+                    return readings
+            except Exception as e:
+                print(f"⚠️ 讀數快取查詢失敗，改查資料庫: {e}")
+        
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
@@ -79,15 +224,16 @@ class DatabaseManager:
             print(f"❌ 取得讀數列表失敗: {e}")
             return []
     
+    @timed(DB_QUERY_DURATION, 'get_sensor_readings_by_date_range')
     def get_sensor_readings_by_date_range(self, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """根據日期範圍取得感測器讀數"""
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(self.read_path()) as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     SELECT id, temp, humidity, timestamp, created_at
                     FROM sensor_readings
-                    WHERE DATE(created_at) BETWEEN ? AND ?
+                    WHERE created_at >= DATE(?) AND created_at < DATE(?, '+1 day')
                     ORDER BY created_at DESC
                 """, (start_date, end_date))
                 results = cursor.fetchall()
@@ -96,14 +242,70 @@ class DatabaseManager:
             print(f"❌ 取得日期範圍讀數失敗: {e}")
             return []
     
-    def get_sensor_statistics(self) -> Dict[str, Any]:
-        """取得感測器統計資訊"""
+    @timed(DB_QUERY_DURATION, 'get_readings_after')
+    def get_readings_after(self, last_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """取得 id 大於 last_id 的讀數（依 id 由舊到新，供讀數推播使用，讀取主資料庫）"""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, temp, humidity, timestamp, created_at
+                FROM sensor_readings
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @timed(DB_QUERY_DURATION, 'get_readings_between')
+    def get_readings_between(self, since: str, until: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        取得 created_at 在 [since, until] 之間的讀數（含邊界），依 id 由舊到新排列
+
+        用於讀數推播重新連線時的補送；超過 limit 筆時只回傳最新的 limit 筆。
+        """
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, temp, humidity, timestamp, created_at
+                FROM sensor_readings
+                WHERE created_at >= ? AND (? IS NULL OR created_at <= ?)
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                (since, until, until, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+    
+    @timed(DB_QUERY_DURATION, 'get_sensor_statistics')
+    def get_sensor_statistics(self, hours: Optional[float] = None) -> Dict[str, Any]:
+        """
+        取得感測器統計資訊
+
+        參數:
+        - hours: 只統計最近 hours 小時的讀數，None 代表全部
+        """
+        if self.reading_cache:
+            try:
+                stats = self.reading_cache.get_statistics(hours)
+                if stats is not None:
+                    return stats
+            except Exception as e:
+                print(f"⚠️ 讀數快取統計失敗，改查資料庫: {e}")
+        
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(self.read_path()) as conn:
                 cursor = conn.cursor()
                 
+                where = ""
+                params = []
+                if hours is not None:
+                    where = "WHERE created_at >= datetime('now', ?)"
+                    params.append(f"-{hours} hours")
+                
                 # 取得基本統計
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT 
                         COUNT(*) as total_readings,
                         AVG(temp) as avg_temp,
@@ -113,16 +315,18 @@ class DatabaseManager:
                         MIN(humidity) as min_humidity,
                         MAX(humidity) as max_humidity
                     FROM sensor_readings
-                """)
+                    {where}
+                """, params)
                 stats = dict(cursor.fetchone())
                 
                 # 取得最新讀數時間
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT created_at
                     FROM sensor_readings
+                    {where}
                     ORDER BY created_at DESC
                     LIMIT 1
-                """)
+                """, params)
                 latest = cursor.fetchone()
                 if latest:
                     stats['latest_reading_time'] = latest['created_at']
@@ -132,12 +336,121 @@ class DatabaseManager:
             print(f"❌ 取得統計資訊失敗: {e}")
             return {}
     
+    @timed(DB_QUERY_DURATION, 'get_reading_distribution')
+    def get_reading_distribution(
+        self,
+        start: datetime,
+        end: datetime,
+        percentiles: Sequence[float] = (50, 95, 99),
+        bins: int = 20
+    ) -> Dict[str, Any]:
+        """
+        取得 [start, end) 內讀數的百分位數與直方圖（created_at 為 UTC）
+
+        回傳:
+        - 範圍、區段數與 temp / humidity 各自的筆數、平均、最小、最大、百分位數與直方圖
+        """
+        distributions, chunks = self.range_scanner.scan(start, end, self.read_path())
+        result = {
+            'start': start.strftime(TIME_FORMAT),
+            'end': end.strftime(TIME_FORMAT),
+            'chunks': chunks
+        }
+        for metric, distribution in distributions.items():
+            result[metric] = distribution.summary(percentiles, bins)
+        return result
+    
+    @timed(DB_QUERY_DURATION, 'get_reading_quantiles')
+    def get_reading_quantiles(
+        self,
+        start: datetime,
+        end: datetime,
+        percentiles: Sequence[float] = (50, 95, 99)
+    ) -> Dict[str, Any]:
+        """
+        由每小時的分位數草圖估計 [start, end) 內讀數的百分位數
+
+        範圍向外對齊到整點；估計值的相對誤差不超過 relative_accuracy
+        （見 common/quantile_sketch.py），最小值、最大值與平均為精確值。
+        """
+        start, end = align_range(start, end)
+        with self.get_connection(self.read_path()) as conn:
+            sketches, hours = load_sketches(conn, start, end, Config.SKETCH_RELATIVE_ACCURACY)
+        result = {
+            'start': start.strftime(TIME_FORMAT),
+            'end': end.strftime(TIME_FORMAT),
+            'hours': hours,
+            'relative_accuracy': max(
+                (sketch.relative_accuracy for sketch in sketches.values() if sketch.count),
+                default=Config.SKETCH_RELATIVE_ACCURACY
+            )
+        }
+        for metric, sketch in sketches.items():
+            if not sketch.count:
+                result[metric] = {'count': 0, 'avg': None, 'min': None, 'max': None, 'percentiles': {}}
+                continue
+            estimates = sketch.quantiles([q / 100 for q in percentiles])
+            result[metric] = {
+                'count': sketch.count,
+                'avg': sketch.sum / sketch.count,
+                'min': sketch.min,
+                'max': sketch.max,
+                'percentiles': {f"p{q:g}": round(value, 4) for q, value in zip(percentiles, estimates)}
+            }
+        return result
+    
+    # 警報歷史查詢的欄位；數值欄位直接回傳，不需要逐筆解析 sensor_data JSON
+    ALERT_COLUMNS = """
+        id, alert_type, severity, message, temp, humidity, device_id,
+        timestamp, sent_to_frontend, created_at
+    """
+
+    @staticmethod
+    def _build_alert_filters(
+        alert_type: Optional[str] = None,
+        severity: Optional[str] = None,
+        device_id: Optional[str] = None,
+        min_temp: Optional[float] = None,
+        max_temp: Optional[float] = None,
+        min_humidity: Optional[float] = None,
+        max_humidity: Optional[float] = None
+    ) -> Tuple[str, List[Any]]:
+        """建立警報歷史的過濾條件"""
+        query = ""
+        params: List[Any] = []
+        for clause, value in (
+            (" AND alert_type = ?", alert_type),
+            (" AND severity = ?", severity),
+            (" AND device_id = ?", device_id),
+            (" AND temp >= ?", min_temp),
+            (" AND temp <= ?", max_temp),
+            (" AND humidity >= ?", min_humidity),
+            (" AND humidity <= ?", max_humidity),
+        ):
+            if value is not None and value != "":
+                query += clause
+                params.append(value)
+        return query, params
+
+    @staticmethod
+    def _alert_row(row: sqlite3.Row) -> Dict[str, Any]:
+        """將警報資料列轉為回應格式，sensor_data 由數值欄位組成"""
+        alert = dict(row)
+        alert["sensor_data"] = {
+            "temp": alert.pop("temp"),
+            "humidity": alert.pop("humidity"),
+            "device_id": alert.pop("device_id")
+        }
+        return alert
+
+    @timed(DB_QUERY_DURATION, 'get_alert_history')
     def get_alert_history(
         self,
         limit: int = 50,
         offset: int = 0,
         alert_type: Optional[str] = None,
-        severity: Optional[str] = None
+        severity: Optional[str] = None,
+        **value_filters
     ) -> Tuple[List[Dict[str, Any]], int]:
         """
         取得警報歷史
@@ -147,59 +460,67 @@ class DatabaseManager:
         - offset: 分頁偏移量
         - alert_type: 警報類型過濾
         - severity: 嚴重程度過濾
+        - value_filters: device_id、min_temp、max_temp、min_humidity、max_humidity 過濾
 
         回傳:
         - Tuple[List[Dict], int]: (警報列表, 總筆數)
         """
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(self.read_path()) as conn:
                 cursor = conn.cursor()
                 
-                # 建立基本查詢
-                query = """
-                    SELECT id, alert_type, severity, message, sensor_data, timestamp, sent_to_frontend, created_at
-                    FROM alert_history
-                    WHERE 1=1
-                """
-                params = []
-
                 # 加入過濾條件
-                if alert_type:
-                    query += " AND alert_type = ?"
-                    params.append(alert_type)
-                
-                if severity:
-                    query += " AND severity = ?"
-                    params.append(severity)
+                filters, params = self._build_alert_filters(alert_type, severity, **value_filters)
 
                 # 先取得總筆數
-                count_query = f"SELECT COUNT(*) as total FROM ({query}) as subquery"
-                cursor.execute(count_query, params)
+                cursor.execute(f"SELECT COUNT(*) as total FROM alert_history WHERE 1=1{filters}", params)
                 total_count = cursor.fetchone()["total"]
 
                 # 加入排序和分頁
-                query += """
+                cursor.execute(f"""
+                    SELECT {self.ALERT_COLUMNS}
+                    FROM alert_history
+                    WHERE 1=1{filters}
                     ORDER BY created_at DESC
                     LIMIT ? OFFSET ?
-                """
-                params.extend([limit, offset])
-
-                # 執行主查詢
-                cursor.execute(query, params)
+                """, params + [limit, offset])
                 results = cursor.fetchall()
                 
-                return [dict(row) for row in results], total_count
+                return [self._alert_row(row) for row in results], total_count
 
         except Exception as e:
             print(f"❌ 取得警報歷史失敗: {e}")
             return [], 0
 
+    @timed(DB_QUERY_DURATION, 'get_alerts_between')
+    def get_alerts_between(self, since: str, until: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        取得 created_at 在 [since, until] 之間的警報（含邊界），依時間由舊到新排列
+
+        用於 WebSocket 重新連線時補送記憶體中已不存在的警報，因此讀取主資料庫（副本可能落後）；
+        超過 limit 筆時只回傳最新的 limit 筆。
+        """
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {self.ALERT_COLUMNS}
+                FROM alert_history
+                WHERE created_at >= ? AND (? IS NULL OR created_at <= ?)
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+                """,
+                (since, until, until, limit)
+            ).fetchall()
+        return [self._alert_row(row) for row in reversed(rows)]
+
+    @timed(DB_QUERY_DURATION, 'get_alert_history_by_date_range')
     def get_alert_history_by_date_range(
         self,
         start_date: str,
         end_date: str,
         alert_type: Optional[str] = None,
-        severity: Optional[str] = None
+        severity: Optional[str] = None,
+        **value_filters
     ) -> Tuple[List[Dict[str, Any]], int]:
         """
         根據日期範圍取得警報歷史
@@ -209,49 +530,40 @@ class DatabaseManager:
         - end_date: 結束日期 (YYYY-MM-DD)
         - alert_type: 警報類型過濾
         - severity: 嚴重程度過濾
+        - value_filters: device_id、min_temp、max_temp、min_humidity、max_humidity 過濾
 
         回傳:
         - Tuple[List[Dict], int]: (警報列表, 總筆數)
         """
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(self.read_path()) as conn:
                 cursor = conn.cursor()
                 
-                # 建立基本查詢
-                query = """
-                    SELECT id, alert_type, severity, message, sensor_data, timestamp, sent_to_frontend, created_at
-                    FROM alert_history
-                    WHERE DATE(created_at) BETWEEN ? AND ?
-                """
-                params = [start_date, end_date]
-
-                # 加入過濾條件
-                if alert_type:
-                    query += " AND alert_type = ?"
-                    params.append(alert_type)
-                
-                if severity:
-                    query += " AND severity = ?"
-                    params.append(severity)
+                # 以範圍條件取代 DATE(created_at)，讓 created_at 索引可以使用
+                filters, params = self._build_alert_filters(alert_type, severity, **value_filters)
+                filters = " AND created_at >= DATE(?) AND created_at < DATE(?, '+1 day')" + filters
+                params = [start_date, end_date] + params
 
                 # 先取得總筆數
-                count_query = f"SELECT COUNT(*) as total FROM ({query}) as subquery"
-                cursor.execute(count_query, params)
+                cursor.execute(f"SELECT COUNT(*) as total FROM alert_history WHERE 1=1{filters}", params)
                 total_count = cursor.fetchone()["total"]
 
                 # 加入排序
-                query += " ORDER BY created_at DESC"
-
-                # 執行主查詢
-                cursor.execute(query, params)
+                cursor.execute(f"""
+                    SELECT {self.ALERT_COLUMNS}
+                    FROM alert_history
+                    WHERE 1=1{filters}
+                    ORDER BY created_at DESC
+                """, params)
                 results = cursor.fetchall()
                 
-                return [dict(row) for row in results], total_count
+                return [self._alert_row(row) for row in results], total_count
 
         except Exception as e:
             print(f"❌ 取得日期範圍警報歷史失敗: {e}")
             return [], 0
 
+    @timed(DB_QUERY_DURATION, 'get_alert_statistics')
     def get_alert_statistics(self) -> Dict[str, Any]:
         """
         取得警報統計資訊
@@ -260,7 +572,7 @@ class DatabaseManager:
         - Dict: 包含各種統計資訊的字典
         """
         try:
-            with self.get_connection() as conn:
+            with self.get_connection(self.read_path()) as conn:
                 cursor = conn.cursor()
                 
                 # 取得基本統計
@@ -318,9 +630,107 @@ class DatabaseManager:
                 "latest_alert_time": None
             }
 
-# 建立全域資料庫管理器實例
-db_manager = DatabaseManager()
+    @timed(DB_QUERY_DURATION, 'insert_sensor_readings')
+    def insert_sensor_readings(self, rows: List[Tuple], chunk_size: int = 5000) -> int:
+        """
+        批次寫入感測器讀數
+
+        參數:
+        - rows: (temp, humidity, timestamp) 資料列；閘道器緩衝的讀數為 (temp, humidity, timestamp, created_at)，
+          created_at 為讀數時間（UTC 'YYYY-MM-DD HH:MM:SS'），分位數草圖也歸入該時間的小時
+        - chunk_size: 每個交易寫入的筆數，避免長時間佔用寫入鎖
+
+        回傳:
+        - int: 寫入筆數
+        """
+        inserted = 0
+        if not rows:
+            return inserted
+        if len(rows[0]) > 3:
+            sql = """
+                INSERT INTO sensor_readings (temp, humidity, timestamp, created_at)
+                VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """
+        else:
+            sql = "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)"
+        with self.get_connection() as conn:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                with conn:
+                    conn.executemany(sql, chunk)
+                    # 提交前記錄到環形緩衝區，讀取端不會再以緩衝區中較舊的讀數回答
+                    if self.ring_reader:
+                        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                        mark_external_write(self.ring_reader.path, last_id)
+                    # 分位數草圖與讀數在同一個交易中合併（已持有寫入鎖）
+                    if Config.SKETCH_ENABLED:
+                        sketches = HourlySketches(Config.SKETCH_RELATIVE_ACCURACY)
+                        sketches.add_many(chunk)
+                        merge_into_db(conn, sketches.drain())
+                inserted += len(chunk)
+        return inserted
+
+    @timed(DB_QUERY_DURATION, 'save_alerts')
+    def save_alerts(self, alerts: List[Dict[str, Any]], created_at: Optional[List[Optional[str]]] = None) -> int:
+        """
+        批次寫入警報記錄，回傳寫入筆數
+
+        created_at: 每筆警報的建立時間（UTC 'YYYY-MM-DD HH:MM:SS'，閘道器緩衝的讀數為讀數時間），預設為寫入時間
+        """
+        if not alerts:
+            return 0
+        if created_at is None:
+            created_at = [None] * len(alerts)
+        with self.get_connection() as conn, conn:
+            conn.executemany(
+                """
+                INSERT INTO alert_history
+                (alert_type, severity, message, sensor_data, timestamp, temp, humidity, device_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """,
+                [
+                    (
+                        alert['alert_type'],
+                        alert['severity'],
+                        alert['message'],
+                        json.dumps(alert['sensor_data']),
+                        alert['timestamp'],
+                        alert['sensor_data'].get('temp'),
+                        alert['sensor_data'].get('humidity'),
+                        alert.get('device_id'),
+                        moment
+                    )
+                    for alert, moment in zip(alerts, created_at)
+                ]
+            )
+        return len(alerts)
+
+# 全域資料庫管理器：import 時不建立，第一次使用時才建立
+# （Web Server 啟動時由 lifespan 建立並預熱，關閉時由 close_db_manager 釋放）
+_db_manager: Optional[DatabaseManager] = None
+_db_manager_lock = threading.Lock()
 
 def get_db_manager() -> DatabaseManager:
     """取得資料庫管理器實例"""
-    return db_manager 
\ No newline at end of file
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            if _db_manager is None:
+                _db_manager = DatabaseManager()
+    return _db_manager
+
+def close_db_manager():
+    """關閉全域資料庫管理器；之後再使用時會重新建立"""
+    global _db_manager
+    with _db_manager_lock:
+        if _db_manager is not None:
+            _db_manager.close()
+            _db_manager = None
+
+class _LazyDatabaseManager:
+    """供路由模組在 import 時引用的代理，存取屬性時才取得全域資料庫管理器"""
+
+    def __getattr__(self, name: str):
+        return getattr(get_db_manager(), name)
+
+db_manager = _LazyDatabaseManager() 
\ No newline at end of file
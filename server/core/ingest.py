@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+批次讀數上傳模組
+解析閘道器上傳的 JSON 陣列或 NDJSON、以欄位為單位驗證讀數，
+並以與 Controller 相同的警報判斷流程（閾值、異常偵測、警報生命週期）產生警報
+
+閘道器緩衝後上傳的讀數以讀數本身的 timestamp 計時：警報生命週期依讀數時間判斷持續與冷卻，
+讀數與警報的 created_at 也使用讀數時間（UTC），無法解析時沿用前一筆讀數的時間
+"""
+
+import json
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from common.alert_pipeline import (
+    AlertPipeline, build_alert_data, format_created_at, get_device_id, parse_reading_time
+)
+
+# 感測器可接受的數值範圍（DHT22 規格）
+TEMP_RANGE = (-40.0, 80.0)
+HUMIDITY_RANGE = (0.0, 100.0)
+
+# 回應中最多列出的錯誤數
+MAX_REPORTED_ERRORS = 20
+
+# 讀數列: (temp, humidity, timestamp)
+ReadingRow = Tuple[float, float, str]
+
+# 警報判斷流程：各裝置的異常偵測與警報生命週期狀態跨批次保留，
+# 同一時間只有一個批次更新（同一裝置的讀數需依序判斷）
+_alert_pipeline: Optional[AlertPipeline] = None
+_alert_pipeline_lock = threading.Lock()
+
+
+def parse_readings(body: bytes, content_type: str = '') -> List[Any]:
+    """
+    解析上傳內容
+
+    Content-Type 含 ndjson / jsonl 時逐行解析，否則視為 JSON 陣列；
+    格式錯誤時拋出 ValueError。
+    """
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        records = []
+        for line_number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_number} 行不是有效的 JSON: {e.msg}")
+        return records
+
+    try:
+        records = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"不是有效的 JSON: {e.msg}")
+    if not isinstance(records, list):
+        raise ValueError("請上傳讀數陣列（JSON array）或 NDJSON")
+    return records
+
+
+def _in_range(values: array, bounds: Tuple[float, float]) -> bool:
+    """整欄檢查是否都在範圍內（NaN 視為超出範圍）"""
+    if not values:
+        return True
+    return bounds[0] <= min(values) and max(values) <= bounds[1] and not any(map(math.isnan, values))
+
+
+def _validate_record(record: Any) -> Optional[str]:
+    """檢查單筆讀數，回傳錯誤原因（正確時回傳 None）"""
+    if not isinstance(record, dict):
+        return "讀數必須是物件"
+    for field, bounds in (('temp', TEMP_RANGE), ('humidity', HUMIDITY_RANGE)):
+        value = record.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{field} 必須是數字"
+        if not bounds[0] <= value <= bounds[1]:
+            return f"{field} 超出範圍 {bounds[0]} ~ {bounds[1]}"
+    timestamp = record.get('timestamp')
+    if not isinstance(timestamp, str) or not timestamp:
+        return "timestamp 必須是非空字串"
+    device = record.get('device_id')
+    if device is not None and not isinstance(device, str):
+        return "device_id 必須是字串"
+    return None
+
+
+def validate_readings(records: List[Any]) -> Tuple[List[ReadingRow], List[Optional[str]], List[Dict[str, Any]]]:
+    """
+    驗證讀數
+
+    先以整欄的方式檢查（轉成 array('d') 後比較最小/最大值），全部通過時直接組成資料列；
+    有任何一筆不合格才逐筆檢查，找出錯誤的位置。
+
+    回傳:
+    - (資料列, 對應的裝置 ID, 錯誤列表)
+    """
+    try:
+        temps = array('d', [record['temp'] for record in records])
+        humidities = array('d', [record['humidity'] for record in records])
+        timestamps = [record['timestamp'] for record in records]
+        devices = [record.get('device_id') for record in records]
+        valid = (
+            _in_range(temps, TEMP_RANGE)
+            and _in_range(humidities, HUMIDITY_RANGE)
+            and all(type(t) is str and t for t in timestamps)
+            and all(d is None or type(d) is str for d in devices)
+            and not any(type(r['temp']) is bool or type(r['humidity']) is bool for r in records)
+        )
+    except (KeyError, TypeError, AttributeError):
+        valid = False
+
+    if valid:
+        return list(zip(temps, humidities, timestamps)), devices, []
+
+    rows: List[ReadingRow] = []
+    devices: List[Optional[str]] = []
+    errors: List[Dict[str, Any]] = []
+    for index, record in enumerate(records):
+        error = _validate_record(record)
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        rows.append((float(record['temp']), float(record['humidity']), record['timestamp']))
+        devices.append(record.get('device_id'))
+    return rows, devices, errors
+
+
+def get_alert_pipeline() -> AlertPipeline:
+    """取得批次上傳共用的警報判斷流程（第一次使用時依 Config 建立）"""
+    global _alert_pipeline
+    if _alert_pipeline is None:
+        with _alert_pipeline_lock:
+            if _alert_pipeline is None:
+                _alert_pipeline = AlertPipeline()
+    return _alert_pipeline
+
+
+def evaluate_alerts(
+    rows: List[ReadingRow],
+    devices: List[Optional[str]],
+    pipeline: Optional[AlertPipeline] = None
+) -> Tuple[List[Tuple[float, float, str, str]], List[Dict[str, Any]], List[str]]:
+    """
+    依上傳順序逐筆判斷警報
+
+    每筆讀數依裝置送入警報判斷流程，以讀數時間計時，與 Controller 及離線重播產生相同的警報；
+    沒有 device_id 的讀數依 MQTT_TOPIC 推得裝置（與離線重播相同），但警報不記錄 device_id。
+
+    回傳:
+    - (加上 created_at 的讀數列, 警報, 每筆警報的 created_at)
+    """
+    pipeline = pipeline or get_alert_pipeline()
+    timed_rows = []
+    alerts = []
+    alert_times = []
+    # 沒有可解析時間的讀數沿用前一筆的時間（批次開頭就無法解析時為上傳時間）
+    reading_time = None
+    with _alert_pipeline_lock:
+        for (temp, humidity, timestamp), device in zip(rows, devices):
+            parsed = parse_reading_time(timestamp)
+            if parsed is not None:
+                reading_time = parsed
+            elif reading_time is None:
+                reading_time = time.time()
+            created_at = format_created_at(reading_time)
+            timed_rows.append((temp, humidity, timestamp, created_at))
+
+            sensor_data = {'temp': temp, 'humidity': humidity, 'timestamp': timestamp}
+            if device:
+                sensor_data['device_id'] = device
+            key = get_device_id(Config.MQTT_TOPIC, sensor_data)
+            for alert in pipeline.evaluate(key, temp, humidity, reading_time):
+                alerts.append(build_alert_data(alert, sensor_data, timestamp, device))
+                alert_times.append(created_at)
+    return timed_rows, alerts, alert_times
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+監控指標模組
+Web Server 的指標註冊表，以及 HTTP 請求延遲與事件迴圈延遲的量測
+"""
+
+import asyncio
+import time
+
+from common.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    timed
+)
+
+# Counter、Gauge、Histogram、timed 由 common.metrics 轉出，server 模組沿用 `from .metrics import ...`
+__all__ = [
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'MetricsRegistry',
+    'timed',
+    'registry',
+    'HTTP_REQUEST_DURATION',
+    'EVENT_LOOP_LAG',
+    'EVENT_LOOP_LAG_HISTOGRAM',
+    'MetricsMiddleware',
+    'monitor_event_loop_lag'
+]
+
+# 建立全域的指標註冊表
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds',
+    'HTTP 請求處理時間（依路由）',
+    ['method', 'route', 'status']
+)
+EVENT_LOOP_LAG = registry.gauge('event_loop_lag_seconds', '事件迴圈最近一次量測的延遲')
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram('event_loop_lag_distribution_seconds', '事件迴圈延遲分佈')
+
+
+class MetricsMiddleware:
+    """
+    量測 HTTP 請求延遲的 ASGI 中介層
+
+    以路由樣板（例如 /api/sensor/readings）作為標籤，避免路徑參數造成標籤數量暴增。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope['method'],
+                getattr(route, 'path', 'unmatched'),
+                str(status)
+            )
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """背景任務：量測事件迴圈的排程延遲"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+唯讀副本模組
+Web Server 的分析查詢改讀資料庫的副本，不與 controller 的寫入競爭同一個檔案的鎖與頁面快取
+
+背景執行緒每 refresh_interval 秒更新一次副本：
+- incremental：依 id 複製主資料庫新增的讀數與警報、依 updated_at 複製草圖，
+  並刪除主資料庫已清理的舊資料；每段最多 chunk_rows 筆，在獨立的短交易中進行
+- backup：以 SQLite 線上備份 API 複製整個資料庫（期間持有主資料庫的讀取鎖，適合較小的資料庫）
+
+副本使用 WAL 模式，更新期間的查詢仍讀到上一次更新的一致快照。
+副本落後超過 max_staleness 秒（或尚未完成第一次同步）時，查詢改讀主資料庫。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .metrics import registry
+
+# 依 id 遞增新增、只會從最舊的資料開始清理的資料表
+APPEND_TABLES = ('sensor_readings', 'alert_history')
+
+REPLICA_STALENESS = registry.gauge('read_replica_staleness_seconds', '唯讀副本落後主資料庫的秒數')
+REPLICA_REFRESH_DURATION = registry.histogram('read_replica_refresh_duration_seconds', '唯讀副本每次更新的耗時')
+REPLICA_FALLBACKS = registry.counter('read_replica_fallbacks_total', '副本過舊而改讀主資料庫的查詢數')
+
+
+class ReadReplica:
+    """由背景執行緒維護的唯讀副本"""
+
+    MODES = ('incremental', 'backup')
+
+    def __init__(
+        self,
+        primary_path: str,
+        replica_path: str,
+        mode: str = 'incremental',
+        refresh_interval: float = 1.0,
+        max_staleness: float = 5.0,
+        chunk_rows: int = 5000
+    ):
+        """
+        參數:
+        - primary_path: 主資料庫路徑
+        - replica_path: 副本路徑（只由此類別寫入）
+        - mode: incremental 或 backup
+        - refresh_interval: 更新間隔（秒）
+        - max_staleness: 允許的最大落後秒數，超過時查詢改讀主資料庫
+        - chunk_rows: incremental 模式每個交易複製的筆數
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"無效的副本模式: {mode}，有效模式: {', '.join(self.MODES)}")
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.mode = mode
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.chunk_rows = max(1, chunk_rows)
+
+        # 最後一次成功更新時，開始讀取主資料庫的時間（副本至少與這個時間點一樣新）
+        self.synced_at: Optional[float] = None
+        self.stats = {
+            'refreshes': 0,
+            'full_syncs': 0,
+            'rows_copied': 0,
+            'rows_deleted': 0,
+            'failures': 0,
+            'fallbacks': 0,
+            'last_duration_ms': 0.0
+        }
+        self._conn: Optional[sqlite3.Connection] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """完成第一次同步後啟動背景更新執行緒"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="read-replica", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止背景更新並關閉副本的寫入連線"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10.0)
+            self._thread = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def staleness(self) -> Optional[float]:
+        """副本落後的秒數；尚未同步時為 None"""
+        if self.synced_at is None:
+            return None
+        return time.time() - self.synced_at
+
+    def read_path(self) -> str:
+        """查詢應使用的資料庫路徑：副本在允許的落後範圍內時為副本，否則為主資料庫"""
+        staleness = self.staleness()
+        if staleness is not None:
+            REPLICA_STALENESS.set(staleness)
+            if staleness <= self.max_staleness:
+                return self.replica_path
+        self.stats['fallbacks'] += 1
+        REPLICA_FALLBACKS.inc()
+        return self.primary_path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.replica_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.replica_path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._conn = conn
+        return self._conn
+
+    def refresh(self) -> bool:
+        """更新副本一次，成功時回傳 True"""
+        with self._lock:
+            started_at = time.time()
+            started = time.perf_counter()
+            try:
+                conn = self._connect()
+                if self.mode == 'backup' or self._needs_full_sync(conn):
+                    self._full_sync(conn)
+                else:
+                    self._incremental(conn)
+            except Exception as e:
+                self.stats['failures'] += 1
+                print(f"❌ 唯讀副本更新失敗: {e}")
+                return False
+            elapsed = time.perf_counter() - started
+            REPLICA_REFRESH_DURATION.observe(elapsed)
+            REPLICA_STALENESS.set(time.time() - started_at)
+            self.synced_at = started_at
+            self.stats['refreshes'] += 1
+            self.stats['last_duration_ms'] = elapsed * 1000
+            return True
+
+    def _needs_full_sync(self, conn: sqlite3.Connection) -> bool:
+        """副本尚未建立或 schema 版本與主資料庫不同時需要完整同步"""
+        if self.synced_at is None and self.stats['full_syncs'] == 0:
+            return True
+        primary = sqlite3.connect(self.primary_path, timeout=30.0)
+        try:
+            primary_version = primary.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            primary.close()
+        return conn.execute("PRAGMA user_version").fetchone()[0] != primary_version
+
+    def _full_sync(self, conn: sqlite3.Connection):
+        """以線上備份 API 複製整個主資料庫（一次完成，避免主資料庫寫入導致備份重新開始）"""
+        primary = sqlite3.connect(self.primary_path, timeout=30.0)
+        try:
+            primary.backup(conn)
+        finally:
+            primary.close()
+        self.stats['full_syncs'] += 1
+
+    def _incremental(self, conn: sqlite3.Connection):
+        """依 id / updated_at 複製主資料庫的變更"""
+        conn.execute("ATTACH DATABASE ? AS src", (self.primary_path,))
+        try:
+            for table in APPEND_TABLES:
+                columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+                last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM main.{table}").fetchone()[0]
+                while True:
+                    # 每段在自己的交易中完成，主資料庫的讀取鎖只持有一小段時間
+                    with conn:
+                        copied = conn.execute(
+                            f"""INSERT INTO main.{table} ({columns})
+                                SELECT {columns} FROM src.{table} WHERE id > ? ORDER BY id LIMIT ?""",
+                            (last_id, self.chunk_rows)
+                        ).rowcount
+                    self.stats['rows_copied'] += copied
+                    if copied < self.chunk_rows:
+                        break
+                    last_id = conn.execute(f"SELECT MAX(id) FROM main.{table}").fetchone()[0]
+
+                # 主資料庫清理舊資料時由最舊的 id 開始刪除
+                with conn:
+                    oldest = conn.execute(f"SELECT MIN(id) FROM src.{table}").fetchone()[0]
+                    if oldest is None:
+                        deleted = conn.execute(f"DELETE FROM main.{table}").rowcount
+                    else:
+                        deleted = conn.execute(f"DELETE FROM main.{table} WHERE id < ?", (oldest,)).rowcount
+                self.stats['rows_deleted'] += deleted
+
+            # 分位數草圖會被合併更新：複製 updated_at 不早於副本最新一筆的資料列
+            with conn:
+                since = conn.execute("SELECT MAX(updated_at) FROM main.reading_sketches").fetchone()[0]
+                copied = conn.execute(
+                    """INSERT OR REPLACE INTO main.reading_sketches (hour, metric, sketch, count, updated_at)
+                       SELECT hour, metric, sketch, count, updated_at FROM src.reading_sketches
+                       WHERE ? IS NULL OR updated_at >= ?""",
+                    (since, since)
+                ).rowcount
+            self.stats['rows_copied'] += copied
+        finally:
+            conn.execute("DETACH DATABASE src")
+
+    def get_stats(self) -> Dict[str, Any]:
+        staleness = self.staleness()
+        return {
+            'mode': self.mode,
+            'replica_path': self.replica_path,
+            'max_staleness': self.max_staleness,
+            'staleness': round(staleness, 3) if staleness is not None else None,
+            'serving': staleness is not None and staleness <= self.max_staleness,
+            **self.stats
+        }
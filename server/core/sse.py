@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events 模組
+給只需要接收資料、或位於不支援 WebSocket 的代理伺服器後方的客戶端
+
+SSE 連線以與 WebSocket 相同的介面加入 ConnectionManager 的 sse 協定分組，
+與 /ws/alerts 共用推播（每則事件只編碼一次）、序號補送（Last-Event-ID）、心跳與連線數上限。
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+from .database import db_manager
+from .websocket import ConnectionManager
+
+
+class SSEConnection:
+    """
+    以 WebSocket 的介面包裝一個 SSE 串流
+
+    推播內容（已編碼的事件位元組）放入佇列，由串流回應的產生器依序寫出；
+    待送事件超過 max_queue 則（客戶端讀取過慢）時結束串流並讓推播失敗，管理器會移除這個連線。
+    每寫出一個事件就更新最後活動時間，半開的連線寫不出去，會在閒置超時後被回收。
+    """
+
+    def __init__(self, request: Request, max_queue: int):
+        self.scope = request.scope
+        self.query_params = request.query_params
+        self.headers = request.headers
+        self.max_queue = max_queue
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        """SSE 沒有握手；回應標頭在串流開始時送出"""
+
+    async def send_bytes(self, payload: bytes):
+        if self.closed:
+            raise RuntimeError("SSE 連線已關閉")
+        if self.queue.qsize() >= self.max_queue:
+            # 結束串流（送完已排入的事件），客戶端重新連線後以 Last-Event-ID 補送
+            pending = self.queue.qsize()
+            await self.close()
+            raise RuntimeError(f"SSE 客戶端讀取過慢（待送 {pending} 則）")
+        self.queue.put_nowait(payload)
+
+    async def send_text(self, payload: str):
+        await self.send_bytes(payload.encode('utf-8'))
+
+    async def close(self, code: int = 1000):
+        """結束串流（已排入佇列的事件會先送出）"""
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+    async def events(self, channel: ConnectionManager, retry_ms: int) -> AsyncIterator[bytes]:
+        """串流回應的內容：先送出重新連線等待時間，再依序送出佇列中的事件"""
+        try:
+            yield f"retry: {retry_ms}\n\n".encode('utf-8')
+            while True:
+                payload = await self.queue.get()
+                if payload is None:
+                    break
+                yield payload
+                channel.touch(self)
+        finally:
+            self.closed = True
+            channel.disconnect(self)
+
+
+class ReadingsFeed:
+    """
+    讀數推播的去重
+
+    controller 透過常駐通道推送的讀數與查詢資料庫找到的讀數（閘道器上傳、離線重播寫入的讀數，
+    或通道送達前就查到的讀數）都經過這裡，同一個 id 只推播一次。
+    """
+
+    def __init__(self, channel: ConnectionManager):
+        self.channel = channel
+        self._sent: Set[int] = set()
+
+    async def push(self, rows: List[Dict[str, Any]]):
+        """常駐通道的 readings 訊框：推播尚未推播過的讀數"""
+        await self.channel.broadcast_many(self.unsent(rows))
+
+    def unsent(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """過濾掉已推播的讀數，並記錄這次要推播的 id"""
+        fresh = []
+        for row in rows:
+            row_id = row.get('id')
+            if row_id is not None:
+                if row_id in self._sent:
+                    continue
+                self._sent.add(row_id)
+            fresh.append(row)
+        return fresh
+
+    def forget(self, through_id: Optional[int] = None):
+        """捨棄 id 不大於 through_id 的紀錄（未指定時全部捨棄）"""
+        if through_id is None:
+            self._sent.clear()
+        else:
+            self._sent = {row_id for row_id in self._sent if row_id > through_id}
+
+
+async def poll_readings(
+    channel: ConnectionManager,
+    interval: float,
+    batch_limit: int = 1000,
+    feed: Optional[ReadingsFeed] = None
+):
+    """
+    背景任務：有讀數訂閱者時，每 interval 秒查詢新的讀數並推播
+
+    沒有訂閱者時不查詢資料庫；之後重新訂閱的客戶端由資料庫補送中斷期間的讀數。
+    controller 透過常駐通道推送新讀數時仍持續查詢（閘道器上傳與離線重播的讀數不經過通道），
+    由 feed 略過通道已推播的讀數。
+    """
+    last_id: Optional[int] = None
+    while True:
+        await asyncio.sleep(interval)
+        if not channel.active_connections:
+            if last_id is not None:
+                channel.mark_gap()
+                last_id = None
+            if feed is not None:
+                feed.forget()
+            continue
+        try:
+            if last_id is None:
+                latest = await run_in_threadpool(db_manager.get_latest_sensor_reading)
+                last_id = latest['id'] if latest else 0
+                if feed is not None:
+                    feed.forget(last_id)
+                continue
+            rows = await run_in_threadpool(db_manager.get_readings_after, last_id, batch_limit)
+        except Exception as e:
+            print(f"❌ 查詢推播讀數失敗: {e}")
+            continue
+        if feed is not None:
+            # 上一輪以前的讀數不會再被查到，只保留這一輪的紀錄給稍晚送達的通道訊框比對
+            feed.forget(last_id)
+        for row in (feed.unsent(rows) if feed is not None else rows):
+            await channel.broadcast(row)
+        if rows:
+            last_id = rows[-1]['id']
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+範圍統計模組
+計算任意時間範圍內讀數的百分位數與分布直方圖
+
+時間範圍依 created_at 切成多個區段，每個區段由執行緒池以獨立的唯讀連線掃描
+（SQLite 執行查詢時會釋放 GIL，多個區段可以同時進行），各區段只回傳
+「數值 -> 筆數」的分組結果，合併後即可求出精確的百分位數與直方圖。
+感測器精度為 0.1，數值以小數點後 VALUE_DECIMALS 位分組不會損失精度。
+"""
+
+import sqlite3
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# 預設範圍
+RANGE_PRESETS = {
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+    'month': timedelta(days=30),
+    'quarter': timedelta(days=90)
+}
+
+# 統計的欄位
+METRICS = ('temp', 'humidity')
+
+# 分組的小數位數
+VALUE_DECIMALS = 2
+
+# created_at 的格式（SQLite CURRENT_TIMESTAMP，UTC）
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def parse_time(value: str) -> datetime:
+    """解析 ISO 8601 日期或時間，轉為 UTC（無時區者視為 UTC）；格式錯誤時拋出 ValueError"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def resolve_range(
+    range_name: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    now: Optional[datetime] = None
+) -> Tuple[datetime, datetime]:
+    """
+    取得統計範圍 [start, end)
+
+    指定 start 時以 start/end 為準（end 預設為現在），否則使用 range_name 的預設範圍（預設 day）；
+    無效時拋出 ValueError。
+    """
+    now = now or datetime.utcnow().replace(microsecond=0)
+    end_time = parse_time(end) if end else now
+    if start:
+        start_time = parse_time(start)
+    else:
+        range_name = range_name or 'day'
+        if range_name not in RANGE_PRESETS:
+            raise ValueError(f"無效的範圍: {range_name}，有效範圍: {', '.join(RANGE_PRESETS)}")
+        start_time = end_time - RANGE_PRESETS[range_name]
+    if start_time >= end_time:
+        raise ValueError("開始時間必須早於結束時間")
+    return start_time, end_time
+
+
+def split_range(start: datetime, end: datetime, chunk: timedelta) -> List[Tuple[str, str]]:
+    """將 [start, end) 切成長度為 chunk 的區段（以 created_at 格式表示）"""
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk, end)
+        chunks.append((chunk_start.strftime(TIME_FORMAT), chunk_end.strftime(TIME_FORMAT)))
+        chunk_start = chunk_end
+    return chunks
+
+
+class Distribution:
+    """單一欄位的數值分布（數值 -> 筆數），可合併"""
+
+    def __init__(self):
+        self.counts: Dict[float, int] = {}
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, value: float, count: int, value_sum: float):
+        self.counts[value] = self.counts.get(value, 0) + count
+        self.total += count
+        self.sum += value_sum
+
+    def merge(self, other: 'Distribution'):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+
+    def percentiles(self, qs: Sequence[float]) -> Dict[str, float]:
+        """百分位數（與 numpy 預設相同，以相鄰排名線性內插）"""
+        if not self.total:
+            return {}
+        values = sorted(self.counts)
+        cumulative = list(accumulate(self.counts[value] for value in values))
+
+        def value_at(rank: int) -> float:
+            return values[bisect_right(cumulative, rank)]
+
+        result = {}
+        for q in qs:
+            position = q / 100 * (self.total - 1)
+            lower = int(position)
+            low_value = value_at(lower)
+            high_value = value_at(min(lower + 1, self.total - 1))
+            result[f"p{q:g}"] = round(low_value + (high_value - low_value) * (position - lower), VALUE_DECIMALS + 2)
+        return result
+
+    def histogram(self, bins: int) -> List[Dict[str, Any]]:
+        """最小值到最大值之間等寬的直方圖"""
+        if not self.total:
+            return []
+        low = min(self.counts)
+        high = max(self.counts)
+        width = (high - low) / bins if high > low else 1.0
+        buckets = [0] * bins
+        for value, count in self.counts.items():
+            buckets[min(int((value - low) / width), bins - 1)] += count
+        return [
+            {
+                'lower': round(low + i * width, VALUE_DECIMALS + 2),
+                'upper': round(low + (i + 1) * width, VALUE_DECIMALS + 2),
+                'count': count
+            }
+            for i, count in enumerate(buckets)
+        ]
+
+    def summary(self, qs: Sequence[float], bins: int) -> Dict[str, Any]:
+        if not self.total:
+            return {'count': 0, 'avg': None, 'min': None, 'max': None, 'percentiles': {}, 'histogram': []}
+        return {
+            'count': self.total,
+            'avg': self.sum / self.total,
+            'min': min(self.counts),
+            'max': max(self.counts),
+            'percentiles': self.percentiles(qs),
+            'histogram': self.histogram(bins)
+        }
+
+
+class RangeScanner:
+    """以執行緒池平行掃描時間區段並合併結果"""
+
+    def __init__(
+        self,
+        db_path: str,
+        connection_factory: Callable = sqlite3.Connection,
+        workers: int = 4,
+        chunk_hours: float = 24.0
+    ):
+        """
+        參數:
+        - db_path: 資料庫路徑
+        - connection_factory: sqlite3 連線類別（查詢分析時為 ProfilingConnection）
+        - workers: 同時掃描的區段數
+        - chunk_hours: 每個區段的長度（小時）
+        """
+        self.db_path = db_path
+        self.connection_factory = connection_factory
+        self.workers = max(1, workers)
+        self.chunk = timedelta(hours=chunk_hours)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stats-scan")
+            return self._executor
+
+    def _scan_chunk(self, start: str, end: str, db_path: Optional[str] = None) -> Dict[str, Distribution]:
+        """以獨立的唯讀連線掃描一個區段"""
+        partial = {metric: Distribution() for metric in METRICS}
+        conn = sqlite3.connect(db_path or self.db_path, factory=self.connection_factory)
+        try:
+            conn.execute("PRAGMA query_only = ON")
+            scale = 10 ** VALUE_DECIMALS
+            for metric in METRICS:
+                # 以整數為分組鍵，比以浮點數分組快
+                rows = conn.execute(f"""
+                    SELECT CAST(ROUND({metric} * {scale}) AS INTEGER), COUNT(*), SUM({metric})
+                    FROM sensor_readings
+                    WHERE created_at >= ? AND created_at < ?
+                    GROUP BY 1
+                """, (start, end))
+                distribution = partial[metric]
+                for key, count, value_sum in rows:
+                    distribution.add(key / scale, count, value_sum)
+        finally:
+            conn.close()
+        return partial
+
+    def scan(
+        self,
+        start: datetime,
+        end: datetime,
+        db_path: Optional[str] = None
+    ) -> Tuple[Dict[str, Distribution], int]:
+        """掃描 [start, end)，回傳 (各欄位的分布, 區段數)；db_path 可指定改讀唯讀副本"""
+        chunks = split_range(start, end, self.chunk)
+        merged = {metric: Distribution() for metric in METRICS}
+        if len(chunks) == 1:
+            partials = [self._scan_chunk(*chunks[0], db_path)]
+        else:
+            executor = self._get_executor()
+            partials = [
+                future.result()
+                for future in [executor.submit(self._scan_chunk, *chunk, db_path) for chunk in chunks]
+            ]
+        for partial in partials:
+            for metric in METRICS:
+                merged[metric].merge(partial[metric])
+        return merged, len(chunks)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
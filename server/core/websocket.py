@@ -2,55 +2,641 @@
 """
 WebSocket 連線管理
 處理 WebSocket 連線的建立、關閉和訊息推播
+
+連線時以 WebSocket 子協定協商推播格式：
+- 未指定子協定（v1）：每則警報一個 JSON 文字訊框 {"type": "alert", "data": ..., "broadcast_time": ...}
+- alerts.v2：在 WS_BATCH_WINDOW 秒內的警報合併成一個訊框
+  {"type": "alerts", "v": 2, "broadcast_time": ..., "alerts": [...]}，
+  第一則為完整內容，其後每則只包含與前一則不同的欄位（巢狀欄位逐層比較，移除的欄位列在 "$del"）
+- alerts.v2.zlib：格式同 alerts.v2，但以 zlib 壓縮的二進位訊框傳送
+  （給代理伺服器不支援 permessage-deflate 的客戶端；支援時 uvicorn 會自動協商傳輸層壓縮）
+
+每個訊框只編碼一次，再傳送給所有使用相同格式的連線。
+
+每則推播帶有遞增的序號 seq（以微秒時間戳為基礎，伺服器重新啟動後仍然遞增），
+最近 WS_REPLAY_BUFFER_SIZE 則保留在記憶體中。重新連線的客戶端以 /ws/alerts?last_seq=N
+帶上收到的最大序號，伺服器只補送之後的警報；缺口超出記憶體範圍（或伺服器已重新啟動）時，
+改由 alert_history 查詢缺口期間的警報（至少一次，邊界上可能重複）。警報先寫入資料庫才推播，
+寫入時間可能早於已送出的序號，因此資料庫查詢的起點往前多涵蓋 WS_REPLAY_DB_LAG 秒。
+缺口期間的警報超過 WS_REPLAY_DB_LIMIT 筆時只補送最新的部分，補送訊息帶有 "truncated": true
+與 "from"（補送的第一筆警報的 created_at），客戶端可改由 /api/alerts/history 查詢更早的警報。
+
+連線以 dict 登記（加入、移除皆為 O(1)），同時連線數超過 WS_MAX_CONNECTIONS 時拒絕新連線。
+背景心跳任務每 WS_HEARTBEAT_INTERVAL 秒 ping 沒有活動的連線，並關閉超過 WS_IDLE_TIMEOUT 秒
+沒有任何訊息（半開）的連線；uvicorn 本身的協定層 ping 則負責偵測已中斷的 TCP 連線。
+
+/sse/alerts 的 Server-Sent Events 連線（見 sse.py）加入同一個管理器的 sse 分組，
+事件的 id 即為序號，瀏覽器重新連線時以 Last-Event-ID 補送。
 """
 
-from typing import List
+import asyncio
+import json
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
 from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 
+from config import Config
+from .database import db_manager
+from .metrics import registry
+
+# 支援的子協定與對應的編碼方式（依客戶端列出的順序選擇第一個支援的）
+SUBPROTOCOLS = {
+    'alerts.v2': 'json',
+    'alerts.v2.zlib': 'zlib'
+}
+
+# 所有協定的編碼方式：v1 與 SSE 每則推播一個事件，v2 子協定合併推播
+ENCODINGS = {
+    'v1': 'json',
+    'sse': 'sse',
+    **SUBPROTOCOLS
+}
+
+# 移除欄位的標記
+DELETED_KEY = '$del'
+
+# WebSocket 相關指標
+WS_CONNECTIONS_TOTAL = registry.counter('websocket_connections_total', '累計建立的 WebSocket 連線數')
+WS_BROADCAST_DURATION = registry.histogram('websocket_broadcast_duration_seconds', '推播給所有連線所需時間')
+WS_BROADCAST_FAILURES = registry.counter('websocket_broadcast_failures_total', '推播失敗而移除的連線數')
+WS_FRAMES_SENT = registry.counter('websocket_frames_sent_total', '送出的 WebSocket 訊框數（依協定）', ['protocol'])
+WS_BYTES_SENT = registry.counter('websocket_bytes_sent_total', '送出的 WebSocket 訊框位元組數（依協定）', ['protocol'])
+WS_BATCH_SIZE = registry.histogram(
+    'websocket_batch_alerts',
+    '每個合併訊框包含的警報數',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+WS_REPLAYED_ALERTS = registry.counter('websocket_replayed_alerts_total', '重新連線時補送的警報數（依來源）', ['source'])
+WS_REJECTED = registry.counter('websocket_rejected_connections_total', '超過連線數上限而拒絕的連線數')
+WS_IDLE_REAPED = registry.counter('websocket_idle_reaped_total', '閒置超時而關閉的連線數')
+
+# 閒置回收使用的關閉碼（應用程式自訂範圍，對應 HTTP 408）
+IDLE_CLOSE_CODE = 4408
+
+
+class ReplayEntry(NamedTuple):
+    """記憶體中保留的一則推播"""
+    seq: int
+    data: Dict[str, Any]
+    broadcast_time: str
+
+
+def _now_seq() -> int:
+    return time.time_ns() // 1000
+
+
+def seq_to_datetime(seq: int) -> str:
+    """將序號轉為 alert_history.created_at 的格式（UTC，精確到秒）"""
+    return datetime.utcfromtimestamp(seq / 1_000_000).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def diff_fields(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """回傳由 previous 變成 current 所需的欄位變更（巢狀 dict 逐層比較）"""
+    changes = {}
+    for key, value in current.items():
+        if key not in previous:
+            changes[key] = value
+            continue
+        old = previous[key]
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_fields(old, value)
+            if nested:
+                changes[key] = nested
+        elif value != old or type(value) is not type(old):
+            changes[key] = value
+    removed = [key for key in previous if key not in current]
+    if removed:
+        changes[DELETED_KEY] = removed
+    return changes
+
+
+def apply_fields(previous: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """diff_fields 的反向操作：將欄位變更套用到 previous，回傳新的 dict"""
+    result = dict(previous)
+    for key in changes.get(DELETED_KEY, ()):
+        result.pop(key, None)
+    for key, value in changes.items():
+        if key == DELETED_KEY:
+            continue
+        old = result.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            result[key] = apply_fields(old, value)
+        else:
+            result[key] = value
+    return result
+
+
+def build_batch(
+    alerts: List[Dict[str, Any]],
+    seqs: Optional[List[Optional[int]]] = None,
+    message_type: str = "alerts"
+) -> Dict[str, Any]:
+    """建立 v2 合併訊框：第一則完整，其後只包含與前一則不同的欄位；seqs 為每則的序號"""
+    entries = []
+    previous: Optional[Dict[str, Any]] = None
+    for alert in alerts:
+        entries.append(alert if previous is None else diff_fields(previous, alert))
+        previous = alert
+    return {
+        "type": message_type,
+        "v": 2,
+        "broadcast_time": datetime.utcnow().isoformat() + "Z",
+        "seqs": seqs if seqs is not None else [None] * len(entries),
+        "alerts": entries
+    }
+
+
+def expand_batch(frame: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """還原 v2 合併訊框中每則警報的完整內容"""
+    alerts = []
+    previous: Dict[str, Any] = {}
+    for entry in frame.get("alerts", []):
+        previous = apply_fields(previous, entry) if alerts else entry
+        alerts.append(previous)
+    return alerts
+
+
+def encode_message(message: Dict[str, Any], encoding: str) -> Union[str, bytes]:
+    """
+    編碼一次推播內容：json 為文字訊框，zlib 為壓縮後的二進位訊框，
+    sse 為 Server-Sent Events 事件（id 為序號，心跳為註解行）的位元組
+    """
+    if encoding == 'sse' and message.get("type") == "ping":
+        return b": ping\n\n"
+    text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    if encoding == 'zlib':
+        return zlib.compress(text.encode('utf-8'))
+    if encoding == 'sse':
+        event = f"event: {message['type']}\ndata: {text}\n\n"
+        if message.get("seq") is not None:
+            event = f"id: {message['seq']}\n" + event
+        return event.encode('utf-8')
+    return text
+
+
+def _payload_size(payload: Union[str, bytes]) -> int:
+    return len(payload) if isinstance(payload, bytes) else len(payload.encode('utf-8'))
+
+
+def decode_message(data: Union[str, bytes]) -> Dict[str, Any]:
+    """解碼 encode_message 的結果（客戶端與測試使用）"""
+    if isinstance(data, bytes):
+        data = zlib.decompress(data).decode('utf-8')
+    return json.loads(data)
+
+
+class ClientState:
+    """單一連線的狀態"""
+
+    __slots__ = ('protocol', 'connected_at', 'last_seen')
+
+    def __init__(self, protocol: str, now: float):
+        self.protocol = protocol
+        self.connected_at = now
+        self.last_seen = now
+
+
+def _load_alert_history(since: str, until: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """由 alert_history 取得補送用的警報（與推播相同的格式，另附 created_at 供截斷時標記起點）"""
+    return [
+        {
+            "alert_type": row["alert_type"],
+            "severity": row["severity"],
+            "message": row["message"],
+            "timestamp": row["timestamp"],
+            "sensor_data": row["sensor_data"],
+            "created_at": row["created_at"]
+        }
+        for row in db_manager.get_alerts_between(since, until, limit)
+    ]
+
+
+def _load_reading_history(since: str, until: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """由 sensor_readings 取得補送用的讀數"""
+    return db_manager.get_readings_between(since, until, limit)
+
+
 class ConnectionManager:
-    """管理 WebSocket 連線"""
-    
-    def __init__(self):
-        """初始化連線管理器"""
-        self.active_connections: List[WebSocket] = []
-        
-    async def connect(self, websocket: WebSocket):
-        """處理新的 WebSocket 連線"""
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"📡 WebSocket 連線建立 - 目前連線數: {len(self.active_connections)}")
-        
+    """
+    管理推播連線（WebSocket 與 SSE）
+
+    每個管理器是一個推播頻道（警報、讀數），有自己的序號、補送緩衝區與連線登記。
+    SSE 連線以與 WebSocket 相同的介面（send_bytes / close）加入 sse 協定分組，共用推播、補送與心跳。
+    """
+
+    PROTOCOLS = tuple(ENCODINGS)
+
+    def __init__(
+        self,
+        batch_window: Optional[float] = None,
+        batch_max: Optional[int] = None,
+        replay_size: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        event: str = 'alert',
+        history_loader: Callable[[str, Optional[str], int], List[Dict[str, Any]]] = _load_alert_history,
+        log_broadcasts: bool = True
+    ):
+        """
+        初始化連線管理器
+
+        參數:
+        - batch_window: v2 連線合併警報的時間窗（秒）
+        - batch_max: 累積到這個數量時立即送出，不等時間窗結束
+        - replay_size: 記憶體中保留供重新連線補送的推播數
+        - max_connections: 同時連線數上限，超過時拒絕新連線（1013 Try Again Later）
+        - event: 推播訊息的 type（v2 合併訊框為複數形，例如 alerts）
+        - history_loader: 缺口超出補送緩衝區時，由資料庫取得 (since, until, limit) 期間的資料
+        - log_broadcasts: 每次推播是否印出紀錄（高頻率的頻道關閉）
+        """
+        self.event = event
+        self.history_loader = history_loader
+        self.log_broadcasts = log_broadcasts
+        # 連線 → 狀態；dict 讓加入與移除都是 O(1)，並保留建立順序
+        self.active_connections: Dict[WebSocket, ClientState] = {}
+        # 依協定分組，推播時每組只編碼一次並直接走訪該組
+        self.groups: Dict[str, Dict[WebSocket, ClientState]] = {protocol: {} for protocol in self.PROTOCOLS}
+        self.max_connections = Config.WS_MAX_CONNECTIONS if max_connections is None else max_connections
+        # 已通過上限檢查、正在完成握手的連線數
+        self._admitting = 0
+
+        self.batch_window = Config.WS_BATCH_WINDOW if batch_window is None else batch_window
+        self.batch_max = max(1, Config.WS_BATCH_MAX_ALERTS if batch_max is None else batch_max)
+        # 等待合併送給 v2 連線的推播（永遠是 replay_buffer 的尾端）
+        self._pending: List[ReplayEntry] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.replay_buffer: Deque[ReplayEntry] = deque(
+            maxlen=max(1, Config.WS_REPLAY_BUFFER_SIZE if replay_size is None else replay_size)
+        )
+        self.seq = 0
+        # 序號不小於此值的客戶端，之後的推播都還在 replay_buffer 中
+        # （起始為啟動時間；緩衝區滿時為最近被移出的序號）
+        self._replay_floor = _now_seq()
+
+    def _has_batched(self) -> bool:
+        return any(self.groups[subprotocol] for subprotocol in SUBPROTOCOLS)
+
+    @staticmethod
+    def negotiate(websocket: WebSocket) -> Optional[str]:
+        """依客戶端列出的子協定順序，選擇第一個支援的；都不支援時使用 v1"""
+        for subprotocol in websocket.scope.get('subprotocols', []):
+            if subprotocol in SUBPROTOCOLS:
+                return subprotocol
+        return None
+
+    @staticmethod
+    def _last_seq(websocket: WebSocket) -> Optional[int]:
+        # EventSource 重新連線時自動帶上 Last-Event-ID
+        value = websocket.query_params.get('last_seq') or websocket.headers.get('last-event-id', '')
+        try:
+            last_seq = int(value)
+        except ValueError:
+            return None
+        return last_seq if last_seq > 0 else None
+
+    async def connect(self, websocket: WebSocket, protocol: Optional[str] = None) -> bool:
+        """
+        處理新的連線；帶有 last_seq（或 SSE 的 Last-Event-ID）時補送錯過的推播
+
+        protocol 未指定時由 WebSocket 子協定協商（SSE 連線指定為 sse）。
+        連線數已達上限時在握手前拒絕（關閉碼 1013），回傳 False。
+        """
+        if len(self.active_connections) + self._admitting >= self.max_connections:
+            WS_REJECTED.inc()
+            await websocket.close(code=1013)
+            print(f"⚠️ 推播連線數已達上限 ({self.max_connections})，拒絕新連線")
+            return False
+
+        self._admitting += 1
+        try:
+            subprotocol = self.negotiate(websocket) if protocol is None else None
+            await websocket.accept(subprotocol=subprotocol)
+
+            last_seq = self._last_seq(websocket)
+            history: List[Dict[str, Any]] = []
+            truncated = False
+            if last_seq is not None and last_seq < self._replay_floor:
+                history, truncated = await self._load_history(last_seq)
+
+            # 以下到加入連線之前沒有 await：補送範圍與之後的即時推播不會重疊或遺漏
+            if subprotocol and self._pending:
+                # 尚未送出的合併推播會在下一個訊框送給這個連線
+                through = self._pending[0].seq - 1
+            else:
+                through = self.seq
+            missed = [
+                entry for entry in self.replay_buffer
+                if last_seq is not None and last_seq < entry.seq <= through
+            ]
+            protocol = protocol or subprotocol or 'v1'
+            state = ClientState(protocol, time.monotonic())
+            self.active_connections[websocket] = state
+            self.groups[protocol][websocket] = state
+        finally:
+            self._admitting -= 1
+        WS_CONNECTIONS_TOTAL.inc()
+
+        if subprotocol:
+            encoding = SUBPROTOCOLS[subprotocol]
+            hello = {"type": "hello", "v": 2, "encoding": encoding, "batch_window": self.batch_window, "seq": through}
+            payload = encode_message(hello, encoding)
+            await self._send(websocket, payload, protocol, _payload_size(payload))
+        if last_seq is not None:
+            await self._replay(websocket, protocol, history, missed, through, truncated)
+        print(f"📡 WebSocket 連線建立 ({protocol}) - 目前連線數: {len(self.active_connections)}")
+        return True
+
+    async def _load_history(self, last_seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        缺口超出記憶體範圍時，由資料庫查詢 last_seq 之後到緩衝區中下一則之間的資料
+
+        controller 先寫入資料庫再通知，寫入時間早於 last_seq 的資料可能在 last_seq 之後才推播；
+        起點往前多查 WS_REPLAY_DB_LAG 秒（這段期間已送出的資料會重複補送）。
+
+        回傳 (最新的最多 WS_REPLAY_DB_LIMIT 筆, 是否有更早的資料未補送)
+        """
+        following = next((entry.seq for entry in self.replay_buffer if entry.seq > last_seq), None)
+        until = seq_to_datetime(following) if following is not None else None
+        since = seq_to_datetime(max(last_seq - int(Config.WS_REPLAY_DB_LAG * 1_000_000), 0))
+        limit = Config.WS_REPLAY_DB_LIMIT
+        try:
+            # 多查一筆以判斷是否超過上限
+            history = await run_in_threadpool(self.history_loader, since, until, limit + 1)
+        except Exception as e:
+            print(f"❌ 查詢補送資料失敗: {e}")
+            return [], False
+        if len(history) > limit:
+            return history[len(history) - limit:], True
+        return history, False
+
+    async def _replay(
+        self,
+        websocket: WebSocket,
+        protocol: str,
+        history: List[Dict[str, Any]],
+        missed: List[ReplayEntry],
+        through: int,
+        truncated: bool = False
+    ):
+        """
+        補送錯過的推播：v1 與 SSE 每則一個事件並以 replay 訊息結尾，v2 合併成一個訊框
+
+        truncated 時補送訊息帶有 "from"（補送的第一筆警報的 created_at），更早的警報沒有補送
+        """
+        source = 'database' if history else 'buffer'
+        summary: Dict[str, Any] = {}
+        if truncated:
+            summary = {"truncated": True, "from": history[0].get('created_at')}
+        try:
+            if protocol in SUBPROTOCOLS:
+                frame = build_batch(
+                    history + [entry.data for entry in missed],
+                    [None] * len(history) + [entry.seq for entry in missed],
+                    self.event + "s"
+                )
+                frame.update(replay=True, source=source, seq=through, **summary)
+                messages = [frame]
+            else:
+                messages = [
+                    {"type": self.event, "data": data, "broadcast_time": None, "seq": None, "replay": True}
+                    for data in history
+                ] + [
+                    {"type": self.event, "data": entry.data, "broadcast_time": entry.broadcast_time,
+                     "seq": entry.seq, "replay": True}
+                    for entry in missed
+                ]
+                messages.append({
+                    "type": "replay", "source": source, "count": len(history) + len(missed), "seq": through,
+                    **summary
+                })
+            for message in messages:
+                payload = encode_message(message, ENCODINGS[protocol])
+                await self._send(websocket, payload, protocol, _payload_size(payload))
+        except Exception as e:
+            print(f"❌ 補送資料失敗: {e}")
+            return
+        if history:
+            WS_REPLAYED_ALERTS.inc('database', amount=len(history))
+        if missed:
+            WS_REPLAYED_ALERTS.inc('buffer', amount=len(missed))
+
+    def mark_gap(self):
+        """
+        標記推播中斷（例如沒有訂閱者時停止推播讀數）：
+        序號早於現在的客戶端重新連線時，中斷期間的資料改由資料庫補送
+        """
+        self._replay_floor = max(self._replay_floor, self.seq + 1, _now_seq())
+
+    def touch(self, websocket: WebSocket):
+        """收到客戶端的任何訊息（包含 pong）時更新最後活動時間"""
+        state = self.active_connections.get(websocket)
+        if state is not None:
+            state.last_seen = time.monotonic()
+
     def disconnect(self, websocket: WebSocket):
         """處理 WebSocket 連線關閉"""
-        self.active_connections.remove(websocket)
+        state = self.active_connections.pop(websocket, None)
+        if state is None:
+            # 伺服器關閉或閒置回收時已移除
+            return
+        self.groups[state.protocol].pop(websocket, None)
+        if not self._has_batched():
+            # 沒有 v2 連線時不再需要合併；這些推播仍在 replay_buffer 中可以補送
+            self._pending = []
         print(f"🔌 WebSocket 連線關閉 - 目前連線數: {len(self.active_connections)}")
-        
-    async def broadcast_alert(self, alert_data: dict):
-        """向所有連線的客戶端推播警報"""
-        # 準備推播資料
-        message = {
-            "type": "alert",
-            "data": alert_data,
-            "broadcast_time": datetime.utcnow().isoformat() + "Z"
-        }
-        
-        # 推播給所有連線中的客戶端
-        disconnected_clients = []
-        for connection in self.active_connections:
+
+    async def close_all(self, code: int = 1001):
+        """伺服器關閉時送出尚未推播的警報，再通知所有客戶端（1001 Going Away），客戶端可自行重新連線"""
+        await self.flush()
+        connections = list(self.active_connections)
+        self.active_connections = {}
+        self.groups = {protocol: {} for protocol in self.PROTOCOLS}
+        self._pending = []
+        for connection in connections:
+            try:
+                await connection.close(code=code)
+            except Exception:
+                pass
+        if connections:
+            print(f"🔌 已關閉 {len(connections)} 個 WebSocket 連線")
+
+    async def reap_idle(self, idle_timeout: float) -> int:
+        """關閉超過 idle_timeout 秒沒有任何訊息（包含 pong）的連線（關閉碼 4408），回傳關閉數"""
+        deadline = time.monotonic() - idle_timeout
+        idle = [ws for ws, state in self.active_connections.items() if state.last_seen < deadline]
+        for connection in idle:
+            self.disconnect(connection)
             try:
-                await connection.send_json(message)
+                await connection.close(code=IDLE_CLOSE_CODE)
+            except Exception:
+                pass
+        if idle:
+            WS_IDLE_REAPED.inc(amount=len(idle))
+            print(f"🧹 已回收 {len(idle)} 個閒置的 WebSocket 連線")
+        return len(idle)
+
+    async def ping(self, older_than: float = 0.0) -> int:
+        """送出 ping 給超過 older_than 秒沒有活動的連線，回傳送出數"""
+        deadline = time.monotonic() - older_than
+        message = {"type": "ping", "seq": self.seq}
+        sent = 0
+        for protocol, group in self.groups.items():
+            connections = [ws for ws, state in group.items() if state.last_seen <= deadline]
+            if connections:
+                payload = encode_message(message, ENCODINGS[protocol])
+                self._remove_failed(await self._send_all(protocol, connections, payload))
+                sent += len(connections)
+        return sent
+
+    async def heartbeat(self, interval: float, idle_timeout: float):
+        """
+        背景任務：每 interval 秒回收閒置連線，並 ping 一個間隔內沒有活動的連線
+
+        客戶端收到 {"type": "ping"} 時回覆任何訊息（例如 {"type": "pong"}）即視為存活；
+        半開的連線不會回覆，超過 idle_timeout 秒後被關閉並移除。
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle(idle_timeout)
+                await self.ping(older_than=interval)
+            except Exception as e:
+                print(f"❌ WebSocket 心跳失敗: {e}")
+
+    async def _send(self, connection: WebSocket, payload: Union[str, bytes], protocol: str, size: int):
+        if isinstance(payload, bytes):
+            await connection.send_bytes(payload)
+        else:
+            await connection.send_text(payload)
+        WS_FRAMES_SENT.inc(protocol)
+        WS_BYTES_SENT.inc(protocol, amount=size)
+
+    async def _send_all(self, protocol: str, connections: List[WebSocket], payload: Union[str, bytes]) -> List[WebSocket]:
+        """將預先編碼的內容送給同一協定的每個連線，回傳失敗的連線"""
+        size = _payload_size(payload)
+        failed = []
+        for connection in connections:
+            try:
+                await self._send(connection, payload, protocol, size)
             except WebSocketDisconnect:
-                disconnected_clients.append(connection)
+                failed.append(connection)
             except Exception as e:
                 print(f"❌ 推播警報時發生錯誤: {e}")
-                disconnected_clients.append(connection)
-                
-        # 移除已斷線的客戶端
-        for client in disconnected_clients:
+                failed.append(connection)
+        return failed
+
+    def _remove_failed(self, failed: List[WebSocket]):
+        for client in failed:
             self.disconnect(client)
-            
-        print(f"📢 警報已推播給 {len(self.active_connections)} 個連線")
+        if failed:
+            WS_BROADCAST_FAILURES.inc(amount=len(failed))
+
+    def _record(self, data: dict) -> ReplayEntry:
+        """指定序號並保留在 replay_buffer 中"""
+        self.seq = max(self.seq + 1, _now_seq())
+        entry = ReplayEntry(self.seq, data, datetime.utcnow().isoformat() + "Z")
+        if len(self.replay_buffer) == self.replay_buffer.maxlen:
+            self._replay_floor = self.replay_buffer[0].seq
+        self.replay_buffer.append(entry)
+        return entry
+
+    async def _send_immediate(self, entries: List[ReplayEntry]):
+        """送給 v1 與 SSE 連線：每則推播一個事件，每種格式只編碼一次（SSE 的多個事件合併成一次寫入）"""
+        start = time.perf_counter()
+        targets = {protocol: list(self.groups[protocol]) for protocol in ('v1', 'sse')}
+        if any(targets.values()):
+            messages = [
+                {"type": self.event, "data": entry.data, "broadcast_time": entry.broadcast_time, "seq": entry.seq}
+                for entry in entries
+            ]
+            if targets['sse']:
+                payload = b"".join(encode_message(message, 'sse') for message in messages)
+                self._remove_failed(await self._send_all('sse', targets['sse'], payload))
+            if targets['v1']:
+                for message in messages:
+                    connections = [ws for ws in targets['v1'] if ws in self.groups['v1']]
+                    payload = encode_message(message, ENCODINGS['v1'])
+                    self._remove_failed(await self._send_all('v1', connections, payload))
+        WS_BROADCAST_DURATION.observe(time.perf_counter() - start)
+
+    async def broadcast(self, data: dict):
+        """向所有連線的客戶端推播：v1 與 SSE 連線立即送出（每種格式編碼一次），v2 連線在時間窗內合併"""
+        entry = self._record(data)
+        if self._has_batched():
+            self._pending.append(entry)
+
+        await self._send_immediate([entry])
+
+        if self._pending:
+            if len(self._pending) >= self.batch_max:
+                await self.flush()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
 
-# 建立全域的連線管理器實例
+        if self.log_broadcasts:
+            print(f"📢 警報已推播給 {len(self.active_connections)} 個連線")
+
+    async def broadcast_many(self, items: List[dict]):
+        """
+        一次推播多則（批次通知）：依序指定序號，v1 與 SSE 連線每則一個事件，
+        v2 連線不等待時間窗，連同之前累積的推播立即合併成一個訊框送出
+        """
+        if not items:
+            return
+        entries = [self._record(data) for data in items]
+        if self._has_batched():
+            self._pending.extend(entries)
+
+        await self._send_immediate(entries)
+        await self.flush()
+
+        if self.log_broadcasts:
+            print(f"📢 {len(entries)} 則警報已推播給 {len(self.active_connections)} 個連線")
+
+    async def broadcast_alert(self, alert_data: dict):
+        """向所有連線的客戶端推播警報"""
+        await self.broadcast(alert_data)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """立即送出累積的警報給 v2 連線，回傳送出的警報數"""
+        task, self._flush_task = self._flush_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        entries, self._pending = self._pending, []
+        targets = {subprotocol: list(self.groups[subprotocol]) for subprotocol in SUBPROTOCOLS}
+        if not entries or not any(targets.values()):
+            return 0
+
+        start = time.perf_counter()
+        frame = build_batch([entry.data for entry in entries], [entry.seq for entry in entries], self.event + "s")
+        for subprotocol, connections in targets.items():
+            if connections:
+                payload = encode_message(frame, SUBPROTOCOLS[subprotocol])
+                self._remove_failed(await self._send_all(subprotocol, connections, payload))
+        WS_BROADCAST_DURATION.observe(time.perf_counter() - start)
+        WS_BATCH_SIZE.observe(len(entries))
+        return len(entries)
+
+# 建立全域的連線管理器實例：警報（/ws/alerts、/sse/alerts）與讀數（/sse/readings）
 manager = ConnectionManager()
+readings_manager = ConnectionManager(event='reading', history_loader=_load_reading_history, log_broadcasts=False)
+
+registry.gauge(
+    'websocket_active_connections',
+    '目前的 WebSocket 連線數',
+    callback=lambda: sum(len(manager.groups[protocol]) for protocol in manager.PROTOCOLS if protocol != 'sse')
+)
+registry.gauge(
+    'sse_active_connections',
+    '目前的 SSE 連線數（警報與讀數）',
+    callback=lambda: len(manager.groups['sse']) + len(readings_manager.groups['sse'])
+)
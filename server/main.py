@@ -6,24 +6,89 @@ FastAPI Web Server 主程式
 
 import sys
 import os
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
 
 # 將專案根目錄加入 Python 路徑，以便導入 config
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from config import Config
 
-# 導入 API 路由與核心模組
-from server.api import sensor, alerts
-from server.core import manager
+# 導入 API 路由與核心模組（import 時不建立資料庫連線或背景任務）
+from server.api import sensor, alerts, events, metrics, debug
+from server.core import manager, readings_manager, ReadingsFeed, poll_readings, ChannelServer, MetricsMiddleware, monitor_event_loop_lag, get_db_manager, close_db_manager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    應用程式生命週期
+
+    啟動：建立資料庫管理器（套用 schema 遷移）、預熱資料庫與環形緩衝區、
+    預先載入最近讀數快取，再啟動背景任務；全部完成後才開始接受請求。
+    關閉：停止 controller 通道與背景任務、關閉 WebSocket 與 SSE 連線，最後釋放資料庫管理器的執行緒與檔案映射。
+    """
+    started = time.perf_counter()
+    db = await run_in_threadpool(get_db_manager)
+    timings = {}
+    if Config.SERVER_WARMUP_ENABLED:
+        timings = await run_in_threadpool(db.warm_up, Config.READING_CACHE_PRELOAD)
+    if db.replica:
+        replica_started = time.perf_counter()
+        await run_in_threadpool(db.start_replica)
+        timings['read_replica_ms'] = (time.perf_counter() - replica_started) * 1000
+
+    lag_monitor = None
+    if Config.METRICS_ENABLED:
+        lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    heartbeats = []
+    if Config.WS_HEARTBEAT_INTERVAL > 0:
+        heartbeats = [
+            asyncio.create_task(channel.heartbeat(Config.WS_HEARTBEAT_INTERVAL, Config.WS_IDLE_TIMEOUT))
+            for channel in (manager, readings_manager)
+        ]
+    # Controller 常駐通道：警報與新讀數直接推播，不經過 HTTP
+    channel_server = None
+    readings_feed = None
+    if Config.CHANNEL_SOCKET_PATH:
+        readings_feed = ReadingsFeed(readings_manager)
+        channel_server = ChannelServer({
+            'alerts': alerts.receive_alerts,
+            'readings': readings_feed.push
+        })
+        await channel_server.start(Config.get_channel_socket_path())
+    # 有 /sse/readings 訂閱者時才查詢新讀數（通道已推播的讀數不重複推播）
+    readings_poller = asyncio.create_task(poll_readings(
+        readings_manager, Config.SSE_READINGS_INTERVAL, feed=readings_feed
+    ))
+
+    details = ", ".join(f"{name} {value:.1f} ms" for name, value in timings.items())
+    print(f"🚀 Web Server 啟動完成: {(time.perf_counter() - started) * 1000:.1f} ms" + (f"（{details}）" if details else ""))
+    try:
+        yield
+    finally:
+        if channel_server:
+            await channel_server.stop()
+        for task in (lag_monitor, readings_poller, *heartbeats):
+            if task:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await manager.close_all()
+        await readings_manager.close_all()
+        await run_in_threadpool(close_db_manager)
+        print("👋 Web Server 已關閉")
 
 # 建立 FastAPI 應用程式
 app = FastAPI(
     title="IoT 環境監控系統",
     description="室內環境監控與警報系統的 Web Server",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 設定 CORS（允許前端存取）
@@ -40,6 +105,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 量測各路由的請求延遲
+if Config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # 基本測試端點
 @app.get("/")
 async def root():
@@ -79,13 +148,17 @@ async def websocket_endpoint(websocket: WebSocket):
     用於即時推播警報通知給前端
     """
     try:
-        # 接受 WebSocket 連線
-        await manager.connect(websocket)
+        # 接受 WebSocket 連線（超過連線數上限時已拒絕）
+        if not await manager.connect(websocket):
+            return
         
         # 保持連線開啟
         while True:
-            # 等待接收訊息（主要是為了檢測連線狀態）
-            data = await websocket.receive_text()
+            # 客戶端的任何訊息（包含回覆心跳的 pong）都代表連線仍然存活
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            manager.touch(websocket)
             
     except WebSocketDisconnect:
         # 連線關閉時，從管理器中移除
@@ -97,6 +170,10 @@ async def websocket_endpoint(websocket: WebSocket):
 # 註冊 API 路由
 app.include_router(sensor.router)
 app.include_router(alerts.router)
+app.include_router(events.router)
+app.include_router(debug.router)
+if Config.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 # 啟動伺服器
 # cd server && uvicorn main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+批次警報通知測試
+測試 POST /api/alerts/notify/batch 的逐則驗證、批次推播與數量上限
+"""
+
+import pytest
+
+from config import Config
+from server.core import manager
+from server.core.websocket import expand_batch
+
+def _alert(i, **overrides):
+    alert = {
+        "alert_type": "high_temperature",
+        "severity": "warning",
+        "message": f"批次警報 {i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}Z",
+        "sensor_data": {"temp": 31.0 + i, "humidity": 50.0},
+        "device_id": "room01"
+    }
+    alert.update(overrides)
+    return alert
+
+@pytest.mark.asyncio
+async def test_batch_notify_broadcasts_valid_alerts(async_client, websocket_client):
+    """測試不合格的警報被略過並列在 errors，其餘警報依序推播；v2 連線收到一個合併訊框"""
+    alerts = [_alert(0), _alert(1, alert_type="unknown"), _alert(2), _alert(3, severity="fatal"), _alert(4)]
+    with websocket_client.websocket_connect("/ws/alerts") as v1, \
+         websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v2"]) as v2:
+        v2.receive_json()
+        response = await async_client.post("/api/alerts/notify/batch", json={"alerts": alerts})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["received"] == 5 and body["broadcast"] == 3 and body["rejected"] == 2
+        assert [e["index"] for e in body["errors"]] == [1, 3]
+        assert "無效的警報類型" in body["errors"][0]["error"]
+
+        messages = [v1.receive_json() for _ in range(3)]
+        assert [m["data"]["message"] for m in messages] == ["批次警報 0", "批次警報 2", "批次警報 4"]
+        assert [m["seq"] for m in messages] == sorted(m["seq"] for m in messages)
+        assert messages[0]["data"]["device_id"] == "room01"
+
+        # 批次不等待合併時間窗
+        frame = v2.receive_json()
+        assert [a["message"] for a in expand_batch(frame)] == ["批次警報 0", "批次警報 2", "批次警報 4"]
+        assert frame["seqs"] == [m["seq"] for m in messages]
+        assert not manager._pending
+
+@pytest.mark.asyncio
+async def test_batch_notify_limits(async_client, monkeypatch):
+    """測試空批次回傳 422，超過 ALERT_NOTIFY_BATCH_MAX 則回傳 413"""
+    response = await async_client.post("/api/alerts/notify/batch", json={"alerts": []})
+    assert response.status_code == 422
+
+    monkeypatch.setattr(Config, "ALERT_NOTIFY_BATCH_MAX", 2)
+    response = await async_client.post("/api/alerts/notify/batch", json={"alerts": [_alert(i) for i in range(3)]})
+    assert response.status_code == 413
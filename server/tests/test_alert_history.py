@@ -7,6 +7,9 @@
 import pytest
 from datetime import datetime, timedelta
 
+from server.api import alerts
+from server.core import DatabaseManager
+
 @pytest.mark.asyncio
 async def test_get_alert_history(async_client):
     """測試取得警報歷史列表"""
@@ -54,6 +57,34 @@ async def test_get_alert_history_with_filters(async_client):
     if len(data["data"]) > 0:
         assert all(alert["severity"] == "warning" for alert in data["data"])
 
+@pytest.mark.asyncio
+async def test_get_alert_history_with_value_range(async_client, tmp_path, monkeypatch):
+    """測試依觸發時的溫度、濕度範圍過濾（含邊界），且 sensor_data 為結構化數值"""
+    db = DatabaseManager(db_path=str(tmp_path / "alerts.db"), ring_buffer_path="")
+    monkeypatch.setattr(alerts, "get_db_manager", lambda: db)
+    db.save_alerts([
+        {
+            "alert_type": "high_temperature",
+            "severity": "warning",
+            "message": f"範圍警報 {temp}",
+            "timestamp": "2025-01-01T00:00:00Z",
+            "sensor_data": {"temp": temp, "humidity": humidity}
+        }
+        for temp, humidity in ((29.9, 50.0), (30.0, 20.0), (45.5, 50.0), (60.0, 80.0), (60.1, 50.0))
+    ])
+
+    response = await async_client.get("/api/alerts/history?min_temp=30&max_temp=60")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "success"
+    assert data["count"] == 3
+    assert sorted(alert["id"] for alert in data["data"]) == [2, 3, 4]
+    assert all(isinstance(alert["sensor_data"], dict) for alert in data["data"])
+    assert sorted(alert["sensor_data"]["temp"] for alert in data["data"]) == [30.0, 45.5, 60.0]
+
+    response = await async_client.get("/api/alerts/history?min_temp=30&max_temp=60&min_humidity=40&max_humidity=60")
+    assert [alert["id"] for alert in response.json()["data"]] == [3]
+
 @pytest.mark.asyncio
 async def test_get_alert_history_with_date_range(async_client):
     """測試使用日期範圍取得警報歷史"""
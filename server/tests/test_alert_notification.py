@@ -83,4 +83,18 @@ async def test_alert_websocket_broadcast(async_client, websocket_client):
         assert data["data"]["alert_type"] == alert_data["alert_type"]
         assert data["data"]["message"] == alert_data["message"]
 
-# 需要在 conftest.py 中新增 websocket_client fixture
\ No newline at end of file
+# 需要在 conftest.py 中新增 websocket_client fixture
+@pytest.mark.asyncio
+async def test_receive_anomaly_notification(async_client):
+    """測試接收串流異常偵測產生的 anomaly 警報"""
+    alert_data = {
+        "alert_type": "anomaly",
+        "severity": "warning",
+        "message": "溫度異常！當前溫度 35.0°C 偏離近期平均 25.0°C (z=8.0)",
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "sensor_data": {"temp": 35.0, "humidity": 50.0}
+    }
+
+    response = await async_client.post("/api/alerts/notify", json=alert_data)
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
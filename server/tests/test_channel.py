@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Controller 常駐通道測試
+測試 Unix domain socket 通道的訊框、確認、警報與讀數推播，以及斷線後自動重新連線並重送
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+import pytest_asyncio
+
+from common.stream_channel import ChannelClient, encode_frame, recv_frame
+from server.api import alerts
+from server.core import ChannelServer, manager, readings_manager
+
+def _alert(i, **overrides):
+    alert = {
+        "alert_type": "high_temperature",
+        "severity": "error",
+        "message": f"通道警報 {i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}Z",
+        "sensor_data": {"temp": 35.0, "humidity": 50.0}
+    }
+    alert.update(overrides)
+    return alert
+
+@pytest_asyncio.fixture
+async def channel_server(tmp_path):
+    server = ChannelServer({'alerts': alerts.receive_alerts, 'readings': readings_manager.broadcast_many})
+    await server.start(str(tmp_path / "server.sock"))
+    yield server
+    await server.stop()
+
+async def _wait_for_clients(server, count=1):
+    for _ in range(200):
+        if server.connections == count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("通道未連線")
+
+@pytest.mark.asyncio
+async def test_channel_delivers_alerts_and_readings(channel_server, websocket_client):
+    """測試通道送出的警報推播給 WebSocket 客戶端、讀數進入讀數推播，並回覆確認"""
+    client = ChannelClient(channel_server.path)
+    client.start()
+    try:
+        with websocket_client.websocket_connect("/ws/alerts") as ws:
+            frame_id = client.send('alerts', [_alert(0), _alert(1, severity="fatal"), _alert(2)])
+            assert await asyncio.to_thread(client.wait, frame_id, 5.0)
+            messages = [ws.receive_json() for _ in range(2)]
+            assert [m["data"]["message"] for m in messages] == ["通道警報 0", "通道警報 2"]
+        assert client.stats['acked'] == 1 and client.stats['rejected'] == 1
+
+        frame_id = client.send('readings', [{"id": 7, "temp": 25.5, "humidity": 48.0, "timestamp": "2025-01-01T00:01:00Z"}])
+        assert await asyncio.to_thread(client.wait, frame_id, 5.0)
+        assert readings_manager.replay_buffer[-1].data["id"] == 7
+        assert channel_server.has_clients()
+    finally:
+        await asyncio.to_thread(client.close)
+
+@pytest.mark.asyncio
+async def test_channel_rejects_invalid_frames(channel_server):
+    """測試未知的訊息類型與格式錯誤的 data 回覆錯誤，連線不中斷"""
+    def exchange():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(channel_server.path)
+            sock.sendall(encode_frame({"id": 1, "type": "unknown", "data": []}))
+            sock.sendall(encode_frame({"id": 2, "type": "alerts", "data": {"message": "不是列表"}}))
+            sock.sendall(encode_frame({"id": 3, "type": "alerts", "data": [{"message": "缺少欄位"}]}))
+            return [recv_frame(sock) for _ in range(3)]
+
+    unknown, not_list, missing = await asyncio.to_thread(exchange)
+    assert unknown["type"] == "error" and unknown["id"] == 1
+    assert not_list["type"] == "error" and not_list["id"] == 2
+    assert missing == {
+        "type": "ack", "id": 3, "broadcast": 0, "rejected": 1,
+        "errors": [{"index": 0, "error": "缺少或無效的欄位: alert_type"}]
+    }
+
+@pytest.mark.asyncio
+async def test_channel_client_reconnects_and_resends(channel_server):
+    """測試 Web Server 重新啟動期間送出的訊框在重新連線後依序重送"""
+    client = ChannelClient(channel_server.path, reconnect_delay=0.02, max_reconnect_delay=0.05)
+    client.start()
+    try:
+        await _wait_for_clients(channel_server)
+        await channel_server.stop()
+        await asyncio.sleep(0.05)
+        assert not client.connected
+
+        seq_before = manager.seq
+        frame_ids = [client.send('alerts', [_alert(i)]) for i in range(3)]
+        assert client.pending == 3
+
+        await channel_server.start(channel_server.path)
+        assert await asyncio.to_thread(client.wait, frame_ids[-1], 5.0)
+        assert client.pending == 0 and client.stats['resent'] >= 3
+        replayed = [entry.data["message"] for entry in manager.replay_buffer if entry.seq > seq_before]
+        assert replayed == [f"通道警報 {i}" for i in range(3)]
+    finally:
+        await asyncio.to_thread(client.close)
+
+def test_channel_send_never_blocks_on_socket(tmp_path):
+    """測試 Web Server 停止讀取（socket 緩衝區已滿）時 send 仍立即返回，由寫入執行緒等待"""
+    path = str(tmp_path / "stalled.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    client = ChannelClient(path)
+    client.start()
+    conn, _ = listener.accept()
+    try:
+        # 共約 13 MB，遠超過 socket 緩衝區
+        started = time.perf_counter()
+        for i in range(200):
+            client.send('alerts', [_alert(i % 60, message="x" * 65536)])
+        assert time.perf_counter() - started < 2.0
+        assert client.pending == 200
+    finally:
+        conn.close()
+        listener.close()
+        client.close(timeout=1.0)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+監控指標測試
+測試 /metrics 端點與指標註冊表
+"""
+
+import pytest
+
+from server.core import MetricsRegistry
+
+def test_histogram_render():
+    """測試直方圖的累計分桶輸出"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_duration_seconds', '測試', ['route'], buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(5.0, '/a')
+
+    output = registry.render()
+    assert '# TYPE test_duration_seconds histogram' in output
+    assert 'test_duration_seconds_bucket{route="/a",le="0.1"} 1' in output
+    assert 'test_duration_seconds_bucket{route="/a",le="1.0"} 2' in output
+    assert 'test_duration_seconds_bucket{route="/a",le="+Inf"} 3' in output
+    assert 'test_duration_seconds_count{route="/a"} 3' in output
+    assert histogram.get_sum('/a') == pytest.approx(5.55)
+
+def test_counter_and_gauge():
+    """測試計數器與量測值"""
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', '測試', ['kind'])
+    counter.inc('a')
+    counter.inc('a', amount=2)
+    assert counter.get('a') == 3
+    assert registry.counter('test_total', '重複註冊') is counter
+
+    registry.gauge('test_callback', '測試', callback=lambda: 42)
+    output = registry.render()
+    assert 'test_total{kind="a"} 3' in output
+    assert 'test_callback 42' in output
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(async_client):
+    """測試 /metrics 端點包含各項熱路徑指標"""
+    await async_client.get("/api/health")
+    await async_client.get("/api/sensor/latest")
+
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    body = response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/health",status="200"' in body
+    assert 'db_query_duration_seconds_count{method="get_latest_sensor_reading"}' in body
+    assert 'websocket_active_connections' in body
+    assert 'websocket_broadcast_duration_seconds' in body
+    assert 'event_loop_lag_seconds' in body
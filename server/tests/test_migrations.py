@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Schema 遷移測試
+測試版本化遷移可以套用在既有資料庫上，且警報歷史查詢會使用複合索引
+"""
+
+import os
+import sqlite3
+import pytest
+
+from data.init_db import SCHEMA_VERSION, get_schema_version, migrate
+from server.core import DatabaseManager
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """以舊版方式（直接執行 schema.sql）建立、含資料的資料庫"""
+    db_path = str(tmp_path / "legacy.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+        conn.executemany(
+            """INSERT INTO alert_history (alert_type, severity, message, sensor_data, timestamp)
+               VALUES (?, ?, ?, ?, ?)""",
+            [
+                (
+                    ("high_temperature", "low_humidity")[i % 2],
+                    ("warning", "critical")[i % 3 == 0],
+                    f"警報 {i}",
+                    "{}",
+                    "2025-01-01T00:00:00Z"
+                )
+                for i in range(200)
+            ]
+        )
+    return db_path
+
+def _plan(conn, sql, params):
+    return " | ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+def test_migrate_new_database(tmp_path):
+    """測試從空白建立資料庫到最新版本"""
+    db_path = str(tmp_path / "sub" / "new.db")
+    assert migrate(db_path) == SCHEMA_VERSION
+    with sqlite3.connect(db_path) as conn:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {'sensor_readings', 'alert_history'} <= tables
+
+    # 再次執行不會重複套用
+    assert migrate(db_path) == 0
+
+def test_migrate_existing_database_keeps_data(legacy_db):
+    """測試在既有資料庫上套用遷移，資料保持不變"""
+    with sqlite3.connect(legacy_db) as conn:
+        assert get_schema_version(conn) == 0
+
+    # 遷移期間仍有讀取端開著連線
+    reader = sqlite3.connect(legacy_db)
+    reader.execute("SELECT COUNT(*) FROM alert_history").fetchone()
+    try:
+        assert migrate(legacy_db) == SCHEMA_VERSION
+    finally:
+        reader.close()
+
+    with sqlite3.connect(legacy_db) as conn:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM alert_history").fetchone()[0] == 200
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert 'idx_alert_history_type_created' in indexes
+    assert 'idx_alert_history_severity_created' in indexes
+    assert 'idx_alert_history_type_severity_created' in indexes
+
+@pytest.mark.parametrize("filters, index", [
+    ("alert_type = ?", "idx_alert_history_type_created"),
+    ("severity = ?", "idx_alert_history_severity_created"),
+    ("alert_type = ? AND severity = ?", "idx_alert_history_type_severity_created"),
+])
+def test_alert_history_query_uses_composite_index(legacy_db, filters, index):
+    """測試警報歷史的過濾＋排序查詢使用複合索引且不需要額外排序"""
+    migrate(legacy_db)
+    params = ["high_temperature", "warning"] if "AND" in filters else ["warning" if "severity" in filters else "high_temperature"]
+    sql = f"""
+        SELECT id, alert_type, severity, message, sensor_data, timestamp, sent_to_frontend, created_at
+        FROM alert_history
+        WHERE 1=1 AND {filters}
+        ORDER BY created_at DESC
+        LIMIT 50 OFFSET 0
+    """
+    with sqlite3.connect(legacy_db) as conn:
+        plan = _plan(conn, sql, params)
+        count_plan = _plan(conn, f"SELECT COUNT(*) FROM alert_history WHERE {filters}", params)
+
+    assert index in plan
+    assert "TEMP B-TREE" not in plan
+    # 計數查詢只需要讀取索引
+    assert "COVERING INDEX" in count_plan
+
+def test_alert_history_date_range_uses_index(legacy_db):
+    """測試日期範圍查詢可以使用 created_at 索引，且結果包含結束日當天"""
+    migrate(legacy_db)
+    db = DatabaseManager(db_path=legacy_db, ring_buffer_path="")
+    with db.get_connection() as conn:
+        today = conn.execute("SELECT DATE('now')").fetchone()[0]
+        plan = _plan(
+            conn,
+            "SELECT id FROM alert_history WHERE created_at >= DATE(?) AND created_at < DATE(?, '+1 day')",
+            [today, today]
+        )
+    assert "idx_alert_history_created_at (created_at>? AND created_at<?)" in plan
+
+    alerts, total = db.get_alert_history_by_date_range(today, today)
+    assert total == 200
+    assert len(alerts) == 200
+
+def test_alert_values_backfilled(tmp_path):
+    """測試遷移由 sensor_data JSON 回填溫度、濕度與裝置欄位"""
+    db_path = str(tmp_path / "values.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+        conn.executemany(
+            """INSERT INTO alert_history (alert_type, severity, message, sensor_data, timestamp)
+               VALUES ('high_temperature', 'warning', '高溫', ?, '2025-01-01T00:00:00Z')""",
+            [
+                ('{"temp": 31.5, "humidity": 45.0, "device_id": "room01"}',),
+                ('{"temp": 35.0, "humidity": 38.5}',),
+                ('not json',),
+            ]
+        )
+
+    migrate(db_path)
+    db = DatabaseManager(db_path=db_path, ring_buffer_path="")
+
+    alerts, total = db.get_alert_history()
+    assert total == 3
+    values = sorted((a["sensor_data"]["temp"] or 0, a["sensor_data"]["device_id"] or "") for a in alerts)
+    assert values == [(0, ""), (31.5, "room01"), (35.0, "")]
+
+    alerts, total = db.get_alert_history(min_temp=32, max_humidity=40)
+    assert total == 1
+    assert alerts[0]["sensor_data"] == {"temp": 35.0, "humidity": 38.5, "device_id": None}
+
+    alerts, total = db.get_alert_history(device_id="room01")
+    assert total == 1
+
+    with db.get_connection() as conn:
+        plan = _plan(conn, "SELECT COUNT(*) FROM alert_history WHERE 1=1 AND temp >= ? AND temp <= ?", [30, 40])
+    assert "idx_alert_history_temp" in plan
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+SQL 查詢分析測試
+測試敘述統計、慢查詢紀錄與 /api/debug/queries 端點
+"""
+
+import json
+import sqlite3
+import pytest
+
+from common.query_profiler import ProfilingConnection, profiler
+
+@pytest.fixture
+def profiling(tmp_path):
+    """啟用分析器並在測試結束後還原"""
+    saved = (profiler.enabled, profiler.slow_threshold, profiler.slow_log_path)
+    log_path = str(tmp_path / "slow.log")
+    profiler.reset()
+    profiler.configure(True, 10.0, log_path)
+    yield log_path
+    profiler.configure(*saved)
+    profiler.reset()
+
+def _connect(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "test.db"), factory=ProfilingConnection)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v REAL)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [(i,) for i in range(50)])
+    return conn
+
+def test_statement_stats(profiling, tmp_path):
+    """測試相同敘述合併統計，並記錄筆數"""
+    conn = _connect(tmp_path)
+    for _ in range(3):
+        conn.execute("SELECT * FROM   t WHERE v < ?", (10,)).fetchall()
+    conn.execute("UPDATE t SET v = v + 1 WHERE v >= ?", (45,))
+    conn.close()
+
+    stats = {entry['sql']: entry for entry in profiler.top(10)}
+    select = stats["SELECT * FROM t WHERE v < ?"]
+    assert select['calls'] == 3
+    assert select['rows'] == 30
+    assert select['slow_calls'] == 0
+    assert stats["UPDATE t SET v = v + 1 WHERE v >= ?"]['rows'] == 5
+    assert stats["INSERT INTO t (v) VALUES (?)"]['rows'] == 50
+
+def test_fetchone_finished_on_close(profiling, tmp_path):
+    """測試只呼叫 fetchone 的查詢在連線關閉時結算"""
+    conn = _connect(tmp_path)
+    conn.execute("SELECT COUNT(*) FROM t").fetchone()
+    conn.close()
+
+    stats = {entry['sql']: entry for entry in profiler.top(10)}
+    assert stats["SELECT COUNT(*) FROM t"]['calls'] == 1
+    assert stats["SELECT COUNT(*) FROM t"]['rows'] == 1
+
+def test_slow_query_log_with_plan(profiling, tmp_path):
+    """測試超過門檻的敘述寫入慢查詢紀錄並附上執行計畫"""
+    profiler.slow_threshold = 0.0
+    conn = _connect(tmp_path)
+    conn.execute("SELECT v FROM t WHERE id = ?", (3,)).fetchall()
+    conn.close()
+
+    with open(profiling, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    select = [e for e in entries if e['sql'] == "SELECT v FROM t WHERE id = ?"][0]
+    assert select['rows'] == 1
+    assert select['parameters'] == ['3']
+    assert any('INTEGER PRIMARY KEY' in line for line in select['plan'])
+
+    top = profiler.top(10)
+    assert top == sorted(top, key=lambda e: e['total_ms'], reverse=True)
+    assert all(e['slow_calls'] == e['calls'] for e in top)
+
+def test_disabled_profiler_records_nothing(tmp_path):
+    """測試停用時不記錄統計"""
+    profiler.reset()
+    conn = sqlite3.connect(str(tmp_path / "test.db"), factory=ProfilingConnection)
+    conn.execute("SELECT 1").fetchall()
+    conn.close()
+    assert profiler.top() == []
+
+@pytest.mark.asyncio
+async def test_query_profile_endpoint(profiling, async_client, tmp_path):
+    """測試 /api/debug/queries 依總耗時列出敘述"""
+    conn = _connect(tmp_path)
+    conn.execute("SELECT * FROM t").fetchall()
+    conn.close()
+
+    response = await async_client.get("/api/debug/queries?limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["enabled"] is True
+    assert data["count"] == 2
+    assert data["data"][0]["total_ms"] >= data["data"][1]["total_ms"]
+
+    response = await async_client.delete("/api/debug/queries")
+    assert response.status_code == 200
+    assert profiler.top() == []
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+唯讀副本測試
+測試增量複製、備份模式、落後時改讀主資料庫，以及副本上的長查詢不阻塞主資料庫的寫入
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from config import Config
+from data.init_db import migrate
+from server.api import sensor
+from server.core import DatabaseManager
+from server.core.replica import ReadReplica
+
+def _insert_readings(db_path, count, start=0):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+            [(20.0 + i % 10, 50.0, f"r-{i}") for i in range(start, start + count)]
+        )
+
+def _count(db_path, table):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+@pytest.fixture
+def primary(tmp_path):
+    db_path = str(tmp_path / "primary.db")
+    migrate(db_path)
+    return db_path
+
+def test_incremental_replica_follows_primary(primary, tmp_path):
+    """測試增量模式複製新增、清理與草圖變更，schema 改變時完整同步"""
+    _insert_readings(primary, 120)
+    with sqlite3.connect(primary) as conn:
+        conn.execute(
+            """INSERT INTO alert_history (alert_type, severity, message, sensor_data, timestamp)
+               VALUES ('high_temperature', 'warning', '高溫', '{}', 't')"""
+        )
+        conn.execute(
+            "INSERT INTO reading_sketches (hour, metric, sketch, count) VALUES ('2025-01-01 00:00:00', 'temp', x'00', 1)"
+        )
+    replica = ReadReplica(primary, str(tmp_path / "replica.db"), chunk_rows=50)
+    replica.start()
+    try:
+        assert replica.stats['full_syncs'] == 1
+        assert _count(replica.replica_path, "sensor_readings") == 120
+
+        # 新增的讀數分段複製；清理最舊的資料也同步刪除
+        _insert_readings(primary, 130, start=120)
+        with sqlite3.connect(primary) as conn:
+            conn.execute("DELETE FROM sensor_readings WHERE id <= 20")
+            conn.execute("UPDATE reading_sketches SET count = 2, updated_at = '2099-01-01 00:00:00'")
+        assert replica.refresh()
+        assert replica.stats['full_syncs'] == 1
+        assert replica.stats['rows_copied'] >= 130
+        assert replica.stats['rows_deleted'] == 20
+        with sqlite3.connect(replica.replica_path) as conn:
+            assert conn.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM sensor_readings").fetchone() == (21, 250, 230)
+            assert conn.execute("SELECT count FROM reading_sketches").fetchone()[0] == 2
+        assert _count(replica.replica_path, "alert_history") == 1
+
+        with sqlite3.connect(primary) as conn:
+            conn.execute("PRAGMA user_version = 99")
+        assert replica.refresh()
+        assert replica.stats['full_syncs'] == 2
+    finally:
+        replica.stop()
+
+def test_backup_mode_and_staleness_bound(primary, tmp_path):
+    """測試備份模式複製整個資料庫，副本落後超過上限時改讀主資料庫"""
+    _insert_readings(primary, 10)
+    replica = ReadReplica(primary, str(tmp_path / "replica.db"), mode='backup', max_staleness=2.0)
+    assert replica.read_path() == primary
+    replica.refresh()
+    assert replica.read_path() == replica.replica_path
+
+    _insert_readings(primary, 5, start=10)
+    replica.refresh()
+    assert _count(replica.replica_path, "sensor_readings") == 15
+
+    replica.synced_at = time.time() - 3.0
+    assert replica.read_path() == primary
+    assert replica.stats['fallbacks'] == 2
+    replica.stop()
+
+    with pytest.raises(ValueError):
+        ReadReplica(primary, str(tmp_path / "other.db"), mode='rsync')
+
+@pytest.mark.asyncio
+async def test_server_reads_replica_without_blocking_writes(async_client, primary, tmp_path, monkeypatch):
+    """測試分析查詢讀取副本；副本上持有讀取鎖的長查詢不會阻塞主資料庫的寫入"""
+    monkeypatch.setattr(Config, 'READ_REPLICA_ENABLED', True)
+    monkeypatch.setattr(Config, 'READ_REPLICA_PATH', str(tmp_path / "replica.db"))
+    monkeypatch.setattr(Config, 'READ_REPLICA_REFRESH_INTERVAL', 3600)
+    monkeypatch.setattr(Config, 'READING_CACHE_ENABLED', False)
+    _insert_readings(primary, 100)
+    manager = DatabaseManager(db_path=primary, ring_buffer_path="")
+    monkeypatch.setattr(sensor, "db_manager", manager)
+    manager.start_replica()
+    try:
+        # 副本尚未更新前看到的是上一次同步的資料
+        _insert_readings(primary, 50, start=100)
+        response = await async_client.get("/api/sensor/statistics")
+        assert response.json()["data"]["total_readings"] == 100
+        manager.replica.refresh()
+        response = await async_client.get("/api/sensor/statistics")
+        assert response.json()["data"]["total_readings"] == 150
+
+        # 儀表板在副本上的長查詢
+        dashboard = sqlite3.connect(manager.replica.replica_path)
+        dashboard.execute("BEGIN")
+        dashboard.execute("SELECT COUNT(*) FROM sensor_readings").fetchone()
+        try:
+            writer = sqlite3.connect(primary, timeout=0.1)
+            started = time.perf_counter()
+            writer.execute("INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (1, 1, 'w')")
+            writer.commit()
+            writer.close()
+            assert time.perf_counter() - started < 0.1
+            # 副本仍可在長查詢期間更新（WAL）
+            assert manager.replica.refresh()
+        finally:
+            dashboard.rollback()
+            dashboard.close()
+    finally:
+        manager.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+最近讀數快取測試
+測試增量刷新、淘汰以及與資料庫查詢結果的一致性
+"""
+
+import os
+import sqlite3
+import pytest
+
+from server.core import DatabaseManager, ReadingCache
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+@pytest.fixture
+def db(tmp_path):
+    """建立含少量讀數的測試資料庫"""
+    db_path = str(tmp_path / "test.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+            [(20.0 + i, 40.0 + i, f"2025-01-01T00:00:{i:02d}Z") for i in range(10)]
+        )
+    return DatabaseManager(db_path=db_path, ring_buffer_path="")
+
+def _insert(db, temp, humidity):
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+            (temp, humidity, "2025-01-01T00:01:00Z")
+        )
+
+def test_cache_incremental_refresh(db):
+    """測試只載入 id > last_seen_id 的新讀數"""
+    cache = ReadingCache(db.get_connection, refresh_interval=0)
+    cache.refresh()
+    assert len(cache) == 10
+    assert cache.complete
+
+    _insert(db, 35.0, 30.0)
+    cache.refresh()
+    assert len(cache) == 11
+    assert cache.last_seen_id == 11
+    assert cache.get_readings(1)[0]["temp"] == 35.0
+
+def test_cache_matches_database(db):
+    """測試快取結果與直接查詢資料庫相同"""
+    cache = ReadingCache(db.get_connection, refresh_interval=0)
+    db.reading_cache = None
+
+    assert cache.get_readings(5, offset=2) == db.get_sensor_readings(limit=5, offset=2)
+
+    cached = cache.get_statistics()
+    expected = db.get_sensor_statistics()
+    assert cached["total_readings"] == expected["total_readings"]
+    for field in ["avg_temp", "avg_humidity", "min_temp", "max_temp", "min_humidity", "max_humidity"]:
+        assert cached[field] == pytest.approx(expected[field])
+    assert cached["latest_reading_time"] == expected["latest_reading_time"]
+
+    assert cache.get_statistics(hours=1)["total_readings"] == 10
+
+def test_cache_eviction_by_max_entries(db):
+    """測試超過筆數上限時淘汰最舊的讀數，並改由資料庫回答"""
+    cache = ReadingCache(db.get_connection, max_entries=4, refresh_interval=0)
+    cache.refresh()
+    assert len(cache) == 4
+    assert not cache.complete
+    assert [r["id"] for r in cache.get_readings(4)] == [10, 9, 8, 7]
+
+    # 超出快取範圍
+    assert cache.get_readings(5) is None
+    assert cache.get_statistics() is None
+    assert db.get_sensor_readings(limit=5)[-1]["id"] == 6
+
+def test_cache_eviction_by_time_window(db):
+    """測試時間窗外的讀數會被淘汰"""
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE sensor_readings SET created_at = datetime('now', '-2 days') WHERE id <= 3")
+
+    cache = ReadingCache(db.get_connection, window_hours=1, refresh_interval=0)
+    cache.refresh()
+    assert len(cache) == 7
+    assert not cache.complete
+    assert cache.get_statistics(hours=0.5)["total_readings"] == 7
+    assert cache.get_statistics(hours=48) is None
+
+def test_cache_keeps_created_at_order_with_backfilled_rows(db):
+    """測試回補的讀數（id 較新、created_at 較舊）不會讓時間窗內的讀數被淘汰，排序與資料庫相同"""
+    cache = ReadingCache(db.get_connection, window_hours=1, refresh_interval=0)
+    db.reading_cache = None
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("DELETE FROM sensor_readings")
+        conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) "
+            "VALUES (20.0, 40.0, 'live-1', datetime('now', '-10 minutes'))"
+        )
+    cache.refresh()
+
+    with sqlite3.connect(db.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) VALUES (?, ?, ?, ?)",
+            [(90.0, 10.0, "backfill-old", "2020-01-01 00:00:00")]
+        )
+        conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) "
+            "VALUES (21.0, 41.0, 'live-2', datetime('now'))"
+        )
+        # 時間窗內但早於已快取讀數的回補
+        conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) "
+            "VALUES (22.0, 42.0, 'backfill-recent', datetime('now', '-20 minutes'))"
+        )
+    cache.refresh()
+
+    stats = cache.get_statistics(1)
+    assert stats["total_readings"] == 3
+    assert stats["max_temp"] == 22.0
+    assert [r["timestamp"] for r in cache.get_readings(3)] == ["live-2", "live-1", "backfill-recent"]
+    assert cache.get_readings(3) == db.get_sensor_readings(limit=3)
+    # 回補的舊讀數不在快取中，無法回答全部讀數的統計
+    assert cache.get_statistics() is None
+
+@pytest.mark.asyncio
+async def test_statistics_hours_parameter(async_client):
+    """測試統計端點的 hours 參數"""
+    response = await async_client.get("/api/sensor/statistics?hours=1")
+    assert response.status_code == 200
+    assert "total_readings" in response.json()["data"]
+
+    response = await async_client.get("/api/sensor/statistics?hours=0")
+    assert response.status_code == 422
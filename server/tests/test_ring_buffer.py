@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+最近讀數環形緩衝區測試
+測試 controller 寫入、server 讀取以及回退到資料庫的行為
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from data.ring_buffer import (
+    RingBufferWriter, RingBufferReader, RingBufferLocked, HEADER_SIZE, VERSION, mark_external_write
+)
+from server.api import sensor
+from server.core import DatabaseManager
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+def _create_db(db_path):
+    """建立測試用資料庫"""
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+
+def test_ring_buffer_roundtrip(tmp_path):
+    """測試寫入後可依新到舊順序讀回"""
+    path = str(tmp_path / "readings.ring")
+    writer = RingBufferWriter(path, capacity=8)
+    for i in range(1, 6):
+        writer.append(i, 20.0 + i, 50.0 + i, f"2025-01-01T00:00:0{i}Z")
+
+    reader = RingBufferReader(path)
+    latest = reader.latest()
+    assert latest["id"] == 5
+    assert latest["temp"] == 25.0
+    assert latest["timestamp"] == "2025-01-01T00:00:05Z"
+    assert "created_at" in latest
+
+    readings = reader.recent(3, offset=1)
+    assert [r["id"] for r in readings] == [4, 3, 2]
+
+    writer.close()
+    reader.close()
+
+def test_ring_buffer_window_not_covered(tmp_path):
+    """測試超出緩衝區範圍時回傳 None"""
+    path = str(tmp_path / "readings.ring")
+    writer = RingBufferWriter(path, capacity=4)
+    for i in range(1, 7):
+        writer.append(i, 25.0, 50.0, "2025-01-01T00:00:00Z")
+
+    reader = RingBufferReader(path)
+    assert [r["id"] for r in reader.recent(4)] == [6, 5, 4, 3]
+    assert reader.recent(5) is None
+    assert reader.recent(2, offset=3) is None
+
+    # 檔案不存在時也回傳 None
+    assert RingBufferReader(str(tmp_path / "missing.ring")).latest() is None
+
+def test_ring_buffer_torn_write_detected(tmp_path):
+    """測試寫入中的紀錄（版本為奇數）不會被讀取"""
+    path = str(tmp_path / "readings.ring")
+    writer = RingBufferWriter(path, capacity=4)
+    writer.append(1, 25.0, 50.0, "2025-01-01T00:00:00Z")
+
+    # 模擬寫入途中的狀態
+    VERSION.pack_into(writer._mm, HEADER_SIZE, 1)
+    reader = RingBufferReader(path)
+    assert reader.latest() is None
+
+    VERSION.pack_into(writer._mm, HEADER_SIZE, 2)
+    assert reader.latest()["id"] == 1
+
+def test_ring_buffer_reopen_keeps_head(tmp_path):
+    """測試 controller 重新啟動後延續既有的緩衝區"""
+    path = str(tmp_path / "readings.ring")
+    writer = RingBufferWriter(path, capacity=4)
+    writer.append(1, 25.0, 50.0, "2025-01-01T00:00:00Z")
+    writer.close()
+
+    writer = RingBufferWriter(path, capacity=4)
+    assert writer.head == 1
+    writer.append(2, 26.0, 51.0, "2025-01-01T00:00:05Z")
+
+    reader = RingBufferReader(path)
+    assert [r["id"] for r in reader.recent(2)] == [2, 1]
+    writer.close()
+
+    # 容量改變時重新建立檔案，讀取端會重新映射
+    writer = RingBufferWriter(path, capacity=8)
+    assert writer.head == 0
+    assert reader.latest() is None
+
+def test_database_manager_uses_ring_buffer(tmp_path):
+    """測試 DatabaseManager 優先使用緩衝區，涵蓋不到時查詢資料庫"""
+    db_path = str(tmp_path / "test.db")
+    ring_path = str(tmp_path / "readings.ring")
+    _create_db(db_path)
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+            [(20.0 + i, 50.0, f"2025-01-01T00:00:0{i}Z") for i in range(5)]
+        )
+
+    # 緩衝區中的溫度與資料庫不同，用來分辨回答的來源
+    writer = RingBufferWriter(ring_path, capacity=4)
+    writer.append(5, 30.0, 45.0, "2025-01-01T00:01:00Z")
+
+    db = DatabaseManager(db_path=db_path, ring_buffer_path=ring_path)
+    latest = db.get_latest_sensor_reading()
+    assert (latest["id"], latest["temp"]) == (5, 30.0)
+
+    # 緩衝區只有一筆，要求 3 筆時改查資料庫
+    readings = db.get_sensor_readings(limit=3)
+    assert [r["id"] for r in readings] == [5, 4, 3]
+    assert all(r["temp"] != 30.0 for r in readings)
+
+@pytest.mark.asyncio
+async def test_latest_skips_stale_ring_buffer(async_client, tmp_path, monkeypatch):
+    """測試不經過緩衝區寫入的讀數（重新啟動前的批次上傳、離線重播）由 /latest 回傳，且不查詢資料庫即可判斷"""
+    db_path = str(tmp_path / "test.db")
+    ring_path = str(tmp_path / "readings.ring")
+    _create_db(db_path)
+
+    writer = RingBufferWriter(ring_path, capacity=4)
+    with sqlite3.connect(db_path) as conn:
+        reading_id = conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (25.0, 50.0, '2025-01-01T00:00:00Z')"
+        ).lastrowid
+    writer.append(reading_id, 25.0, 50.0, "2025-01-01T00:00:00Z")
+
+    # 重新啟動前的 Web Server 以批次上傳寫入，緩衝區只記錄 external_id
+    before_restart = DatabaseManager(db_path=db_path, ring_buffer_path=ring_path)
+    before_restart.insert_sensor_readings([(18.0, 70.0, "2025-01-01T00:00:10Z")])
+    assert RingBufferReader(ring_path).external_id() == 2
+
+    # 新建立的管理器（如同 Web Server 重新啟動）沒有任何先前寫入的紀錄
+    db = DatabaseManager(db_path=db_path, ring_buffer_path=ring_path)
+    db.reading_cache = None
+    monkeypatch.setattr(sensor, "db_manager", db)
+
+    response = await async_client.get("/api/sensor/latest")
+    assert response.status_code == 200
+    assert response.json()["data"]["temp"] == 18.0
+
+    # 離線重播（其他行程）寫入的讀數
+    with sqlite3.connect(db_path) as conn:
+        reading_id = conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (12.0, 80.0, '2025-01-01T00:00:20Z')"
+        ).lastrowid
+    assert mark_external_write(ring_path, reading_id)
+    response = await async_client.get("/api/sensor/latest")
+    assert response.json()["data"]["temp"] == 12.0
+
+    # controller 之後寫入的讀數晚於 external_id，再次由緩衝區回答（不查詢資料庫）
+    writer.append(reading_id + 1, 26.0, 50.0, "2025-01-01T00:00:30Z")
+    monkeypatch.setattr(db, "get_connection", None)
+    assert db.get_latest_sensor_reading()["temp"] == 26.0
+    writer.close()
+
+def test_external_id_survives_ring_recreation(tmp_path):
+    """測試 controller 以不同容量重新建立緩衝區時保留 external_id"""
+    path = str(tmp_path / "readings.ring")
+    assert not mark_external_write(path, 5)
+    RingBufferWriter(path, capacity=4).close()
+    assert mark_external_write(path, 7)
+    assert mark_external_write(path, 3)
+    assert RingBufferReader(path).external_id() == 7
+
+    RingBufferWriter(path, capacity=8).close()
+    assert RingBufferReader(path).external_id() == 7
+
+def test_single_writer_lock(tmp_path):
+    """測試同一個緩衝區只允許一個寫入端，關閉後才能由其他寫入端開啟"""
+    path = str(tmp_path / "readings.ring")
+    writer = RingBufferWriter(path, capacity=4)
+    writer.append(1, 25.0, 50.0, "2025-01-01T00:00:00Z")
+    with pytest.raises(RingBufferLocked):
+        RingBufferWriter(path, capacity=8)
+    # 取不到鎖的寫入端不會重新建立檔案
+    assert RingBufferReader(path).latest()["id"] == 1
+
+    writer.close()
+    RingBufferWriter(path, capacity=4).close()
+
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+批次讀數上傳測試
+測試 POST /api/sensor/readings/batch 的解析、驗證、寫入與警報判斷
+"""
+
+import json
+import os
+import sqlite3
+import time
+import pytest
+
+from config import Config
+from data.ring_buffer import RingBufferWriter
+from server.api import sensor
+from server.core import DatabaseManager
+from server.core import ingest
+from server.core.ingest import validate_readings
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """以暫存資料庫取代 API 使用的資料庫管理器"""
+    db_path = str(tmp_path / "test.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+    manager = DatabaseManager(db_path=db_path, ring_buffer_path="")
+    monkeypatch.setattr(sensor, "db_manager", manager)
+    # 每個測試使用新的警報判斷流程，裝置狀態不跨測試保留
+    monkeypatch.setattr(ingest, "_alert_pipeline", None)
+    return manager
+
+def _count(db, table):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_validate_readings_reports_bad_rows():
+    """測試整欄驗證失敗時逐筆找出錯誤的讀數"""
+    records = [
+        {"temp": 25.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:00Z"},
+        {"temp": "25", "humidity": 50.0, "timestamp": "2025-01-01T00:00:01Z"},
+        {"temp": 25.0, "humidity": 150.0, "timestamp": "2025-01-01T00:00:02Z"},
+        {"temp": float("nan"), "humidity": 50.0, "timestamp": "2025-01-01T00:00:03Z"},
+        {"temp": 25.0, "humidity": 50.0},
+        [25.0, 50.0],
+        {"temp": 26, "humidity": 51, "timestamp": "2025-01-01T00:00:06Z", "device_id": "gw1"},
+        {"temp": 25.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:07Z", "device_id": ["gw1"]},
+        {"temp": 25.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:08Z", "device_id": {"id": 1}},
+    ]
+    rows, devices, errors = validate_readings(records)
+    assert rows == [(25.0, 50.0, "2025-01-01T00:00:00Z"), (26.0, 51.0, "2025-01-01T00:00:06Z")]
+    assert devices == [None, "gw1"]
+    assert [e["index"] for e in errors] == [1, 2, 3, 4, 5, 7, 8]
+    assert errors[-1]["error"] == "device_id 必須是字串"
+
+@pytest.mark.asyncio
+async def test_batch_json_array(async_client, db):
+    """測試上傳 JSON 陣列，不合格的讀數被略過"""
+    readings = [
+        {"temp": 20.0 + i * 0.1, "humidity": 50.0, "timestamp": f"2025-01-01T00:00:{i:02d}Z"}
+        for i in range(10)
+    ]
+    readings.append({"temp": None, "humidity": 50.0, "timestamp": "2025-01-01T00:01:00Z"})
+
+    response = await async_client.post("/api/sensor/readings/batch", json=readings)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["received"] == 11
+    assert data["inserted"] == 10
+    assert data["rejected"] == 1
+    assert data["errors"][0]["index"] == 10
+    assert data["alerts"] == 0
+    assert _count(db, "sensor_readings") == 10
+
+@pytest.mark.asyncio
+async def test_batch_ndjson_with_alerts(async_client, db):
+    """測試上傳 NDJSON，同一裝置持續超標只產生一次開啟事件"""
+    lines = [
+        json.dumps({"temp": 35.0, "humidity": 50.0, "timestamp": f"2025-01-01T00:00:0{i}Z", "device_id": "gw1"})
+        for i in range(5)
+    ]
+    lines.append(json.dumps({"temp": 25.0, "humidity": 30.0, "timestamp": "2025-01-01T00:00:09Z", "device_id": "gw2"}))
+    body = "\n".join(lines) + "\n"
+
+    response = await async_client.post(
+        "/api/sensor/readings/batch",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["inserted"] == 6
+    assert data["alerts"] == 2
+
+    alerts, total = db.get_alert_history()
+    assert total == 2
+    by_type = {alert["alert_type"]: alert for alert in alerts}
+    assert by_type["high_temperature"]["timestamp"] == "2025-01-01T00:00:00Z"
+    assert by_type["high_temperature"]["sensor_data"] == {"temp": 35.0, "humidity": 50.0, "device_id": "gw1"}
+    assert by_type["low_humidity"]["sensor_data"]["device_id"] == "gw2"
+
+@pytest.mark.asyncio
+async def test_batch_uses_reading_time(async_client, db, monkeypatch):
+    """測試緩衝上傳的讀數以讀數時間寫入 created_at，警報生命週期也依讀數時間計時"""
+    monkeypatch.setattr(Config, "ALERT_COOLDOWN", 300)
+    monkeypatch.setattr(Config, "ALERT_REMINDER_INTERVAL", 600)
+    readings = [
+        {"temp": temp, "humidity": 50.0, "timestamp": f"2025-01-01T00:{minute:02d}:00Z", "device_id": "gw1"}
+        for minute, temp in [(0, 33.0), (5, 33.0), (11, 33.0), (12, 29.0)]
+    ]
+    response = await async_client.post("/api/sensor/readings/batch", json=readings)
+    assert response.status_code == 200
+    assert response.json()["alerts"] == 3
+
+    with sqlite3.connect(db.db_path) as conn:
+        created = [row[0] for row in conn.execute("SELECT created_at FROM sensor_readings ORDER BY id")]
+        alerts = conn.execute(
+            "SELECT created_at, message FROM alert_history WHERE device_id = 'gw1' ORDER BY id"
+        ).fetchall()
+    assert created == ["2025-01-01 00:00:00", "2025-01-01 00:05:00", "2025-01-01 00:11:00", "2025-01-01 00:12:00"]
+    # 開啟、10 分鐘後的彙總提醒、解除
+    assert [row[0] for row in alerts] == ["2025-01-01 00:00:00", "2025-01-01 00:11:00", "2025-01-01 00:12:00"]
+    assert "持續 660 秒" in alerts[1][1]
+    assert alerts[2][1].startswith("警報解除")
+
+@pytest.mark.asyncio
+async def test_batch_rejects_non_string_device_id(async_client, db):
+    """測試 device_id 不是字串的讀數在寫入前被拒絕，其餘讀數與警報照常寫入"""
+    readings = [
+        {"temp": 35.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:00Z", "device_id": ["gw1"]},
+        {"temp": 35.0, "humidity": 50.0, "timestamp": "2025-01-01T00:00:01Z", "device_id": "gw2"},
+    ]
+    response = await async_client.post("/api/sensor/readings/batch", json=readings)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["inserted"], data["rejected"], data["alerts"]) == (1, 1, 1)
+    assert data["errors"][0] == {"index": 0, "error": "device_id 必須是字串"}
+    assert _count(db, "alert_history") == 1
+
+@pytest.mark.asyncio
+async def test_batch_rejects_bad_payload(async_client, db, monkeypatch):
+    """測試格式錯誤與超過筆數上限"""
+    response = await async_client.post("/api/sensor/readings/batch", content=b"{not json")
+    assert response.status_code == 400
+
+    response = await async_client.post("/api/sensor/readings/batch", json={"temp": 25.0})
+    assert response.status_code == 400
+
+    response = await async_client.post(
+        "/api/sensor/readings/batch",
+        content=b'{"temp": 25.0, "humidity": 50.0, "timestamp": "t"}\nbroken\n',
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 400
+    assert "第 2 行" in response.json()["detail"]
+
+    monkeypatch.setattr(Config, "BATCH_INGEST_MAX_READINGS", 2)
+    response = await async_client.post(
+        "/api/sensor/readings/batch",
+        json=[{"temp": 25.0, "humidity": 50.0, "timestamp": "t"}] * 3
+    )
+    assert response.status_code == 413
+    assert _count(db, "sensor_readings") == 0
+
+@pytest.mark.asyncio
+async def test_batch_100k_readings(async_client, db):
+    """測試單次上傳 100k 筆讀數"""
+    readings = [
+        {"temp": 20.0 + (i % 100) * 0.05, "humidity": 45.0 + (i % 50) * 0.1, "timestamp": "2025-01-01T00:00:00Z"}
+        for i in range(100000)
+    ]
+    body = json.dumps(readings)
+
+    start = time.perf_counter()
+    response = await async_client.post(
+        "/api/sensor/readings/batch",
+        content=body,
+        headers={"Content-Type": "application/json"}
+    )
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 100000
+    assert _count(db, "sensor_readings") == 100000
+    print(f"100k 筆讀數上傳耗時 {elapsed:.2f} 秒")
+
+def test_ring_buffer_bypassed_after_batch(db, tmp_path):
+    """測試批次寫入後，不再由環形緩衝區回答最近讀數"""
+    ring_path = str(tmp_path / "recent.ring")
+    writer = RingBufferWriter(ring_path, capacity=8)
+    with sqlite3.connect(db.db_path) as conn:
+        for i in range(3):
+            reading_id = conn.execute(
+                "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+                (20.0 + i, 50.0, f"2025-01-01T00:00:0{i}Z")
+            ).lastrowid
+            writer.append(reading_id, 20.0 + i, 50.0, f"2025-01-01T00:00:0{i}Z")
+
+    db = DatabaseManager(db_path=db.db_path, ring_buffer_path=ring_path)
+    db.reading_cache = None
+    assert db.get_latest_sensor_reading()["temp"] == 22.0
+
+    db.insert_sensor_readings([(30.0, 40.0, "2025-01-01T00:00:05Z")])
+    assert db.get_latest_sensor_reading()["temp"] == 30.0
+    assert [r["temp"] for r in db.get_sensor_readings(limit=2)] == [30.0, 22.0]
+
+    # controller 之後寫入的讀數與緩衝區中的舊讀數之間夾著批次資料，id 不連續時改查資料庫
+    with sqlite3.connect(db.db_path) as conn:
+        reading_id = conn.execute(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (31.0, 40.0, 't')"
+        ).lastrowid
+    writer.append(reading_id, 31.0, 40.0, "t")
+    assert db.get_latest_sensor_reading()["temp"] == 31.0
+    assert [r["temp"] for r in db.get_sensor_readings(limit=3)] == [31.0, 30.0, 22.0]
+    writer.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+範圍統計測試
+測試 GET /api/sensor/statistics/distribution 的百分位數、直方圖與區段合併
+"""
+
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.api import sensor
+from server.core import DatabaseManager
+from server.core.statistics import Distribution, resolve_range, split_range
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+END = datetime(2025, 4, 1)
+
+def _exact_percentile(values, q):
+    ordered = sorted(values)
+    position = q / 100 * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+@pytest.fixture
+def quarter_db(tmp_path, monkeypatch):
+    """90 天、每 2 分鐘一筆的讀數（約 6.5 萬筆）"""
+    db_path = str(tmp_path / "test.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    rng = random.Random(42)
+    rows = []
+    created = END - timedelta(days=90)
+    while created < END:
+        rows.append((
+            round(rng.gauss(25, 3), 1),
+            round(min(max(rng.gauss(55, 10), 0), 100), 1),
+            created.isoformat() + "Z",
+            created.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        created += timedelta(minutes=2)
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+    manager = DatabaseManager(db_path=db_path, ring_buffer_path="")
+    monkeypatch.setattr(sensor, "db_manager", manager)
+    return manager, rows
+
+def test_resolve_and_split_range():
+    """測試範圍解析與切分"""
+    start, end = resolve_range('week', now=END)
+    assert end - start == timedelta(days=7)
+    start, end = resolve_range(start='2025-03-01', end='2025-03-02T12:00:00+08:00')
+    assert (start, end) == (datetime(2025, 3, 1), datetime(2025, 3, 2, 4))
+    with pytest.raises(ValueError):
+        resolve_range('year')
+    with pytest.raises(ValueError):
+        resolve_range(start='2025-03-02', end='2025-03-01')
+
+    chunks = split_range(datetime(2025, 3, 1), datetime(2025, 3, 3, 6), timedelta(days=1))
+    assert chunks == [
+        ('2025-03-01 00:00:00', '2025-03-02 00:00:00'),
+        ('2025-03-02 00:00:00', '2025-03-03 00:00:00'),
+        ('2025-03-03 00:00:00', '2025-03-03 06:00:00'),
+    ]
+
+def test_distribution_merge_matches_single_pass():
+    """測試分段合併的結果與一次計算相同"""
+    values = [round(random.Random(i).uniform(10, 40), 1) for i in range(1000)]
+    whole = Distribution()
+    parts = [Distribution(), Distribution()]
+    for i, value in enumerate(values):
+        whole.add(value, 1, value)
+        parts[i % 2].add(value, 1, value)
+    merged = Distribution()
+    for part in parts:
+        merged.merge(part)
+    merged_summary = merged.summary([50, 99], 10)
+    whole_summary = whole.summary([50, 99], 10)
+    assert merged_summary.pop('avg') == pytest.approx(whole_summary.pop('avg'))
+    assert merged_summary == whole_summary
+    assert sum(bucket['count'] for bucket in whole.histogram(10)) == 1000
+
+@pytest.mark.asyncio
+async def test_quarter_distribution_is_exact(async_client, quarter_db):
+    """測試一季的百分位數與直方圖與精確計算一致"""
+    manager, rows = quarter_db
+    started = time.perf_counter()
+    response = await async_client.get(
+        "/api/sensor/statistics/distribution",
+        params={"range": "quarter", "end": END.isoformat(), "percentiles": "50,95,99", "bins": 12}
+    )
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    data = response.json()["data"]
+
+    assert data["chunks"] == 90
+    temps = [row[0] for row in rows]
+    humidities = [row[1] for row in rows]
+    assert data["temp"]["count"] == len(rows)
+    for q in (50, 95, 99):
+        assert data["temp"]["percentiles"][f"p{q}"] == pytest.approx(_exact_percentile(temps, q))
+        assert data["humidity"]["percentiles"][f"p{q}"] == pytest.approx(_exact_percentile(humidities, q))
+    assert data["temp"]["min"] == min(temps)
+    assert data["temp"]["max"] == max(temps)
+    assert data["temp"]["avg"] == pytest.approx(sum(temps) / len(temps))
+    assert len(data["temp"]["histogram"]) == 12
+    assert sum(bucket["count"] for bucket in data["humidity"]["histogram"]) == len(rows)
+    assert elapsed < 5.0
+
+@pytest.mark.asyncio
+async def test_distribution_range_and_validation(async_client, quarter_db):
+    """測試指定起訖時間與參數驗證"""
+    response = await async_client.get(
+        "/api/sensor/statistics/distribution",
+        params={"start": "2025-03-31T00:00:00Z", "end": "2025-03-31T12:00:00Z"}
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["chunks"] == 1
+    assert data["temp"]["count"] == 360
+
+    response = await async_client.get("/api/sensor/statistics/distribution", params={"range": "year"})
+    assert response.status_code == 400
+    response = await async_client.get("/api/sensor/statistics/distribution", params={"percentiles": "50,101"})
+    assert response.status_code == 400
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+分位數草圖測試
+測試 common/quantile_sketch.py 的誤差界限、合併與序列化，以及 GET /api/sensor/statistics/quantiles
+"""
+
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common.quantile_sketch import DDSketch, align_range, rebuild_sketches
+from server.api import sensor
+from server.core import DatabaseManager
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data', 'schema.sql'
+)
+
+END = datetime(2025, 4, 1)
+ALPHA = 0.005
+
+def _exact_percentile(values, q):
+    ordered = sorted(values)
+    position = q / 100 * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """以暫存資料庫取代 API 使用的資料庫管理器"""
+    db_path = str(tmp_path / "test.db")
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema_sql = f.read()
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(schema_sql)
+    manager = DatabaseManager(db_path=db_path, ring_buffer_path="")
+    monkeypatch.setattr(sensor, "db_manager", manager)
+    return manager
+
+def test_sketch_error_bound_merge_and_serialization():
+    """測試估計值在相對誤差內，分段合併與序列化不改變結果"""
+    rng = random.Random(7)
+    values = [round(rng.gauss(5, 8), 1) for _ in range(20000)]
+    whole = DDSketch(ALPHA)
+    parts = [DDSketch(ALPHA) for _ in range(24)]
+    for i, value in enumerate(values):
+        whole.add(value)
+        parts[i % 24].add(value)
+
+    merged = DDSketch(ALPHA)
+    for part in parts:
+        merged.merge(DDSketch.from_bytes(part.to_bytes()))
+
+    qs = [0, 1, 25, 50, 75, 95, 99, 100]
+    assert merged.count == whole.count == len(values)
+    assert merged.quantiles([q / 100 for q in qs]) == whole.quantiles([q / 100 for q in qs])
+    for q, estimate in zip(qs, merged.quantiles([q / 100 for q in qs])):
+        exact = _exact_percentile(values, q)
+        # 兩個排名異號時（接近 0）誤差為 alpha * max(|x_lo|, |x_hi|)
+        assert abs(estimate - exact) <= ALPHA * max(abs(exact), 0.1) + 1e-9
+    assert (merged.min, merged.max) == (min(values), max(values))
+    assert merged.sum == pytest.approx(sum(values))
+    # 每份草圖只與數值範圍有關，與筆數無關
+    assert len(whole.to_bytes()) < 1000
+
+def test_sketch_merge_with_different_accuracy():
+    """測試不同相對精度的草圖合併後誤差不超過兩者相加"""
+    fine = DDSketch(0.001)
+    coarse = DDSketch(0.01)
+    values = [10 + i * 0.01 for i in range(3000)]
+    for i, value in enumerate(values):
+        (fine if i % 2 else coarse).add(value)
+    coarse.merge(fine)
+    assert coarse.count == 3000
+    estimate = coarse.quantile(0.5)
+    exact = _exact_percentile(values, 50)
+    assert abs(estimate - exact) <= 0.011 * exact
+
+def test_align_range():
+    """測試範圍向外對齊到整點"""
+    assert align_range(datetime(2025, 3, 1, 10, 30), datetime(2025, 3, 1, 12, 0, 1)) == (
+        datetime(2025, 3, 1, 10), datetime(2025, 3, 1, 13)
+    )
+    assert align_range(datetime(2025, 3, 1, 10), datetime(2025, 3, 1, 12)) == (
+        datetime(2025, 3, 1, 10), datetime(2025, 3, 1, 12)
+    )
+
+@pytest.mark.asyncio
+async def test_quantiles_from_hourly_sketches(async_client, db):
+    """測試一週的每小時草圖合併後與精確百分位數的誤差在界限內"""
+    rng = random.Random(42)
+    rows = []
+    created = END - timedelta(days=7)
+    while created < END:
+        rows.append((
+            round(rng.gauss(25, 3), 1),
+            round(min(max(rng.gauss(55, 10), 0), 100), 1),
+            created.isoformat() + "Z",
+            created.strftime('%Y-%m-%d %H:%M:%S')
+        ))
+        created += timedelta(minutes=1)
+    with sqlite3.connect(db.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp, created_at) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        assert rebuild_sketches(conn, END - timedelta(days=7), END, ALPHA) == 168
+
+    response = await async_client.get(
+        "/api/sensor/statistics/quantiles",
+        params={"range": "week", "end": END.isoformat(), "percentiles": "50,95,99"}
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["hours"] == 168
+    assert data["relative_accuracy"] == ALPHA
+    assert data["temp"]["count"] == len(rows)
+    for index, metric in ((0, "temp"), (1, "humidity")):
+        values = [row[index] for row in rows]
+        assert data[metric]["min"] == min(values)
+        assert data[metric]["max"] == max(values)
+        for q in (50, 95, 99):
+            exact = _exact_percentile(values, q)
+            assert abs(data[metric]["percentiles"][f"p{q}"] - exact) <= ALPHA * exact + 1e-4
+
+    # 非整點的範圍向外對齊
+    response = await async_client.get(
+        "/api/sensor/statistics/quantiles",
+        params={"start": "2025-03-31T10:30:00Z", "end": "2025-03-31T12:10:00Z"}
+    )
+    data = response.json()["data"]
+    assert (data["start"], data["end"], data["hours"]) == ("2025-03-31 10:00:00", "2025-03-31 13:00:00", 3)
+    assert data["temp"]["count"] == 180
+
+    response = await async_client.get("/api/sensor/statistics/quantiles", params={"percentiles": "-1"})
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_batch_ingest_updates_sketches(async_client, db):
+    """測試批次上傳的讀數在同一個交易中合併進讀數時間所在小時的草圖"""
+    start = datetime.now(timezone.utc) - timedelta(seconds=50)
+    readings = [
+        {"temp": 20.0 + i * 0.1, "humidity": 50.0, "timestamp": (start + timedelta(seconds=i)).isoformat()}
+        for i in range(50)
+    ]
+    for half in (readings[:25], readings[25:]):
+        response = await async_client.post("/api/sensor/readings/batch", json=half)
+        assert response.status_code == 200
+
+    with sqlite3.connect(db.db_path) as conn:
+        counts = dict(conn.execute("SELECT metric, SUM(count) FROM reading_sketches GROUP BY metric"))
+    assert counts == {"temp": 50, "humidity": 50}
+
+    response = await async_client.get("/api/sensor/statistics/quantiles", params={"range": "day"})
+    data = response.json()["data"]
+    assert data["temp"]["count"] == 50
+    assert data["temp"]["percentiles"]["p50"] == pytest.approx(22.45, rel=ALPHA)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events 測試
+測試 /sse/alerts 與 /sse/readings 的事件格式、Last-Event-ID 補送、讀取過慢的客戶端、連線數上限與通道推送的讀數去重
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from config import Config
+from server.core import DatabaseManager, ReadingsFeed, manager, readings_manager, poll_readings
+from server.core import sse
+from server.main import app
+
+def _alert(i):
+    return {
+        "alert_type": "low_humidity",
+        "severity": "warning",
+        "message": f"SSE 警報 {i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}Z",
+        "sensor_data": {"temp": 25.0, "humidity": 20.0 + i}
+    }
+
+class SSEStream:
+    """直接以 ASGI 呼叫應用程式的串流客戶端（httpx 的 ASGITransport 會等待整個回應結束）"""
+
+    def __init__(self, path, headers=None):
+        self.path, _, query = path.partition("?")
+        self.query = query
+        self.headers = headers or {}
+        self.start = None
+        self.chunks = asyncio.Queue()
+        self.buffer = b""
+        self.disconnected = asyncio.Event()
+        self.finished = asyncio.Event()
+        # 清除時模擬讀取過慢的客戶端：伺服器的寫入停住
+        self.reading = asyncio.Event()
+        self.reading.set()
+
+    async def __aenter__(self):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": self.path, "raw_path": self.path.encode(), "root_path": "",
+            "query_string": self.query.encode(), "server": ("test", 80), "client": ("127.0.0.1", 50000),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in self.headers.items()]
+        }
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await self.disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            await self.reading.wait()
+            if message["type"] == "http.response.start":
+                self.start = message
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    self.chunks.put_nowait(message["body"])
+                if not message.get("more_body"):
+                    self.finished.set()
+                    self.chunks.put_nowait(None)
+
+        self.task = asyncio.create_task(app(scope, receive, send))
+        while self.start is None:
+            await asyncio.sleep(0.005)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 2)
+
+    @property
+    def status(self):
+        return self.start["status"]
+
+    async def event(self, timeout=2.0):
+        """讀取下一個事件（以空行分隔），回傳欄位 dict"""
+        while b"\n\n" not in self.buffer:
+            chunk = await asyncio.wait_for(self.chunks.get(), timeout)
+            if chunk is None:
+                return None
+            self.buffer += chunk
+        raw, self.buffer = self.buffer.split(b"\n\n", 1)
+        fields = {}
+        for line in raw.decode("utf-8").split("\n"):
+            name, _, value = line.partition(": ")
+            fields[name] = value
+        return fields
+
+@pytest.mark.asyncio
+async def test_sse_alert_stream_shares_broadcast_with_websocket(websocket_client):
+    """測試同一則警報同時推播給 WebSocket 與 SSE 客戶端，SSE 事件的 id 為序號"""
+    with websocket_client.websocket_connect("/ws/alerts") as ws:
+        async with SSEStream("/sse/alerts") as stream:
+            assert stream.status == 200
+            headers = dict(stream.start["headers"])
+            assert headers[b"content-type"].startswith(b"text/event-stream")
+            assert headers[b"cache-control"] == b"no-cache"
+            assert await stream.event() == {"retry": str(Config.SSE_RETRY_MS)}
+
+            await manager.broadcast_alert(_alert(0))
+            event = await stream.event()
+            message = ws.receive_json()
+            assert event["event"] == "alert"
+            assert json.loads(event["data"]) == message
+            assert event["id"] == str(message["seq"])
+
+@pytest.mark.asyncio
+async def test_sse_last_event_id_replays_missed_alerts():
+    """測試瀏覽器以 Last-Event-ID 重新連線時補送錯過的警報"""
+    async with SSEStream("/sse/alerts") as stream:
+        await stream.event()
+        await manager.broadcast_alert(_alert(0))
+        last_id = (await stream.event())["id"]
+
+    for i in range(1, 3):
+        await manager.broadcast_alert(_alert(i))
+
+    async with SSEStream("/sse/alerts", {"Last-Event-ID": last_id}) as stream:
+        await stream.event()
+        replayed = [await stream.event() for _ in range(2)]
+        assert [json.loads(e["data"])["data"]["message"] for e in replayed] == ["SSE 警報 1", "SSE 警報 2"]
+        assert all(json.loads(e["data"])["replay"] for e in replayed)
+        marker = await stream.event()
+        assert marker["event"] == "replay"
+        assert json.loads(marker["data"])["count"] == 2
+        # 結尾事件的 id 為最後補送的序號，再次重新連線時不會重複補送
+        assert marker["id"] == replayed[-1]["id"]
+
+@pytest.mark.asyncio
+async def test_slow_sse_client_is_dropped(monkeypatch):
+    """測試待送事件超過 SSE_MAX_QUEUE 的客戶端被移除，串流結束"""
+    monkeypatch.setattr(Config, "SSE_MAX_QUEUE", 2)
+    before = set(manager.active_connections)
+    async with SSEStream("/sse/alerts") as stream:
+        await stream.event()
+        (connection,) = set(manager.active_connections) - before
+        stream.reading.clear()
+        for i in range(4):
+            await manager.broadcast_alert(_alert(i))
+        assert connection not in manager.active_connections
+        assert connection.closed
+
+        # 客戶端恢復讀取後收到已排入的事件，接著串流結束
+        stream.reading.set()
+        events = []
+        while (event := await stream.event()) is not None:
+            events.append(event)
+        assert 1 <= len(events) <= 3
+        assert stream.finished.is_set()
+
+@pytest.mark.asyncio
+async def test_sse_rejected_over_connection_limit(monkeypatch):
+    """測試達到連線數上限時回傳 503 與 Retry-After"""
+    monkeypatch.setattr(manager, "max_connections", len(manager.active_connections))
+    async with SSEStream("/sse/alerts") as stream:
+        assert stream.status == 503
+        assert dict(stream.start["headers"])[b"retry-after"] == str(Config.SSE_RETRY_MS // 1000).encode()
+
+@pytest.mark.asyncio
+async def test_sse_readings_stream_polls_new_readings(tmp_path, monkeypatch):
+    """測試有訂閱者時推播新寫入的讀數（不推播訂閱前的舊讀數），沒有訂閱者時標記推播缺口"""
+    db = DatabaseManager(db_path=str(tmp_path / "sse.db"), ring_buffer_path="")
+    db.insert_sensor_readings([(24.0, 55.0, "2025-01-01T00:00:00Z")])
+    monkeypatch.setattr(sse, "db_manager", db)
+    poller = asyncio.create_task(poll_readings(readings_manager, 0.01))
+    try:
+        async with SSEStream("/sse/readings") as stream:
+            await stream.event()
+            await asyncio.sleep(0.05)
+            db.insert_sensor_readings([(25.0 + i, 50.0, f"2025-01-01T00:00:0{i + 1}Z") for i in range(2)])
+            events = [await stream.event() for _ in range(2)]
+            assert {e["event"] for e in events} == {"reading"}
+            assert [json.loads(e["data"])["data"]["temp"] for e in events] == [25.0, 26.0]
+            last_seq = int(events[-1]["id"])
+
+        # 沒有訂閱者後停止查詢，並標記缺口：之後重新訂閱的客戶端改由資料庫補送
+        await asyncio.sleep(0.05)
+        assert readings_manager._replay_floor > last_seq
+    finally:
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        db.close()
+
+@pytest.mark.asyncio
+async def test_sse_readings_include_uploads_while_channel_pushes(tmp_path, monkeypatch):
+    """測試常駐通道推送讀數期間，閘道器上傳的讀數仍由查詢推播，且通道已推播的讀數不重複推播"""
+    db = DatabaseManager(db_path=str(tmp_path / "sse_feed.db"), ring_buffer_path="")
+    db.insert_sensor_readings([(24.0, 55.0, "2025-01-01T00:00:00Z")])
+    monkeypatch.setattr(sse, "db_manager", db)
+    feed = ReadingsFeed(readings_manager)
+    poller = asyncio.create_task(poll_readings(readings_manager, 0.01, feed=feed))
+    try:
+        async with SSEStream("/sse/readings") as stream:
+            await stream.event()
+            await asyncio.sleep(0.05)
+            # controller 寫入並透過通道推送
+            db.insert_sensor_readings([(30.0, 50.0, "2025-01-01T00:00:01Z")])
+            latest = db.get_latest_sensor_reading()
+            await feed.push([{k: latest[k] for k in ("id", "temp", "humidity", "timestamp")}])
+            # 閘道器上傳（不經過通道）
+            db.insert_sensor_readings([(31.0, 50.0, "2025-01-01T00:00:02Z")])
+            events = [await stream.event() for _ in range(2)]
+            assert [json.loads(e["data"])["data"]["temp"] for e in events] == [30.0, 31.0]
+
+            # 稍後送達的通道訊框（查詢已推播過）不重複推播
+            uploaded = db.get_latest_sensor_reading()
+            await feed.push([{k: uploaded[k] for k in ("id", "temp", "humidity", "timestamp")}])
+            await asyncio.sleep(0.05)
+            assert stream.chunks.empty() and not stream.buffer
+    finally:
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        db.close()
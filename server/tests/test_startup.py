@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+啟動與關閉測試
+測試 import 時沒有副作用，以及 lifespan 的預熱、快取預先載入與關閉
+"""
+
+import os
+import subprocess
+import sys
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+from config import Config
+from server.core import database
+from server.main import app
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def test_import_has_no_side_effects(tmp_path):
+    """測試 import server.main 不建立資料庫，也不印出 .env 的內容"""
+    db_path = tmp_path / "lazy.db"
+    env = dict(os.environ, DB_PATH=str(db_path), CONFIG_VERBOSE="false")
+    result = subprocess.run(
+        [sys.executable, "-c", "import server.main; from server.core import database; print(database._db_manager)"],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "None"
+    assert not db_path.exists()
+    assert "=" not in "".join(line for line in result.stdout.splitlines() if line.startswith("   "))
+
+def test_lifespan_warms_up_and_closes(tmp_path, monkeypatch):
+    """測試 lifespan 啟動時建立並預熱資料庫、預先載入快取，關閉時釋放資源與 WebSocket 連線"""
+    monkeypatch.setattr(Config, 'DB_PATH', str(tmp_path / "startup.db"))
+    monkeypatch.setattr(Config, 'RING_BUFFER_ENABLED', False)
+    monkeypatch.setattr(Config, 'READING_CACHE_ENABLED', True)
+    monkeypatch.setattr(Config, 'READING_CACHE_PRELOAD', True)
+    database.close_db_manager()
+
+    # 先以另一個行程建立資料庫並寫入讀數，確認啟動時會預先載入
+    database.DatabaseManager(db_path=Config.get_db_path(), ring_buffer_path="")
+    with sqlite3.connect(Config.get_db_path()) as conn:
+        conn.executemany(
+            "INSERT INTO sensor_readings (temp, humidity, timestamp) VALUES (?, ?, ?)",
+            [(25.0 + i, 50.0, f"2025-01-01T00:00:0{i}Z") for i in range(3)]
+        )
+
+    with TestClient(app) as client:
+        manager = database._db_manager
+        assert manager is not None and manager.db_path == Config.get_db_path()
+        assert len(manager.reading_cache) == 3
+
+        response = client.get("/api/sensor/readings", params={"limit": 2})
+        assert response.status_code == 200
+
+        with client.websocket_connect("/ws/alerts"):
+            pass
+
+    # 關閉後全域管理器已釋放，下次使用時重新建立
+    assert database._db_manager is None
+    assert manager.range_scanner._executor is None
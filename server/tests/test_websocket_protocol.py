@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+WebSocket v2 協定測試
+測試子協定協商、時間窗內的警報合併、只傳送變更欄位，以及 zlib 二進位訊框
+"""
+
+import asyncio
+
+import pytest
+
+from server.core import manager
+from server.core.websocket import apply_fields, build_batch, decode_message, diff_fields, expand_batch
+
+def _alert(i, temp):
+    return {
+        "alert_type": "high_temperature",
+        "severity": "warning",
+        "message": f"高溫警報 {i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}Z",
+        "sensor_data": {"temp": temp, "humidity": 50.0, "timestamp": f"2025-01-01T00:00:{i:02d}Z"}
+    }
+
+def test_diff_and_apply_fields_roundtrip():
+    """測試欄位差異只包含變更（含巢狀與移除的欄位），並能還原完整內容"""
+    previous = {**_alert(1, 31.0), "state": "open"}
+    current = {**_alert(2, 31.0), "device_id": "dev-1"}
+    changes = diff_fields(previous, current)
+    assert set(changes) == {"message", "timestamp", "sensor_data", "device_id", "$del"}
+    assert changes["sensor_data"] == {"timestamp": current["sensor_data"]["timestamp"]}
+    assert changes["$del"] == ["state"]
+    assert apply_fields(previous, changes) == current
+
+    alerts = [_alert(i, 30.0 + i % 3) for i in range(10)] + [{"alert_type": "low_humidity", "severity": "info"}]
+    frame = build_batch(alerts)
+    assert frame["alerts"][0] == alerts[0]
+    assert "severity" not in frame["alerts"][1]
+    assert expand_batch(frame) == alerts
+
+@pytest.mark.asyncio
+async def test_v2_connections_receive_coalesced_frames(async_client, websocket_client):
+    """測試 v1 與 v2 連線同時存在：v1 每則一個訊框，v2 合併成一個訊框並可還原"""
+    alerts = [_alert(i, 30.0 + i) for i in range(5)]
+    with websocket_client.websocket_connect("/ws/alerts") as v1, \
+         websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v9", "alerts.v2"]) as v2:
+        assert v1.accepted_subprotocol is None
+        assert v2.accepted_subprotocol == "alerts.v2"
+        hello = v2.receive_json()
+        assert hello["type"] == "hello" and hello["encoding"] == "json"
+
+        for alert in alerts:
+            response = await async_client.post("/api/alerts/notify", json=alert)
+            assert response.status_code == 200
+        assert await manager.flush() == 5
+
+        for alert in alerts:
+            assert v1.receive_json()["data"]["message"] == alert["message"]
+        frame = v2.receive_json()
+        assert frame["type"] == "alerts" and frame["v"] == 2
+        assert [a["message"] for a in expand_batch(frame)] == [a["message"] for a in alerts]
+        assert set(frame["alerts"][1]) == {"message", "timestamp", "sensor_data"}
+
+@pytest.mark.asyncio
+async def test_zlib_frames_reduce_frames_and_bytes(websocket_client, monkeypatch):
+    """測試 zlib 二進位訊框；警報風暴時 v2 的訊框數與位元組數都遠少於 v1，達到上限時立即送出"""
+    monkeypatch.setattr(manager, "batch_max", 50)
+    alerts = [_alert(i % 60, 30.0 + (i % 7) * 0.5) for i in range(50)]
+    with websocket_client.websocket_connect("/ws/alerts") as v1, \
+         websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v2.zlib"]) as v2:
+        assert v2.accepted_subprotocol == "alerts.v2.zlib"
+        assert decode_message(v2.receive_bytes())["encoding"] == "zlib"
+
+        for alert in alerts:
+            await manager.broadcast_alert(alert)
+        # 第 50 則達到上限時已送出，不需等待時間窗
+        assert manager._pending == []
+
+        v1_bytes = sum(len(v1.receive_text().encode("utf-8")) for _ in alerts)
+        payload = v2.receive_bytes()
+        assert [a["message"] for a in expand_batch(decode_message(payload))] == [a["message"] for a in alerts]
+        assert len(payload) * 10 < v1_bytes
+
+@pytest.mark.asyncio
+async def test_batch_window_flushes_automatically(websocket_client, monkeypatch):
+    """測試時間窗結束後自動送出累積的警報"""
+    monkeypatch.setattr(manager, "batch_window", 0.01)
+    with websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v2"]) as v2:
+        v2.receive_json()
+        await manager.broadcast_alert(_alert(1, 31.0))
+        await manager.broadcast_alert(_alert(2, 32.0))
+        await asyncio.sleep(0.1)
+        assert manager._pending == []
+        assert len(v2.receive_json()["alerts"]) == 2
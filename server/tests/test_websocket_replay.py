@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+WebSocket 重新連線補送測試
+測試推播序號、由記憶體緩衝區補送錯過的警報，以及缺口超出緩衝區時改由資料庫補送
+"""
+
+import sqlite3
+from collections import deque
+
+import pytest
+
+from config import Config
+from server.core import DatabaseManager, manager
+from server.core import websocket
+from server.core.websocket import ConnectionManager, expand_batch, seq_to_datetime
+
+def _alert(i):
+    return {
+        "alert_type": "high_temperature",
+        "severity": "warning",
+        "message": f"補送警報 {i}",
+        "timestamp": f"2025-01-01T00:00:{i:02d}Z",
+        "sensor_data": {"temp": 30.0 + i, "humidity": 50.0}
+    }
+
+@pytest.mark.asyncio
+async def test_sequence_numbers_survive_restart():
+    """測試序號遞增；新的管理器（伺服器重新啟動）的序號仍大於之前的序號，舊序號需由資料庫補送"""
+    first = ConnectionManager()
+    seqs = [first._record(_alert(i)).seq for i in range(3)]
+    assert seqs == sorted(set(seqs))
+
+    restarted = ConnectionManager()
+    assert restarted._record(_alert(3)).seq > seqs[-1]
+    assert seqs[-1] < restarted._replay_floor
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_alerts_from_buffer(websocket_client):
+    """測試 v1 與 v2 客戶端帶上 last_seq 重新連線時，只收到錯過的警報"""
+    with websocket_client.websocket_connect("/ws/alerts") as ws:
+        await manager.broadcast_alert(_alert(0))
+        last_seq = ws.receive_json()["seq"]
+
+    # 斷線期間的警報
+    for i in range(1, 4):
+        await manager.broadcast_alert(_alert(i))
+
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}") as ws:
+        replayed = [ws.receive_json() for _ in range(3)]
+        assert [m["data"]["message"] for m in replayed] == [f"補送警報 {i}" for i in range(1, 4)]
+        assert all(m["replay"] for m in replayed)
+        assert [m["seq"] for m in replayed] == sorted(m["seq"] for m in replayed)
+        marker = ws.receive_json()
+        assert marker == {"type": "replay", "source": "buffer", "count": 3, "seq": replayed[-1]["seq"]}
+
+        # 補送之後的即時推播序號接續
+        await manager.broadcast_alert(_alert(4))
+        assert ws.receive_json()["seq"] > marker["seq"]
+
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}", subprotocols=["alerts.v2"]) as ws:
+        hello = ws.receive_json()
+        frame = ws.receive_json()
+        assert frame["replay"] is True and frame["source"] == "buffer"
+        assert [a["message"] for a in expand_batch(frame)] == [f"補送警報 {i}" for i in range(1, 5)]
+        assert frame["seqs"][-1] == frame["seq"] == hello["seq"]
+
+@pytest.mark.asyncio
+async def test_gap_beyond_buffer_falls_back_to_database(websocket_client, tmp_path, monkeypatch):
+    """測試缺口超出記憶體緩衝區時，由 alert_history 補送被移出的警報"""
+    db = DatabaseManager(db_path=str(tmp_path / "replay.db"), ring_buffer_path="")
+    monkeypatch.setattr(websocket, "db_manager", db)
+    monkeypatch.setattr(manager, "replay_buffer", deque(maxlen=2))
+    monkeypatch.setattr(manager, "_replay_floor", manager._replay_floor)
+
+    with websocket_client.websocket_connect("/ws/alerts") as ws:
+        await manager.broadcast_alert(_alert(0))
+        last_seq = ws.receive_json()["seq"]
+
+    # 斷線期間 5 則警報（controller 同時寫入資料庫），記憶體只保留最後 2 則
+    missed = [_alert(i) for i in range(1, 6)]
+    db.save_alerts(missed[:3])
+    for alert in missed:
+        await manager.broadcast_alert(alert)
+    assert last_seq < manager._replay_floor
+
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}") as ws:
+        replayed = [ws.receive_json() for _ in range(5)]
+        assert [m["data"]["message"] for m in replayed] == [a["message"] for a in missed]
+        assert [m["seq"] is None for m in replayed] == [True, True, True, False, False]
+        marker = ws.receive_json()
+        assert marker["source"] == "database" and marker["count"] == 5
+
+@pytest.mark.asyncio
+async def test_database_replay_covers_notify_lag(websocket_client, tmp_path, monkeypatch):
+    """測試寫入時間早於最後收到的序號、但斷線後才推播的警報（通知延遲）仍由資料庫補送"""
+    db = DatabaseManager(db_path=str(tmp_path / "replay.db"), ring_buffer_path="")
+    monkeypatch.setattr(websocket, "db_manager", db)
+    monkeypatch.setattr(manager, "replay_buffer", deque(maxlen=1))
+    monkeypatch.setattr(manager, "_replay_floor", manager._replay_floor)
+
+    with websocket_client.websocket_connect("/ws/alerts") as ws:
+        await manager.broadcast_alert(_alert(0))
+        last_seq = ws.receive_json()["seq"]
+
+    # controller 在 last_seq 之前 10 秒就寫入的警報，批次通知延遲到斷線之後才推播
+    delayed = _alert(1)
+    db.save_alerts([delayed])
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE alert_history SET created_at = ?", (seq_to_datetime(last_seq - 10_000_000),))
+    await manager.broadcast_alert(delayed)
+    await manager.broadcast_alert(_alert(2))
+    assert last_seq < manager._replay_floor
+
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}") as ws:
+        replayed = [ws.receive_json() for _ in range(2)]
+        assert [m["data"]["message"] for m in replayed] == ["補送警報 1", "補送警報 2"]
+        assert [m["seq"] is None for m in replayed] == [True, False]
+        marker = ws.receive_json()
+        assert marker["source"] == "database" and marker["count"] == 2
+
+@pytest.mark.asyncio
+async def test_database_replay_reports_truncation(websocket_client, tmp_path, monkeypatch):
+    """測試資料庫補送超過 WS_REPLAY_DB_LIMIT 時只補送最新的部分，並標記 truncated 與起點"""
+    db = DatabaseManager(db_path=str(tmp_path / "replay.db"), ring_buffer_path="")
+    monkeypatch.setattr(websocket, "db_manager", db)
+    monkeypatch.setattr(manager, "replay_buffer", deque(maxlen=1))
+    monkeypatch.setattr(manager, "_replay_floor", manager._replay_floor)
+    monkeypatch.setattr(Config, "WS_REPLAY_DB_LIMIT", 3)
+
+    with websocket_client.websocket_connect("/ws/alerts") as ws:
+        await manager.broadcast_alert(_alert(0))
+        last_seq = ws.receive_json()["seq"]
+
+    missed = [_alert(i) for i in range(1, 6)]
+    db.save_alerts(missed[:4])
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE alert_history SET created_at = datetime('now', '-' || (5 - id) || ' seconds')")
+    for alert in missed:
+        await manager.broadcast_alert(alert)
+
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}") as ws:
+        replayed = [ws.receive_json() for _ in range(4)]
+        # 資料庫只補送最新的 3 筆，最舊的警報 1 沒有補送
+        assert [m["data"]["message"] for m in replayed] == [a["message"] for a in missed[1:]]
+        marker = ws.receive_json()
+        assert marker["truncated"] is True
+        assert marker["from"] == replayed[0]["data"]["created_at"]
+
+    # 沒有超過上限時不帶 truncated
+    monkeypatch.setattr(Config, "WS_REPLAY_DB_LIMIT", 10)
+    with websocket_client.websocket_connect(f"/ws/alerts?last_seq={last_seq}") as ws:
+        replayed = [ws.receive_json() for _ in range(5)]
+        marker = ws.receive_json()
+        assert marker["count"] == 5
+        assert "truncated" not in marker and "from" not in marker
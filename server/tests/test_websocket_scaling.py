@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+WebSocket 連線管理測試
+測試連線數上限、心跳 ping、閒置連線回收，以及連線登記的移除
+"""
+
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from server.core import manager
+from server.core.websocket import IDLE_CLOSE_CODE
+
+async def _wait_until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_max_connections_rejects_new_clients(websocket_client, monkeypatch):
+    """測試達到連線數上限時拒絕新連線（1013），有連線關閉後可再連線"""
+    monkeypatch.setattr(manager, "max_connections", len(manager.active_connections) + 1)
+    with websocket_client.websocket_connect("/ws/alerts"):
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with websocket_client.websocket_connect("/ws/alerts"):
+                pass
+        assert exc_info.value.code == 1013
+
+    with websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v2"]) as ws:
+        assert ws.receive_json()["type"] == "hello"
+
+@pytest.mark.asyncio
+async def test_heartbeat_pings_and_reaps_idle_connections(websocket_client):
+    """測試 ping 所有連線；回覆 pong 的連線保留，沒有回覆的閒置連線被關閉並移除"""
+    before = set(manager.active_connections)
+    with websocket_client.websocket_connect("/ws/alerts") as idle, \
+         websocket_client.websocket_connect("/ws/alerts", subprotocols=["alerts.v2.zlib"]) as alive:
+        alive.receive_bytes()
+        connections = [ws for ws in manager.active_connections if ws not in before]
+        assert len(connections) == 2
+
+        assert await manager.ping() >= 2
+        assert idle.receive_json()["type"] == "ping"
+        for ws in connections:
+            manager.active_connections[ws].last_seen -= 60
+        alive_state = next(manager.active_connections[ws] for ws in connections if ws in manager.groups["alerts.v2.zlib"])
+        stale = alive_state.last_seen
+
+        alive.send_text('{"type": "pong"}')
+        await _wait_until(lambda: alive_state.last_seen > stale)
+
+        assert await manager.reap_idle(30) == 1
+        assert idle.receive() == {"type": "websocket.close", "code": IDLE_CLOSE_CODE, "reason": ""}
+        remaining = [ws for ws in manager.active_connections if ws not in before]
+        assert len(remaining) == 1
+        assert remaining[0] in manager.groups["alerts.v2.zlib"]
+        assert not any(remaining[0] in group for name, group in manager.groups.items() if name != "alerts.v2.zlib")
+
+    await _wait_until(lambda: set(manager.active_connections) <= before)